@@ -0,0 +1,81 @@
+"""Cohort analytics in the database against looping over ORM objects in Python.
+
+Creates ``BENCH_PATIENTS`` cards (default 1,000,000) with random birth dates, blood types and conditions,
+then times ``compute_cohort_report``, a cached view of the analytics page, and the naive approach:
+``Patient.query.all()`` and counting in a Python loop. The naive run loads ``NAIVE`` cards and is
+extrapolated, since loading a million ORM objects takes minutes and gigabytes.
+"""
+import os
+import random
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+from common import login, make_app, timeit
+from sqlalchemy import insert
+
+from mediarch import db
+from mediarch.analytics import AGE_BANDS, compute_cohort_report, split_conditions
+from mediarch.models import BloodType, Patient
+
+PATIENTS = int(os.getenv("BENCH_PATIENTS", "1000000"))
+NAIVE = 100000
+BATCH = 10000
+CONDITIONS = ["Hypertension", "Type 2 diabetes", "Asthma", "Hypothyroidism", "Migraine", "COPD", "Depression",
+              "Osteoarthritis", "Atrial fibrillation", "Chronic kidney disease"]
+
+
+def random_card(i: int) -> dict:
+    conditions = random.sample(CONDITIONS, random.choice([0, 0, 1, 1, 2, 3]))
+    return {
+        "first_name": f"First{i}", "last_name": f"Last{i:07d}",
+        "birth_date": date(1925, 1, 1) + timedelta(days=random.randrange(36500)) if random.random() < 0.95 else None,
+        "blood_type": random.choice(list(BloodType)),
+        "medical_conditions": ", ".join(conditions) or None,
+    }
+
+
+def naive_report(today: date) -> dict:
+    """What the analytics page would do without the database: load every card and count in Python."""
+    ages, bloods, conditions = Counter(), Counter(), Counter()
+    for patient in Patient.query.limit(NAIVE).all():
+        if patient.birth_date is None:
+            ages["Unknown"] += 1
+        else:
+            age = (today - patient.birth_date).days // 365
+            ages[max(lower for lower in AGE_BANDS if lower <= age)] += 1
+        bloods[patient.blood_type] += 1
+        conditions.update(split_conditions(patient.medical_conditions or ""))
+    return {"ages": ages, "blood_types": bloods, "conditions": conditions}
+
+
+def main() -> None:
+    app = make_app()
+    random.seed(1)
+    today = date.today()
+    with app.app_context():
+        for offset in range(0, PATIENTS, BATCH):
+            db.session.execute(insert(Patient.__table__),
+                               [random_card(i) for i in range(offset, min(offset + BATCH, PATIENTS))])
+            db.session.commit()
+
+        start = time.perf_counter()
+        report = compute_cohort_report(today)
+        aggregated = time.perf_counter() - start
+
+        start = time.perf_counter()
+        naive_report(today)
+        naive = (time.perf_counter() - start) * PATIENTS / NAIVE
+
+    client = app.test_client()
+    login(client, "admin")
+    client.get("/admin/analytics")
+    cached = timeit(lambda: client.get("/admin/analytics"), 50)
+    print(f"{report['total']} patients")
+    print(f"{'aggregated in the database':<28}{aggregated:>8.2f} s")
+    print(f"{'ORM objects, Python loop':<28}{naive:>8.2f} s (extrapolated from {NAIVE})")
+    print(f"{'cached page view':<28}{cached / 1000:>8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
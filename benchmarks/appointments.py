@@ -0,0 +1,124 @@
+"""Double-booking checks and next free slot search on a busy clinic.
+
+Fills ``BENCH_DAYS`` days (default 30) of ``BENCH_DOCTORS`` doctors (default 100) with back-to-back
+appointments of 15 to 45 minutes and a few gaps, about 2,000 a day, booked a day at a time through
+``book_appointments``. Then compares, for every doctor:
+
+* finding the next free slot with ``next_free_slot``, which jumps past appointments in an interval tree,
+  against asking the database about every 15-minute slot in turn;
+* checking each appointment of one doctor's month for overlaps with the interval tree against a linear scan.
+"""
+import os
+import random
+import time
+from datetime import UTC, datetime, timedelta
+
+from common import make_app
+from sqlalchemy import exists, select
+
+from mediarch import db
+from mediarch.appointments import IntervalTree, Schedule, book_appointments, next_free_slot
+from mediarch.models import AccountType, Appointment, AppointmentStatus, Patient, User
+
+DOCTORS = int(os.getenv("BENCH_DOCTORS", "100"))
+DAYS = int(os.getenv("BENCH_DAYS", "30"))
+START = datetime(2030, 1, 7, tzinfo=UTC)  # a Monday
+SLOT = timedelta(minutes=15)
+
+
+def day_of_appointments(doctor_ids: list[int], day: int) -> list[Appointment]:
+    booked = []
+    for doctor_id in doctor_ids:
+        at = START + timedelta(days=day, hours=8)
+        closes = at + timedelta(hours=10)
+        while at < closes - SLOT:
+            length = random.choice((15, 30, 30, 45)) * timedelta(minutes=1)
+            if random.random() > 0.05:  # leave a few gaps
+                booked.append(Appointment(doctor_id=doctor_id, patient_id=random.randint(1, 1000),
+                                          starts_at=at, ends_at=min(at + length, closes)))
+            at += length
+    return booked
+
+
+def naive_next_free(doctor_id: int, after: datetime, length: timedelta) -> datetime | None:
+    """Try every slot of the working day in turn, one overlap query each."""
+    slot, until = after, after + timedelta(days=60)  # APPOINTMENTS_SEARCH_DAYS
+    while slot < until:
+        opens = slot.replace(hour=8, minute=0)
+        if opens <= slot and slot + length <= opens + timedelta(hours=10):
+            taken = db.session.scalar(select(exists().where(
+                Appointment.doctor_id == doctor_id, Appointment.status == AppointmentStatus.SCHEDULED,
+                Appointment.starts_at < slot + length, Appointment.ends_at > slot)))
+            if not taken:
+                return slot
+        slot += SLOT
+    return None
+
+
+def populate() -> list[int]:
+    """The bench patients and doctors; returns the doctor ids."""
+    db.session.add_all(Patient(first_name=f"P{i}", last_name="Bench") for i in range(1000))
+    doctors = [User(username=f"doctor{i}", email=f"doctor{i}@example.com", password_hash="x",
+                    account_type=AccountType.DOCTOR) for i in range(DOCTORS)]
+    db.session.add_all(doctors)
+    db.session.commit()
+    return [doctor.id for doctor in doctors]
+
+
+def time_booking(doctor_ids: list[int]) -> None:
+    booked, began = 0, time.perf_counter()
+    for day in range(DAYS):
+        appointments = day_of_appointments(doctor_ids, day)
+        book_appointments(appointments)
+        db.session.commit()
+        booked += len(appointments)
+        db.session.expunge_all()
+    booking = time.perf_counter() - began
+    print(f"{booked} appointments for {DOCTORS} doctors over {DAYS} days ({booked // DAYS} a day)")
+    print(f"{'booked a day at a time':<36}{booking / booked * 1e6:>10.0f} us per appointment")
+
+
+def time_next_free(doctor_ids: list[int]) -> None:
+    began = time.perf_counter()
+    slots = [next_free_slot(doctor_id, START, 60) for doctor_id in doctor_ids]
+    tree = time.perf_counter() - began
+    began = time.perf_counter()
+    naive = [naive_next_free(doctor_id, START + timedelta(hours=8), timedelta(minutes=60)) for doctor_id in doctor_ids]
+    scan = time.perf_counter() - began
+    assert slots == naive
+    print(f"{'next free hour, interval tree':<36}{tree / DOCTORS * 1000:>10.2f} ms per doctor")
+    print(f"{'next free hour, query per slot':<36}{scan / DOCTORS * 1000:>10.2f} ms per doctor")
+
+
+def time_conflicts(doctor_id: int) -> None:
+    schedule = Schedule.load(doctor_id, START, START + timedelta(days=DAYS))
+    spans = [(a.starts_at, a.ends_at) for a in schedule.appointments]
+    queries = [(start + timedelta(minutes=5), end - timedelta(minutes=5)) for start, end in spans]
+    began = time.perf_counter()
+    for start, end in queries:
+        schedule.conflicts(start, end)
+    with_tree = time.perf_counter() - began
+    began = time.perf_counter()
+    for start, end in queries:
+        [span for span in spans if span[0] < end and span[1] > start]
+    linear = time.perf_counter() - began
+    built = time.perf_counter()
+    IntervalTree((start, end, None) for start, end in spans)
+    built = time.perf_counter() - built
+    print(f"{len(spans)} appointments of one doctor; tree built in {built * 1000:.1f} ms")
+    print(f"{'overlap check, interval tree':<36}{with_tree / len(queries) * 1e6:>10.1f} us")
+    print(f"{'overlap check, linear scan':<36}{linear / len(queries) * 1e6:>10.1f} us")
+
+
+def main() -> None:
+    app = make_app()
+    random.seed(1)
+    with app.app_context():
+        doctor_ids = populate()
+        time_booking(doctor_ids)
+        time_next_free(doctor_ids)
+        time_conflicts(doctor_ids[0])
+
+
+if __name__ == "__main__":
+    main()
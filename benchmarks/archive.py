@@ -0,0 +1,55 @@
+"""Size of inactive cards in cold storage and the cost of restoring one when it is opened.
+
+Archives ``COUNT`` cards with typical medical text, then compares their size as individual JSON rows with
+the compressed batches, and times opening an archived card against opening a hot one.
+"""
+import json
+import random
+from datetime import UTC, datetime, timedelta
+
+from common import login, make_app, timeit
+from sqlalchemy import select, update
+
+from mediarch import db
+from mediarch.archive import archive_inactive_patients, archive_stats
+from mediarch.history import json_value
+from mediarch.models import ArchivedPatient, BloodType, Patient
+
+COUNT = 20000
+REPEAT = 200
+CONDITIONS = ["Hypertension", "Type 2 diabetes", "Asthma", "None known", "Hypothyroidism", "Migraine"]
+
+
+def main() -> None:
+    app = make_app()
+    random.seed(1)
+    patients = Patient.__table__
+    with app.app_context():
+        db.session.add_all(Patient(
+            first_name=f"First{i}", last_name=f"Last{i:05d}", blood_type=random.choice(list(BloodType)),
+            medical_conditions=random.choice(CONDITIONS), allergies=random.choice(["Penicillin", None]),
+            notes=f"Routine check-up, no complaints. Follow-up in {random.randint(1, 12)} months.",
+        ) for i in range(COUNT))
+        db.session.commit()
+        rows = db.session.execute(select(patients)).all()
+        raw = sum(len(json.dumps({key: json_value(value) for key, value in row._mapping.items()})) for row in rows)
+        db.session.execute(update(patients).values(last_activity_at=datetime.now(UTC) - timedelta(days=3650)))
+        db.session.commit()
+        # The card of the benchmark's patient account is linked, so it stays hot.
+        hot_id = db.session.scalar(select(Patient.id).where(Patient.first_name == "Bench"))
+        archived = archive_inactive_patients(timedelta(days=365))
+        stats = archive_stats()
+    print(f"{archived} cards archived in {stats['archive_batches']} batches")
+    print(f"as JSON rows {raw / 1024:>10.0f} kB")
+    print(f"compressed   {stats['archive_bytes'] / 1024:>10.0f} kB ({raw / stats['archive_bytes']:.1f}x smaller)")
+
+    client = app.test_client()
+    login(client, "doctor")
+    with app.app_context():
+        archived_ids = iter(db.session.scalars(select(ArchivedPatient.patient_id)).all())
+    print(f"open hot card      {timeit(lambda: client.get(f'/patients/{hot_id}'), REPEAT):>8.0f} us")
+    print(f"open archived card {timeit(lambda: client.get(f'/patients/{next(archived_ids)}'), REPEAT):>8.0f} us")
+
+
+if __name__ == "__main__":
+    main()
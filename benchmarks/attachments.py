@@ -0,0 +1,114 @@
+"""Streaming attachment uploads and ranged downloads.
+
+Generates a file of ``BENCH_UPLOAD_MB`` megabytes (default 64) on the fly and measures:
+
+* the peak Python memory of storing it with ``store_stream``, chunk by chunk, against reading the whole
+  body first, as ``request.get_data()`` would;
+* upload throughput through the API's raw body and the patient page's multipart form, the second upload
+  of the same content being deduplicated;
+* downloads of the whole file and of 64 kB ranges at random offsets through the test client. Behind a
+  real WSGI server the whole file goes through ``wsgi.file_wrapper`` (``sendfile(2)``) instead.
+"""
+import hashlib
+import io
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from common import login, make_app, timeit
+
+from mediarch.attachments import store_stream
+
+SIZE = int(os.getenv("BENCH_UPLOAD_MB", "64")) * 1024 * 1024
+BLOCK = random.Random(1).randbytes(1024 * 1024)
+
+
+class GeneratedBody(io.RawIOBase):
+    """``SIZE`` bytes of pseudo-random content, produced as they are read."""
+
+    def __init__(self) -> None:
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:  # the test client measures the body
+        return True
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        self.position = {os.SEEK_SET: 0, os.SEEK_CUR: self.position, os.SEEK_END: SIZE}[whence] + offset
+        return self.position
+
+    def readinto(self, buffer) -> int:
+        count = min(len(buffer), SIZE - self.position)
+        offset = self.position % len(BLOCK)
+        chunk = (BLOCK[offset:] + BLOCK)[:count]
+        buffer[:count] = chunk
+        self.position += count
+        return count
+
+
+def peak_memory(fn) -> int:
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main() -> None:
+    root = tempfile.mkdtemp(prefix="mediarch-attachments-")
+    app = make_app(ATTACHMENTS_PATH=root, ATTACHMENTS_MAX_SIZE=2 * SIZE)
+    print(f"{SIZE / 1024 ** 2:.0f} MB file, stored in {root}")
+
+    with app.app_context():
+        streamed = peak_memory(lambda: store_stream(io.BufferedReader(GeneratedBody())))
+
+        def buffered() -> None:
+            body = io.BufferedReader(GeneratedBody()).read()
+            hashlib.sha256(body)
+            Path(root, "buffered").write_bytes(body)
+
+        whole = peak_memory(buffered)
+        os.unlink(os.path.join(root, "buffered"))
+    print(f"{'peak memory, streamed':<34}{streamed / 1024 ** 2:>10.2f} MB")
+    print(f"{'peak memory, whole body read':<34}{whole / 1024 ** 2:>10.2f} MB")
+
+    client = app.test_client()
+    login(client, "doctor")
+    began = time.perf_counter()
+    response = client.post("/api/v1/patients/1/attachments?filename=scan.bin", input_stream=GeneratedBody(),
+                           content_length=SIZE, content_type="application/octet-stream")
+    api = time.perf_counter() - began
+    assert response.status_code == 201, response.get_data(as_text=True)
+    url = response.get_json()["url"]
+    began = time.perf_counter()
+    client.post("/patients/1/attachments", content_type="multipart/form-data",
+                data={"file": (io.BufferedReader(GeneratedBody()), "scan-copy.bin")})
+    form = time.perf_counter() - began
+    print(f"{'upload, API raw body':<34}{SIZE / 1024 ** 2 / api:>10.0f} MB/s")
+    print(f"{'upload, multipart form (dedup)':<34}{SIZE / 1024 ** 2 / form:>10.0f} MB/s")
+    print(f"{'files stored for both uploads':<34}{sum(len(names) for _, _, names in os.walk(root)):>10}")
+
+    began = time.perf_counter()
+    assert len(client.get(url).get_data()) == SIZE
+    full = time.perf_counter() - began
+    print(f"{'download, whole file':<34}{SIZE / 1024 ** 2 / full:>10.0f} MB/s")
+    offsets = [random.randrange(SIZE - 65536) for _ in range(200)]
+    index = iter(offsets)
+
+    def ranged() -> None:
+        start = next(index)
+        response = client.get(url, headers={"Range": f"bytes={start}-{start + 65535}"})
+        assert response.status_code == 206
+        assert len(response.get_data()) == 65536
+
+    print(f"{'download, 64 kB range':<34}{timeit(ranged, len(offsets)) / 1000:>10.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
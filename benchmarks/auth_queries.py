@@ -0,0 +1,45 @@
+"""Per-request database queries spent on authentication, before and after session claims.
+
+"before" sets ``AUTH_CLAIMS_TTL=0``, which reloads the user from the database on every request
+exactly like the original ``user_loader`` did; "after" uses the default claim lifetime.
+"""
+from functools import partial
+
+from common import count_queries, login, make_app, timeit
+
+REPEAT = 200
+SCENARIOS = [
+    ("anonymous", None, "/"),
+    ("anonymous", None, "/login"),
+    ("admin", "admin", "/"),
+    ("admin", "admin", "/admin"),
+    ("doctor", "doctor", "/patients"),
+    ("patient", "patient", "/patients/1"),
+]
+
+
+def run(ttl: int) -> dict[tuple[str, str], tuple[float, float]]:
+    app = make_app(AUTH_CLAIMS_TTL=ttl)
+    results = {}
+    for label, username, path in SCENARIOS:
+        client = app.test_client()
+        if username:
+            login(client, username)
+        client.get(path)  # warm up
+        with count_queries(app) as statements:
+            mean_us = timeit(partial(client.get, path), REPEAT)
+        results[label, path] = (len(statements) / REPEAT, mean_us)
+    return results
+
+
+def main() -> None:
+    before, after = run(ttl=0), run(ttl=60)
+    print(f"{'scenario':<28}{'queries/req before':>20}{'after':>8}{'us/req before':>16}{'after':>10}")
+    for label, path in before:
+        q0, t0 = before[label, path]
+        q1, t1 = after[label, path]
+        print(f"{label + ' ' + path:<28}{q0:>20.2f}{q1:>8.2f}{t0:>16.0f}{t1:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
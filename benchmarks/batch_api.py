@@ -0,0 +1,48 @@
+"""Updating many patient cards: one edit form POST per patient versus one batch API request.
+
+Both paths apply the same change to ``COUNT`` patients; reports the total wall time and the number of
+SQL statements each needed.
+"""
+import time
+
+from common import count_queries, login, make_app
+
+from mediarch import db
+from mediarch.models import Patient
+
+COUNT = 100
+
+
+def main() -> None:
+    app = make_app()
+    with app.app_context():
+        patients = [Patient(first_name=f"First{i}", last_name=f"Last{i:04d}") for i in range(COUNT)]
+        db.session.add_all(patients)
+        db.session.commit()
+        ids = [patient.id for patient in patients]
+    client = app.test_client()
+    login(client, "doctor")
+
+    def one_by_one() -> None:
+        for patient_id in ids:
+            client.post(f"/patients/{patient_id}/edit", data={
+                "first_name": "Edited", "last_name": "Form", "notes": "one by one",
+            })
+
+    def batch() -> None:
+        client.patch("/api/v1/patients/batch", json={"updates": [
+            {"id": patient_id, "first_name": "Edited", "last_name": "Batch", "notes": "batch"} for patient_id in ids
+        ]})
+
+    print(f"{COUNT} patients updated")
+    print(f"{'path':<14}{'ms':>10}{'statements':>12}")
+    for label, update in [("edit form", one_by_one), ("batch API", batch)]:
+        with count_queries(app) as statements:
+            start = time.perf_counter()
+            update()
+            elapsed = (time.perf_counter() - start) * 1000
+        print(f"{label:<14}{elapsed:>10.1f}{len(statements):>12}")
+
+
+if __name__ == "__main__":
+    main()
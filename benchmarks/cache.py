@@ -0,0 +1,48 @@
+"""Server time of cache-backed pages with the cache disabled and enabled.
+
+The patient list renders its rows from the per-patient fragment cache, the admin dashboard reads its
+counts from the cache, and a session whose claims expired is refreshed from the cache instead of the
+users table. Also reports the cache's hit ratio after the run.
+"""
+from common import login, make_app, timeit
+
+from mediarch import db
+from mediarch.cache import current_cache
+from mediarch.models import Patient
+
+REPEAT = 200
+PATHS = ["/patients", "/admin"]
+
+
+def run(enabled: bool) -> None:
+    app = make_app(CACHE_ENABLED=enabled)
+    with app.app_context():
+        db.session.add_all(Patient(first_name=f"First{i}", last_name=f"Last{i:04d}") for i in range(200))
+        db.session.commit()
+    client = app.test_client()
+    login(client, "admin")
+    label = "enabled" if enabled else "disabled"
+    for path in PATHS:
+        client.get(path)
+        print(f"{path:<12}{label:<10}{timeit(lambda path=path: client.get(path), REPEAT):>12.0f}")
+
+    def expired_claims() -> None:
+        with client.session_transaction() as session:
+            session["_claims"] = {**session["_claims"], "iat": 0}
+        client.get("/")
+
+    print(f"{'reload user':<12}{label:<10}{timeit(expired_claims, REPEAT):>12.0f}")
+    if enabled:
+        with app.app_context():
+            stats = current_cache().stats()
+        print(f"hit ratio {stats['hit_ratio']:.3f}, {stats['entries']} entries")
+
+
+def main() -> None:
+    print(f"{'page':<12}{'cache':<10}{'us/request':>12}")
+    run(enabled=False)
+    run(enabled=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Cost for a downstream system to catch up after a few edits: full export versus the change feed.
+
+A full export pages through ``/api/v1/patients``; an incremental sync reads ``/api/v1/changes`` from the
+cursor of its previous sync. Reports wall time, requests and bytes transferred for each.
+"""
+import time
+
+from common import login, make_app
+
+from mediarch import db
+from mediarch.models import Patient
+
+PATIENTS = 5000
+EDITS = 50
+
+
+def full_export(client) -> tuple[int, int]:
+    requests, size, page, has_next = 0, 0, 1, True
+    while has_next:
+        response = client.get(f"/api/v1/patients?page={page}")
+        requests, size, page = requests + 1, size + len(response.data), page + 1
+        has_next = response.get_json()["has_next"]
+    return requests, size
+
+
+def incremental_sync(client, cursor: int) -> tuple[int, int]:
+    requests, size, has_more = 0, 0, True
+    while has_more:
+        response = client.get(f"/api/v1/changes?since={cursor}")
+        document = response.get_json()
+        requests, size = requests + 1, size + len(response.data)
+        cursor, has_more = document["cursor"], document["has_more"]
+    return requests, size
+
+
+def main() -> None:
+    app = make_app(API_PER_PAGE=500)
+    with app.app_context():
+        db.session.add_all(Patient(first_name=f"First{i}", last_name=f"Last{i:05d}") for i in range(PATIENTS))
+        db.session.commit()
+    client = app.test_client()
+    login(client, "admin")
+    cursor = client.get("/api/v1/changes?since=latest").get_json()["cursor"]
+    with app.app_context():
+        for patient in db.session.scalars(db.select(Patient).limit(EDITS)):
+            patient.notes = "Edited"
+        db.session.commit()
+
+    print(f"{PATIENTS} patients, {EDITS} edited since the last sync")
+    print(f"{'sync':<14}{'ms':>10}{'requests':>10}{'kB':>10}")
+    for label, sync in [("full export", lambda: full_export(client)),
+                        ("change feed", lambda: incremental_sync(client, cursor))]:
+        start = time.perf_counter()
+        requests, size = sync()
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"{label:<14}{elapsed:>10.1f}{requests:>10}{size / 1024:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
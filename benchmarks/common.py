@@ -0,0 +1,70 @@
+"""Shared helpers for the benchmark scripts.
+
+The scripts are meant to be run from the repository root, e.g. ``uv run python benchmarks/auth_queries.py``.
+They use an in-memory SQLite database unless ``DATABASE_URL`` is set.
+"""
+import os
+import time
+from collections.abc import Callable
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from mediarch import create_app, db
+from mediarch.models import AccountType, Patient, User
+
+PASSWORD = "password123"
+
+
+def make_app(**config):
+    """Create an app with an admin, a doctor and a patient account."""
+    app = create_app(test_config={
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": os.getenv("DATABASE_URL", "sqlite:///:memory:"),
+        "WTF_CSRF_ENABLED": False,
+        "SECRET_KEY": "benchmark",
+        **config,
+    })
+    with app.app_context():
+        db.create_all()
+        if not User.query.filter_by(username="admin").first():
+            patient = Patient(first_name="Bench", last_name="Patient")
+            db.session.add(patient)
+            for username, account_type in [("admin", AccountType.ADMIN), ("doctor", AccountType.DOCTOR),
+                                           ("patient", AccountType.PATIENT)]:
+                user = User(username=username, email=f"{username}@example.com", account_type=account_type)
+                user.set_password(PASSWORD)
+                if account_type == AccountType.PATIENT:
+                    user.patient_card = patient
+                db.session.add(user)
+            db.session.commit()
+    return app
+
+
+def login(client, username: str) -> None:
+    client.post("/login", data={"email": f"{username}@example.com", "password": PASSWORD})
+
+
+@contextmanager
+def count_queries(app):
+    """Collect the SQL statements executed while the block runs."""
+    statements: list[str] = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def timeit(fn: Callable[[], object], repeat: int) -> float:
+    """Mean wall time of ``fn`` in microseconds."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
@@ -0,0 +1,42 @@
+"""Bytes on the wire and compression CPU time per response, for each available encoding.
+
+Covers a paged patient list, the streamed full list and a JSON API page, with 1000 patients.
+"CPU us" is the extra time the middleware adds to a request compared to sending the page uncompressed.
+br and zstd are only measured when the ``brotli`` / ``zstandard`` packages are installed.
+"""
+from functools import partial
+
+from common import login, make_app, timeit
+
+from mediarch import db
+from mediarch.compress import COMPRESSORS
+from mediarch.models import Patient
+
+REPEAT = 50
+PAGES = ["/patients", "/patients?all=1", "/api/v1/patients"]
+
+
+def main() -> None:
+    app = make_app()
+    with app.app_context():
+        db.session.add_all(Patient(first_name=f"First{i}", last_name=f"Last{i:04d}") for i in range(1000))
+        db.session.commit()
+    client = app.test_client()
+    login(client, "admin")
+
+    def fetch(path: str, encoding: str) -> int:
+        return len(client.get(path, headers={"Accept-Encoding": encoding}).get_data())
+
+    print(f"{'page':<20}{'encoding':<10}{'bytes':>10}{'ratio':>8}{'us/request':>12}{'CPU us':>10}")
+    for path in PAGES:
+        identity = fetch(path, "identity")
+        base_us = timeit(partial(fetch, path, "identity"), REPEAT)
+        print(f"{path:<20}{'identity':<10}{identity:>10}{1:>8.1f}{base_us:>12.0f}{0:>10.0f}")
+        for encoding in COMPRESSORS:
+            size = fetch(path, encoding)
+            mean_us = timeit(partial(fetch, path, encoding), REPEAT)
+            print(f"{'':<20}{encoding:<10}{size:>10}{identity / size:>8.1f}{mean_us:>12.0f}{mean_us - base_us:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
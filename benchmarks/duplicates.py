@@ -0,0 +1,108 @@
+"""Duplicate detection with blocking keys against comparing every pair of cards.
+
+Creates ``COUNT`` cards from common first and last names with random birth dates, plus ``DUPLICATES``
+copies of existing cards with a typo, a swapped name or a missing birth date, then runs the blocked
+scan and reports its comparisons, time and how many of the planted duplicates it found. All pairs are
+scored on a sample and extrapolated, since scoring them all would take hours. The name pool is small, so
+many unrelated cards are namesakes, and a planted card without birth date is queued with each of them.
+"""
+import random
+import time
+from datetime import date, timedelta
+
+from common import make_app
+from sqlalchemy import func, insert, select
+
+from mediarch import db
+from mediarch.duplicates import Card, cached_similarity, find_duplicates, rebuild_match_keys, score_pair
+from mediarch.models import DuplicateCandidate, Patient, PatientMatchKey
+
+COUNT = 50000
+DUPLICATES = 500
+SAMPLE = 2000
+FIRST = ["James", "Mary", "John", "Patricia", "Robert", "Jennifer", "Michael", "Linda", "William", "Elizabeth",
+         "David", "Barbara", "Richard", "Susan", "Joseph", "Jessica", "Thomas", "Sarah", "Charles", "Karen"]
+LAST = [f"{stem}{suffix}" for stem in ("Smith", "Johns", "Willi", "Brown", "Jones", "Garc", "Mill", "Davis",
+                                       "Rodrig", "Mart", "Hern", "Lopez", "Gonz", "Wils", "Anders")
+        for suffix in ("", "on", "son", "er", "ez", "ing", "man", "ley", "ford", "ton")]
+
+
+def typo(name: str) -> str:
+    i = random.randrange(1, len(name))
+    return name[:i] + name[i + 1:] if random.random() < 0.5 else name[:i] + random.choice("aeiou") + name[i:]
+
+
+def planted(row) -> dict:
+    first, last, born = row.first_name, row.last_name, row.birth_date
+    change = random.choice(["typo", "swap", "no birth date"])
+    if change == "typo":
+        last = typo(last)
+    elif change == "swap":
+        first, last = last, first
+    else:
+        born = None
+    return {"first_name": first, "last_name": last, "birth_date": born}
+
+
+def generate_cards() -> set[tuple[int, int]]:
+    """The bench cards with the planted copies; returns the (original, copy) id pairs."""
+    patients = Patient.__table__
+    db.session.execute(insert(patients), [
+        {"first_name": random.choice(FIRST), "last_name": random.choice(LAST),
+         "birth_date": date(1930, 1, 1) + timedelta(days=random.randrange(30000))}
+        for _ in range(COUNT)
+    ])
+    originals = random.sample(db.session.execute(select(patients)).all(), DUPLICATES)
+    copies = db.session.scalars(insert(patients).returning(patients.c.id, sort_by_parameter_order=True),
+                                [planted(row) for row in originals]).all()
+    db.session.commit()
+    return {(row.id, copy) for row, copy in zip(originals, copies, strict=True)}
+
+
+def planted_found(expected: set[tuple[int, int]]) -> int:
+    """How many of the planted pairs the scan queued."""
+    queued = db.session.execute(select(DuplicateCandidate.patient_id, DuplicateCandidate.other_id)).tuples()
+    return len(expected & set(queued))
+
+
+def time_per_pair() -> float:
+    """Seconds to score one pair, measured over every pair of a sample."""
+    cards = [Card.from_row(row) for row in db.session.execute(select(Patient.__table__).limit(SAMPLE))]
+    similarity = cached_similarity()
+    start = time.perf_counter()
+    for i, a in enumerate(cards):
+        for b in cards[i + 1:]:
+            score_pair(a, b, similarity)
+    return (time.perf_counter() - start) / (SAMPLE * (SAMPLE - 1) / 2)
+
+
+def main() -> None:
+    app = make_app()
+    random.seed(1)
+    max_block = app.config["DUPLICATES_MAX_BLOCK"]
+    with app.app_context():
+        expected = generate_cards()
+        start = time.perf_counter()
+        rebuild_match_keys()
+        keys_time = time.perf_counter() - start
+
+        sizes = select(func.count().label("size")).select_from(PatientMatchKey).group_by(PatientMatchKey.key).subquery()
+        compared = db.session.scalar(select(func.sum(sizes.c.size * (sizes.c.size - 1) / 2))
+                                     .where(sizes.c.size.between(2, max_block)))
+        start = time.perf_counter()
+        queued = find_duplicates(max_block, app.config["DUPLICATES_MIN_SCORE"])
+        blocked_time = time.perf_counter() - start
+        found = planted_found(expected)
+        per_pair = time_per_pair()
+
+    total = COUNT + DUPLICATES
+    all_pairs = total * (total - 1) / 2
+    print(f"{total} cards, {DUPLICATES} planted duplicates")
+    print(f"blocking keys built in {keys_time:.1f} s")
+    print(f"blocked:   {compared:>14,.0f} comparisons {blocked_time:>10.1f} s, "
+          f"{queued} pairs queued, {found} of {DUPLICATES} planted duplicates found")
+    print(f"all pairs: {all_pairs:>14,.0f} comparisons {all_pairs * per_pair:>10.0f} s (extrapolated)")
+
+
+if __name__ == "__main__":
+    main()
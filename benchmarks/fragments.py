@@ -0,0 +1,31 @@
+"""Full page versus partial (``X-Fragment``) responses for the navigations main.js now does in place.
+
+For paging through the patient list and opening a patient card, reports the server time per request
+and the response size (uncompressed) of the full page and of the fragment main.js swaps in.
+"""
+from common import login, make_app, timeit
+
+from mediarch import db
+from mediarch.models import Patient
+
+REPEAT = 300
+CASES = [("/patients?page=2", "rows"), ("/patients/1", "main")]
+
+
+def main() -> None:
+    app = make_app()
+    with app.app_context():
+        db.session.add_all(Patient(first_name=f"First{i}", last_name=f"Last{i:04d}") for i in range(200))
+        db.session.commit()
+    client = app.test_client()
+    login(client, "admin")
+    print(f"{'navigation':<20}{'variant':<10}{'us/request':>12}{'bytes':>10}")
+    for path, kind in CASES:
+        for variant, headers in (("full", {}), (kind, {"X-Fragment": kind})):
+            size = len(client.get(path, headers=headers).data)
+            elapsed = timeit(lambda path=path, headers=headers: client.get(path, headers=headers), REPEAT)
+            print(f"{path:<20}{variant:<10}{elapsed:>12.0f}{size:>10}")
+
+
+if __name__ == "__main__":
+    main()
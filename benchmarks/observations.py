@@ -0,0 +1,74 @@
+"""Downsampled observation series against fetching every reading.
+
+Imports ``BENCH_YEARS`` years (default 10) of glucose readings every ``BENCH_MINUTES`` minutes (default 15)
+for one patient through ``import_csv``, then times the observations API for the whole range: the raw
+readings (paged by ``OBSERVATIONS_MAX_POINTS``, so all pages are fetched) and the series downsampled to
+``POINTS`` buckets, and the patient page that charts it.
+"""
+import os
+import random
+import time
+from datetime import UTC, datetime, timedelta
+
+from common import login, make_app, timeit
+
+from mediarch import db
+from mediarch.observations import import_csv
+
+YEARS = int(os.getenv("BENCH_YEARS", "10"))
+MINUTES = int(os.getenv("BENCH_MINUTES", "15"))
+POINTS = 300
+
+
+def readings(count: int, start: datetime):
+    yield "patient_id,code,observed_at,value,unit\n"
+    for i in range(count):
+        yield f"1,glucose,{(start + timedelta(minutes=i * MINUTES)).isoformat()},{random.gauss(6, 1.2):.1f},mmol/L\n"
+
+
+def fetch_all(client) -> tuple[int, int]:
+    """Fetch every raw reading page by page; return the rows and bytes received."""
+    rows = size = 0
+    url, query = "/api/v1/patients/1/observations/glucose", {}
+    while True:
+        response = client.get(url, query_string=query)
+        page = response.get_json()
+        rows += len(page["observations"])
+        size += len(response.data)
+        if not page["has_more"]:
+            return rows, size
+        query = {"start": page["next_start"]}
+
+
+def main() -> None:
+    app = make_app(OBSERVATIONS_MAX_POINTS=50000)
+    random.seed(1)
+    end = datetime.now(UTC).replace(second=0, microsecond=0)
+    start = end - timedelta(days=round(365.25 * YEARS))
+    count = int((end - start).total_seconds() // 60 // MINUTES)
+    with app.app_context():
+        began = time.perf_counter()
+        result = import_csv(readings(count, start))
+        imported = time.perf_counter() - began
+        db.session.remove()
+
+    client = app.test_client()
+    login(client, "doctor")
+    began = time.perf_counter()
+    rows, raw_bytes = fetch_all(client)
+    raw = time.perf_counter() - began
+    downsampled = client.get(f"/api/v1/patients/1/observations/glucose?points={POINTS}")
+    buckets = len(downsampled.get_json()["buckets"])
+    series = timeit(lambda: client.get(f"/api/v1/patients/1/observations/glucose?points={POINTS}"), 5)
+    page = timeit(lambda: client.get("/patients/1"), 5)
+
+    print(f"{result.inserted} readings over {YEARS} years, imported in {imported:.1f} s "
+          f"({result.inserted / imported:,.0f} rows/s)")
+    print(f"{'raw readings':<24}{raw * 1000:>10.0f} ms {rows:>9} rows {raw_bytes / 1e6:>8.1f} MB")
+    print(f"{'downsampled':<24}{series / 1000:>10.0f} ms {buckets:>9} rows "
+          f"{len(downsampled.data) / 1e6:>8.3f} MB")
+    print(f"{'patient page':<24}{page / 1000:>10.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
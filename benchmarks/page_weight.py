@@ -0,0 +1,68 @@
+"""Bytes and requests per navigation for a logged-in admin, with a simulated browser cache.
+
+Every page is fetched with ``Accept-Encoding: gzip``; the same-origin stylesheets, scripts and the icon
+sprite it references are fetched once and then served from the cache according to their
+``Cache-Control``: immutable assets cost nothing afterwards, ``no-cache`` ones cost a revalidation
+request each time. The Tailwind CDN script is third-party and not counted.
+
+Run it on two commits to compare, e.g. before and after moving the inline ``<style>``/``<script>``
+blocks of ``base.html`` into versioned static files.
+"""
+import re
+
+from common import login, make_app
+
+NAVIGATION = ["/", "/patients", "/patients/1", "/patients", "/admin", "/admin/users", "/patients/1/edit"]
+ASSET_RE = re.compile(r'(?:href|src)="(/static/[^"#]+)')
+INLINE_RE = re.compile(r"<(script|style)>(.*?)</\1>", re.DOTALL)
+
+
+class Browser:
+    def __init__(self, client) -> None:
+        self.client = client
+        self.cache: dict[str, str] = {}  # url -> "fresh" or "revalidate"
+
+    def fetch(self, url: str) -> tuple[int, int]:
+        """Return (bytes transferred, requests made) for one resource."""
+        policy = self.cache.get(url)
+        if policy == "fresh":
+            return 0, 0
+        response = self.client.get(url, headers={"Accept-Encoding": "gzip"})
+        cache_control = response.cache_control
+        if cache_control.immutable or (cache_control.max_age or 0) > 0:
+            self.cache[url] = "fresh"
+        else:
+            self.cache[url] = "revalidate"
+        # A revalidated resource is answered with an empty 304.
+        return (0 if policy == "revalidate" else len(response.get_data())), 1
+
+    def navigate(self, path: str) -> tuple[int, int, int]:
+        response = self.client.get(path, headers={"Accept-Encoding": "gzip"})
+        html = self.client.get(path).get_data(as_text=True)
+        inline = sum(len(body) for _, body in INLINE_RE.findall(html))
+        total, requests = len(response.get_data()), 1
+        for url in dict.fromkeys(ASSET_RE.findall(html)):
+            size, count = self.fetch(url)
+            total += size
+            requests += count
+        return total, requests, inline
+
+
+def main() -> None:
+    app = make_app()
+    client = app.test_client()
+    login(client, "admin")
+    browser = Browser(client)
+    print(f"{'navigation':<20}{'bytes':>10}{'requests':>10}{'inline CSS/JS':>15}")
+    totals = [0, 0]
+    for path in NAVIGATION:
+        size, requests, inline = browser.navigate(path)
+        totals[0] += size
+        totals[1] += requests
+        print(f"{path:<20}{size:>10}{requests:>10}{inline:>15}")
+    print(f"{'total':<20}{totals[0]:>10}{totals[1]:>10}")
+    print(f"{'per navigation':<20}{totals[0] / len(NAVIGATION):>10.0f}{totals[1] / len(NAVIGATION):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
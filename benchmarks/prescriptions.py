@@ -0,0 +1,76 @@
+"""Drug safety checks with the precomputed interaction index against matching the rules on every save.
+
+Loads the bundled dataset and times, for random medication lists of 5 to ``BENCH_MAX_DRUGS`` drugs
+(default 30) with two drug allergies, ``InteractionIndex.check`` against testing every pair of drugs
+against every rule by ATC prefix, which is what a check without the expanded index has to do. Both must
+find the same warnings. Then times a whole staff save of the edit form with a list of 15 drugs.
+"""
+import os
+import random
+import time
+
+from common import login, make_app, timeit
+
+from mediarch.prescriptions import ALLERGY, INTERACTION, SEVERITIES, load_index
+
+MAX_DRUGS = int(os.getenv("BENCH_MAX_DRUGS", "30"))
+ALLERGENS = ["J01C", "M01A"]
+
+
+def naive_check(rules, drugs: list[str], allergens: list[str]) -> set[tuple]:
+    """Every rule matched by prefix against every pair: the warnings as ``(kind, first, second, severity)``."""
+    found = {}
+
+    def add(key, severity):
+        if key not in found or SEVERITIES.index(severity) < SEVERITIES.index(found[key]):
+            found[key] = severity
+
+    for i, first in enumerate(drugs):
+        for second in drugs[i + 1:]:
+            for rule in rules:
+                if rule.kind == INTERACTION and (
+                        (first.startswith(rule.first) and second.startswith(rule.second))
+                        or (first.startswith(rule.second) and second.startswith(rule.first))):
+                    add((INTERACTION, first, second), rule.severity)
+    for allergen in allergens:
+        for drug in drugs:
+            if drug.startswith(allergen):
+                add((ALLERGY, allergen, drug), SEVERITIES[0])
+            for rule in rules:
+                if rule.kind == ALLERGY and allergen.startswith(rule.first) and drug.startswith(rule.second):
+                    add((ALLERGY, allergen, drug), rule.severity)
+    return {(*key, severity) for key, severity in found.items()}
+
+
+def main() -> None:
+    random.seed(1)
+    began = time.perf_counter()
+    index = load_index()
+    loaded = time.perf_counter() - began
+    rules = index._rules[len(index.names):]  # the dataset's own rules, without the implicit allergy ones
+    drugs = sorted(set(index.names) - index.classes)
+    print(f"{len(drugs)} drugs, {len(rules)} rules expanded to {len(index)} pairs, loaded in {loaded * 1000:.1f} ms")
+
+    for size in (5, 15, MAX_DRUGS):
+        lists = [random.sample(drugs, size) for _ in range(200)]
+        for listed in lists:
+            expected = naive_check(rules, listed, ALLERGENS)
+            assert {(w.kind, w.first, w.second, w.severity) for w in index.check(listed, ALLERGENS)} == expected
+        with_index = sum(timeit(lambda listed=listed: index.check(listed, ALLERGENS), 50) for listed in lists)
+        naive = sum(timeit(lambda listed=listed: naive_check(rules, listed, ALLERGENS), 5) for listed in lists)
+        print(f"{size:>3} drugs: index {with_index / len(lists):>8.1f} us, "
+              f"rule scan {naive / len(lists):>9.1f} us per check")
+
+    app = make_app()
+    client = app.test_client()
+    login(client, "doctor")
+    listed = random.sample(drugs, 15)
+    form = {"first_name": "Bench", "last_name": "Patient", "medication_form": "1", "confirm_warnings": "1",
+            "drug_code": listed, "dosage": ["1 tablet daily"] * len(listed), "allergen_code": ALLERGENS}
+    client.post("/patients/1/edit", data=form)
+    save = timeit(lambda: client.post("/patients/1/edit", data=form), 50)
+    print(f"staff save of the edit form with 15 drugs: {save / 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
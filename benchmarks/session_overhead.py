@@ -0,0 +1,45 @@
+"""Cookie header size and per-request cost of the session backends.
+
+Compares Flask's signed cookie session with the filesystem and SQLite server-side stores for a
+logged-in admin, both with an empty flash queue and with a few queued flash messages.
+"""
+import tempfile
+from functools import partial
+from pathlib import Path
+
+from common import login, make_app, timeit
+
+REPEAT = 300
+
+
+def cookie_header(client) -> str:
+    cookie = client.get_cookie(client.application.config["SESSION_COOKIE_NAME"])
+    return f"{cookie.key}={cookie.value}"
+
+
+def run(backend: str | None, store_dir: Path) -> tuple[int, int, float]:
+    app = make_app(SESSION_BACKEND=backend, SESSION_STORE_PATH=str(store_dir / (backend or "none")))
+    client = app.test_client()
+    login(client, "admin")
+    idle_size = len(cookie_header(client))
+
+    with client.session_transaction() as session:
+        session["_flashes"] = [("info", f"Queued notification number {i} for the admin.") for i in range(5)]
+    flashed_size = len(cookie_header(client))
+    with client.session_transaction() as session:
+        session.pop("_flashes")
+
+    mean_us = timeit(partial(client.get, "/admin"), REPEAT)
+    return idle_size, flashed_size, mean_us
+
+
+def main() -> None:
+    print(f"{'backend':<12}{'Cookie bytes':>14}{'with flashes':>14}{'us/request':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in (None, "filesystem", "sqlite"):
+            idle, flashed, mean_us = run(backend, Path(tmp))
+            print(f"{backend or 'cookie':<12}{idle:>14}{flashed:>14}{mean_us:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
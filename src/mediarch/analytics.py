@@ -0,0 +1,150 @@
+"""Cohort breakdowns of the patient registry for the admin analytics page.
+
+Everything is aggregated by the database: one ``GROUP BY`` over age band and blood type yields the age
+histogram, the blood type histogram and their cross-tab at once, and a second one groups the distinct
+``medical_conditions`` texts per age band. Only those grouped rows reach Python, so the cost in the
+application does not grow with the number of patients, only with the number of distinct values. The age
+band is a ``CASE`` over ``birth_date`` compared with cut-off dates computed for the report day, which
+works the same on every database and needs no per-row date arithmetic.
+
+Archived cards count towards the total and the age bands, from the birth dates of their
+``ArchivedPatient`` stubs. Their blood types and conditions are compressed in the archive batches, so those
+breakdowns cover the active cards only (``active`` in the report).
+
+``cohort_report`` caches its result per day under the ``patients`` tag, which archiving and restoring also
+invalidate, so any committed patient change recomputes it on the next view.
+"""
+import re
+from collections import Counter
+from datetime import date
+from itertools import pairwise
+
+from flask import current_app
+from sqlalchemy import case, func, select
+
+from . import db
+from .cache import cache_key, current_cache
+from .models import ArchivedPatient, BloodType, Patient
+
+# Lower bounds of the age bands, in years.
+AGE_BANDS = (0, 18, 30, 45, 65, 80)
+UNKNOWN_AGE = "Unknown"
+UNKNOWN_BLOOD_TYPE = "Not recorded"
+
+# Separators between the conditions of one free-text ``medical_conditions`` entry.
+_CONDITION_SEPARATORS = re.compile(r"[,;\n]+")
+
+
+def age_band_labels() -> list[str]:
+    """Labels of the age bands, youngest first, then ``UNKNOWN_AGE``."""
+    labels = [f"{lower}-{upper - 1}" for lower, upper in pairwise(AGE_BANDS)]
+    return [*labels, f"{AGE_BANDS[-1]}+", UNKNOWN_AGE]
+
+
+def blood_type_labels() -> list[str]:
+    return [*(blood_type.value for blood_type in BloodType), UNKNOWN_BLOOD_TYPE]
+
+
+def _years_before(day: date, years: int) -> date:
+    try:
+        return day.replace(year=day.year - years)
+    except ValueError:  # 29 February
+        return day.replace(year=day.year - years, day=28)
+
+
+def age_band(today: date, birth_date=Patient.birth_date):
+    """SQL expression: the age band label of ``birth_date`` (``Patient.birth_date``) on ``today``."""
+    labels = age_band_labels()
+    # Oldest band first: a card falls in the first band whose cut-off it was born on or before.
+    whens = [(birth_date <= _years_before(today, lower), labels[i])
+             for i, lower in reversed(list(enumerate(AGE_BANDS)))]
+    return case(*whens, else_=UNKNOWN_AGE)
+
+
+def split_conditions(text: str) -> list[str]:
+    """The conditions of one ``medical_conditions`` entry, stripped, without empty ones or repeats."""
+    seen = {}
+    for part in _CONDITION_SEPARATORS.split(text):
+        if condition := part.strip().rstrip("."):
+            seen.setdefault(condition.casefold(), condition)
+    return list(seen.values())
+
+
+def _archived_ages(today: date) -> list[int]:
+    """Archived cards per age band."""
+    band = age_band(today, ArchivedPatient.birth_date).label("band")
+    ages = age_band_labels()
+    counts = [0] * len(ages)
+    for label, count in db.session.execute(select(band, func.count()).group_by(band)):
+        counts[ages.index(label)] += count
+    return counts
+
+
+def _demographics(today: date) -> dict:
+    band = age_band(today).label("band")
+    ages, bloods = age_band_labels(), blood_type_labels()
+    crosstab = [[0] * len(bloods) for _ in ages]
+    for label, blood_type, count in db.session.execute(
+        select(band, Patient.blood_type, func.count())
+        .where(Patient.deleted_at.is_(None))
+        .group_by(band, Patient.blood_type)
+    ):
+        column = bloods.index(blood_type.value) if blood_type is not None else len(bloods) - 1
+        crosstab[ages.index(label)][column] += count
+    archived = _archived_ages(today)
+    active = sum(map(sum, crosstab))
+    return {
+        "total": active + sum(archived),
+        "active": active,
+        "archived": sum(archived),
+        "age_bands": [(label, sum(row) + stubs) for label, row, stubs in zip(ages, crosstab, archived, strict=True)],
+        "blood_types": list(zip(bloods, map(sum, zip(*crosstab, strict=True)), strict=True)),
+        "crosstab": crosstab,
+    }
+
+
+def _conditions(today: date, top: int) -> list[tuple[str, int, list[int]]]:
+    """The ``top`` most frequent conditions with their count overall and per age band."""
+    band = age_band(today).label("band")
+    ages = age_band_labels()
+    totals: Counter[str] = Counter()
+    by_band: dict[str, list[int]] = {}
+    names: dict[str, str] = {}
+    for label, text, count in db.session.execute(
+        select(band, Patient.medical_conditions, func.count())
+        .where(Patient.deleted_at.is_(None), Patient.medical_conditions.is_not(None))
+        .group_by(band, Patient.medical_conditions)
+    ):
+        column = ages.index(label)
+        for condition in split_conditions(text):
+            key = condition.casefold()
+            names.setdefault(key, condition)
+            totals[key] += count
+            by_band.setdefault(key, [0] * len(ages))[column] += count
+    return [(names[key], total, by_band[key]) for key, total in totals.most_common(top)]
+
+
+def compute_cohort_report(today: date, top_conditions: int = 20) -> dict:
+    """Age, blood type and condition breakdowns of the live patient cards, computed now.
+
+    ``total`` and ``age_bands`` include the archived cards; the blood types, the cross-tab and the
+    conditions describe the ``active`` cards only.
+    """
+    return {
+        "as_of": today.isoformat(),
+        "age_labels": age_band_labels(),
+        "blood_type_labels": blood_type_labels(),
+        **_demographics(today),
+        "conditions": _conditions(today, top_conditions),
+    }
+
+
+def cohort_report(today: date | None = None) -> dict:
+    """``compute_cohort_report`` for today, cached until a patient changes or ``ANALYTICS_CACHE_TTL`` passes."""
+    today = today or date.today()
+    config = current_app.config
+    return current_cache().get_or_set(
+        cache_key("cohort-report", today.isoformat()),
+        lambda: compute_cohort_report(today, config["ANALYTICS_TOP_CONDITIONS"]),
+        ttl=config["ANALYTICS_CACHE_TTL"], tags=["patients"],
+    )
@@ -0,0 +1,517 @@
+"""JSON API under ``/api/v1``, authenticated with the same session as the HTML views.
+
+The patient endpoints are also served natively by the async app in ``asgi.py``; both build their
+queries and responses with the helpers below so the two modes return identical documents.
+
+The batch endpoints read or update up to ``API_BATCH_MAX_SIZE`` patients per request with one ``IN``
+query and, for updates, one commit. They answer 200 with a result per requested patient, each carrying
+the status the single-patient endpoint or the edit form would have produced.
+
+Observations (see ``observations.py``) are read per patient and code, raw or downsampled into time
+buckets, and imported in bulk from CSV dumps.
+
+Appointments (see ``appointments.py``) are listed per doctor or patient and booked by admins and
+doctors; a booking that overlaps another answers 409 with the doctor's next free slot.
+
+Attachments (see ``attachments.py``) are uploaded as the raw request body, streamed to the store, and
+listed with the URL that downloads them.
+"""
+import io
+from datetime import UTC, date, datetime, timedelta
+
+from flask import Blueprint, current_app, jsonify, request, url_for
+from flask_login import current_user, login_required
+from sqlalchemy import Select, select
+from werkzeug.exceptions import BadRequest, Forbidden, HTTPException, NotFound, RequestEntityTooLarge
+
+from . import db
+from .appointments import (
+    BookingConflict,
+    BookingError,
+    book_appointment,
+    cancel_appointment,
+    list_appointments,
+    next_free_slot,
+)
+from .archive import is_archived, load_patient, restore_patients
+from .attachments import (
+    AttachmentTooLarge,
+    add_attachment,
+    can_delete_attachment,
+    load_attachment,
+    patient_attachments,
+    store_stream,
+)
+from .auth import STAFF_EDITABLE_FIELDS, can_view_patient, editable_patient_fields
+from .cache import current_cache
+from .changes import latest_seq, wait_for_changes
+from .models import AccountType, Appointment, AppointmentStatus, Attachment, BloodType, Job, Patient
+from .observations import (
+    as_utc,
+    bucket_seconds,
+    downsample,
+    first_observed,
+    import_csv,
+    normalize_code,
+    observations_between,
+    parse_time,
+    series_summary,
+)
+from .replica import replica_reads
+from .routes import admin_or_doctor_required, admin_required
+
+bp = Blueprint("api", __name__, url_prefix="/api/v1")
+
+
+def patient_list_query(page: int, per_page: int) -> Select:
+    """Live patients ordered like the HTML list, fetching one extra row to detect a next page."""
+    return (
+        select(Patient)
+        .where(Patient.deleted_at.is_(None))
+        .order_by(Patient.last_name, Patient.first_name, Patient.id)
+        .offset((page - 1) * per_page)
+        .limit(per_page + 1)
+    )
+
+
+def patient_list_document(patients: list[Patient], page: int, per_page: int) -> dict:
+    return {
+        "patients": [patient.to_dict() for patient in patients[:per_page]],
+        "page": page,
+        "has_next": len(patients) > per_page,
+    }
+
+
+@bp.errorhandler(HTTPException)
+def json_error(error: HTTPException):
+    """Return errors as JSON instead of HTML pages."""
+    return jsonify(error=error.name, message=error.description), error.code
+
+
+@bp.get("/jobs/<int:job_id>")
+@login_required
+@admin_required
+def job_status(job_id: int):
+    """Status, attempts, last error and result of a background job."""
+    job = db.session.get(Job, job_id)
+    if job is None:
+        raise NotFound
+    return jsonify(job.to_dict())
+
+
+@bp.get("/cache")
+@login_required
+@admin_required
+def cache_stats():
+    """Hit, miss and eviction counters of the cache of the worker answering the request."""
+    return jsonify(current_cache().stats())
+
+
+@bp.get("/changes")
+@login_required
+@admin_required
+def list_changes():
+    """Change feed entries after the cursor ``?since=`` (0, the default, is the beginning), oldest first.
+
+    ``?wait=<seconds>`` holds the request until an entry exists, at most ``CHANGES_MAX_WAIT`` seconds.
+    ``?since=latest`` returns no entries, only the current cursor, for consumers that start from a full
+    export: they take the cursor first, then export, then follow the feed from it.
+    """
+    config = current_app.config
+    since = request.args.get("since", "0")
+    if since == "latest":
+        return jsonify(changes=[], cursor=latest_seq(), has_more=False)
+    if not since.isdigit():
+        raise BadRequest("since must be a cursor returned by this endpoint.")
+    limit = min(max(request.args.get("limit", config["CHANGES_BATCH_SIZE"], type=int), 1),
+                config["CHANGES_BATCH_SIZE"])
+    wait = min(max(request.args.get("wait", 0, type=float), 0), config["CHANGES_MAX_WAIT"])
+    changes = wait_for_changes(int(since), limit + 1, wait, config["CHANGES_POLL_INTERVAL"])
+    batch = changes[:limit]
+    return jsonify(
+        changes=[change.to_dict() for change in batch],
+        cursor=batch[-1].seq if batch else int(since),
+        has_more=len(changes) > limit,
+    )
+
+
+@bp.get("/patients")
+@login_required
+@admin_or_doctor_required
+@replica_reads
+def list_patients():
+    """One page of live patients, ``?page=`` starting at 1."""
+    page = max(request.args.get("page", 1, type=int), 1)
+    per_page = current_app.config["API_PER_PAGE"]
+    patients = db.session.scalars(patient_list_query(page, per_page)).all()
+    return jsonify(patient_list_document(patients, page, per_page))
+
+
+@bp.get("/patients/<int:patient_id>")
+@login_required
+@replica_reads
+def get_patient(patient_id: int):
+    """A single patient card, with the same access rules as the patient detail page."""
+    patient = load_patient(patient_id, current_user)
+    if patient is None:
+        raise NotFound
+    if not can_view_patient(current_user, patient.id):
+        raise Forbidden
+    return jsonify(patient.to_dict())
+
+
+def _check_batch_size(count: int) -> None:
+    limit = current_app.config["API_BATCH_MAX_SIZE"]
+    if count > limit:
+        raise BadRequest(f"At most {limit} patients per batch, got {count}.")
+
+
+def _load_patients(ids: list[int]) -> dict[int, Patient]:
+    """The patients with ``ids`` by id, restoring the archived ones the current user may view."""
+    patients = {patient.id: patient for patient in db.session.scalars(select(Patient).where(Patient.id.in_(ids)))}
+    missing = {patient_id for patient_id in set(ids) - set(patients) if can_view_patient(current_user, patient_id)}
+    if missing and is_archived(missing) and (restored := restore_patients(missing)):
+        db.session.commit()
+        patients.update((patient.id, patient)
+                        for patient in db.session.scalars(select(Patient).where(Patient.id.in_(restored))))
+    return patients
+
+
+def _item_error(patient_id: int | None, error: HTTPException, message: str | None = None) -> dict:
+    return {"id": patient_id, "status": error.code, "error": error.name, "message": message or error.description}
+
+
+@bp.get("/patients/batch")
+@login_required
+@replica_reads
+def get_patients_batch():
+    """The patient cards ``?ids=1,2,3``, in that order, with the access rules of ``get_patient``."""
+    try:
+        ids = list(dict.fromkeys(int(part) for part in request.args.get("ids", "").split(",") if part.strip()))
+    except ValueError:
+        raise BadRequest("ids must be a comma-separated list of patient ids.") from None
+    _check_batch_size(len(ids))
+    patients = _load_patients(ids)
+    results = []
+    for patient_id in ids:
+        patient = patients.get(patient_id)
+        if patient is None:
+            results.append(_item_error(patient_id, NotFound()))
+        elif not can_view_patient(current_user, patient_id):
+            results.append(_item_error(patient_id, Forbidden()))
+        else:
+            results.append({"id": patient_id, "status": 200, "patient": patient.to_dict()})
+    return jsonify(results=results)
+
+
+def _name(value):
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError("must be a non-empty string")
+    return value
+
+
+def _optional_text(value):
+    if value is not None and not isinstance(value, str):
+        raise ValueError("must be a string or null")
+    return value or None
+
+
+def _birth_date(value):
+    if value is None:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError("must be a date in YYYY-MM-DD format or null") from None
+
+
+def _blood_type(value):
+    if value is None:
+        return None
+    try:
+        return BloodType(value)
+    except ValueError:
+        raise ValueError(f"must be one of {', '.join(b.value for b in BloodType)} or null") from None
+
+
+# Converts a JSON value of each editable field to the column value, like ``edit_patient`` parses its form.
+_FIELD_PARSERS = {
+    "first_name": _name,
+    "last_name": _name,
+    "birth_date": _birth_date,
+    "blood_type": _blood_type,
+    "allergies": _optional_text,
+    "medical_conditions": _optional_text,
+    "medications": _optional_text,
+    "notes": _optional_text,
+}
+
+
+def _apply_update(update, patients: dict[int, Patient]) -> dict:
+    """Apply one item of a batch update to its loaded patient and return the item's result."""
+    if not isinstance(update, dict) or not isinstance(update.get("id"), int):
+        return _item_error(None, BadRequest(), "Each update must be an object with an integer id.")
+    patient_id = update["id"]
+    fields = {key: value for key, value in update.items() if key != "id"}
+    patient = patients.get(patient_id)
+    if patient is None:
+        return _item_error(patient_id, NotFound())
+    editable = editable_patient_fields(current_user, patient_id)
+    if not editable:
+        return _item_error(patient_id, Forbidden())
+    if unknown := sorted(set(fields) - STAFF_EDITABLE_FIELDS):
+        return _item_error(patient_id, BadRequest(), f"Unknown fields: {', '.join(unknown)}.")
+    if denied := sorted(set(fields) - editable):
+        return _item_error(patient_id, Forbidden(), f"Not allowed to edit: {', '.join(denied)}.")
+    values = {}
+    for key, value in fields.items():
+        try:
+            values[key] = _FIELD_PARSERS[key](value)
+        except ValueError as e:
+            return _item_error(patient_id, BadRequest(), f"{key} {e}.")
+    for key, value in values.items():
+        setattr(patient, key, value)
+    return {"id": patient_id, "status": 200, "patient": patient.to_dict()}
+
+
+@bp.patch("/patients/batch")
+@login_required
+def update_patients_batch():
+    """Apply ``{"updates": [{"id": 1, "notes": "..."}, ...]}``, partial updates of several patients.
+
+    Valid items are committed together in one transaction; invalid ones change nothing and report why.
+    """
+    document = request.get_json(silent=True)
+    if not isinstance(document, dict) or not isinstance(document.get("updates"), list):
+        raise BadRequest('Expected a JSON object {"updates": [...]}.')
+    updates = document["updates"]
+    _check_batch_size(len(updates))
+    ids = [update["id"] for update in updates if isinstance(update, dict) and isinstance(update.get("id"), int)]
+    patients = _load_patients(ids)
+    results = [_apply_update(update, patients) for update in updates]
+    db.session.commit()
+    return jsonify(results=results, updated=sum(result["status"] == 200 for result in results))
+
+
+def _viewable_patient(patient_id: int) -> Patient:
+    patient = load_patient(patient_id, current_user)
+    if patient is None:
+        raise NotFound
+    if not can_view_patient(current_user, patient.id):
+        raise Forbidden
+    return patient
+
+
+def _time_arg(name: str) -> datetime | None:
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        return parse_time(value)
+    except ValueError:
+        raise BadRequest(f"{name} must be an ISO 8601 time.") from None
+
+
+@bp.get("/patients/<int:patient_id>/observations")
+@login_required
+@replica_reads
+def list_observation_codes(patient_id: int):
+    """The observation codes recorded for a patient, with their count and time span."""
+    _viewable_patient(patient_id)
+    return jsonify(codes=[{**summary, "first": summary["first"].isoformat(), "last": summary["last"].isoformat()}
+                          for summary in series_summary(patient_id)])
+
+
+@bp.get("/patients/<int:patient_id>/observations/<code>")
+@login_required
+@replica_reads
+def get_observations(patient_id: int, code: str):
+    """Observations of one code from ``?start=`` (inclusive) to ``?end=`` (exclusive), ISO 8601 times.
+
+    ``?points=N`` aggregates the range into at most N equal time buckets with their min, max, mean and
+    count. Otherwise the rows are returned oldest first, at most ``OBSERVATIONS_MAX_POINTS``; when
+    ``has_more`` is true, request again with ``start`` set to ``next_start``. The code is matched as
+    the import stores it, in lowercase.
+    """
+    _viewable_patient(patient_id)
+    try:
+        code = normalize_code(code)
+    except ValueError:
+        raise BadRequest(f"{code!r} is not a valid observation code.") from None
+    limit = current_app.config["OBSERVATIONS_MAX_POINTS"]
+    start = _time_arg("start") or datetime(1900, 1, 1, tzinfo=UTC)
+    end = _time_arg("end") or datetime.now(UTC) + timedelta(seconds=1)
+    if end <= start:
+        raise BadRequest("end must be after start.")
+    points = request.args.get("points", type=int)
+    if points is not None:
+        if not 1 <= points <= limit:
+            raise BadRequest(f"points must be between 1 and {limit}.")
+        if (first := first_observed(patient_id, code)) is not None:
+            start = max(start, first)  # buckets over the recorded span, not since 1900
+        buckets = downsample(patient_id, code, start, end, points)
+        return jsonify(code=code, start=start.isoformat(), end=end.isoformat(),
+                       bucket_seconds=bucket_seconds(start, end, points),
+                       buckets=[bucket.to_dict() for bucket in buckets])
+    rows = observations_between(patient_id, code, start, end, limit + 1)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return jsonify(code=code, observations=[row.to_dict() for row in rows], has_more=has_more,
+                   next_start=(as_utc(rows[-1].observed_at) + timedelta(microseconds=1)).isoformat()
+                   if has_more else None)
+
+
+@bp.post("/observations/import")
+@login_required
+@admin_or_doctor_required
+def import_observations():
+    """Import a CSV dump of observations sent as the request body (see ``observations.py`` for the format).
+
+    The body is streamed; the response counts inserted, duplicate and rejected rows and lists the first
+    errors by line.
+    """
+    lines = io.TextIOWrapper(request.stream, encoding="utf-8-sig", newline="")
+    try:
+        result = import_csv(lines, current_app.config["OBSERVATIONS_IMPORT_BATCH_SIZE"])
+    except (ValueError, UnicodeDecodeError) as e:
+        raise BadRequest(str(e)) from None
+    return jsonify(result.to_dict())
+
+
+@bp.get("/appointments")
+@login_required
+@replica_reads
+def get_appointments():
+    """Scheduled appointments starting from ``?start=`` (default now) to ``?end=`` (default a week later).
+
+    Admins and doctors filter by ``?doctor_id=`` and ``?patient_id=``; patient accounts always get the
+    appointments of their own card. The range spans at most ``APPOINTMENTS_SEARCH_DAYS``.
+    """
+    start = _time_arg("start") or datetime.now(UTC)
+    end = _time_arg("end") or start + timedelta(days=7)
+    if not start < end <= start + timedelta(days=current_app.config["APPOINTMENTS_SEARCH_DAYS"]):
+        raise BadRequest("end must be after start, within APPOINTMENTS_SEARCH_DAYS.")
+    doctor_id, patient_id = request.args.get("doctor_id", type=int), request.args.get("patient_id", type=int)
+    if current_user.account_type == AccountType.PATIENT:
+        if current_user.patient_id is None:
+            return jsonify(appointments=[])
+        patient_id = current_user.patient_id
+    booked = list_appointments(start, end, doctor_id=doctor_id, patient_id=patient_id)
+    return jsonify(appointments=[appointment.to_dict() for appointment in booked])
+
+
+def _free_slot_document(doctor_id: int, after: datetime, minutes: int) -> dict:
+    slot = next_free_slot(doctor_id, after, minutes)
+    return {"doctor_id": doctor_id, "starts_at": slot.isoformat() if slot else None,
+            "ends_at": (slot + timedelta(minutes=minutes)).isoformat() if slot else None}
+
+
+@bp.get("/doctors/<int:doctor_id>/free-slot")
+@login_required
+@replica_reads
+def get_free_slot(doctor_id: int):
+    """A doctor's first free slot of ``?minutes=`` at or after ``?after=`` (default now), or nulls."""
+    minutes = request.args.get("minutes", current_app.config["APPOINTMENTS_DEFAULT_MINUTES"], type=int)
+    if not 1 <= minutes <= current_app.config["APPOINTMENTS_MAX_MINUTES"]:
+        raise BadRequest("minutes must be between 1 and APPOINTMENTS_MAX_MINUTES.")
+    return jsonify(_free_slot_document(doctor_id, _time_arg("after") or datetime.now(UTC), minutes))
+
+
+@bp.post("/appointments")
+@login_required
+@admin_or_doctor_required
+def create_appointment():
+    """Book ``{"doctor_id", "patient_id", "starts_at", "minutes", "reason"}``; ``minutes`` and ``reason`` are optional.
+
+    Answers 201 with the appointment, or 409 with the doctor's next free slot if the time is taken.
+    """
+    document = request.get_json(silent=True)
+    if not isinstance(document, dict):
+        raise BadRequest("Expected a JSON object.")
+    doctor_id, patient_id = document.get("doctor_id"), document.get("patient_id")
+    minutes = document.get("minutes", current_app.config["APPOINTMENTS_DEFAULT_MINUTES"])
+    if not all(isinstance(value, int) for value in (doctor_id, patient_id, minutes)):
+        raise BadRequest("doctor_id, patient_id and minutes must be integers.")
+    try:
+        starts_at = parse_time(document.get("starts_at") or "")
+        reason = _optional_text(document.get("reason"))
+    except ValueError:
+        raise BadRequest("starts_at must be an ISO 8601 time and reason a string or null.") from None
+    if load_patient(patient_id, current_user) is None:
+        raise NotFound(f"Patient #{patient_id} does not exist.")
+    try:
+        appointment = book_appointment(doctor_id, patient_id, starts_at, minutes, reason, booked_by_id=current_user.id)
+    except BookingConflict as e:
+        db.session.rollback()
+        return jsonify(error="Conflict", message=str(e),
+                       conflicts=[appointment.id for appointment in e.conflicts],
+                       next_free=_free_slot_document(doctor_id, starts_at, minutes)), 409
+    except BookingError as e:
+        db.session.rollback()
+        raise BadRequest(str(e)) from None
+    db.session.commit()
+    return jsonify(appointment.to_dict()), 201
+
+
+@bp.post("/appointments/<int:appointment_id>/cancel")
+@login_required
+def cancel_appointment_api(appointment_id: int):
+    """Cancel a scheduled appointment; patients can only cancel those of their own card."""
+    appointment = db.session.get(Appointment, appointment_id)
+    if appointment is None or appointment.status != AppointmentStatus.SCHEDULED:
+        raise NotFound
+    if not can_view_patient(current_user, appointment.patient_id):
+        raise Forbidden
+    cancel_appointment(appointment)
+    db.session.commit()
+    return jsonify(appointment.to_dict())
+
+
+def _attachment_document(attachment: Attachment) -> dict:
+    return {**attachment.to_dict(), "url": url_for("main.download_attachment", attachment_id=attachment.id)}
+
+
+@bp.get("/patients/<int:patient_id>/attachments")
+@login_required
+@replica_reads
+def list_attachments(patient_id: int):
+    """A patient's attachments, newest first, with the URL of each file."""
+    _viewable_patient(patient_id)
+    return jsonify(attachments=[_attachment_document(attachment) for attachment in patient_attachments(patient_id)])
+
+
+@bp.post("/patients/<int:patient_id>/attachments")
+@login_required
+def upload_attachment(patient_id: int):
+    """Attach the request body as a file named ``?filename=``, of the request's ``Content-Type``.
+
+    The body is streamed to the store; answers 201 with the attachment, or 413 beyond ``ATTACHMENTS_MAX_SIZE``.
+    """
+    patient = _viewable_patient(patient_id)
+    filename = request.args.get("filename", "").strip()
+    if not filename:
+        raise BadRequest("filename is required.")
+    max_size = current_app.config["ATTACHMENTS_MAX_SIZE"]
+    try:
+        if (request.content_length or 0) > max_size:  # refused before reading the body
+            raise AttachmentTooLarge(max_size)
+        writer = store_stream(request.stream)
+    except AttachmentTooLarge as e:
+        raise RequestEntityTooLarge(str(e)) from None
+    attachment = add_attachment(patient, writer, filename, request.mimetype or None, current_user.id)
+    db.session.commit()
+    return jsonify(_attachment_document(attachment)), 201
+
+
+@bp.delete("/attachments/<int:attachment_id>")
+@login_required
+def delete_attachment_api(attachment_id: int):
+    """Delete an attachment; patients can only delete the files they attached themselves. Answers 204."""
+    attachment = load_attachment(attachment_id, current_user)
+    if attachment is None:
+        raise NotFound
+    if not can_view_patient(current_user, attachment.patient_id) or not can_delete_attachment(current_user, attachment):
+        raise Forbidden
+    db.session.delete(attachment)
+    db.session.commit()
+    return "", 204
@@ -0,0 +1,300 @@
+"""Appointments: doctors' schedules, double-booking checks and free slot search.
+
+An ``Appointment`` books a patient card with a doctor (a user with ``AccountType.DOCTOR``) over
+``[starts_at, ends_at)``, stored in UTC. A doctor's scheduled appointments must not overlap:
+
+* On PostgreSQL the exclusion constraint ``ex_appointments_doctor_overlap`` enforces it with a GiST index
+  over the doctor and ``tstzrange(starts_at, ends_at)``, so two concurrent bookings of the same time cannot
+  both commit. The index needs the ``btree_gist`` extension, which is created with the table.
+* SQLite has no interval index. ``book_appointments`` inserts the new rows first, which takes SQLite's
+  single write lock until the commit, then loads each doctor's appointments around them into an
+  ``IntervalTree`` and checks every new one against it in O(log n + k).
+
+A ``Schedule`` is one doctor's scheduled appointments over a time range, read with one indexed query and
+held in an ``IntervalTree``. Since no appointment lasts longer than ``APPOINTMENTS_MAX_MINUTES``, only
+those starting at most that long before the range can reach into it, which bounds the scan. Free slots
+lie within the working hours, ``APPOINTMENTS_DAY_START`` to ``APPOINTMENTS_DAY_END`` in
+``APPOINTMENTS_TIMEZONE``, on a grid of ``APPOINTMENTS_SLOT_MINUTES``; ``Schedule.next_free`` jumps past
+each appointment in the way instead of testing every slot.
+"""
+from collections import defaultdict
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from datetime import UTC, date, datetime, time, timedelta
+from operator import itemgetter
+from zoneinfo import ZoneInfo
+
+from flask import current_app
+from sqlalchemy import DDL, event, select
+from sqlalchemy.exc import IntegrityError
+
+from . import db
+from .models import AccountType, Appointment, AppointmentStatus, Patient, User
+from .observations import as_utc
+
+# SQLSTATE of exclusion constraint violations.
+EXCLUSION_VIOLATION = "23P01"
+# A free slot is searched this many days of schedule at a time.
+SEARCH_CHUNK = timedelta(days=7)
+
+event.listen(Appointment.__table__, "before_create",
+             DDL("CREATE EXTENSION IF NOT EXISTS btree_gist").execute_if(dialect="postgresql"))
+
+
+class BookingError(Exception):
+    """The appointment cannot be booked; the message says why."""
+
+
+class BookingConflict(BookingError):
+    """The doctor already has an appointment at that time.
+
+    ``conflicts`` are the appointments in the way; PostgreSQL's constraint does not name them, so they
+    are empty there.
+    """
+
+    def __init__(self, appointment: Appointment | None = None, conflicts: list[Appointment] | None = None) -> None:
+        self.appointment = appointment
+        self.conflicts = conflicts or []
+        super().__init__("The doctor already has an appointment at that time.")
+
+
+class IntervalTree:
+    """Static interval tree over half-open ``(start, end, item)`` intervals.
+
+    The intervals are kept sorted by start and the tree is implicit: the node of ``intervals[lo:hi]`` is
+    its middle element, and ``_max_end`` holds the latest end below each node. A search skips subtrees
+    that end before the query starts, and right subtrees that start after it ends.
+    """
+
+    def __init__(self, intervals: Iterable[tuple]) -> None:
+        self._intervals = sorted(intervals, key=itemgetter(0))
+        self._max_end: list = [None] * len(self._intervals)
+        if self._intervals:
+            self._build(0, len(self._intervals))
+
+    def _build(self, lo: int, hi: int):
+        mid = (lo + hi) // 2
+        latest = self._intervals[mid][1]
+        if lo < mid:
+            latest = max(latest, self._build(lo, mid))
+        if mid + 1 < hi:
+            latest = max(latest, self._build(mid + 1, hi))
+        self._max_end[mid] = latest
+        return latest
+
+    def __len__(self) -> int:
+        return len(self._intervals)
+
+    def overlapping(self, start, end) -> list:
+        """Items of the intervals that overlap ``[start, end)``, by start."""
+        found = []
+        stack = [(0, len(self._intervals))] if self._intervals else []
+        while stack:
+            lo, hi = stack.pop()
+            mid = (lo + hi) // 2
+            if self._max_end[mid] <= start:
+                continue
+            if lo < mid:
+                stack.append((lo, mid))
+            interval_start, interval_end, _ = self._intervals[mid]
+            if interval_start < end:
+                if interval_end > start:
+                    found.append(mid)
+                if mid + 1 < hi:
+                    stack.append((mid + 1, hi))
+        return [self._intervals[i][2] for i in sorted(found)]
+
+
+@dataclass(frozen=True)
+class WorkingHours:
+    zone: ZoneInfo
+    day_start: int  # hours
+    day_end: int
+    slot: timedelta
+
+    @classmethod
+    def from_config(cls, config) -> "WorkingHours":
+        return cls(ZoneInfo(config["APPOINTMENTS_TIMEZONE"]), config["APPOINTMENTS_DAY_START"],
+                   config["APPOINTMENTS_DAY_END"], timedelta(minutes=config["APPOINTMENTS_SLOT_MINUTES"]))
+
+    def local_day(self, moment: datetime) -> date:
+        return as_utc(moment).astimezone(self.zone).date()
+
+    def day_bounds(self, day: date) -> tuple[datetime, datetime]:
+        """Start and end of the local calendar ``day``, in UTC."""
+        return (datetime.combine(day, time(), tzinfo=self.zone).astimezone(UTC),
+                datetime.combine(day + timedelta(days=1), time(), tzinfo=self.zone).astimezone(UTC))
+
+    def window(self, day: date) -> tuple[datetime, datetime]:
+        """Opening and closing time of ``day``, in UTC."""
+        midnight = datetime.combine(day, time(), tzinfo=self.zone)
+        return ((midnight + timedelta(hours=self.day_start)).astimezone(UTC),
+                (midnight + timedelta(hours=self.day_end)).astimezone(UTC))
+
+    def align(self, moment: datetime, opens: datetime) -> datetime:
+        """The first slot of the day opening at ``opens`` that starts at or after ``moment``."""
+        return opens + -((opens - moment) // self.slot) * self.slot
+
+
+def _span(appointment: Appointment) -> tuple[datetime, datetime, Appointment]:
+    return as_utc(appointment.starts_at), as_utc(appointment.ends_at), appointment
+
+
+class Schedule:
+    """A doctor's scheduled appointments that overlap ``[start, end)``."""
+
+    def __init__(self, doctor_id: int, start: datetime, end: datetime, appointments: list[Appointment]) -> None:
+        self.doctor_id, self.start, self.end = doctor_id, as_utc(start), as_utc(end)
+        self.appointments = appointments
+        self._tree = IntervalTree(map(_span, appointments))
+
+    @classmethod
+    def load(cls, doctor_id: int, start: datetime, end: datetime) -> "Schedule":
+        start, end = as_utc(start), as_utc(end)
+        longest = timedelta(minutes=current_app.config["APPOINTMENTS_MAX_MINUTES"])
+        appointments = db.session.scalars(
+            select(Appointment)
+            .where(Appointment.doctor_id == doctor_id, Appointment.status == AppointmentStatus.SCHEDULED,
+                   Appointment.starts_at > start - longest, Appointment.starts_at < end,
+                   Appointment.ends_at > start)
+            .order_by(Appointment.starts_at)
+        ).all()
+        return cls(doctor_id, start, end, appointments)
+
+    def conflicts(self, start: datetime, end: datetime, ignore: Appointment | None = None) -> list[Appointment]:
+        """The appointments overlapping ``[start, end)``, other than ``ignore``."""
+        return [a for a in self._tree.overlapping(as_utc(start), as_utc(end)) if a is not ignore]
+
+    def next_free(self, after: datetime, length: timedelta, hours: WorkingHours) -> datetime | None:
+        """Start of the first free slot of ``length`` at or after ``after`` within this schedule's range."""
+        after = max(as_utc(after), self.start)
+        day = hours.local_day(after)
+        while True:
+            opens, closes = hours.window(day)
+            if opens >= self.end:
+                return None
+            slot = hours.align(max(after, opens), opens)
+            while slot + length <= min(closes, self.end):
+                busy = self._tree.overlapping(slot, slot + length)
+                if not busy:
+                    return slot
+                slot = hours.align(max(as_utc(a.ends_at) for a in busy), opens)
+            day += timedelta(days=1)
+
+
+def next_free_slot(doctor_id: int, after: datetime, minutes: int | None = None,
+                   days: int | None = None) -> datetime | None:
+    """Start of a doctor's first free slot of ``minutes`` at or after ``after``, searching ``days`` ahead."""
+    config = current_app.config
+    hours = WorkingHours.from_config(config)
+    length = timedelta(minutes=minutes or config["APPOINTMENTS_DEFAULT_MINUTES"])
+    after = as_utc(after)
+    until = after + timedelta(days=days or config["APPOINTMENTS_SEARCH_DAYS"])
+    start = after
+    while start < until:
+        # Each chunk's schedule reaches ``length`` past it, so a slot across the boundary is seen whole.
+        end = min(start + SEARCH_CHUNK, until)
+        slot = Schedule.load(doctor_id, start, end + length).next_free(start, length, hours)
+        if slot is not None:
+            return slot if slot < until else None
+        start = end
+    return None
+
+
+def _is_overlap_violation(error: IntegrityError) -> bool:
+    orig = error.orig
+    return (getattr(orig, "sqlstate", None) or getattr(orig, "pgcode", None)) == EXCLUSION_VIOLATION
+
+
+def _check_overlaps(appointments: list[Appointment]) -> None:
+    """Raise ``BookingConflict`` if a flushed new appointment overlaps another of its doctor's."""
+    by_doctor: dict[int, list[Appointment]] = defaultdict(list)
+    for appointment in appointments:
+        by_doctor[appointment.doctor_id].append(appointment)
+    for doctor_id, booked in by_doctor.items():
+        schedule = Schedule.load(doctor_id, min(a.starts_at for a in booked), max(a.ends_at for a in booked))
+        for appointment in booked:
+            if conflicts := schedule.conflicts(appointment.starts_at, appointment.ends_at, ignore=appointment):
+                raise BookingConflict(appointment, conflicts)
+
+
+def book_appointments(appointments: list[Appointment], booked_by_id: int | None = None) -> list[Appointment]:
+    """Book new appointments all together; the caller commits, or rolls back on ``BookingError``.
+
+    Raises ``BookingError`` for an invalid time, doctor or patient, and ``BookingConflict`` if one would
+    overlap another scheduled appointment of its doctor, including one of the others booked here.
+    """
+    if not appointments:
+        return []
+    config = current_app.config
+    longest = config["APPOINTMENTS_MAX_MINUTES"]
+    for appointment in appointments:
+        appointment.starts_at, appointment.ends_at = as_utc(appointment.starts_at), as_utc(appointment.ends_at)
+        if appointment.ends_at <= appointment.starts_at:
+            raise BookingError("An appointment must end after it starts.")
+        if appointment.ends_at - appointment.starts_at > timedelta(minutes=longest):
+            raise BookingError(f"An appointment lasts at most {longest} minutes.")
+        appointment.status = AppointmentStatus.SCHEDULED
+        appointment.booked_by_id = booked_by_id
+
+    doctor_ids = {a.doctor_id for a in appointments}
+    doctors = set(db.session.scalars(select(User.id).where(User.id.in_(doctor_ids),
+                                                           User.account_type == AccountType.DOCTOR)))
+    if missing := sorted(doctor_ids - doctors):
+        raise BookingError(f"User #{missing[0]} is not a doctor.")
+    patient_ids = {a.patient_id for a in appointments}
+    patients = set(db.session.scalars(select(Patient.id).where(Patient.id.in_(patient_ids))))
+    if missing := sorted(patient_ids - patients):
+        raise BookingError(f"Patient #{missing[0]} does not exist.")
+
+    db.session.add_all(appointments)
+    try:
+        db.session.flush()
+    except IntegrityError as e:
+        if _is_overlap_violation(e):
+            raise BookingConflict from e
+        raise
+    if db.engine.dialect.name != "postgresql":
+        _check_overlaps(appointments)
+    return appointments
+
+
+def book_appointment(doctor_id: int, patient_id: int, starts_at: datetime, minutes: int,
+                     reason: str | None = None, booked_by_id: int | None = None) -> Appointment:
+    """Book one appointment; see ``book_appointments``."""
+    appointment = Appointment(doctor_id=doctor_id, patient_id=patient_id, starts_at=starts_at,
+                              ends_at=starts_at + timedelta(minutes=minutes), reason=reason or None)
+    return book_appointments([appointment], booked_by_id)[0]
+
+
+def cancel_appointment(appointment: Appointment) -> None:
+    """Cancel ``appointment``, freeing its time; the caller commits."""
+    appointment.status = AppointmentStatus.CANCELLED
+
+
+def list_appointments(start: datetime, end: datetime, *, doctor_id: int | None = None,
+                      patient_id: int | None = None) -> list[Appointment]:
+    """Scheduled appointments starting in ``[start, end)`` of a doctor or a patient, earliest first."""
+    query = (select(Appointment)
+             .where(Appointment.status == AppointmentStatus.SCHEDULED,
+                    Appointment.starts_at >= as_utc(start), Appointment.starts_at < as_utc(end))
+             .order_by(Appointment.starts_at))
+    if doctor_id is not None:
+        query = query.where(Appointment.doctor_id == doctor_id)
+    if patient_id is not None:
+        query = query.where(Appointment.patient_id == patient_id)
+    return db.session.scalars(query).all()
+
+
+def doctors() -> list[User]:
+    """Active doctor accounts, by name."""
+    return db.session.scalars(select(User).where(User.account_type == AccountType.DOCTOR, User.is_active)
+                              .order_by(User.username)).all()
+
+
+def local_times(appointments: Iterable[Appointment],
+                zone: ZoneInfo) -> Iterator[tuple[Appointment, datetime, datetime]]:
+    """``(appointment, start, end)`` with the times in ``zone``, for display."""
+    for appointment in appointments:
+        start, end, _ = _span(appointment)
+        yield appointment, start.astimezone(zone), end.astimezone(zone)
@@ -0,0 +1,224 @@
+"""Cold storage for inactive patient cards.
+
+Cards nobody has edited or opened for ``ARCHIVE_AFTER_DAYS`` are moved out of ``patients`` by the
+``patients.archive`` job, so the hot table and its indexes only hold cards in use. Each run archives
+bounded batches, each in its own short transaction: the cards of a batch are stored together as one
+zlib-compressed, column-oriented ``PatientArchiveBatch`` and removed from ``patients``.
+
+Opening an archived card puts it back: ``restore_patients`` copies the row out of its batch, with the same
+id, and the card is hot again, with fresh duplicate-matching keys. ``load_patient`` only restores a card
+for a user allowed to view it. Each card leaves a small ``ArchivedPatient`` stub with its names and birth
+date, which staff can list and search (``archived_patients_query``) and the duplicate detection compares.
+Cards linked to a user account are never archived, since the account can log in at any time, nor are
+cards with an upcoming appointment.
+
+Activity is ``Patient.last_activity_at``, set by every ORM update and, at most once per
+``ARCHIVE_TOUCH_INTERVAL``, by ``touch_patient`` when the card is viewed.
+"""
+import enum
+import json
+import zlib
+from collections.abc import Iterable
+from datetime import UTC, date, datetime, timedelta
+
+from flask import current_app, has_app_context
+from sqlalchemy import delete, func, insert, or_, select, update
+
+from . import db
+from .auth import can_view_patient
+from .cache import EXTENSION_KEY as CACHE_EXTENSION_KEY
+from .cache import current_cache
+from .duplicates import blocking_keys
+from .history import json_value
+from .jobs import job
+from .models import (
+    Appointment,
+    AppointmentStatus,
+    ArchivedPatient,
+    Patient,
+    PatientArchiveBatch,
+    PatientMatchKey,
+    User,
+)
+
+
+def _columns():
+    return list(Patient.__table__.columns)
+
+
+def encode_batch(rows) -> bytes:
+    """Compress ``patients`` rows (Core rows) into one column-oriented blob."""
+    columns = {column.key: [json_value(getattr(row, column.key)) for row in rows] for column in _columns()}
+    return zlib.compress(json.dumps(columns, separators=(",", ":")).encode(), 9)
+
+
+def _decode_value(column, value):
+    if value is None:
+        return None
+    python_type = column.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is date:
+        return date.fromisoformat(value)
+    if issubclass(python_type, enum.Enum):
+        return python_type(value)
+    return value
+
+
+def decode_rows(data: bytes, positions: Iterable[int]) -> list[dict]:
+    """The ``patients`` rows at ``positions`` of a compressed batch, ready for a Core ``INSERT``."""
+    columns = json.loads(zlib.decompress(data))
+    return [{column.key: _decode_value(column, columns[column.key][position]) for column in _columns()}
+            for position in positions]
+
+
+def _invalidate_patients() -> None:
+    if has_app_context() and CACHE_EXTENSION_KEY in current_app.extensions:
+        current_cache().invalidate_tags("patients")
+
+
+def archive_inactive_patients(older_than: timedelta, batch_size: int = 500) -> int:
+    """Archive live, unlinked cards inactive for more than ``older_than``; return how many were archived.
+
+    Cards with a scheduled appointment still ahead are kept. Rows locked by a concurrent run or request
+    are skipped on PostgreSQL.
+    """
+    now = datetime.now(UTC)
+    cutoff = now - older_than
+    patients = Patient.__table__
+    archived = 0
+    while True:
+        with db.engine.begin() as connection:
+            rows = connection.execute(
+                select(patients)
+                .where(patients.c.deleted_at.is_(None), patients.c.last_activity_at < cutoff,
+                       ~select(User.id).where(User.patient_id == patients.c.id).exists(),
+                       ~select(Appointment.id).where(Appointment.patient_id == patients.c.id,
+                                                     Appointment.status == AppointmentStatus.SCHEDULED,
+                                                     Appointment.ends_at > now).exists())
+                .order_by(patients.c.last_activity_at)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            ).all()
+            if not rows:
+                break
+            batch_id = connection.execute(
+                insert(PatientArchiveBatch).values(row_count=len(rows), data=encode_batch(rows),
+                                                   archived_at=datetime.now(UTC))
+                .returning(PatientArchiveBatch.id)
+            ).scalar_one()
+            connection.execute(insert(ArchivedPatient), [
+                {"patient_id": row.id, "batch_id": batch_id, "position": position, "first_name": row.first_name,
+                 "last_name": row.last_name, "birth_date": row.birth_date}
+                for position, row in enumerate(rows)
+            ])
+            connection.execute(delete(patients).where(patients.c.id.in_([row.id for row in rows])))
+        archived += len(rows)
+        if len(rows) < batch_size:
+            break
+    if archived:
+        _invalidate_patients()
+    return archived
+
+
+def restore_patients(patient_ids: Iterable[int]) -> list[int]:
+    """Move the archived cards among ``patient_ids`` back into ``patients``; return their ids.
+
+    Runs in the current session's transaction, and the caller commits. Deleting the ``ArchivedPatient``
+    rows first claims them, so two requests restoring the same card cannot both insert it. The cards'
+    match keys are recomputed, as ``rebuild_match_keys`` would.
+    """
+    archived, batches = ArchivedPatient.__table__, PatientArchiveBatch.__table__
+    claimed = db.session.execute(
+        delete(archived).where(archived.c.patient_id.in_(list(patient_ids)))
+        .returning(archived.c.batch_id, archived.c.position)
+    ).all()
+    if not claimed:
+        return []
+    by_batch: dict[int, list[int]] = {}
+    for batch_id, position in claimed:
+        by_batch.setdefault(batch_id, []).append(position)
+    rows = []
+    for batch_id, data in db.session.execute(
+        select(batches.c.id, batches.c.data).where(batches.c.id.in_(by_batch))
+    ):
+        rows.extend(decode_rows(data, by_batch[batch_id]))
+    db.session.execute(insert(Patient.__table__), rows)
+    keys = PatientMatchKey.__table__
+    db.session.execute(delete(keys).where(keys.c.patient_id.in_([row["id"] for row in rows])))
+    key_rows = [{"patient_id": row["id"], "key": key} for row in rows
+                for key in blocking_keys(row["first_name"], row["last_name"], row["birth_date"])]
+    if key_rows:
+        db.session.execute(insert(keys), key_rows)
+
+    # Drop the batches whose last card was just restored.
+    db.session.execute(delete(batches).where(
+        batches.c.id.in_(by_batch),
+        ~select(archived.c.patient_id).where(archived.c.batch_id == batches.c.id).exists(),
+    ))
+    _invalidate_patients()
+    return [row["id"] for row in rows]
+
+
+def is_archived(patient_ids: Iterable[int]) -> bool:
+    """Whether any of ``patient_ids`` is archived."""
+    archived = ArchivedPatient.__table__
+    return db.session.scalar(select(archived.c.patient_id).where(archived.c.patient_id.in_(list(patient_ids)))
+                             .limit(1)) is not None
+
+
+def archived_patients_query(search: str = ""):
+    """Statement selecting the archived stubs, by name; ``search`` matches the start of either name."""
+    query = select(ArchivedPatient).order_by(ArchivedPatient.last_name, ArchivedPatient.first_name,
+                                             ArchivedPatient.patient_id)
+    if search := search.strip().lower():
+        query = query.where(or_(func.lower(ArchivedPatient.last_name).startswith(search, autoescape=True),
+                                func.lower(ArchivedPatient.first_name).startswith(search, autoescape=True)))
+    return query
+
+
+def load_patient(patient_id: int, user) -> Patient | None:
+    """``db.session.get(Patient, ...)`` that first restores the card, and commits, if it is archived.
+
+    Only a card ``user`` may view is restored; to anyone else an archived card reads as missing.
+    """
+    patient = db.session.get(Patient, patient_id)
+    if patient is None and can_view_patient(user, patient_id) and is_archived([patient_id]):
+        if restore_patients([patient_id]):
+            db.session.commit()
+        # Restoring wrote to the primary, so this reads there too, even if another request restored it.
+        patient = db.session.get(Patient, patient_id)
+    return patient
+
+
+def touch_patient(patient: Patient) -> None:
+    """Record that ``patient`` was viewed, at most once per ``ARCHIVE_TOUCH_INTERVAL`` seconds."""
+    now = datetime.now(UTC)
+    last = patient.last_activity_at
+    if last is not None and last.tzinfo is None:  # SQLite returns naive UTC datetimes
+        last = last.replace(tzinfo=UTC)
+    if last is not None and now - last < timedelta(seconds=current_app.config["ARCHIVE_TOUCH_INTERVAL"]):
+        return
+    # A Core UPDATE: a view is not an edit, so neither the history nor the change feed sees it.
+    db.session.execute(update(Patient.__table__).where(Patient.id == patient.id).values(last_activity_at=now))
+    db.session.commit()
+
+
+def archive_stats() -> dict[str, int]:
+    return {
+        "archived_patients": db.session.scalar(select(func.count()).select_from(ArchivedPatient)),
+        "archive_batches": db.session.scalar(select(func.count()).select_from(PatientArchiveBatch)),
+        "archive_bytes": db.session.scalar(
+            select(func.coalesce(func.sum(func.length(PatientArchiveBatch.data)), 0))),
+    }
+
+
+@job("patients.archive")
+def archive_job(days: int | None = None, batch_size: int | None = None) -> dict:
+    """Background job wrapper around ``archive_inactive_patients`` using the configured defaults."""
+    config = current_app.config
+    archived = archive_inactive_patients(
+        timedelta(days=config["ARCHIVE_AFTER_DAYS"] if days is None else days),
+        batch_size or config["ARCHIVE_BATCH_SIZE"],
+    )
+    return {"archived": archived}
@@ -0,0 +1,177 @@
+"""ASGI serving mode.
+
+The patient read endpoints of the JSON API run natively on SQLAlchemy's async engine, so a slow query
+suspends a coroutine instead of holding a worker thread. Every other request is handed to the regular
+Flask app through ``asgiref``'s WSGI adapter, which runs it in a thread pool as before. Run with::
+
+    uvicorn --factory mediarch.asgi:create_asgi_app
+
+This mode needs the ``asgi`` extra (``pip install mediarch[asgi]``): ``asgiref``, ``uvicorn`` and, for
+SQLite databases, ``aiosqlite``. PostgreSQL uses the async side of ``psycopg``, which is already a dependency.
+"""
+import asyncio
+import json
+import re
+from collections.abc import Awaitable, Callable
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+from flask import Flask
+from sqlalchemy import URL, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from werkzeug.exceptions import Forbidden, HTTPException, NotFound, Unauthorized
+
+from . import create_app
+from .api import patient_list_document, patient_list_query
+from .archive import load_patient
+from .auth import CLAIMS_KEY, SessionUser, can_view_patient, claims_valid, make_claims
+from .models import AccountType, Patient, User
+
+_ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+psycopg"}
+
+
+def async_database_url(url: str | URL) -> URL:
+    """Map a sync database URL to the driver SQLAlchemy's async engine needs."""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in _ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend!r} databases; set ASYNC_DATABASE_URL.")
+    return url.set(drivername=_ASYNC_DRIVERS[backend])
+
+
+def _json_response(status: int, document: dict) -> tuple[int, list, bytes]:
+    body = json.dumps(document).encode()
+    headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    return status, headers, body
+
+
+class AsyncApp:
+    """ASGI application serving ``self.routes`` natively and everything else through Flask."""
+
+    def __init__(self, flask_app: Flask) -> None:
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+        self._engine: AsyncEngine | None = None
+        self._sessionmaker: async_sessionmaker[AsyncSession] | None = None
+        self.routes: list[tuple[re.Pattern, Callable[..., Awaitable[dict]]]] = [
+            (re.compile(r"^/api/v1/patients$"), self.list_patients),
+            (re.compile(r"^/api/v1/patients/(?P<patient_id>\d+)$"), self.get_patient),
+        ]
+
+    def session(self) -> AsyncSession:
+        # The engine is created on first use, so the async driver is only imported once a native route is hit.
+        if self._sessionmaker is None:
+            config = self.flask_app.config
+            url = config.get("ASYNC_DATABASE_URL") or async_database_url(config["SQLALCHEMY_DATABASE_URI"])
+            self._engine = create_async_engine(url, **config.get("SQLALCHEMY_ENGINE_OPTIONS", {}))
+            self._sessionmaker = async_sessionmaker(self._engine, expire_on_commit=False)
+        return self._sessionmaker()
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] == "http" and scope["method"] in {"GET", "HEAD"}:
+            for pattern, handler in self.routes:
+                if match := pattern.match(scope["path"]):
+                    await self._dispatch(scope, send, handler, match.groupdict())
+                    return
+        await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive: Callable, send: Callable) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self._engine is not None:
+                    await self._engine.dispose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _dispatch(self, scope: dict, send: Callable, handler: Callable, params: dict) -> None:
+        try:
+            status, headers, body = _json_response(200, await handler(scope, **params))
+        except HTTPException as e:
+            # Same document as ``api.json_error``.
+            status, headers, body = _json_response(e.code, {"error": e.name, "message": e.description})
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": b"" if scope["method"] == "HEAD" else body})
+
+    # --- Authentication ---
+
+    def _open_session(self, scope: dict) -> dict:
+        """Decode the Flask session of the request with the app's own session interface."""
+        headers = {name.decode("latin-1"): value.decode("latin-1") for name, value in scope["headers"]}
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            "PATH_INFO": scope["path"],
+            "SERVER_NAME": "localhost",
+            "SERVER_PORT": "80",
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "HTTP_COOKIE": headers.get("cookie", ""),
+        }
+        app = self.flask_app
+        session = app.session_interface.open_session(app, app.request_class(environ))
+        return dict(session) if session is not None else {}
+
+    async def current_user(self, scope: dict, db: AsyncSession) -> SessionUser:
+        """The logged-in user, resolved from the session claims like ``auth.load_user``."""
+        # Server-side session stores do blocking I/O.
+        data = await asyncio.to_thread(self._open_session, scope)
+        if "_user_id" not in data:
+            raise Unauthorized
+        user_id = int(data["_user_id"])
+        claims = data.get(CLAIMS_KEY)
+        if not claims or not claims_valid(claims, user_id, self.flask_app.config["AUTH_CLAIMS_TTL"]):
+            row = await db.get(User, user_id)
+            if row is None:
+                raise Unauthorized
+            claims = make_claims(row)
+        user = SessionUser(claims)
+        if not user.is_active:
+            raise Unauthorized
+        return user
+
+    # --- Handlers ---
+
+    async def list_patients(self, scope: dict) -> dict:
+        async with self.session() as db:
+            user = await self.current_user(scope, db)
+            if user.account_type not in {AccountType.ADMIN, AccountType.DOCTOR}:
+                raise Forbidden
+            query = parse_qs(scope.get("query_string", b"").decode())
+            try:
+                page = max(int(query.get("page", ["1"])[0]), 1)
+            except ValueError:
+                page = 1
+            per_page = self.flask_app.config["API_PER_PAGE"]
+            patients = (await db.scalars(patient_list_query(page, per_page))).all()
+            return patient_list_document(list(patients), page, per_page)
+
+    def _restore_patient(self, patient_id: int, user: SessionUser) -> dict | None:
+        """The card restored from cold storage by the Flask side, as the WSGI endpoint does."""
+        with self.flask_app.app_context():
+            patient = load_patient(patient_id, user)
+            return None if patient is None else patient.to_dict()
+
+    async def get_patient(self, scope: dict, patient_id: str) -> dict:
+        async with self.session() as db:
+            user = await self.current_user(scope, db)
+            patient = await db.get(Patient, int(patient_id))
+            if patient is None:
+                # Maybe archived: restoring is rare and writes, so it runs on the synchronous code in a thread.
+                document = await asyncio.to_thread(self._restore_patient, int(patient_id), user)
+                if document is None:
+                    raise NotFound
+                return document
+            if patient.deleted_at is not None:
+                raise NotFound
+            if not can_view_patient(user, patient.id):
+                raise Forbidden
+            return patient.to_dict()
+
+
+def create_asgi_app(test_config=None) -> AsyncApp:
+    """ASGI application factory; takes the same configuration as ``create_app``."""
+    return AsyncApp(create_app(test_config))
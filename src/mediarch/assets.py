@@ -0,0 +1,48 @@
+"""Versioned static asset URLs.
+
+``static_url("css/main.css")`` in a template returns ``/static/css/main.css?v=<content hash>``. A
+request carrying the version is answered with ``Cache-Control: public, max-age=31536000, immutable``,
+so browsers keep the file until its content, and therefore its URL, changes. Plain ``url_for("static")``
+URLs keep Flask's default revalidation.
+"""
+import hashlib
+import os
+from pathlib import Path
+
+from flask import Flask, Response, current_app, request, url_for
+
+VERSION_ARG = "v"
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# (absolute path, mtime_ns) -> version; the mtime makes edits visible without a restart.
+_versions: dict[tuple[str, int], str] = {}
+
+
+def asset_version(path: str) -> str:
+    """Short content hash of the file at ``path``."""
+    key = (path, os.stat(path).st_mtime_ns)
+    version = _versions.get(key)
+    if version is None:
+        version = hashlib.sha256(Path(path).read_bytes()).hexdigest()[:12]
+        _versions[key] = version
+    return version
+
+
+def static_url(filename: str) -> str:
+    """URL of a file in ``static/`` that changes whenever the file does."""
+    path = os.path.join(current_app.static_folder, filename)
+    return url_for("static", filename=filename, **{VERSION_ARG: asset_version(path)})
+
+
+def _cache_versioned(response: Response) -> Response:
+    if request.endpoint == "static" and VERSION_ARG in request.args and response.status_code == 200:
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+        response.cache_control.no_cache = None
+    return response
+
+
+def init_app(app: Flask) -> None:
+    app.add_template_global(static_url)
+    app.after_request(_cache_versioned)
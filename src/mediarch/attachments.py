@@ -0,0 +1,252 @@
+"""Documents attached to patient cards, in a content-addressed store on the local filesystem.
+
+Each file is stored once under the hex SHA-256 of its content, ``<root>/ab/cd/abcd...``, however many
+``Attachment`` rows point to it: the same scan uploaded to two cards, or twice to one, takes the space of
+one. ``ATTACHMENTS_PATH`` names the root (default: ``attachments`` in the instance folder).
+
+Uploads are never held in memory. ``BlobWriter`` writes the body to a temporary file under
+``<root>/tmp`` in the chunks it arrives in, hashing it on the way, and moves the file to its digest's path
+once complete; the multipart form of the patient page and the API's raw body both feed it directly.
+Downloads go through ``send_file`` with the file's path, so the WSGI server's ``wsgi.file_wrapper`` can
+send it with ``sendfile(2)`` (or the web server in front, with ``USE_X_SENDFILE``), and ``Range``,
+``If-None-Match`` and ``If-Modified-Since`` requests are answered from the file's size, digest and time.
+
+Deleting an attachment deletes its row only. ``collect_garbage`` (the ``attachments.collect`` job, or
+``flask attachments collect``) removes the files no row refers to any more, and the temporary files of
+uploads that never finished, once older than ``ATTACHMENTS_GC_GRACE`` seconds: a file stored by an upload
+whose row is not committed yet is always younger than that.
+"""
+import hashlib
+import mimetypes
+import os
+import tempfile
+import time
+from collections.abc import Iterator
+from datetime import UTC, datetime, timedelta
+from typing import IO, Self
+
+from flask import Response, current_app, send_file
+from sqlalchemy import select
+
+from . import db
+from .archive import load_patient
+from .jobs import job
+from .models import AccountType, Attachment, Patient, User
+
+DIGEST_LENGTH = 64
+# Shown in the browser on request (?inline=1); everything else is always a download.
+INLINE_TYPES = frozenset({"application/pdf", "image/gif", "image/jpeg", "image/png", "image/webp", "text/plain"})
+_GC_BATCH_SIZE = 500
+
+
+class AttachmentError(Exception):
+    """An upload could not be stored."""
+
+
+class AttachmentTooLarge(AttachmentError):
+    """An upload is larger than ``ATTACHMENTS_MAX_SIZE``."""
+
+    def __init__(self, max_size: int) -> None:
+        limit = f"{max_size / 1024 ** 2:g} MB" if max_size >= 1024 ** 2 else f"{max_size / 1024:g} kB"
+        super().__init__(f"The file is larger than the {limit} limit.")
+        self.max_size = max_size
+
+
+def storage_root() -> str:
+    return current_app.config["ATTACHMENTS_PATH"] or os.path.join(current_app.instance_path, "attachments")
+
+
+def blob_path(root: str, digest: str) -> str:
+    return os.path.join(root, digest[:2], digest[2:4], digest)
+
+
+class BlobWriter:
+    """A file-like object storing what is written to it under its SHA-256 in ``root``.
+
+    Write the content, then ``commit()`` to get its digest, or ``discard()`` to drop it. Reading and seeking
+    work on the temporary file, as parsers expect of the containers they write uploads to.
+    """
+
+    def __init__(self, root: str, max_size: int) -> None:
+        self.root, self.max_size = root, max_size
+        os.makedirs(os.path.join(root, "tmp"), exist_ok=True)
+        fd, self._temp_path = tempfile.mkstemp(dir=os.path.join(root, "tmp"), suffix=".part")
+        self._file: IO[bytes] = os.fdopen(fd, "w+b")
+        self._hash = hashlib.sha256()
+        self.size = 0
+        self.digest: str | None = None
+
+    def write(self, data: bytes) -> int:
+        self.size += len(data)
+        if self.size > self.max_size:
+            raise AttachmentTooLarge(self.max_size)
+        self._hash.update(data)
+        return self._file.write(data)
+
+    def read(self, size: int = -1) -> bytes:
+        return self._file.read(size)
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        return self._file.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._file.tell()
+
+    def commit(self) -> str:
+        """Move the content to its digest's path, unless a file with that content is stored already."""
+        if self.digest is not None:
+            return self.digest
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        digest = self._hash.hexdigest()
+        path = blob_path(self.root, digest)
+        if os.path.exists(path):
+            os.utime(path)  # young again, so the garbage collection leaves it to the row about to be committed
+            os.unlink(self._temp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(self._temp_path, path)
+        self.digest = digest
+        return digest
+
+    def discard(self) -> None:
+        if self.digest is None and not self._file.closed:
+            self._file.close()
+            os.unlink(self._temp_path)
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.discard()
+
+
+def new_writer() -> BlobWriter:
+    return BlobWriter(storage_root(), current_app.config["ATTACHMENTS_MAX_SIZE"])
+
+
+def store_stream(stream: IO[bytes]) -> BlobWriter:
+    """Copy ``stream`` into the store chunk by chunk; returns the committed writer, with its digest and size."""
+    chunk_size = current_app.config["ATTACHMENTS_CHUNK_SIZE"]
+    with new_writer() as writer:
+        while chunk := stream.read(chunk_size):
+            writer.write(chunk)
+        writer.commit()
+    return writer
+
+
+def clean_filename(filename: str | None) -> str:
+    """The last component of a client's file name, which may be a Windows path; never empty."""
+    name = (filename or "").replace("\\", "/").rsplit("/", 1)[-1].strip()
+    return name[-255:] or "attachment"
+
+
+def add_attachment(patient: Patient, writer: BlobWriter, filename: str | None, content_type: str | None,
+                   uploaded_by_id: int | None = None) -> Attachment:
+    """Commit ``writer`` and add its row to the session; the caller commits."""
+    filename = clean_filename(filename)
+    content_type = content_type or mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    now = datetime.now(UTC)
+    attachment = Attachment(patient_id=patient.id, digest=writer.commit(), filename=filename,
+                            content_type=content_type[:255], size=writer.size, uploaded_by_id=uploaded_by_id,
+                            uploaded_at=now)
+    db.session.add(attachment)
+    patient.last_activity_at = now
+    return attachment
+
+
+def patient_attachments(patient_id: int) -> list[Attachment]:
+    """A card's attachments, newest first."""
+    return list(db.session.scalars(select(Attachment).where(Attachment.patient_id == patient_id)
+                                   .order_by(Attachment.uploaded_at.desc(), Attachment.id.desc())))
+
+
+def load_attachment(attachment_id: int, user) -> Attachment | None:
+    """The attachment, unless it or its card does not exist (or was deleted); see ``load_patient``."""
+    attachment = db.session.get(Attachment, attachment_id)
+    if attachment is None or load_patient(attachment.patient_id, user) is None:
+        return None
+    return attachment
+
+
+def can_delete_attachment(user: User, attachment: Attachment) -> bool:
+    """Admins and doctors delete any attachment they can see, patients those they uploaded."""
+    return user.account_type in {AccountType.ADMIN, AccountType.DOCTOR} or attachment.uploaded_by_id == user.id
+
+
+def send_attachment(attachment: Attachment, inline: bool = False) -> Response:
+    """The file as a response answering ``Range`` and conditional requests.
+
+    Only ``INLINE_TYPES`` are shown inline, and the response is sandboxed so an uploaded document cannot
+    run scripts on the app's origin. ``no-transform`` keeps proxies and ``CompressionMiddleware`` from
+    re-encoding the file, which would break ranges and the server's ``sendfile(2)``.
+    """
+    path = blob_path(storage_root(), attachment.digest)
+    response = send_file(path, mimetype=attachment.content_type, download_name=attachment.filename,
+                         as_attachment=not (inline and attachment.content_type in INLINE_TYPES),
+                         conditional=True, etag=attachment.digest, last_modified=attachment.uploaded_at)
+    response.headers["X-Content-Type-Options"] = "nosniff"
+    response.headers["Content-Security-Policy"] = "sandbox"
+    response.cache_control.private = True
+    response.cache_control.no_transform = True
+    return response
+
+
+def _stored_files(root: str) -> Iterator[tuple[str, str]]:
+    """``(digest, path)`` of every stored file."""
+    for first in os.scandir(root):
+        if len(first.name) != 2 or not first.is_dir():
+            continue
+        for second in os.scandir(first.path):
+            if second.is_dir():
+                for entry in os.scandir(second.path):
+                    if len(entry.name) == DIGEST_LENGTH:
+                        yield entry.name, entry.path
+
+
+def collect_garbage(grace: timedelta) -> dict[str, int]:
+    """Remove stored files without a row and abandoned temporary files, older than ``grace``."""
+    root = storage_root()
+    if not os.path.isdir(root):
+        return {"removed": 0, "freed_bytes": 0, "abandoned_uploads": 0}
+    cutoff = time.time() - grace.total_seconds()
+    removed = freed = abandoned = 0
+
+    def collect(batch: dict[str, str]) -> None:
+        nonlocal removed, freed
+        referenced = set(db.session.scalars(select(Attachment.digest.distinct())
+                                            .where(Attachment.digest.in_(batch))))
+        for digest in batch.keys() - referenced:
+            try:
+                stat = os.stat(batch[digest])
+                if stat.st_mtime < cutoff:
+                    os.unlink(batch[digest])
+                    removed, freed = removed + 1, freed + stat.st_size
+            except FileNotFoundError:
+                pass
+
+    batch = {}
+    for digest, path in _stored_files(root):
+        batch[digest] = path
+        if len(batch) >= _GC_BATCH_SIZE:
+            collect(batch)
+            batch = {}
+    if batch:
+        collect(batch)
+
+    if os.path.isdir(os.path.join(root, "tmp")):
+        for entry in os.scandir(os.path.join(root, "tmp")):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.unlink(entry.path)
+                    abandoned += 1
+            except FileNotFoundError:
+                pass
+    return {"removed": removed, "freed_bytes": freed, "abandoned_uploads": abandoned}
+
+
+@job("attachments.collect")
+def collect_job(grace: int | None = None) -> dict:
+    """Background job wrapper around ``collect_garbage`` using the configured grace period."""
+    return collect_garbage(timedelta(seconds=current_app.config["ATTACHMENTS_GC_GRACE"] if grace is None else grace))
@@ -0,0 +1,144 @@
+"""Session-claim based user loading.
+
+Flask-Login calls the user loader on every request that carries a logged-in session, which used to
+cost one ``SELECT`` per page view just to render the navigation bar. Instead, the account state the
+views and templates rely on is stored as a claim inside the signed session cookie at login, and is
+trusted for ``AUTH_CLAIMS_TTL`` seconds before being revalidated. Revalidation always reads the account
+from the database, never from a cache: a cached copy could be as old as the claims themselves (and other
+workers' caches are not told about a revocation), so a deactivated or demoted user would keep their
+access for up to twice the TTL.
+"""
+import time
+
+from flask import current_app, request, session
+from flask_login import UserMixin
+
+from . import db
+from .cache import current_cache
+from .models import AccountType, User
+
+CLAIMS_KEY = "_claims"
+
+# user id -> timestamp of the last change to that account made in this process.
+# Claims issued before that moment are revalidated immediately instead of waiting for the TTL.
+_revoked: dict[int, float] = {}
+
+
+class SessionUser(UserMixin):
+    """Read-only stand-in for ``User`` built from the session claims, without a database query."""
+
+    def __init__(self, claims: dict) -> None:
+        self.id: int = claims["uid"]
+        self.username: str = claims["name"]
+        self.account_type = AccountType(claims["role"])
+        self.patient_id: int | None = claims["pid"]
+        self._active: bool = claims["active"]
+
+    @property
+    def is_active(self) -> bool:
+        return self._active
+
+    @property
+    def is_globally_active(self) -> bool:
+        """Mirror of ``User.is_globally_active``."""
+        if self.username == "admin":
+            return True
+        return self._active
+
+    def __repr__(self) -> str:  # pragma: no cover
+        return f"<SessionUser {self.username} ({self.account_type.value})>"
+
+
+def make_claims(user: User) -> dict:
+    return {
+        "uid": user.id,
+        "name": user.username,
+        "role": user.account_type.value,
+        "pid": user.patient_id,
+        "active": user.is_active,
+        "iat": time.time(),
+    }
+
+
+def issue_claims(user: User) -> None:
+    """Store the account state of ``user`` in the session."""
+    session[CLAIMS_KEY] = make_claims(user)
+
+
+def clear_claims() -> None:
+    session.pop(CLAIMS_KEY, None)
+
+
+def revoke_claims(user_id: int) -> None:
+    """Force the next request of ``user_id`` to reload the account from the database."""
+    _revoked[user_id] = time.time()
+    current_cache().invalidate_tags(f"user:{user_id}")
+
+
+def claims_valid(claims: dict, user_id: int, ttl: float) -> bool:
+    """Whether ``claims`` belong to ``user_id``, are younger than ``ttl`` seconds and were not revoked."""
+    if claims.get("uid") != user_id:
+        return False
+    issued_at = claims.get("iat", 0)
+    if time.time() - issued_at >= ttl:
+        return False
+    return issued_at > _revoked.get(user_id, 0)
+
+
+def _account_claims(user_id: int) -> dict | None:
+    user = db.session.get(User, user_id)
+    return make_claims(user) if user is not None else None
+
+
+def load_user(user_id: str) -> SessionUser | None:
+    """User loader for Flask-Login.
+
+    Returns a ``SessionUser`` from the session claims while they are fresh; otherwise refreshes the
+    claims from the database, at most once per ``AUTH_CLAIMS_TTL`` seconds and session.
+    """
+    uid = int(user_id)
+    claims = session.get(CLAIMS_KEY)
+    if claims and claims_valid(claims, uid, current_app.config["AUTH_CLAIMS_TTL"]):
+        return SessionUser(claims)
+
+    claims = _account_claims(uid)
+    if claims is None:
+        clear_claims()
+        return None
+    session[CLAIMS_KEY] = claims
+    return SessionUser(claims)
+
+
+def has_session_user() -> bool:
+    """Whether the request can resolve to a logged-in user at all.
+
+    Cheap check that lets anonymous requests skip ``current_user`` entirely.
+    """
+    if "_user_id" in session:
+        return True
+    return current_app.config.get("REMEMBER_COOKIE_NAME", "remember_token") in request.cookies
+
+
+# Patient card fields each role may change, shared by the edit form and the batch API.
+STAFF_EDITABLE_FIELDS = frozenset({"first_name", "last_name", "birth_date", "blood_type", "allergies",
+                                   "medical_conditions", "medications", "notes"})
+OWN_CARD_EDITABLE_FIELDS = frozenset({"first_name", "last_name"})
+
+
+def editable_patient_fields(user, patient_id: int) -> frozenset[str]:
+    """Fields of a patient card ``user`` may edit; empty if they may not edit it at all.
+
+    Admins and doctors edit every field of any card, patients only the names on their own card.
+    """
+    if user.account_type in {AccountType.ADMIN, AccountType.DOCTOR}:
+        return STAFF_EDITABLE_FIELDS
+    if user.patient_id == patient_id:
+        return OWN_CARD_EDITABLE_FIELDS
+    return frozenset()
+
+
+def can_view_patient(user, patient_id: int) -> bool:
+    """Admins and doctors see every patient card, patients only their own."""
+    if user.account_type in {AccountType.ADMIN, AccountType.DOCTOR}:
+        return True
+    return user.patient_id == patient_id
@@ -0,0 +1,357 @@
+"""Two-level cache.
+
+``Cache`` keeps values in a size-bounded, per-process LRU with TTLs (level 1) and, when
+``CACHE_SHARED_BACKEND`` is set, in a ``SharedBackend`` every worker can read (level 2). Two shared
+backends are provided: ``sqlite``, a file shared by the worker processes of one host, and ``memory``, a
+stand-in that only shares within the process and is meant for tests. Like ``SessionStore``, a
+networked backend (Redis, memcached, ...) only has to implement the ``SharedBackend`` methods.
+
+Entries can carry tags; ``invalidate_tags`` makes every entry with one of the tags stale at once. Tags
+are versioned rather than indexed: an entry remembers the tag versions it was computed under, and is
+stale as soon as one of them moved. With a shared backend, level-1 entries are kept at most
+``CACHE_LOCAL_TTL`` seconds, which bounds how long another worker's invalidation takes to be seen.
+Without one, invalidations stay in the process that committed the change and other workers keep their
+entries until the TTL runs out, so the ``prod`` profile uses the ``sqlite`` backend by default.
+
+``get_or_set`` lets only one thread per process compute a missing value (single-flight); the others
+wait for its result. Commits of ``Patient`` and ``User`` rows invalidate the ``patient:<id>``,
+``patients``, ``user:<id>`` and ``users`` tags, so callers tag entries by what they were derived from.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from collections.abc import Callable, Iterable
+from pathlib import Path
+from typing import Any
+
+from flask import Flask, current_app, has_app_context
+from markupsafe import Markup
+from sqlalchemy import event
+
+from . import db
+from .models import Patient, User
+
+EXTENSION_KEY = "mediarch.cache"
+PENDING_TAGS = "cache_tags"  # key of ``Session.info``
+
+_MISSING = object()
+_TAG_PREFIX = "tag:"
+_TAG_LIFETIME = 30 * 24 * 3600  # shared tag versions outlive any entry that could depend on them
+
+
+def cache_key(*parts: object) -> str:
+    return ":".join(str(part) for part in parts)
+
+
+class SharedBackend(ABC):
+    """Storage shared between workers. Values are opaque bytes; implementations must be thread-safe."""
+
+    @abstractmethod
+    def get_many(self, keys: list[str]) -> dict[str, bytes]:
+        """Return the values of the keys that exist and have not expired."""
+
+    @abstractmethod
+    def set(self, key: str, value: bytes, expires_at: float) -> None:
+        """Create or replace ``key``."""
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """Remove ``key`` if it exists."""
+
+    @abstractmethod
+    def clear(self) -> None:
+        """Remove every key."""
+
+
+class MemoryBackend(SharedBackend):
+    """Process-local stand-in for a shared backend: caches built on the same instance share it."""
+
+    def __init__(self) -> None:
+        self._data: dict[str, tuple[bytes, float]] = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: list[str]) -> dict[str, bytes]:
+        now = time.time()
+        with self._lock:
+            found = {key: self._data.get(key) for key in keys}
+        return {key: item[0] for key, item in found.items() if item is not None and item[1] >= now}
+
+    def set(self, key: str, value: bytes, expires_at: float) -> None:
+        with self._lock:
+            self._data[key] = (value, expires_at)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class SQLiteBackend(SharedBackend):
+    """Entries in a local SQLite file, shared by all worker processes on the host."""
+
+    SWEEP_EVERY = 1000  # writes between deletions of expired rows
+
+    def __init__(self, path: str | os.PathLike) -> None:
+        self.path = str(path)
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._writes = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache "
+                "(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, keys: list[str]) -> dict[str, bytes]:
+        placeholders = ", ".join("?" * len(keys))
+        rows = self._connect().execute(
+            f"SELECT key, value FROM cache WHERE key IN ({placeholders}) AND expires_at >= ?",
+            (*keys, time.time()),
+        )
+        return dict(rows)
+
+    def set(self, key: str, value: bytes, expires_at: float) -> None:
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                         (key, value, expires_at))
+            self._writes += 1
+            if self._writes % self.SWEEP_EVERY == 0:
+                conn.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+
+    def delete(self, key: str) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM cache")
+
+
+class Cache:
+    """Level-1 LRU in front of an optional ``SharedBackend``."""
+
+    def __init__(self, *, max_entries: int = 1024, default_ttl: float = 60, local_ttl: float = 5,
+                 shared: SharedBackend | None = None, enabled: bool = True) -> None:
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.local_ttl = local_ttl
+        self.shared = shared
+        self.enabled = enabled
+        # key -> (value, expires_at, {tag: version}); most recently used last
+        self._entries: OrderedDict[str, tuple[Any, float, dict[str, int]]] = OrderedDict()
+        self._versions: dict[str, int] = {}  # local tag versions; missing means 0
+        self._lock = threading.Lock()
+        self._flights: dict[str, threading.Lock] = {}
+        self._counters = dict.fromkeys(
+            ("hits", "shared_hits", "misses", "sets", "evictions", "invalidations", "coalesced"), 0)
+
+    # -- tag versions --
+
+    def _versions_of(self, tags: tuple[str, ...]) -> tuple[dict[str, int], dict[str, bytes] | None]:
+        """Current (local, shared) versions of ``tags``; shared is ``None`` without a shared backend."""
+        with self._lock:
+            local = {tag: self._versions.get(tag, 0) for tag in tags}
+        return local, (self._shared_versions(tags) if self.shared is not None else None)
+
+    def _shared_versions(self, tags: Iterable[str]) -> dict[str, bytes]:
+        tags = list(tags)
+        if not tags:
+            return {}
+        stored = self.shared.get_many([_TAG_PREFIX + tag for tag in tags])
+        return {tag: stored.get(_TAG_PREFIX + tag, b"0") for tag in tags}
+
+    def invalidate_tags(self, *tags: str) -> None:
+        """Make every entry tagged with one of ``tags`` stale, in this process and in the shared backend."""
+        if not tags:
+            return
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+            self._counters["invalidations"] += len(tags)
+        if self.shared is not None:
+            token = f"{time.time_ns()}-{os.getpid()}-{threading.get_ident()}".encode()
+            for tag in tags:
+                self.shared.set(_TAG_PREFIX + tag, token, time.time() + _TAG_LIFETIME)
+
+    # -- reads and writes --
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self._counters[counter] += 1
+
+    def _get_local(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            value, expires_at, versions = entry
+            if expires_at < time.monotonic() or any(
+                    self._versions.get(tag, 0) != version for tag, version in versions.items()):
+                del self._entries[key]
+                return _MISSING
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return value
+
+    def _set_local(self, key: str, value: Any, ttl: float, versions: dict[str, int]) -> None:
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl, versions)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def _store(self, key: str, value: Any, ttl: float | None, versions: tuple) -> None:
+        local, shared = versions
+        ttl = self.default_ttl if ttl is None else ttl
+        self._count("sets")
+        if self.shared is not None:
+            expires_at = time.time() + ttl
+            self.shared.set(key, pickle.dumps((value, shared, expires_at)), expires_at)
+            ttl = min(ttl, self.local_ttl)
+        self._set_local(key, value, ttl, local)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """The cached value of ``key``, or ``default``."""
+        if not self.enabled:
+            self._count("misses")
+            return default
+        value = self._get_local(key)
+        if value is not _MISSING:
+            return value
+        if self.shared is not None:
+            found = self.shared.get_many([key])
+            if key in found:
+                value, versions, expires_at = pickle.loads(found[key])  # written by this app only
+                if self._shared_versions(versions) == versions:
+                    self._count("shared_hits")
+                    local, _ = self._versions_of(tuple(versions))
+                    self._set_local(key, value, min(self.local_ttl, expires_at - time.time()), local)
+                    return value
+        self._count("misses")
+        return default
+
+    def set(self, key: str, value: Any, ttl: float | None = None, tags: Iterable[str] = ()) -> None:
+        """Cache ``value`` under ``key`` for ``ttl`` seconds (``CACHE_DEFAULT_TTL`` if omitted)."""
+        if self.enabled:
+            self._store(key, value, ttl, self._versions_of(tuple(tags)))
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.shared is not None:
+            self.shared.delete(key)
+
+    def clear(self) -> None:
+        """Drop every entry of this process and of the shared backend."""
+        with self._lock:
+            self._entries.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+    def get_or_set(self, key: str, factory: Callable[[], Any], ttl: float | None = None,
+                   tags: Iterable[str] = ()) -> Any:
+        """The cached value of ``key``, computing and caching ``factory()`` on a miss.
+
+        Concurrent misses on the same key in this process run ``factory`` once. The tag versions are
+        read before ``factory`` runs, so an invalidation that happens while it runs is not lost.
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        if not self.enabled:
+            return factory()
+        with self._lock:
+            flight = self._flights.setdefault(key, threading.Lock())
+        with flight:
+            value = self._get_local(key)
+            if value is not _MISSING:
+                self._count("coalesced")
+                return value
+            versions = self._versions_of(tuple(tags))
+            try:
+                value = factory()
+                self._store(key, value, ttl, versions)
+            finally:
+                with self._lock:
+                    self._flights.pop(key, None)
+        return value
+
+    def stats(self) -> dict[str, Any]:
+        """Counters since the process started, plus the current level-1 size and hit ratio."""
+        with self._lock:
+            stats = dict(self._counters, entries=len(self._entries), max_entries=self.max_entries)
+        lookups = stats["hits"] + stats["shared_hits"] + stats["misses"]
+        stats["hit_ratio"] = (stats["hits"] + stats["shared_hits"]) / lookups if lookups else None
+        return stats
+
+
+def current_cache() -> Cache:
+    return current_app.extensions[EXTENSION_KEY]
+
+
+def cached_fragment(*key_parts: object, ttl: float | None = None, tags: Iterable[str] = (), caller) -> Markup:
+    """Template helper caching the body of a ``{% call cached_fragment(...) %}`` block."""
+    return Markup(current_cache().get_or_set(cache_key("fragment", *key_parts), lambda: str(caller()), ttl, tags))
+
+
+@event.listens_for(db.session, "after_flush")
+def _collect_tags(session, flush_context) -> None:
+    tags = session.info.setdefault(PENDING_TAGS, set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, Patient):
+            tags.update(("patients", f"patient:{obj.id}"))
+        elif isinstance(obj, User):
+            tags.update(("users", f"user:{obj.id}"))
+
+
+@event.listens_for(db.session, "after_commit")
+def _invalidate_committed(session) -> None:
+    tags = session.info.pop(PENDING_TAGS, None)
+    if tags and has_app_context() and EXTENSION_KEY in current_app.extensions:
+        current_cache().invalidate_tags(*tags)
+
+
+@event.listens_for(db.session, "after_rollback")
+def _forget_rolled_back(session) -> None:
+    session.info.pop(PENDING_TAGS, None)
+
+
+def create_backend(name: str | None, path: str) -> SharedBackend | None:
+    if name is None:
+        return None
+    if name == "memory":
+        return MemoryBackend()
+    if name == "sqlite":
+        return SQLiteBackend(path)
+    raise ValueError(f"Unknown CACHE_SHARED_BACKEND {name!r}; expected memory or sqlite.")
+
+
+def init_app(app: Flask) -> None:
+    """Create the app's cache from the ``CACHE_*`` settings and expose ``cached_fragment`` to templates."""
+    config = app.config
+    path = config["CACHE_SHARED_PATH"] or os.path.join(app.instance_path, "cache.sqlite3")
+    app.extensions[EXTENSION_KEY] = Cache(
+        max_entries=config["CACHE_MAX_ENTRIES"],
+        default_ttl=config["CACHE_DEFAULT_TTL"],
+        local_ttl=config["CACHE_LOCAL_TTL"],
+        shared=create_backend(config["CACHE_SHARED_BACKEND"], path),
+        enabled=config["CACHE_ENABLED"],
+    )
+    app.add_template_global(cached_fragment)
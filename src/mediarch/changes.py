@@ -0,0 +1,166 @@
+"""Change feed for downstream systems.
+
+Every flush that inserts, updates or deletes a ``Patient``, or changes a ``User``'s account type, activation
+or patient link, appends one ``Change`` row per entity with its state after the change. Like the patient
+history, the rows of a flush go out in one multi-row ``INSERT`` on the flushing connection and commit
+together with the change.
+
+``GET /api/v1/changes?since=<seq>`` returns the entries after ``seq`` in order. Consumers store the
+returned ``cursor`` and pass it back, so they only ever fetch what changed; ``wait=<seconds>`` keeps the
+request open until something new is committed.
+
+Sequence numbers must become visible in order, or a consumer could advance its cursor past a number
+whose transaction has not committed yet. On PostgreSQL every writer therefore takes a transaction-scoped
+advisory lock before appending, which serialises only the end of write transactions that touch
+patients or users; SQLite serialises writers anyway.
+"""
+import threading
+import time
+from datetime import UTC, datetime
+
+from sqlalchemy import event, func, insert, inspect, select, text
+from sqlalchemy.engine import Connection
+
+from . import db
+from .models import Change, ChangeOperation, Patient, User
+
+# Columns of ``users`` downstream systems follow; password and e-mail changes are not published.
+USER_COLUMNS = ("username", "account_type", "is_active", "patient_id")
+
+# Key of ``pg_advisory_xact_lock`` held while appending, arbitrary but fixed.
+APPEND_LOCK_KEY = 0x4D43_4443
+
+# Key of ``Session.info`` set when the pending transaction appended changes.
+APPENDED = "appended_changes"
+
+
+class _CommitSignal:
+    """Counter bumped after every commit in this process that appended changes; long polls wait on it."""
+
+    def __init__(self) -> None:
+        self._condition = threading.Condition()
+        self.generation = 0
+
+    def notify(self) -> None:
+        with self._condition:
+            self.generation += 1
+            self._condition.notify_all()
+
+    def wait(self, generation: int, timeout: float) -> None:
+        """Return once a commit after ``generation`` happened, or after ``timeout`` seconds."""
+        with self._condition:
+            self._condition.wait_for(lambda: self.generation != generation, timeout=timeout)
+
+
+_committed = _CommitSignal()
+
+
+def user_document(user) -> dict:
+    """The published state of a user; ``user`` may be an ORM object or a Core row."""
+    account_type = user.account_type
+    return {
+        "id": user.id,
+        "username": user.username,
+        "account_type": getattr(account_type, "value", account_type),
+        "is_active": user.is_active,
+        "patient_id": user.patient_id,
+    }
+
+
+def _changed(obj, keys) -> bool:
+    attrs = inspect(obj).attrs
+    return any(attrs[key].history.has_changes() for key in keys)
+
+
+def _entry(entity: str, entity_id: int, operation: ChangeOperation, data: dict | None, now: datetime) -> dict:
+    return {"entity": entity, "entity_id": entity_id, "operation": operation, "changed_at": now, "data": data}
+
+
+def collect_changes(session) -> list[dict]:
+    """Build the change feed rows for the pending flush of ``session``."""
+    now = datetime.now(UTC)
+    rows = []
+    for obj in session.new:
+        if isinstance(obj, Patient):
+            rows.append(_entry("patient", obj.id, ChangeOperation.INSERT, obj.to_dict(), now))
+        elif isinstance(obj, User):
+            rows.append(_entry("user", obj.id, ChangeOperation.INSERT, user_document(obj), now))
+    for obj in session.dirty:
+        # Column attributes only: linking a user account also touches ``Patient.user_account``.
+        if isinstance(obj, Patient) and _changed(obj, Patient.__table__.columns.keys()):
+            if obj.deleted_at is not None:
+                rows.append(_entry("patient", obj.id, ChangeOperation.DELETE, None, now))
+            else:
+                rows.append(_entry("patient", obj.id, ChangeOperation.UPDATE, obj.to_dict(), now))
+        elif isinstance(obj, User) and _changed(obj, USER_COLUMNS):
+            rows.append(_entry("user", obj.id, ChangeOperation.UPDATE, user_document(obj), now))
+    for obj in session.deleted:
+        if isinstance(obj, Patient) and obj.deleted_at is None:  # soft-deleted cards were published already
+            rows.append(_entry("patient", obj.id, ChangeOperation.DELETE, None, now))
+        elif isinstance(obj, User):
+            rows.append(_entry("user", obj.id, ChangeOperation.DELETE, None, now))
+    return rows
+
+
+def append_changes(connection: Connection, rows: list[dict]) -> None:
+    """Append ``rows`` to the change log in the transaction of ``connection``."""
+    if not rows:
+        return
+    if connection.dialect.name == "postgresql":
+        connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": APPEND_LOCK_KEY})
+    connection.execute(insert(Change), rows)
+
+
+def user_updates(users) -> list[dict]:
+    """Change rows publishing ``users`` (Core rows with ``USER_COLUMNS``) after a bulk ``UPDATE``."""
+    now = datetime.now(UTC)
+    return [_entry("user", user.id, ChangeOperation.UPDATE, user_document(user), now) for user in users]
+
+
+@event.listens_for(db.session, "after_flush")
+def _append_flushed_changes(session, flush_context) -> None:
+    if rows := collect_changes(session):
+        append_changes(session.connection(), rows)
+        session.info[APPENDED] = True
+
+
+@event.listens_for(db.session, "after_commit")
+def _notify_waiters(session) -> None:
+    if session.info.pop(APPENDED, False):
+        notify_committed()
+
+
+@event.listens_for(db.session, "after_rollback")
+def _forget_rolled_back(session) -> None:
+    session.info.pop(APPENDED, None)
+
+
+def notify_committed() -> None:
+    """Wake the long polls of this process; call after committing changes outside ``db.session``."""
+    _committed.notify()
+
+
+def latest_seq() -> int:
+    return db.session.scalar(select(func.coalesce(func.max(Change.seq), 0)))
+
+
+def changes_since(since: int, limit: int) -> list[Change]:
+    """Up to ``limit`` committed changes after ``since``, oldest first."""
+    return db.session.scalars(select(Change).where(Change.seq > since).order_by(Change.seq).limit(limit)).all()
+
+
+def wait_for_changes(since: int, limit: int, timeout: float, poll_interval: float) -> list[Change]:
+    """``changes_since``, waiting up to ``timeout`` seconds for the first change if there is none yet.
+
+    Commits in this process wake the wait immediately; those of other workers are picked up by polling
+    every ``poll_interval`` seconds. The session is closed while waiting, so no connection is held.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        generation = _committed.generation
+        changes = changes_since(since, limit)
+        remaining = deadline - time.monotonic()
+        if changes or remaining <= 0:
+            return changes
+        db.session.close()
+        _committed.wait(generation, min(poll_interval, remaining))
@@ -0,0 +1,200 @@
+"""Command line interface.
+
+Maintenance commands are available as ``flask <group> <command>`` and through the ``mediarch``
+entry point, which also serves the app (``mediarch run``) and runs background jobs (``mediarch worker``).
+"""
+import multiprocessing
+import signal
+from datetime import timedelta
+
+import click
+from flask import Flask, current_app
+from flask.cli import AppGroup, FlaskGroup
+
+from . import db
+from .archive import archive_inactive_patients, archive_stats
+from .attachments import collect_garbage
+from .duplicates import find_duplicates, rebuild_match_keys
+from .history import ensure_history_partitions
+from .jobs import Worker, run_pending
+from .observations import import_csv
+from .sessions import ServerSideSessionInterface
+from .softdelete import purge_deleted_patients
+from .startup import measure_cold_start
+
+sessions_cli = AppGroup("sessions", help="Server-side session maintenance.")
+history_cli = AppGroup("history", help="Patient change history maintenance.")
+patients_cli = AppGroup("patients", help="Patient record maintenance.")
+observations_cli = AppGroup("observations", help="Vital signs and lab results.")
+attachments_cli = AppGroup("attachments", help="Files attached to patient cards.")
+
+
+@sessions_cli.command("sweep")
+def sweep_sessions() -> None:
+    """Delete expired server-side sessions."""
+    interface = current_app.session_interface
+    if not isinstance(interface, ServerSideSessionInterface):
+        raise click.ClickException("SESSION_BACKEND is not configured; sessions live in client cookies.")
+    removed = interface.store.sweep()
+    click.echo(f"Removed {removed} expired session(s).")
+
+
+@history_cli.command("partitions")
+@click.option("--ahead", default=None, type=int, help="Months to prepare beyond the current one.")
+def create_history_partitions(ahead: int | None) -> None:
+    """Create upcoming monthly partitions of patient_history (PostgreSQL only).
+
+    Run it from a monthly cron job so new rows never land in the default partition.
+    """
+    config = current_app.config
+    months = config["HISTORY_PARTITIONS_AHEAD"] if ahead is None else ahead
+    with db.engine.begin() as connection:
+        names = ensure_history_partitions(connection, months, hash_partitions=config["PATIENT_HASH_PARTITIONS"])
+    if not names:
+        click.echo("Partitioning is only used on PostgreSQL; nothing to do.")
+    for name in names:
+        click.echo(name)
+
+
+@patients_cli.command("purge")
+@click.option("--days", default=None, type=int, help="Purge cards soft-deleted more than this many days ago.")
+@click.option("--batch-size", default=None, type=int, help="Rows deleted per transaction.")
+def purge_patients(days: int | None, batch_size: int | None) -> None:
+    """Permanently delete soft-deleted patient cards, archiving them into the history."""
+    config = current_app.config
+    purged = purge_deleted_patients(
+        timedelta(days=config["PATIENT_PURGE_AFTER_DAYS"] if days is None else days),
+        batch_size or config["PATIENT_PURGE_BATCH_SIZE"],
+    )
+    click.echo(f"Purged {purged} patient card(s).")
+
+
+@patients_cli.command("archive")
+@click.option("--days", default=None, type=int, help="Archive cards without edits or views for this many days.")
+@click.option("--batch-size", default=None, type=int, help="Cards per compressed batch and transaction.")
+def archive_patients(days: int | None, batch_size: int | None) -> None:
+    """Move inactive patient cards into compressed cold storage; they are restored when opened."""
+    config = current_app.config
+    archived = archive_inactive_patients(
+        timedelta(days=config["ARCHIVE_AFTER_DAYS"] if days is None else days),
+        batch_size or config["ARCHIVE_BATCH_SIZE"],
+    )
+    stats = archive_stats()
+    click.echo(f"Archived {archived} patient card(s); {stats['archived_patients']} in cold storage "
+               f"({stats['archive_batches']} batch(es), {stats['archive_bytes'] / 1024:.1f} kB).")
+
+
+@patients_cli.command("duplicates")
+@click.option("--min-score", default=None, type=float, help="Lowest score queued for review (0 to 1).")
+@click.option("--rebuild-keys", is_flag=True, help="Recompute the blocking keys of every card first.")
+def find_duplicate_patients(min_score: float | None, rebuild_keys: bool) -> None:
+    """Queue likely duplicate patient cards for review at /admin/duplicates."""
+    config = current_app.config
+    if rebuild_keys:
+        click.echo(f"Rebuilt the keys of {rebuild_match_keys()} patient card(s).")
+    queued = find_duplicates(config["DUPLICATES_MAX_BLOCK"],
+                             config["DUPLICATES_MIN_SCORE"] if min_score is None else min_score)
+    click.echo(f"Queued {queued} new pair(s) of likely duplicates.")
+
+
+@observations_cli.command("import")
+@click.argument("files", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option("--batch-size", default=None, type=int, help="Rows inserted per transaction.")
+def import_observations(files: tuple[str, ...], batch_size: int | None) -> None:
+    """Import CSV dumps of observations (patient_id,code,observed_at,value[,unit])."""
+    batch_size = batch_size or current_app.config["OBSERVATIONS_IMPORT_BATCH_SIZE"]
+    for path in files:
+        with open(path, encoding="utf-8-sig", newline="") as lines:
+            try:
+                result = import_csv(lines, batch_size)
+            except ValueError as e:
+                raise click.ClickException(f"{path}: {e}") from None
+        click.echo(f"{path}: inserted {result.inserted}, skipped {result.duplicates} already stored, "
+                   f"rejected {result.rejected} row(s).")
+        for error in result.errors:
+            click.echo(f"  {error}", err=True)
+
+
+@attachments_cli.command("collect")
+@click.option("--grace", default=None, type=int, help="Keep unreferenced files younger than this many seconds.")
+def collect_attachments(grace: int | None) -> None:
+    """Remove stored files no attachment refers to any more, and abandoned uploads."""
+    result = collect_garbage(timedelta(seconds=current_app.config["ATTACHMENTS_GC_GRACE"] if grace is None else grace))
+    click.echo(f"Removed {result['removed']} file(s) ({result['freed_bytes'] / 1024:.1f} kB) and "
+               f"{result['abandoned_uploads']} abandoned upload(s).")
+
+
+def _run_worker_process(threads: int | None) -> None:
+    from . import create_app  # noqa: PLC0415
+
+    _run_worker(create_app(), threads)
+
+
+def _run_worker(app: Flask, threads: int | None) -> None:
+    worker = Worker(app, threads=threads)
+    signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+    signal.signal(signal.SIGINT, lambda *_: worker.stop())
+    worker.run()
+
+
+@click.command("worker")
+@click.option("--threads", default=None, type=int, help="Worker threads per process (JOBS_WORKER_THREADS).")
+@click.option("--processes", default=1, show_default=True, help="Worker processes, for CPU-bound jobs.")
+@click.option("--once", is_flag=True, help="Run all due jobs in the foreground and exit.")
+def worker_command(threads: int | None, processes: int, once: bool) -> None:
+    """Execute queued background jobs until interrupted."""
+    app = current_app._get_current_object()
+    if once:
+        click.echo(f"Ran {run_pending(app)} job(s).")
+        return
+    if processes <= 1:
+        _run_worker(app, threads)
+        return
+    context = multiprocessing.get_context("spawn")
+    children = [context.Process(target=_run_worker_process, args=(threads,), name=f"mediarch-worker-{i}")
+                for i in range(processes)]
+    for child in children:
+        child.start()
+
+    def terminate(*_) -> None:
+        for child in children:
+            child.terminate()
+
+    signal.signal(signal.SIGTERM, terminate)
+    for child in children:
+        child.join()
+
+
+@click.command("profile-startup")
+@click.option("--repeat", default=3, show_default=True, help="Cold starts to measure; the fastest is reported.")
+@click.option("--top", default=15, show_default=True, help="Slowest top-level imports to list.")
+def profile_startup_command(repeat: int, top: int) -> None:
+    """Measure how long a new worker takes to import MediArch and create the app.
+
+    Runs in fresh interpreters with this environment, so the database in DATABASE_URL is contacted.
+    """
+    best = min((measure_cold_start() for _ in range(max(repeat, 1))), key=lambda run: run.total)
+    click.echo(f"Cold start: {best.total * 1000:.0f} ms (fastest of {max(repeat, 1)})")
+    click.echo("create_app phases:")
+    for phase, seconds in best.phases.items():
+        click.echo(f"  {phase:<32}{seconds * 1000:>8.1f} ms")
+    click.echo("Slowest imports (cumulative, measured with -X importtime):")
+    for module, seconds in measure_cold_start(importtime=True).imports[:top]:
+        click.echo(f"  {module:<32}{seconds * 1000:>8.1f} ms")
+
+
+def register_commands(app: Flask) -> None:
+    app.cli.add_command(sessions_cli)
+    app.cli.add_command(history_cli)
+    app.cli.add_command(patients_cli)
+    app.cli.add_command(observations_cli)
+    app.cli.add_command(attachments_cli)
+    app.cli.add_command(worker_command)
+    app.cli.add_command(profile_startup_command)
+
+
+def main() -> None:
+    """Entry point of the ``mediarch`` console script."""
+    from . import create_app  # noqa: PLC0415
+
+    FlaskGroup(create_app=create_app, help="MediArch management commands.").main()
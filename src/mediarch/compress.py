@@ -0,0 +1,285 @@
+"""Response compression.
+
+A WSGI middleware that compresses text responses with the best encoding both sides support: brotli
+(``br``) or zstd when the optional ``brotli`` / ``zstandard`` packages are installed, gzip otherwise.
+Only content types in ``COMPRESS_MIMETYPES`` of at least ``COMPRESS_MIN_SIZE`` bytes are compressed.
+Responses to ``HEAD`` and ``Range`` requests, partial and bodiless statuses, already encoded bodies,
+``Cache-Control: no-transform`` and files sent through ``wsgi.file_wrapper`` (``send_file``) pass through
+untouched: compressing a file would read it into the worker instead of letting the server ``sendfile(2)`` it.
+
+Bodies of known length up to ``COMPRESS_MAX_BUFFERED`` bytes are compressed whole, keeping an exact
+``Content-Length``. Larger ones and streamed responses (e.g. the full patient list) are compressed chunk by
+chunk, each chunk flushed so the browser can render rows as they arrive, so a worker never holds a large
+body in memory. Responses written through the legacy ``write()`` callable are sent as written.
+"""
+import re
+import zlib
+from collections.abc import Callable, Iterable, Iterator
+from itertools import chain
+
+from flask import Flask
+from werkzeug.wsgi import FileWrapper
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+DEFAULT_MIMETYPES = frozenset({
+    "text/html", "text/css", "text/plain", "text/csv", "text/javascript", "application/javascript",
+    "application/json", "image/svg+xml",
+})
+
+_NO_BODY_STATUSES = frozenset({204, 206, 304})
+_TOKEN_RE = re.compile(r"\s*([^\s;,]+)\s*(?:;\s*q=([0-9.]+))?\s*")
+
+
+class _Gzip:
+    def __init__(self, level: int) -> None:
+        self._obj = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.compress(data)
+
+    def flush(self) -> bytes:
+        return self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._obj.flush()
+
+
+class _Brotli:
+    def __init__(self, level: int) -> None:
+        self._obj = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.process(data)
+
+    def flush(self) -> bytes:
+        return self._obj.flush()
+
+    def finish(self) -> bytes:
+        return self._obj.finish()
+
+
+class _Zstd:
+    def __init__(self, level: int) -> None:
+        self._obj = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.compress(data)
+
+    def flush(self) -> bytes:
+        return self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._obj.flush()
+
+
+# Content-Encoding -> compressor, in order of server preference.
+COMPRESSORS: dict[str, type] = {}
+if brotli is not None:
+    COMPRESSORS["br"] = _Brotli
+if zstandard is not None:
+    COMPRESSORS["zstd"] = _Zstd
+COMPRESSORS["gzip"] = _Gzip
+
+DEFAULT_LEVELS = {"br": 4, "zstd": 3, "gzip": 6}
+
+
+def negotiate(accept_encoding: str, available: Iterable[str]) -> str | None:
+    """Pick the encoding with the highest ``q`` in ``Accept-Encoding``; ties go to the first of ``available``."""
+    weights = {}
+    for part in accept_encoding.lower().split(","):
+        match = _TOKEN_RE.fullmatch(part)
+        if not match:
+            continue
+        try:
+            weights[match.group(1)] = float(match.group(2) or 1)
+        except ValueError:
+            continue
+    best, best_q = None, 0.0
+    for encoding in available:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class CompressionMiddleware:
+    """WSGI middleware compressing eligible responses."""
+
+    def __init__(self, app: Callable, *, min_size: int = 500, max_buffered: int = 1024 * 1024,
+                 mimetypes: Iterable[str] = DEFAULT_MIMETYPES, encodings: Iterable[str] | None = None,
+                 levels: dict[str, int] | None = None) -> None:
+        self.app = app
+        self.min_size = min_size
+        self.max_buffered = max_buffered
+        self.mimetypes = frozenset(mimetypes)
+        self.encodings = [name for name in (encodings or COMPRESSORS) if name in COMPRESSORS]
+        self.levels = {**DEFAULT_LEVELS, **(levels or {})}
+
+    def __call__(self, environ: dict, start_response: Callable) -> Iterable[bytes]:
+        state: dict = {}
+
+        def write(data: bytes) -> None:
+            # The app writes before returning its body: start the response as it is and send both through.
+            if "write" not in state:
+                state["write"] = start_response(state["status"], state["headers"], state["exc_info"])
+            state["write"](data)
+
+        def capture(status, headers, exc_info=None):
+            state["status"], state["headers"], state["exc_info"] = status, headers, exc_info
+            return write
+
+        body = self.app(environ, capture)
+        if "write" in state:
+            return body
+        if "status" in state and _is_file(body, environ):
+            start_response(state["status"], state["headers"], state["exc_info"])
+            return body
+        if "status" not in state:  # start_response deferred to the first chunk
+            iterator = iter(body)
+            first = next(iterator, b"")
+            body = _Closing(chain([first], iterator), body)
+
+        status, headers = state["status"], state["headers"]
+        content_type = _header(headers, "content-type")
+        if content_type is None or content_type.split(";")[0].strip().lower() not in self.mimetypes:
+            start_response(status, headers, state["exc_info"])
+            return body
+
+        headers = _add_vary(headers)
+        encoding = self._encoding_for(environ, int(status.split(" ", 1)[0]), headers)
+        if encoding is None:
+            start_response(status, headers, state["exc_info"])
+            return body
+
+        length = _header(headers, "content-length")
+        if length is not None and int(length) < self.min_size:
+            start_response(status, headers, state["exc_info"])
+            return body
+        if length is not None and int(length) <= self.max_buffered:
+            return self._compress_whole(encoding, status, headers, body, start_response, state["exc_info"])
+        return self._compress_stream(encoding, status, headers, body, start_response, state["exc_info"])
+
+    def _encoding_for(self, environ: dict, status: int, headers: list) -> str | None:
+        if environ.get("REQUEST_METHOD") == "HEAD" or "HTTP_RANGE" in environ:
+            return None
+        if status < 200 or status in _NO_BODY_STATUSES:
+            return None
+        if _header(headers, "content-encoding") is not None:
+            return None
+        if "no-transform" in (_header(headers, "cache-control") or "").lower():
+            return None
+        return negotiate(environ.get("HTTP_ACCEPT_ENCODING", ""), self.encodings)
+
+    def _compressed_headers(self, headers: list, encoding: str) -> list:
+        result = []
+        for name, value in headers:
+            key = name.lower()
+            if key == "content-length":
+                continue
+            if key == "etag" and not value.startswith("W/"):
+                # The bytes differ from the identity representation.
+                result.append((name, f"W/{value}"))
+            else:
+                result.append((name, value))
+        result.append(("Content-Encoding", encoding))
+        return result
+
+    def _compress_whole(self, encoding, status, headers, body, start_response, exc_info) -> list[bytes]:
+        try:
+            data = b"".join(body)
+        finally:
+            if hasattr(body, "close"):
+                body.close()
+        compressor = COMPRESSORS[encoding](self.levels[encoding])
+        compressed = compressor.compress(data) + compressor.finish()
+        headers = self._compressed_headers(headers, encoding)
+        headers.append(("Content-Length", str(len(compressed))))
+        start_response(status, headers, exc_info)
+        return [compressed]
+
+    def _compress_stream(self, encoding, status, headers, body, start_response, exc_info) -> Iterator[bytes]:
+        iterator = iter(body)
+        try:
+            # Hold back the start of the body until it is clear the response is worth compressing.
+            pending, size = [], 0
+            for chunk in iterator:
+                pending.append(chunk)
+                size += len(chunk)
+                if size >= self.min_size:
+                    break
+            else:
+                start_response(status, headers, exc_info)
+                yield b"".join(pending)
+                return
+
+            start_response(status, self._compressed_headers(headers, encoding), exc_info)
+            compressor = COMPRESSORS[encoding](self.levels[encoding])
+            yield compressor.compress(b"".join(pending)) + compressor.flush()
+            for chunk in iterator:
+                if chunk:
+                    yield compressor.compress(chunk) + compressor.flush()
+            yield compressor.finish()
+        finally:
+            if hasattr(body, "close"):
+                body.close()
+
+
+class _Closing:
+    """Iterable that forwards ``close`` to the original response body."""
+
+    def __init__(self, iterator: Iterator[bytes], body: Iterable[bytes]) -> None:
+        self._iterator = iterator
+        self._body = body
+
+    def __iter__(self) -> Iterator[bytes]:
+        return self._iterator
+
+    def close(self) -> None:
+        if hasattr(self._body, "close"):
+            self._body.close()
+
+
+def _is_file(body: Iterable[bytes], environ: dict) -> bool:
+    """Whether ``body`` is a file wrapped for the server, by its ``wsgi.file_wrapper`` or Werkzeug's fallback."""
+    wrapper = environ.get("wsgi.file_wrapper")
+    return isinstance(body, FileWrapper) or (isinstance(wrapper, type) and isinstance(body, wrapper))
+
+
+def _header(headers: list, name: str) -> str | None:
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _add_vary(headers: list) -> list:
+    """Responses differ by ``Accept-Encoding`` whether or not this one is compressed."""
+    vary = _header(headers, "vary")
+    if vary is None:
+        return [*headers, ("Vary", "Accept-Encoding")]
+    if "accept-encoding" in vary.lower() or vary.strip() == "*":
+        return headers
+    return [(k, f"{v}, Accept-Encoding" if k.lower() == "vary" else v) for k, v in headers]
+
+
+def init_app(app: Flask) -> None:
+    """Wrap ``app.wsgi_app`` in ``CompressionMiddleware`` unless ``COMPRESS_ENABLED`` is false."""
+    if not app.config["COMPRESS_ENABLED"]:
+        return
+    app.wsgi_app = CompressionMiddleware(
+        app.wsgi_app,
+        min_size=app.config["COMPRESS_MIN_SIZE"],
+        max_buffered=app.config["COMPRESS_MAX_BUFFERED"],
+        mimetypes=app.config["COMPRESS_MIMETYPES"] or DEFAULT_MIMETYPES,
+        encodings=app.config["COMPRESS_ENCODINGS"],
+        levels=app.config["COMPRESS_LEVELS"],
+    )
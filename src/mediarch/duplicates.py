@@ -0,0 +1,433 @@
+"""Detection and merging of duplicate patient cards.
+
+The same person often ends up with two cards: one self-registered, one entered by a doctor, or one per
+spelling of their name. Comparing every card with every other is quadratic and does not scale to a
+large registry, so detection works in two steps:
+
+Blocking
+    Every live card gets a few ``PatientMatchKey`` rows, maintained on each flush: the phonetic codes of
+    its two names (in either order, which catches typos and swapped first and last names), its
+    normalised last name with the first initial, and its birth date with either initial. Only cards
+    sharing a key are compared. Keys shared by more than ``DUPLICATES_MAX_BLOCK`` cards (very common
+    names) are skipped, since another key usually pairs the real duplicates anyway. An archived card
+    keeps its keys and is compared through its ``ArchivedPatient`` stub.
+
+Scoring
+    Each block is scored as a whole: every card is normalised once, and name similarities
+    (Jaro-Winkler) are cached for the scan, since the same names recur across pairs and blocks. The
+    name score is weighed with the birth dates, which add when they agree and count against the pair
+    when they differ.
+
+Pairs scoring at least ``DUPLICATES_MIN_SCORE`` are queued as ``DuplicateCandidate`` rows, which admins
+review best first at ``/admin/duplicates``, merging the pair or dismissing it. The ``patients.duplicates``
+job scans the whole registry in bounded batches of keys; ``patients.match`` checks one new card.
+"""
+import unicodedata
+from collections.abc import Callable, Iterable, Sequence
+from dataclasses import dataclass
+from datetime import UTC, date, datetime
+from functools import lru_cache
+
+from flask import current_app
+from sqlalchemy import delete, event, func, insert, inspect, or_, select, union_all, update
+from sqlalchemy.orm import aliased
+
+from . import db
+from .jobs import enqueue, job
+from .models import (
+    Appointment,
+    ArchivedPatient,
+    Attachment,
+    BloodType,
+    DuplicateCandidate,
+    DuplicateStatus,
+    Observation,
+    Patient,
+    PatientAllergy,
+    PatientMatchKey,
+    Prescription,
+)
+from .softdelete import soft_delete
+
+# Columns the blocking keys are built from; changing one rebuilds the card's keys.
+KEY_COLUMNS = ("first_name", "last_name", "birth_date", "deleted_at")
+
+# Free-text fields combined when two cards are merged.
+MERGED_TEXT_FIELDS = ("allergies", "medical_conditions", "medications", "notes")
+
+_SOUNDEX_CODES = {letter: code for letters, code in (("bfpv", "1"), ("cgjkqsxz", "2"), ("dt", "3"), ("l", "4"),
+                                                      ("mn", "5"), ("r", "6"))
+                  for letter in letters}
+
+
+class MergeError(ValueError):
+    """Two cards cannot be merged; the message says why."""
+
+
+def normalize_name(value: str | None) -> str:
+    """Lowercase letters of ``value`` without accents, spaces or punctuation."""
+    decomposed = unicodedata.normalize("NFKD", (value or "").casefold())
+    return "".join(char for char in decomposed if char.isalpha())
+
+
+def soundex(name: str) -> str:
+    """American Soundex code of a normalised name; names in other scripts keep their first four letters."""
+    if not name or not name.isascii():
+        return name[:4]
+    code, last = name[0], _SOUNDEX_CODES.get(name[0], "")
+    for char in name[1:]:
+        digit = _SOUNDEX_CODES.get(char, "")
+        if digit and digit != last:
+            code += digit
+            if len(code) == 4:
+                break
+        if char not in "hw":  # vowels separate equal codes, h and w do not
+            last = digit
+    return code.ljust(4, "0")
+
+
+def blocking_keys(first_name: str | None, last_name: str | None, birth_date: date | None) -> set[str]:
+    """The blocking keys of a card."""
+    first, last = normalize_name(first_name), normalize_name(last_name)
+    keys = set()
+    if first or last:
+        keys.add("name:" + "|".join(sorted((soundex(first), soundex(last)))))
+    if first and last:
+        keys.add(f"last:{last}|{first[0]}")
+    if birth_date is not None:
+        keys.update(f"dob:{birth_date.isoformat()}|{initial}" for initial in {first[:1], last[:1]})
+    return keys
+
+
+def jaro_winkler(a: str, b: str) -> float:
+    """Jaro-Winkler similarity of two strings, from 0.0 to 1.0."""
+    if a == b:
+        return 1.0 if a else 0.0
+    if not a or not b:
+        return 0.0
+    window = max(max(len(a), len(b)) // 2 - 1, 0)
+    used = [False] * len(b)
+    matches_a = []
+    for i, char in enumerate(a):
+        for j in range(max(0, i - window), min(len(b), i + window + 1)):
+            if not used[j] and b[j] == char:
+                used[j] = True
+                matches_a.append(char)
+                break
+    matches = len(matches_a)
+    if not matches:
+        return 0.0
+    matches_b = [char for char, hit in zip(b, used, strict=True) if hit]
+    transpositions = sum(x != y for x, y in zip(matches_a, matches_b, strict=True)) // 2
+    jaro = (matches / len(a) + matches / len(b) + (matches - transpositions) / matches) / 3
+    prefix = 0
+    for x, y in zip(a[:4], b[:4], strict=False):
+        if x != y:
+            break
+        prefix += 1
+    return jaro + prefix * 0.1 * (1 - jaro)
+
+
+@dataclass(frozen=True, slots=True)
+class Card:
+    """What scoring needs of a patient card, normalised once per scan."""
+
+    id: int
+    first: str
+    last: str
+    birth_date: date | None
+
+    @classmethod
+    def from_row(cls, row) -> "Card":
+        return cls(row.id, normalize_name(row.first_name), normalize_name(row.last_name), row.birth_date)
+
+
+Similarity = Callable[[str, str], float]
+
+
+def cached_similarity(maxsize: int = 1 << 16) -> Similarity:
+    """A ``jaro_winkler`` that remembers its results; use one per scan."""
+    return lru_cache(maxsize=maxsize)(jaro_winkler)
+
+
+def _mistyped(a: date, b: date) -> bool:
+    """Whether two dates differ by one digit, or by day and month being swapped."""
+    if a.year == b.year and (a.month, a.day) == (b.day, b.month):
+        return True
+    return sum(x != y for x, y in zip(a.isoformat(), b.isoformat(), strict=True)) == 1
+
+
+def score_pair(a: Card, b: Card, similarity: Similarity = jaro_winkler) -> tuple[float, dict]:
+    """How likely ``a`` and ``b`` are the same person, from 0.0 to 1.0, and the reasons shown to reviewers."""
+    straight = 0.6 * similarity(a.last, b.last) + 0.4 * similarity(a.first, b.first)
+    swapped = 0.6 * similarity(a.last, b.first) + 0.4 * similarity(a.first, b.last)
+    name = max(straight, swapped)
+    if a.birth_date is None or b.birth_date is None:
+        birth_date, score = "missing", 0.85 * name  # only near-identical names reach the default threshold
+    elif a.birth_date == b.birth_date:
+        birth_date, score = "same", 0.7 * name + 0.3
+    elif _mistyped(a.birth_date, b.birth_date):
+        birth_date, score = "close", 0.7 * name + 0.15
+    else:
+        birth_date, score = "different", 0.7 * name
+    reasons = {"name": round(name, 3), "birth_date": birth_date}
+    if swapped > straight:
+        reasons["swapped_names"] = True
+    return round(score, 4), reasons
+
+
+def score_block(cards: Sequence[Card], similarity: Similarity, min_score: float,
+                only: int | None = None) -> dict[tuple[int, int], tuple[float, dict]]:
+    """Score the pairs of one block (those involving card ``only`` if given) and keep the likely ones."""
+    found = {}
+    for i, a in enumerate(cards):
+        for b in cards[i + 1:]:
+            if only is not None and only not in {a.id, b.id}:
+                continue
+            score, reasons = score_pair(a, b, similarity)
+            if score >= min_score:
+                found[min(a.id, b.id), max(a.id, b.id)] = (score, reasons)
+    return found
+
+
+# --- Blocking keys ---
+
+def _key_rows(patient: Patient) -> list[dict]:
+    return [{"patient_id": patient.id, "key": key}
+            for key in blocking_keys(patient.first_name, patient.last_name, patient.birth_date)]
+
+
+@event.listens_for(db.session, "after_flush")
+def _maintain_match_keys(session, flush_context) -> None:
+    stale, rows = [], []
+    for obj in session.dirty:
+        if isinstance(obj, Patient) and any(inspect(obj).attrs[key].history.has_changes() for key in KEY_COLUMNS):
+            stale.append(obj.id)
+            if obj.deleted_at is None:
+                rows.extend(_key_rows(obj))
+    stale.extend(obj.id for obj in session.deleted if isinstance(obj, Patient))
+    rows.extend(row for obj in session.new if isinstance(obj, Patient) and obj.deleted_at is None
+                for row in _key_rows(obj))
+    connection = session.connection()
+    if stale:
+        connection.execute(delete(PatientMatchKey).where(PatientMatchKey.patient_id.in_(stale)))
+    if rows:
+        connection.execute(insert(PatientMatchKey), rows)
+
+
+def rebuild_match_keys(batch_size: int = 1000) -> int:
+    """Recompute the keys of every live card, e.g. for cards created before keys existed; returns the count."""
+    patients, keys = Patient.__table__, PatientMatchKey.__table__
+    last_id, rebuilt = 0, 0
+    while True:
+        rows = db.session.execute(
+            select(patients.c.id, patients.c.first_name, patients.c.last_name, patients.c.birth_date)
+            .where(patients.c.deleted_at.is_(None), patients.c.id > last_id)
+            .order_by(patients.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return rebuilt
+        ids = [row.id for row in rows]
+        db.session.execute(delete(keys).where(keys.c.patient_id.in_(ids)))
+        db.session.execute(insert(keys), [{"patient_id": row.id, "key": key} for row in rows
+                                          for key in blocking_keys(row.first_name, row.last_name, row.birth_date)])
+        db.session.commit()
+        last_id, rebuilt = ids[-1], rebuilt + len(rows)
+
+
+# --- Detection ---
+
+def _blocks(keys: Iterable[str]) -> dict[str, list[Card]]:
+    """The live and archived cards of each of ``keys``."""
+    patients, archived, match_keys = Patient.__table__, ArchivedPatient.__table__, PatientMatchKey.__table__
+    keys = list(keys)
+    blocks: dict[str, list[Card]] = {}
+    for row in db.session.execute(union_all(
+        select(match_keys.c.key, patients.c.id, patients.c.first_name, patients.c.last_name, patients.c.birth_date)
+        .join(patients, patients.c.id == match_keys.c.patient_id)
+        .where(match_keys.c.key.in_(keys), patients.c.deleted_at.is_(None)),
+        select(match_keys.c.key, archived.c.patient_id.label("id"), archived.c.first_name, archived.c.last_name,
+               archived.c.birth_date)
+        .join(archived, archived.c.patient_id == match_keys.c.patient_id)
+        .where(match_keys.c.key.in_(keys)),
+    )):
+        blocks.setdefault(row.key, []).append(Card.from_row(row))
+    return blocks
+
+
+def _queue(found: dict[tuple[int, int], tuple[float, dict]]) -> int:
+    """Insert the pairs of ``found`` not queued or decided before; return how many were new."""
+    if not found:
+        return 0
+    existing = set(db.session.execute(
+        select(DuplicateCandidate.patient_id, DuplicateCandidate.other_id)
+        .where(DuplicateCandidate.patient_id.in_({pair[0] for pair in found}))
+    ).tuples())
+    rows = [{"patient_id": first, "other_id": second, "score": score, "reasons": reasons,
+             "status": DuplicateStatus.PENDING, "detected_at": datetime.now(UTC)}
+            for (first, second), (score, reasons) in found.items() if (first, second) not in existing]
+    if rows:
+        db.session.execute(insert(DuplicateCandidate), rows)
+    return len(rows)
+
+
+def _merge_found(target: dict, found: dict) -> None:
+    for pair, result in found.items():
+        if pair not in target or result[0] > target[pair][0]:
+            target[pair] = result
+
+
+def find_duplicates(max_block: int, min_score: float, keys_per_batch: int = 1000) -> int:
+    """Scan every block of the registry and queue the likely duplicates; return how many pairs were new.
+
+    Keys are read in batches, each scored and committed on its own, so memory and transactions stay
+    bounded however large the registry is.
+    """
+    keys = PatientMatchKey.__table__
+    similarity = cached_similarity()
+    last_key, queued = "", 0
+    while True:
+        batch = db.session.scalars(
+            select(keys.c.key)
+            .where(keys.c.key > last_key)
+            .group_by(keys.c.key)
+            .having(func.count().between(2, max_block))
+            .order_by(keys.c.key)
+            .limit(keys_per_batch)
+        ).all()
+        if not batch:
+            return queued
+        found: dict[tuple[int, int], tuple[float, dict]] = {}
+        for cards in _blocks(batch).values():
+            _merge_found(found, score_block(cards, similarity, min_score))
+        queued += _queue(found)
+        db.session.commit()
+        last_key = batch[-1]
+
+
+def find_duplicates_of(patient_id: int, max_block: int, min_score: float) -> int:
+    """Compare one card with the cards sharing its keys and queue the likely duplicates."""
+    keys = PatientMatchKey.__table__
+    own = select(keys.c.key).where(keys.c.patient_id == patient_id).scalar_subquery()
+    shared = db.session.scalars(
+        select(keys.c.key).where(keys.c.key.in_(own)).group_by(keys.c.key)
+        .having(func.count().between(2, max_block))
+    ).all()
+    found: dict[tuple[int, int], tuple[float, dict]] = {}
+    similarity = cached_similarity()
+    for cards in _blocks(shared).values():
+        _merge_found(found, score_block(cards, similarity, min_score, only=patient_id))
+    queued = _queue(found)
+    db.session.commit()
+    return queued
+
+
+def check_new_patient(patient: Patient) -> None:
+    """Queue a duplicate check of a card being added; the caller commits."""
+    db.session.flush()  # assigns the id
+    enqueue("patients.match", {"patient_id": patient.id})
+
+
+def _exists(patient_id):
+    """Whether the card ``patient_id`` (a column) is in ``patients`` or archived."""
+    return or_(select(Patient.id).where(Patient.id == patient_id).exists(),
+               select(ArchivedPatient.patient_id).where(ArchivedPatient.patient_id == patient_id).exists())
+
+
+def pending_candidates():
+    """Statement selecting the pending pairs whose two cards still exist, live or archived, best first."""
+    return (select(DuplicateCandidate)
+            .where(DuplicateCandidate.status == DuplicateStatus.PENDING,
+                   _exists(DuplicateCandidate.patient_id), _exists(DuplicateCandidate.other_id))
+            .order_by(DuplicateCandidate.score.desc(), DuplicateCandidate.id))
+
+
+# --- Review ---
+
+def _combined_text(kept: str | None, merged: str | None) -> str | None:
+    values = [value.strip() for value in (kept, merged) if value and value.strip()]
+    if len(values) == 2 and values[0] == values[1]:
+        values.pop()
+    return "\n".join(values) or None
+
+
+def merge_patients(source: Patient, target: Patient) -> None:
+    """Fold ``source`` into ``target`` and soft-delete ``source``; the caller commits.
+
+    Blank fields of ``target`` are filled from ``source``, differing free-text fields are combined, and
+    the observations, appointments, prescriptions, drug allergies, attachments and user account of
+    ``source`` move to ``target``. Names stay those of ``target``.
+    """
+    if source.id == target.id:
+        raise MergeError("A patient card cannot be merged into itself.")
+    account = source.user_account
+    if account is not None and target.user_account is not None:
+        raise MergeError("Both cards are linked to user accounts; unlink one of them first.")
+    if target.birth_date is None:
+        target.birth_date = source.birth_date
+    if target.blood_type in {None, BloodType.UNKNOWN} and source.blood_type is not None:
+        target.blood_type = source.blood_type
+    for key in MERGED_TEXT_FIELDS:
+        setattr(target, key, _combined_text(getattr(target, key), getattr(source, key)))
+    if account is not None:
+        account.patient_card = target
+    _move_observations(source.id, target.id)
+    for model in (Appointment, Attachment, Prescription):
+        db.session.execute(update(model).where(model.patient_id == source.id).values(patient_id=target.id)
+                           .execution_options(synchronize_session=False))
+    _move_allergies(source.id, target.id)
+    soft_delete(source)
+
+
+def _move_observations(source_id: int, target_id: int) -> None:
+    """Give ``target_id`` the observations of ``source_id``; readings both cards have are kept once."""
+    other = aliased(Observation)
+    db.session.execute(
+        update(Observation)
+        .where(Observation.patient_id == source_id,
+               ~select(other.patient_id).where(other.patient_id == target_id, other.code == Observation.code,
+                                               other.observed_at == Observation.observed_at).exists())
+        .values(patient_id=target_id)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.execute(delete(Observation).where(Observation.patient_id == source_id)
+                       .execution_options(synchronize_session=False))
+
+
+def _move_allergies(source_id: int, target_id: int) -> None:
+    """Give ``target_id`` the drug allergies of ``source_id`` it does not have yet."""
+    other = aliased(PatientAllergy)
+    db.session.execute(
+        update(PatientAllergy)
+        .where(PatientAllergy.patient_id == source_id,
+               ~select(other.patient_id).where(other.patient_id == target_id,
+                                               other.allergen_code == PatientAllergy.allergen_code).exists())
+        .values(patient_id=target_id)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.execute(delete(PatientAllergy).where(PatientAllergy.patient_id == source_id)
+                       .execution_options(synchronize_session=False))
+
+
+def review_candidate(candidate: DuplicateCandidate, status: DuplicateStatus, reviewer_id: int) -> None:
+    """Record an admin's decision on ``candidate``; the caller commits."""
+    candidate.status = status
+    candidate.reviewed_by_id = reviewer_id
+    candidate.reviewed_at = datetime.now(UTC)
+
+
+@job("patients.duplicates")
+def duplicates_job(min_score: float | None = None) -> dict:
+    """Background job wrapper around ``find_duplicates`` using the configured defaults."""
+    config = current_app.config
+    queued = find_duplicates(config["DUPLICATES_MAX_BLOCK"],
+                             config["DUPLICATES_MIN_SCORE"] if min_score is None else min_score)
+    return {"queued": queued}
+
+
+@job("patients.match")
+def match_job(patient_id: int) -> dict:
+    """Check one new card against the registry."""
+    config = current_app.config
+    return {"queued": find_duplicates_of(patient_id, config["DUPLICATES_MAX_BLOCK"], config["DUPLICATES_MIN_SCORE"])}
@@ -0,0 +1,42 @@
+"""Partial page responses for client-side navigation.
+
+``static/js/main.js`` fetches links marked ``data-fragment`` with an ``X-Fragment`` request header naming
+the part it wants, and swaps it into the current page instead of reloading it:
+
+* ``main`` -- the content of ``<main>`` (page header, flashed messages and content) plus the ``<title>``;
+  templates opt in with ``{% extends "_fragment.html" if fragment else "base.html" %}``;
+* ``rows`` -- only the patient table rows and pager of the patient list.
+
+Views accept fragments with the ``fragments`` decorator. A partial response echoes the header, so the
+script can tell it from a full page it must navigate to instead (e.g. the login page after a redirect).
+"""
+from functools import wraps
+
+from flask import Flask, g, make_response, request
+
+FRAGMENT_HEADER = "X-Fragment"
+
+
+def current_fragment() -> str | None:
+    """Kind of partial response being rendered, ``None`` for a full page."""
+    return g.get("fragment")
+
+
+def fragments(*kinds: str):
+    """Let a view answer ``X-Fragment: <kind>`` requests for ``kinds`` with a partial response."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            kind = request.headers.get(FRAGMENT_HEADER)
+            g.fragment = kind if kind in kinds else None
+            response = make_response(view(*args, **kwargs))
+            response.vary.add(FRAGMENT_HEADER)
+            if g.fragment is not None and response.status_code == 200:
+                response.headers[FRAGMENT_HEADER] = g.fragment
+            return response
+        return wrapper
+    return decorator
+
+
+def init_app(app: Flask) -> None:
+    app.context_processor(lambda: {"fragment": current_fragment()})
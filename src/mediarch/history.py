@@ -0,0 +1,187 @@
+"""Append-only change history for patient records.
+
+Every flush that creates, modifies or deletes ``Patient`` rows appends one ``PatientHistory`` row per
+patient with a field-level diff. All rows of a flush are written with a single multi-row ``INSERT`` on
+the flushing connection, so the audit trail commits or rolls back together with the change itself.
+"""
+import enum
+from dataclasses import dataclass
+from datetime import UTC, date, datetime
+
+from flask import has_request_context
+from flask import session as flask_session
+from sqlalchemy import event, insert, inspect, select, text
+from sqlalchemy.engine import Connection
+
+from . import db
+from .models import HistoryAction, Patient, PatientHistory, User
+from .partitioning import create_hash_partitions, is_partitioned, partition_count, primary_key_includes
+
+# Columns that are bookkeeping rather than medical record content.
+UNAUDITED_COLUMNS = frozenset({"id", "last_activity_at"})
+
+
+def json_value(value):
+    """``value`` as stored in JSON: enums by value, dates and datetimes in ISO format."""
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _audited_columns() -> list[str]:
+    return [column.key for column in Patient.__table__.columns if column.key not in UNAUDITED_COLUMNS]
+
+
+def _actor_id() -> int | None:
+    # Read straight from the Flask session: resolving ``current_user`` could query inside the flush.
+    if not has_request_context():
+        return None
+    user_id = flask_session.get("_user_id")
+    return int(user_id) if user_id is not None else None
+
+
+def _diff(patient: Patient) -> dict:
+    state = inspect(patient)
+    changes = {}
+    for key in _audited_columns():
+        history = state.attrs[key].history
+        if not history.has_changes():
+            continue
+        old = history.deleted[0] if history.deleted else None
+        new = history.added[0] if history.added else None
+        if old != new:
+            changes[key] = [json_value(old), json_value(new)]
+    return changes
+
+
+def _snapshot(values, *, as_new: bool) -> dict:
+    changes = {}
+    for key in _audited_columns():
+        value = json_value(getattr(values, key))
+        if value is not None:
+            changes[key] = [None, value] if as_new else [value, None]
+    return changes
+
+
+def _update_action(changes: dict) -> HistoryAction:
+    if changes.get("deleted_at", (None, None))[1] is not None:
+        return HistoryAction.DELETE
+    return HistoryAction.UPDATE
+
+
+def collect_changes(session) -> list[dict]:
+    """Build the history rows for the pending flush of ``session``."""
+    rows = [(obj, HistoryAction.CREATE, _snapshot(obj, as_new=True))
+            for obj in session.new if isinstance(obj, Patient)]
+    rows.extend((obj, _update_action(changes), changes)
+                for obj in session.dirty if isinstance(obj, Patient) and (changes := _diff(obj)))
+    rows.extend((obj, HistoryAction.PURGE, _snapshot(obj, as_new=False))
+                for obj in session.deleted if isinstance(obj, Patient))
+    if not rows:
+        return []
+
+    now = datetime.now(UTC)
+    actor = _actor_id()
+    return [
+        {"patient_id": patient.id, "changed_at": now, "changed_by_id": actor, "action": action, "changes": changes}
+        for patient, action, changes in rows
+    ]
+
+
+def purge_entries(rows) -> list[dict]:
+    """History rows archiving hard-deleted ``patients`` rows (as returned by a Core ``SELECT``)."""
+    now = datetime.now(UTC)
+    return [
+        {"patient_id": row.id, "changed_at": now, "changed_by_id": None, "action": HistoryAction.PURGE,
+         "changes": _snapshot(row, as_new=False)}
+        for row in rows
+    ]
+
+
+@event.listens_for(db.session, "after_flush")
+def _record_patient_history(session, flush_context) -> None:
+    # Primary keys of new patients are known here, and attribute history is still intact.
+    if session.info.get("skip_patient_history"):
+        return
+    if rows := collect_changes(session):
+        session.connection().execute(insert(PatientHistory), rows)
+
+
+@dataclass(frozen=True, slots=True)
+class HistoryPage:
+    entries: list
+    page: int
+    has_next: bool
+
+    @property
+    def has_prev(self) -> bool:
+        return self.page > 1
+
+
+def history_page(patient_id: int, page: int = 1, per_page: int = 20) -> HistoryPage:
+    """Newest-first history entries for one patient with the username of the author.
+
+    Fetches one extra row instead of running a ``COUNT`` to know whether a next page exists.
+    """
+    page = max(page, 1)
+    rows = db.session.execute(
+        select(PatientHistory, User.username)
+        .outerjoin(User, User.id == PatientHistory.changed_by_id)
+        .where(PatientHistory.patient_id == patient_id)
+        .order_by(PatientHistory.changed_at.desc(), PatientHistory.id.desc())
+        .offset((page - 1) * per_page)
+        .limit(per_page + 1)
+    ).all()
+    return HistoryPage(entries=rows[:per_page], page=page, has_next=len(rows) > per_page)
+
+
+# --- PostgreSQL monthly partitions ---
+
+
+def _month_start(year: int, month: int) -> date:
+    year += (month - 1) // 12
+    month = (month - 1) % 12 + 1
+    return date(year, month, 1)
+
+
+def ensure_history_partitions(connection: Connection, months_ahead: int = 3, today: date | None = None,
+                              hash_partitions: int = 0) -> list[str]:
+    """Create the monthly partitions of ``patient_history`` up to ``months_ahead`` months from now.
+
+    A ``DEFAULT`` partition catches anything outside the prepared range so inserts never fail. With
+    ``hash_partitions``, new monthly partitions are split further by hash of ``patient_id``; months that
+    already exist keep their layout. That needs ``patient_id`` in the table's primary key, which it only has
+    when the table was created with ``PATIENT_HASH_PARTITIONS`` set; otherwise months are not split.
+    Returns the names of the monthly partitions that exist afterwards. No-op on other databases.
+    """
+    if connection.dialect.name != "postgresql":
+        return []
+    today = today or datetime.now(UTC).date()
+    table = PatientHistory.__tablename__
+    if hash_partitions and not primary_key_includes(connection, table, "patient_id"):
+        hash_partitions = 0
+    names = []
+    for offset in range(months_ahead + 1):
+        start = _month_start(today.year, today.month + offset)
+        end = _month_start(start.year, start.month + 1)
+        name = f"{table}_y{start.year}m{start.month:02d}"
+        connection.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            + (" PARTITION BY HASH (patient_id)" if hash_partitions else "")
+        ))
+        if hash_partitions and is_partitioned(connection, name):
+            create_hash_partitions(connection, name, hash_partitions)
+        names.append(name)
+    connection.execute(text(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT"))
+    return names
+
+
+@event.listens_for(PatientHistory.__table__, "after_create")
+def _add_partitioned_primary_key(target, connection, **kw) -> None:
+    # Every partitioning column must be in the key: the months, and their hash partitions by patient.
+    if connection.dialect.name == "postgresql":
+        columns = "id, changed_at, patient_id" if partition_count(connection) else "id, changed_at"
+        connection.execute(text(f"ALTER TABLE {target.name} ADD PRIMARY KEY ({columns})"))
@@ -0,0 +1,288 @@
+"""Database-backed background jobs.
+
+Slow work is queued as ``Job`` rows and executed by ``mediarch worker`` outside the request, with no
+external broker. Workers claim jobs with ``SELECT ... FOR UPDATE SKIP LOCKED`` on PostgreSQL (a
+conditional ``UPDATE`` makes the claim atomic on SQLite too), retry failures with exponential backoff
+and record the outcome on the row, where the job status API reads it.
+
+While a job runs, its worker refreshes ``locked_at`` every ``JOBS_HEARTBEAT_INTERVAL`` seconds, however
+long the job takes. A job whose lock went unrefreshed for ``JOBS_LOCK_TIMEOUT`` seconds belongs to a
+worker that died; it is queued again, or marked failed if that was its last attempt.
+
+Register a job and queue it from a view::
+
+    @job("reports.monthly")
+    def monthly_report(month: str) -> dict: ...
+
+    enqueue("reports.monthly", {"month": "2026-10"})
+    db.session.commit()
+"""
+import logging
+import os
+import socket
+import threading
+import traceback
+from collections.abc import Callable, Collection
+from dataclasses import dataclass
+from datetime import UTC, datetime, timedelta
+
+from flask import Flask
+from sqlalchemy import select, update
+
+from . import db
+from .models import Job, JobStatus
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True, slots=True)
+class JobDefinition:
+    name: str
+    func: Callable
+    max_attempts: int
+
+
+_registry: dict[str, JobDefinition] = {}
+
+
+def job(name: str, max_attempts: int = 3) -> Callable[[Callable], Callable]:
+    """Register ``func`` as the handler of jobs called ``name``; it receives the payload as keyword arguments."""
+    def decorator(func: Callable) -> Callable:
+        _registry[name] = JobDefinition(name, func, max_attempts)
+        return func
+    return decorator
+
+
+def registered_jobs() -> dict[str, JobDefinition]:
+    return dict(_registry)
+
+
+def enqueue(name: str, payload: dict | None = None, *, run_at: datetime | None = None,
+            max_attempts: int | None = None) -> Job:
+    """Add a job to the current session; it is queued when the caller commits."""
+    if name not in _registry:
+        raise KeyError(f"Unknown job {name!r}")
+    new_job = Job(
+        name=name,
+        payload=payload or {},
+        max_attempts=max_attempts or _registry[name].max_attempts,
+        run_at=run_at or datetime.now(UTC),
+    )
+    db.session.add(new_job)
+    db.session.flush()
+    return new_job
+
+
+def retry_delay(attempts: int, base: float, cap: float) -> timedelta:
+    """Exponential backoff: ``base``, ``2 * base``, ``4 * base``, ... capped at ``cap`` seconds."""
+    return timedelta(seconds=min(cap, base * 2 ** max(attempts - 1, 0)))
+
+
+def claim_next(worker_id: str) -> int | None:
+    """Atomically move the oldest due job to ``RUNNING`` and return its id."""
+    now = datetime.now(UTC)
+    candidate = db.session.execute(
+        select(Job.id)
+        .where(Job.status == JobStatus.QUEUED, Job.run_at <= now)
+        .order_by(Job.run_at, Job.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    ).scalar()
+    if candidate is None:
+        db.session.rollback()
+        return None
+    claimed = db.session.execute(
+        update(Job)
+        .where(Job.id == candidate, Job.status == JobStatus.QUEUED)
+        .values(status=JobStatus.RUNNING, locked_by=worker_id, locked_at=now, attempts=Job.attempts + 1)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return candidate if claimed else None
+
+
+def _record_failure(app: Flask, job_id: int, error: Exception) -> JobStatus:
+    """Roll back the job's work and schedule a retry, or mark it failed after its last attempt."""
+    config = app.config
+    db.session.rollback()
+    current = db.session.get(Job, job_id)
+    current.last_error = "".join(traceback.format_exception_only(error)).strip()
+    current.locked_by = current.locked_at = None
+    if current.attempts < current.max_attempts:
+        current.status = JobStatus.QUEUED
+        current.run_at = datetime.now(UTC) + retry_delay(
+            current.attempts, config["JOBS_RETRY_BASE_SECONDS"], config["JOBS_RETRY_MAX_SECONDS"])
+    else:
+        current.status = JobStatus.FAILED
+        current.finished_at = datetime.now(UTC)
+    logger.warning("Job %s (%s) failed on attempt %s: %s", job_id, current.name, current.attempts,
+                   current.last_error)
+    db.session.commit()
+    return current.status
+
+
+def run_job(app: Flask, job_id: int) -> JobStatus:
+    """Execute a claimed job and store its result, or schedule a retry.
+
+    Storing the result can fail too (e.g. a result the JSON column cannot hold); that counts as a failed
+    attempt, so the job never stays ``RUNNING`` behind a live worker.
+    """
+    current = db.session.get(Job, job_id)
+    definition = _registry.get(current.name)
+    try:
+        if definition is None:
+            raise LookupError(f"No handler registered for job {current.name!r}")
+        result = definition.func(**current.payload)
+    except Exception as e:
+        return _record_failure(app, job_id, e)
+    current.status = JobStatus.SUCCEEDED
+    current.result = result
+    current.finished_at = datetime.now(UTC)
+    current.locked_by = current.locked_at = None
+    try:
+        db.session.commit()
+    except Exception as e:
+        return _record_failure(app, job_id, e)
+    return current.status
+
+
+def heartbeat(worker_id: str, job_ids: Collection[int]) -> int:
+    """Refresh the lock of ``job_ids``, the jobs the threads of ``worker_id`` are running; return how many."""
+    if not job_ids:
+        return 0
+    count = db.session.execute(
+        update(Job)
+        .where(Job.id.in_(job_ids), Job.status == JobStatus.RUNNING,
+               Job.locked_by.startswith(f"{worker_id}:", autoescape=True))
+        .values(locked_at=datetime.now(UTC))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return count
+
+
+def requeue_stale(lock_timeout: float) -> int:
+    """Return jobs whose worker died mid-run to the queue; return how many.
+
+    The claim counted as an attempt, so a job that was on its last attempt is marked ``FAILED`` instead:
+    a job that kills its worker is not run forever.
+    """
+    now = datetime.now(UTC)
+    stale = (Job.status == JobStatus.RUNNING, Job.locked_at < now - timedelta(seconds=lock_timeout))
+    failed = db.session.execute(
+        update(Job)
+        .where(*stale, Job.attempts >= Job.max_attempts)
+        .values(status=JobStatus.FAILED, locked_by=None, locked_at=None, finished_at=now,
+                last_error="The worker running the job stopped responding.")
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    count = db.session.execute(
+        update(Job)
+        .where(*stale)
+        .values(status=JobStatus.QUEUED, locked_by=None, locked_at=None)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    if failed:
+        logger.warning("%s stale job(s) were out of attempts and failed", failed)
+    return count
+
+
+def schedule_periodic(schedule: dict[str, float]) -> list[Job]:
+    """Queue each ``{name: interval_seconds}`` job unless one is pending or finished within its interval."""
+    queued = []
+    now = datetime.now(UTC)
+    for name, interval in schedule.items():
+        last = db.session.execute(
+            select(Job.status, Job.created_at).where(Job.name == name).order_by(Job.id.desc()).limit(1)
+        ).first()
+        if last is not None:
+            status, created_at = last
+            if status in {JobStatus.QUEUED, JobStatus.RUNNING}:
+                continue
+            if created_at.tzinfo is None:  # SQLite returns naive datetimes
+                created_at = created_at.replace(tzinfo=UTC)
+            if now - created_at < timedelta(seconds=interval):
+                continue
+        queued.append(enqueue(name))
+    db.session.commit()
+    return queued
+
+
+def run_pending(app: Flask, limit: int | None = None, worker_id: str = "inline") -> int:
+    """Run due jobs in the calling thread until the queue is empty; used by tests and ``worker --once``."""
+    ran = 0
+    while limit is None or ran < limit:
+        with app.app_context():
+            job_id = claim_next(worker_id)
+            if job_id is None:
+                return ran
+            run_job(app, job_id)
+        ran += 1
+    return ran
+
+
+class Worker:
+    """Pool of threads polling the job table. Run several processes for CPU-bound jobs."""
+
+    def __init__(self, app: Flask, threads: int | None = None, poll_interval: float | None = None) -> None:
+        self.app = app
+        self.threads = threads or app.config["JOBS_WORKER_THREADS"]
+        self.poll_interval = poll_interval or app.config["JOBS_POLL_INTERVAL"]
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.stopping = threading.Event()
+        # thread index -> id of the job it is running; only these jobs get heartbeats
+        self.running: dict[int, int] = {}
+
+    def _loop(self, index: int) -> None:
+        worker_id = f"{self.worker_id}:{index}"
+        while not self.stopping.is_set():
+            try:
+                with self.app.app_context():
+                    job_id = claim_next(worker_id)
+                    if job_id is not None:
+                        self.running[index] = job_id
+                        try:
+                            run_job(self.app, job_id)
+                        finally:
+                            self.running.pop(index, None)
+                        continue
+            except Exception:
+                logger.exception("Worker thread %s failed to process a job", worker_id)
+            self.stopping.wait(self.poll_interval)
+
+    def _heartbeat(self) -> None:
+        interval = self.app.config["JOBS_HEARTBEAT_INTERVAL"]
+        while not self.stopping.wait(interval):
+            try:
+                with self.app.app_context():
+                    heartbeat(self.worker_id, list(self.running.values()))
+            except Exception:
+                logger.exception("Job heartbeat failed")
+
+    def _maintenance(self) -> None:
+        config = self.app.config
+        while not self.stopping.is_set():
+            try:
+                with self.app.app_context():
+                    requeue_stale(config["JOBS_LOCK_TIMEOUT"])
+                    schedule_periodic(config["JOBS_PERIODIC"])
+            except Exception:
+                logger.exception("Job maintenance failed")
+            self.stopping.wait(60)
+
+    def run(self) -> None:
+        """Block until ``stop()`` is called (e.g. from a signal handler)."""
+        pool = [threading.Thread(target=self._loop, args=(i,), name=f"job-worker-{i}", daemon=True)
+                for i in range(self.threads)]
+        pool.extend(threading.Thread(target=target, name=name, daemon=True)
+                    for target, name in ((self._heartbeat, "job-heartbeat"), (self._maintenance, "job-maintenance")))
+        for thread in pool:
+            thread.start()
+        logger.info("Worker %s started with %s thread(s)", self.worker_id, self.threads)
+        self.stopping.wait()
+        for thread in pool:
+            thread.join()
+
+    def stop(self) -> None:
+        self.stopping.set()
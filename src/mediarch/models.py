@@ -1,7 +1,20 @@
 import enum
-from datetime import date
+from datetime import UTC, date, datetime
+from typing import Any
 
 from flask_login import UserMixin
+from sqlalchemy import (
+    BigInteger,
+    CheckConstraint,
+    Index,
+    Integer,
+    PrimaryKeyConstraint,
+    UniqueConstraint,
+    column,
+    func,
+    text,
+)
+from sqlalchemy.dialects.postgresql import ExcludeConstraint
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from werkzeug.security import check_password_hash, generate_password_hash
 
@@ -30,6 +43,19 @@ class Patient(db.Model):
     """Patient medical record data."""
 
     __tablename__ = "patients"
+    __table_args__ = (
+        # Live rows only: what every list and lookup reads.
+        Index("ix_patients_live_name", "last_name", "first_name",
+              postgresql_where=text("deleted_at IS NULL"), sqlite_where=text("deleted_at IS NULL")),
+        # Deleted rows only: what the purge job scans.
+        Index("ix_patients_deleted_at", "deleted_at",
+              postgresql_where=text("deleted_at IS NOT NULL"), sqlite_where=text("deleted_at IS NOT NULL")),
+        # Live rows by activity: what the archive job scans.
+        Index("ix_patients_live_activity", "last_activity_at",
+              postgresql_where=text("deleted_at IS NULL"), sqlite_where=text("deleted_at IS NULL")),
+        # Never hand out the id of an archived card again: restoring it puts the row back under that id.
+        {"sqlite_autoincrement": True},
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     first_name: Mapped[str] = mapped_column(nullable=False)
@@ -43,11 +69,31 @@ class Patient(db.Model):
     medications: Mapped[str | None] = mapped_column(db.Text, nullable=True)
     notes: Mapped[str | None] = mapped_column(db.Text, nullable=True)  # General medical notes
 
+    # Soft delete: set by delete_patient, hard-deleted later by softdelete.purge_deleted_patients()
+    deleted_at: Mapped[datetime | None] = mapped_column(db.DateTime(timezone=True), nullable=True)
+    # Last edit, or last view within ARCHIVE_TOUCH_INTERVAL; archive.py archives cards inactive for long
+    last_activity_at: Mapped[datetime | None] = mapped_column(db.DateTime(timezone=True), nullable=True,
+                                                              default=lambda: datetime.now(UTC),
+                                                              onupdate=lambda: datetime.now(UTC))
+
     # The relationship is now primarily defined by User.patient_id
     user_account: Mapped["User | None"] = relationship(back_populates="patient_card", uselist=False)
 
     # Add more medical-record fields later (blood_type, notes, …)
 
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "first_name": self.first_name,
+            "last_name": self.last_name,
+            "birth_date": self.birth_date.isoformat() if self.birth_date else None,
+            "blood_type": self.blood_type.value if self.blood_type else None,
+            "allergies": self.allergies,
+            "medical_conditions": self.medical_conditions,
+            "medications": self.medications,
+            "notes": self.notes,
+        }
+
     def __repr__(self) -> str:  # pragma: no cover
         return f"<Patient {self.id} – {self.last_name}, {self.first_name}>"
 
@@ -87,3 +133,394 @@ class User(UserMixin, db.Model):
 
     def __repr__(self) -> str:
         return f"<User {self.username} ({self.account_type.value})>"
+
+
+class HistoryAction(enum.Enum):
+    CREATE = "create"
+    UPDATE = "update"
+    DELETE = "delete"  # soft delete
+    PURGE = "purge"  # final hard delete; ``changes`` holds the archived row
+
+
+def _not_postgresql(ddl, target, bind, **kw) -> bool:
+    return kw["dialect"].name != "postgresql"
+
+
+class PatientHistory(db.Model):
+    """Append-only change log of patient records: one row per changed patient per flush.
+
+    On PostgreSQL the table is range-partitioned by month on ``changed_at`` (see ``history.py``), which
+    requires the partition key in the primary key; that key is added after creation instead, with
+    ``patient_id`` too when the months are hash-partitioned by patient.
+    """
+
+    __tablename__ = "patient_history"
+    __table_args__ = (
+        PrimaryKeyConstraint("id").ddl_if(callable_=_not_postgresql),
+        Index("ix_patient_history_patient_changed", "patient_id", "changed_at"),
+        {"postgresql_partition_by": "RANGE (changed_at)"},
+    )
+
+    id: Mapped[int] = mapped_column(BigInteger().with_variant(Integer, "sqlite"), autoincrement=True)
+    # Deliberately not a foreign key: the history must outlive the patient row.
+    patient_id: Mapped[int] = mapped_column(nullable=False)
+    changed_at: Mapped[datetime] = mapped_column(db.DateTime(timezone=True), nullable=False,
+                                                 default=lambda: datetime.now(UTC))
+    changed_by_id: Mapped[int | None] = mapped_column(nullable=True)  # None for self-registration and scripts
+    action: Mapped[HistoryAction] = mapped_column(db.Enum(HistoryAction), nullable=False)
+    # {column: [old, new]} with JSON-compatible values
+    changes: Mapped[dict] = mapped_column(db.JSON, nullable=False)
+
+    def __repr__(self) -> str:  # pragma: no cover
+        return f"<PatientHistory {self.id} {self.action.value} patient={self.patient_id}>"
+
+
+class ChangeOperation(enum.Enum):
+    INSERT = "insert"
+    UPDATE = "update"
+    DELETE = "delete"  # includes soft deletes of patient cards
+
+
+class Change(db.Model):
+    """Entry of the change feed read by downstream systems (see ``changes.py``).
+
+    ``seq`` increases in commit order, so it doubles as the consumers' cursor.
+    """
+
+    __tablename__ = "change_log"
+    __table_args__ = ({"sqlite_autoincrement": True},)  # never reuse the number of a deleted row
+
+    seq: Mapped[int] = mapped_column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True,
+                                     autoincrement=True)
+    entity: Mapped[str] = mapped_column(nullable=False)  # "patient" or "user"
+    entity_id: Mapped[int] = mapped_column(nullable=False)
+    operation: Mapped[ChangeOperation] = mapped_column(db.Enum(ChangeOperation), nullable=False)
+    changed_at: Mapped[datetime] = mapped_column(db.DateTime(timezone=True), nullable=False,
+                                                 default=lambda: datetime.now(UTC))
+    # The entity's state after the change; None for deletes
+    data: Mapped[dict | None] = mapped_column(db.JSON, nullable=True)
+
+    def to_dict(self) -> dict:
+        return {
+            "seq": self.seq,
+            "entity": self.entity,
+            "id": self.entity_id,
+            "operation": self.operation.value,
+            "changed_at": self.changed_at.isoformat(),
+            "data": self.data,
+        }
+
+    def __repr__(self) -> str:  # pragma: no cover
+        return f"<Change {self.seq} {self.operation.value} {self.entity}={self.entity_id}>"
+
+
+class PatientArchiveBatch(db.Model):
+    """Inactive patient cards moved out of ``patients`` by ``archive.py``, compressed together.
+
+    ``data`` is zlib-compressed JSON holding one list per column, which compresses far better than the
+    rows one by one. Restored cards are only dropped from ``ArchivedPatient``; the batch is deleted once
+    none of its cards is left.
+    """
+
+    __tablename__ = "patient_archive_batches"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    archived_at: Mapped[datetime] = mapped_column(db.DateTime(timezone=True), nullable=False,
+                                                  default=lambda: datetime.now(UTC))
+    row_count: Mapped[int] = mapped_column(nullable=False)
+    data: Mapped[bytes] = mapped_column(db.LargeBinary, nullable=False)
+
+    def __repr__(self) -> str:  # pragma: no cover
+        return f"<PatientArchiveBatch {self.id} ({self.row_count} cards)>"
+
+
+class ArchivedPatient(db.Model):
+    """Where an archived card lives: its batch and its position in the batch's columns.
+
+    The names and birth date are copied out of the batch, so staff can find archived cards and the
+    duplicate detection can compare them without decompressing anything.
+    """
+
+    __tablename__ = "archived_patients"
+    __table_args__ = (Index("ix_archived_patients_name", "last_name", "first_name"),)
+
+    # Not a foreign key: the id is free in ``patients`` while the card is archived.
+    patient_id: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+    batch_id: Mapped[int] = mapped_column(db.ForeignKey("patient_archive_batches.id"), nullable=False, index=True)
+    position: Mapped[int] = mapped_column(nullable=False)
+    first_name: Mapped[str] = mapped_column(nullable=False)
+    last_name: Mapped[str] = mapped_column(nullable=False)
+    birth_date: Mapped[date | None]
+
+
+class Observation(db.Model):
+    """A measured value of a patient over time: a vital sign or a lab result (see ``observations.py``).
+
+    The table is kept narrow, and its primary key is the access path of every query: one patient's
+    series of one code in time order. On SQLite the rows are stored in that order (``WITHOUT ROWID``).
+    """
+
+    __tablename__ = "observations"
+    __table_args__ = ({"sqlite_with_rowid": False},)
+
+    # Not a foreign key, like the history: observations stay while their card is archived.
+    patient_id: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+    code: Mapped[str] = mapped_column(db.String(64), primary_key=True)  # e.g. "glucose"; see observations.CODES
+    observed_at: Mapped[datetime] = mapped_column(db.DateTime(timezone=True), primary_key=True)  # UTC
+    value: Mapped[float] = mapped_column(nullable=False)
+    unit: Mapped[str | None] = mapped_column(db.String(16), nullable=True)
+
+    def to_dict(self) -> dict:
+        return {
+            "code": self.code,
+            "observed_at": self.observed_at.isoformat(),
+            "value": self.value,
+            "unit": self.unit,
+        }
+
+    def __repr__(self) -> str:  # pragma: no cover
+        return f"<Observation {self.patient_id} {self.code}={self.value} at {self.observed_at}>"
+
+
+class PatientMatchKey(db.Model):
+    """Blocking key of a live patient card; only cards sharing a key are compared (see ``duplicates.py``)."""
+
+    __tablename__ = "patient_match_keys"
+    __table_args__ = (Index("ix_patient_match_keys_key", "key", "patient_id"),)
+
+    # Not a foreign key, like the history: the card may be archived or purged under it.
+    patient_id: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+    key: Mapped[str] = mapped_column(primary_key=True)
+
+
+class DuplicateStatus(enum.Enum):
+    PENDING = "pending"
+    MERGED = "merged"
+    DISMISSED = "dismissed"
+
+
+class DuplicateCandidate(db.Model):
+    """Pair of patient cards that look like the same person, waiting for an admin's decision.
+
+    ``patient_id`` is always the smaller id, so a pair is stored once; decided pairs are kept so a
+    rescan does not queue them again.
+    """
+
+    __tablename__ = "duplicate_candidates"
+    __table_args__ = (
+        UniqueConstraint("patient_id", "other_id"),
+        # The review queue only reads pending pairs, best first.
+        Index("ix_duplicate_candidates_pending", "score",
+              postgresql_where=text("status = 'PENDING'"), sqlite_where=text("status = 'PENDING'")),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    patient_id: Mapped[int] = mapped_column(nullable=False)
+    other_id: Mapped[int] = mapped_column(nullable=False, index=True)
+    score: Mapped[float] = mapped_column(nullable=False)
+    # Why the pair matched, e.g. {"name": 0.97, "birth_date": "same"}
+    reasons: Mapped[dict] = mapped_column(db.JSON, nullable=False, default=dict)
+    status: Mapped[DuplicateStatus] = mapped_column(db.Enum(DuplicateStatus), nullable=False,
+                                                    default=DuplicateStatus.PENDING)
+    detected_at: Mapped[datetime] = mapped_column(db.DateTime(timezone=True), nullable=False,
+                                                  default=lambda: datetime.now(UTC))
+    reviewed_by_id: Mapped[int | None] = mapped_column(nullable=True)
+    reviewed_at: Mapped[datetime | None] = mapped_column(db.DateTime(timezone=True), nullable=True)
+
+    def __repr__(self) -> str:  # pragma: no cover
+        return f"<DuplicateCandidate {self.patient_id}~{self.other_id} {self.score:.2f} {self.status.value}>"
+
+
+class AppointmentStatus(enum.Enum):
+    SCHEDULED = "scheduled"
+    CANCELLED = "cancelled"
+
+
+class Appointment(db.Model):
+    """A patient's visit to a doctor over ``[starts_at, ends_at)``.
+
+    A doctor's scheduled appointments never overlap. PostgreSQL enforces it with an exclusion constraint
+    (a GiST index over the doctor and the time range); elsewhere ``appointments.book_appointments`` checks
+    it. Cancelled appointments are kept and free their time.
+    """
+
+    __tablename__ = "appointments"
+    __table_args__ = (
+        CheckConstraint("ends_at > starts_at", name="ck_appointments_time_order"),
+        ExcludeConstraint(
+            ("doctor_id", "="), (func.tstzrange(column("starts_at"), column("ends_at")), "&&"),
+            name="ex_appointments_doctor_overlap", using="gist", where=text("status = 'SCHEDULED'"),
+        ).ddl_if(dialect="postgresql"),
+        # Schedules and free slot searches read one doctor's scheduled appointments by time.
+        Index("ix_appointments_doctor_scheduled", "doctor_id", "starts_at",
+              postgresql_where=text("status = 'SCHEDULED'"), sqlite_where=text("status = 'SCHEDULED'")),
+        Index("ix_appointments_patient_starts", "patient_id", "starts_at"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    doctor_id: Mapped[int] = mapped_column(db.ForeignKey("users.id"), nullable=False)
+    # Not a foreign key: the card may be in cold storage (see archive.py).
+    patient_id: Mapped[int] = mapped_column(nullable=False)
+    starts_at: Mapped[datetime] = mapped_column(db.DateTime(timezone=True), nullable=False)
+    ends_at: Mapped[datetime] = mapped_column(db.DateTime(timezone=True), nullable=False)
+    status: Mapped[AppointmentStatus] = mapped_column(db.Enum(AppointmentStatus), nullable=False,
+                                                      default=AppointmentStatus.SCHEDULED)
+    reason: Mapped[str | None] = mapped_column(db.Text, nullable=True)
+    booked_by_id: Mapped[int | None] = mapped_column(nullable=True)
+    booked_at: Mapped[datetime] = mapped_column(db.DateTime(timezone=True), nullable=False,
+                                                default=lambda: datetime.now(UTC))
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "id": self.id,
+            "doctor_id": self.doctor_id,
+            "patient_id": self.patient_id,
+            "starts_at": self.starts_at.isoformat(),
+            "ends_at": self.ends_at.isoformat(),
+            "status": self.status.value,
+            "reason": self.reason,
+        }
+
+    def __repr__(self) -> str:  # pragma: no cover
+        return f"<Appointment {self.id} doctor={self.doctor_id} patient={self.patient_id} {self.starts_at}>"
+
+
+class Prescription(db.Model):
+    """A drug a patient takes, by ATC code (see ``prescriptions.py``).
+
+    Stopping a prescription stamps ``stopped_at``; the row is kept as the record of what was taken.
+    """
+
+    __tablename__ = "prescriptions"
+    __table_args__ = (
+        # The edit form and every safety check read one patient's current prescriptions.
+        Index("ix_prescriptions_patient_active", "patient_id",
+              postgresql_where=text("stopped_at IS NULL"), sqlite_where=text("stopped_at IS NULL")),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    # Not a foreign key, like the observations: prescriptions stay while their card is archived.
+    patient_id: Mapped[int] = mapped_column(nullable=False)
+    drug_code: Mapped[str] = mapped_column(db.String(16), nullable=False)  # e.g. "B01AA03" (warfarin)
+    dosage: Mapped[str | None] = mapped_column(db.Text, nullable=True)  # e.g. "5 mg once daily"
+    prescribed_by_id: Mapped[int | None] = mapped_column(nullable=True)
+    started_at: Mapped[datetime] = mapped_column(db.DateTime(timezone=True), nullable=False,
+                                                 default=lambda: datetime.now(UTC))
+    stopped_at: Mapped[datetime | None] = mapped_column(db.DateTime(timezone=True), nullable=True)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "id": self.id,
+            "drug_code": self.drug_code,
+            "dosage": self.dosage,
+            "started_at": self.started_at.isoformat(),
+            "stopped_at": self.stopped_at.isoformat() if self.stopped_at else None,
+        }
+
+    def __repr__(self) -> str:  # pragma: no cover
+        return f"<Prescription {self.id} patient={self.patient_id} {self.drug_code}>"
+
+
+class PatientAllergy(db.Model):
+    """A patient's allergy to a drug or a whole class of drugs, by ATC code (see ``prescriptions.py``).
+
+    Allergies to anything else (food, latex...) stay in the free-text ``Patient.allergies``.
+    """
+
+    __tablename__ = "patient_allergies"
+
+    # Not a foreign key, like the prescriptions.
+    patient_id: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+    allergen_code: Mapped[str] = mapped_column(db.String(16), primary_key=True)  # e.g. "J01C" (penicillins)
+    recorded_at: Mapped[datetime] = mapped_column(db.DateTime(timezone=True), nullable=False,
+                                                  default=lambda: datetime.now(UTC))
+
+    def __repr__(self) -> str:  # pragma: no cover
+        return f"<PatientAllergy {self.patient_id} {self.allergen_code}>"
+
+
+class Attachment(db.Model):
+    """A file attached to a patient card: a scan, a PDF, an imaging report (see ``attachments.py``).
+
+    The content is stored once per SHA-256 ``digest`` on the filesystem, shared by every row with that digest.
+    """
+
+    __tablename__ = "attachments"
+    __table_args__ = (Index("ix_attachments_patient_uploaded", "patient_id", "uploaded_at"),)
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    # Not a foreign key, like the observations: attachments stay while their card is archived.
+    patient_id: Mapped[int] = mapped_column(nullable=False)
+    digest: Mapped[str] = mapped_column(db.String(64), nullable=False, index=True)  # hex SHA-256 of the content
+    filename: Mapped[str] = mapped_column(db.String(255), nullable=False)
+    content_type: Mapped[str] = mapped_column(db.String(255), nullable=False)
+    size: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    uploaded_by_id: Mapped[int | None] = mapped_column(nullable=True)
+    uploaded_at: Mapped[datetime] = mapped_column(db.DateTime(timezone=True), nullable=False,
+                                                  default=lambda: datetime.now(UTC))
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "id": self.id,
+            "patient_id": self.patient_id,
+            "filename": self.filename,
+            "content_type": self.content_type,
+            "size": self.size,
+            "sha256": self.digest,
+            "uploaded_at": self.uploaded_at.isoformat(),
+        }
+
+    def __repr__(self) -> str:  # pragma: no cover
+        return f"<Attachment {self.id} patient={self.patient_id} {self.filename!r}>"
+
+
+class JobStatus(enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class Job(db.Model):
+    """Background job queued in the database and executed by ``mediarch worker``."""
+
+    __tablename__ = "jobs"
+    __table_args__ = (
+        # Only queued jobs are ever polled, so keep the polling index small.
+        Index("ix_jobs_ready", "run_at",
+              postgresql_where=text("status = 'QUEUED'"), sqlite_where=text("status = 'QUEUED'")),
+        Index("ix_jobs_name_status", "name", "status"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    name: Mapped[str] = mapped_column(nullable=False)
+    payload: Mapped[dict] = mapped_column(db.JSON, nullable=False, default=dict)
+    status: Mapped[JobStatus] = mapped_column(db.Enum(JobStatus), nullable=False, default=JobStatus.QUEUED)
+    attempts: Mapped[int] = mapped_column(nullable=False, default=0)
+    max_attempts: Mapped[int] = mapped_column(nullable=False, default=3)
+    run_at: Mapped[datetime] = mapped_column(db.DateTime(timezone=True), nullable=False,
+                                             default=lambda: datetime.now(UTC))
+    locked_by: Mapped[str | None] = mapped_column(nullable=True)
+    locked_at: Mapped[datetime | None] = mapped_column(db.DateTime(timezone=True), nullable=True)
+    last_error: Mapped[str | None] = mapped_column(db.Text, nullable=True)
+    result: Mapped[Any] = mapped_column(db.JSON, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(db.DateTime(timezone=True), nullable=False,
+                                                 default=lambda: datetime.now(UTC))
+    finished_at: Mapped[datetime | None] = mapped_column(db.DateTime(timezone=True), nullable=True)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "status": self.status.value,
+            "attempts": self.attempts,
+            "max_attempts": self.max_attempts,
+            "run_at": self.run_at.isoformat(),
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "last_error": self.last_error,
+            "result": self.result,
+        }
+
+    def __repr__(self) -> str:  # pragma: no cover
+        return f"<Job {self.id} {self.name} ({self.status.value})>"
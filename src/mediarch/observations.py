@@ -0,0 +1,293 @@
+"""Structured observations: vital signs and lab results recorded over time.
+
+Each ``Observation`` is one value of one code (``glucose``, ``bp_systolic``, a lab's own code...) for one
+patient at one instant, which is also its primary key. Devices and labs deliver them in bulk as CSV
+dumps with the columns ``patient_id,code,observed_at,value`` and an optional ``unit``::
+
+    patient_id,code,observed_at,value,unit
+    42,glucose,2026-10-19T07:30:00+02:00,5.4,mmol/L
+    42,bp,2026-10-19T07:31:00Z,128/84,mmHg
+
+``import_csv`` streams such a file and inserts it in batches of ``OBSERVATIONS_IMPORT_BATCH_SIZE`` rows,
+each in its own transaction. Rows already stored are skipped, so a dump can be imported again after a
+failure; invalid rows and rows of unknown patients are reported by line and skipped. A ``bp`` value
+written as ``systolic/diastolic`` is stored as ``bp_systolic`` and ``bp_diastolic``. Times without an
+offset are taken as UTC, and everything is stored in UTC.
+
+Charts do not need every point: ``downsample`` groups a time range into at most N equal buckets in the
+database and returns each bucket's minimum, maximum, mean and count, so ten years of readings every
+few minutes come back as a few hundred rows.
+"""
+import csv
+import math
+import re
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+from datetime import UTC, datetime, timedelta
+
+from sqlalchemy import BigInteger, cast, extract, func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from . import db
+from .models import ArchivedPatient, Observation, Patient
+
+# Codes with a display label; other codes are stored and charted under their own name.
+CODES = {
+    "bp_systolic": "Systolic blood pressure",
+    "bp_diastolic": "Diastolic blood pressure",
+    "heart_rate": "Heart rate",
+    "glucose": "Blood glucose",
+    "weight": "Weight",
+    "temperature": "Body temperature",
+    "spo2": "Oxygen saturation",
+    "hba1c": "HbA1c",
+    "cholesterol": "Total cholesterol",
+    "creatinine": "Creatinine",
+}
+REQUIRED_COLUMNS = ("patient_id", "code", "observed_at", "value")
+MAX_REPORTED_ERRORS = 100
+
+_CODE = re.compile(r"[a-z0-9][a-z0-9_.:-]{0,63}")
+
+
+def normalize_code(raw: str | None) -> str:
+    """An observation code in its stored form, lowercase; raises ``ValueError`` if it is not a valid code."""
+    code = (raw or "").strip().lower()
+    if not _CODE.fullmatch(code):
+        raise ValueError(f"invalid code {raw!r}")
+    return code
+
+
+def code_label(code: str) -> str:
+    return CODES.get(code, code)
+
+
+def as_utc(moment: datetime) -> datetime:
+    """``moment`` in UTC; naive values, as SQLite returns them, are taken as UTC already."""
+    return moment.replace(tzinfo=UTC) if moment.tzinfo is None else moment.astimezone(UTC)
+
+
+def parse_time(value: str) -> datetime:
+    """An ISO 8601 time in UTC."""
+    return as_utc(datetime.fromisoformat(value.strip()))
+
+
+def parse_row(row: dict) -> list[dict]:
+    """The ``observations`` rows of one CSV row; raises ``ValueError`` with a readable message."""
+    try:
+        patient_id = int(row["patient_id"])
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid patient_id {row['patient_id']!r}") from None
+    code = normalize_code(row["code"])
+    try:
+        observed_at = parse_time(row["observed_at"] or "")
+    except ValueError:
+        raise ValueError(f"invalid observed_at {row['observed_at']!r}") from None
+    unit = (row.get("unit") or "").strip() or None
+    raw = (row["value"] or "").strip()
+    if code == "bp" and "/" in raw:
+        pairs = zip(("bp_systolic", "bp_diastolic"), raw.split("/", 1), strict=True)
+    else:
+        pairs = [(code, raw)]
+    rows = []
+    for name, text in pairs:
+        try:
+            value = float(text)
+        except ValueError:
+            raise ValueError(f"invalid value {raw!r}") from None
+        if not math.isfinite(value):
+            raise ValueError(f"invalid value {raw!r}")
+        rows.append({"patient_id": patient_id, "code": name, "observed_at": observed_at, "value": value,
+                     "unit": unit})
+    return rows
+
+
+@dataclass
+class ImportResult:
+    inserted: int = 0
+    duplicates: int = 0
+    rejected: int = 0
+    errors: list[str] = field(default_factory=list)  # the first MAX_REPORTED_ERRORS, "line N: ..."
+
+    def reject(self, line: int, message: str) -> None:
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"line {line}: {message}")
+
+    def to_dict(self) -> dict:
+        return {"inserted": self.inserted, "duplicates": self.duplicates, "rejected": self.rejected,
+                "errors": self.errors}
+
+
+def _insert_new():
+    """``INSERT`` into ``observations`` that skips rows whose key is already stored."""
+    table = Observation.__table__
+    dialect = db.engine.dialect.name
+    if dialect == "postgresql":
+        statement = postgresql.insert(table).on_conflict_do_nothing()
+    elif dialect == "sqlite":
+        statement = sqlite.insert(table).on_conflict_do_nothing()
+    else:  # no portable way to skip duplicates; they fail the batch
+        statement = insert(table)
+    return statement.returning(table.c.patient_id)
+
+
+def _known_patients(ids: set[int]) -> set[int]:
+    """Those of ``ids`` that have a card, live, deleted or archived."""
+    patients, archived = Patient.__table__, ArchivedPatient.__table__
+    return set(db.session.scalars(
+        select(patients.c.id).where(patients.c.id.in_(ids))
+        .union(select(archived.c.patient_id).where(archived.c.patient_id.in_(ids)))
+    ))
+
+
+def _store(batch: list[tuple[int, dict]], result: ImportResult) -> None:
+    known = _known_patients({row["patient_id"] for _, row in batch})
+    rows = []
+    for line, row in batch:
+        if row["patient_id"] in known:
+            rows.append(row)
+        else:
+            result.reject(line, f"unknown patient {row['patient_id']}")
+    if rows:
+        inserted = len(db.session.execute(_insert_new(), rows).all())
+        result.inserted += inserted
+        result.duplicates += len(rows) - inserted
+    db.session.commit()
+
+
+def import_csv(lines: Iterable[str], batch_size: int = 5000) -> ImportResult:
+    """Import a CSV dump of observations, streaming it; raises ``ValueError`` if a required column is missing."""
+    reader = csv.DictReader(lines)
+    missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or ())]
+    if missing:
+        raise ValueError(f"Missing CSV column(s): {', '.join(missing)}.")
+    result = ImportResult()
+    batch: list[tuple[int, dict]] = []
+    for row in reader:
+        try:
+            batch.extend((reader.line_num, parsed) for parsed in parse_row(row))
+        except ValueError as e:
+            result.reject(reader.line_num, str(e))
+            continue
+        if len(batch) >= batch_size:
+            _store(batch, result)
+            batch = []
+    if batch:
+        _store(batch, result)
+    return result
+
+
+def series_summary(patient_id: int) -> list[dict]:
+    """The codes recorded for a patient with their count, first and last time, in label order."""
+    rows = db.session.execute(
+        select(Observation.code, func.count(), func.min(Observation.observed_at), func.max(Observation.observed_at))
+        .where(Observation.patient_id == patient_id)
+        .group_by(Observation.code)
+    ).all()
+    return sorted(({"code": code, "label": code_label(code), "count": count, "first": as_utc(first),
+                    "last": as_utc(last)} for code, count, first, last in rows),
+                  key=lambda summary: summary["label"].casefold())
+
+
+def first_observed(patient_id: int, code: str) -> datetime | None:
+    """Time of a patient's first observation of ``code``, if any."""
+    first = db.session.scalar(select(func.min(Observation.observed_at))
+                              .where(Observation.patient_id == patient_id, Observation.code == code))
+    return as_utc(first) if first is not None else None
+
+
+def observations_between(patient_id: int, code: str, start: datetime, end: datetime,
+                         limit: int) -> list[Observation]:
+    """The observations of one code in ``[start, end)``, oldest first, at most ``limit``."""
+    return db.session.scalars(
+        select(Observation)
+        .where(Observation.patient_id == patient_id, Observation.code == code,
+               Observation.observed_at >= as_utc(start), Observation.observed_at < as_utc(end))
+        .order_by(Observation.observed_at)
+        .limit(limit)
+    ).all()
+
+
+@dataclass(frozen=True, slots=True)
+class Bucket:
+    """Aggregate of the observations in one time bucket; ``at`` is the first of them."""
+
+    at: datetime
+    min: float
+    max: float
+    avg: float
+    count: int
+
+    def to_dict(self) -> dict:
+        return {"at": self.at.isoformat(), "min": self.min, "max": self.max, "avg": self.avg, "count": self.count}
+
+
+def bucket_seconds(start: datetime, end: datetime, points: int) -> int:
+    """Width of the buckets that split ``[start, end)`` into at most ``points``."""
+    return max(math.ceil((end - start).total_seconds() / max(points, 1)), 1)
+
+
+def downsample(patient_id: int, code: str, start: datetime, end: datetime, points: int) -> list[Bucket]:
+    """One code's observations in ``[start, end)`` aggregated into at most ``points`` equal time buckets."""
+    start, end = as_utc(start), as_utc(end)
+    width = bucket_seconds(start, end, points)
+    epoch = cast(extract("epoch", Observation.observed_at), BigInteger)
+    bucket = ((epoch - int(start.timestamp())) // width).label("bucket")
+    rows = db.session.execute(
+        select(bucket, func.min(Observation.observed_at), func.min(Observation.value), func.max(Observation.value),
+               func.avg(Observation.value), func.count())
+        .where(Observation.patient_id == patient_id, Observation.code == code,
+               Observation.observed_at >= start, Observation.observed_at < end)
+        .group_by(bucket)
+        .order_by(bucket)
+    )
+    return [Bucket(as_utc(at), low, high, float(mean), count) for _, at, low, high, mean, count in rows]
+
+
+@dataclass(frozen=True, slots=True)
+class Chart:
+    """SVG geometry of a downsampled series: the mean as a line, the min-max range as a band."""
+
+    line: str
+    band: str
+    low: float
+    high: float
+    count: int
+
+
+def chart(buckets: list[Bucket], start: datetime, end: datetime, width: int = 600, height: int = 120) -> Chart | None:
+    """Plot ``buckets`` over ``[start, end)`` in a ``width`` x ``height`` SVG viewBox; ``None`` without data."""
+    if not buckets:
+        return None
+    low, high = min(b.min for b in buckets), max(b.max for b in buckets)
+    span, scale = (end - start).total_seconds() or 1, (high - low) or 1
+    start = as_utc(start)
+
+    def point(bucket: Bucket, value: float) -> str:
+        x = (bucket.at - start).total_seconds() / span * width
+        y = height - (value - low) / scale * height
+        return f"{x:.1f},{y:.1f}"
+
+    return Chart(
+        line=" ".join(point(b, b.avg) for b in buckets),
+        band=" ".join([point(b, b.max) for b in buckets] + [point(b, b.min) for b in reversed(buckets)]),
+        low=low, high=high, count=sum(b.count for b in buckets),
+    )
+
+
+def patient_charts(patient_id: int, years: int, points: int, now: datetime | None = None) -> list[dict]:
+    """Chart of every code of a patient over the last ``years``, for the patient detail page."""
+    end = as_utc(now or datetime.now(UTC))
+    start = end - timedelta(days=round(365.25 * years))
+    charts = []
+    for summary in series_summary(patient_id):
+        if summary["last"] < start:
+            continue
+        buckets = downsample(patient_id, summary["code"], start, end + timedelta(seconds=1), points)
+        latest = db.session.scalars(
+            select(Observation).where(Observation.patient_id == patient_id, Observation.code == summary["code"])
+            .order_by(Observation.observed_at.desc()).limit(1)
+        ).first()
+        charts.append({**summary, "chart": chart(buckets, start, end), "latest": latest})
+    return charts
@@ -0,0 +1,77 @@
+"""Optional PostgreSQL hash partitioning of patient data.
+
+With ``PATIENT_HASH_PARTITIONS`` set to N > 0, ``db.create_all()`` creates ``patients`` as
+``PARTITION BY HASH (id)`` with N partitions ``patients_p0`` to ``patients_p<N-1>``, and every other table
+registered with ``hash_partitioned`` (``observations``) by hash of its patient column. The monthly partitions of
+``patient_history`` are split the same way by ``patient_id`` (see ``history.ensure_history_partitions``).
+
+Each partition is a table with its own indexes, so vacuum and index maintenance work on a fraction of the
+rows, and a lookup by patient only touches one partition. Nothing else changes: PostgreSQL routes inserts
+and prunes partitions by itself, and other databases ignore the setting.
+
+The layout is fixed when a table is created; changing the setting later does not repartition existing
+tables. Partitioned tables need the partition column in their primary key and every unique constraint,
+and foreign keys into them need PostgreSQL 12 or later. ``patient_history`` gets ``patient_id`` in its
+primary key when it is created with the setting on; if it was created without, its months stay unsplit.
+"""
+from flask import current_app, has_app_context
+from sqlalchemy import Table, event, text
+from sqlalchemy.engine import Connection
+
+from .models import Observation, Patient
+
+# Tables partitioned by hash of a patient id column: table name -> column name.
+_HASHED: dict[str, str] = {}
+
+
+def partition_count(connection: Connection) -> int:
+    """Number of hash partitions to create on ``connection``; 0 means none."""
+    if connection.dialect.name != "postgresql" or not has_app_context():
+        return 0
+    return current_app.config["PATIENT_HASH_PARTITIONS"]
+
+
+def create_hash_partitions(connection: Connection, table: str, count: int) -> list[str]:
+    """Create the ``count`` partitions of the hash-partitioned ``table`` and return their names."""
+    names = [f"{table}_p{remainder}" for remainder in range(count)]
+    for remainder, name in enumerate(names):
+        connection.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} "
+            f"FOR VALUES WITH (MODULUS {count}, REMAINDER {remainder})"
+        ))
+    return names
+
+
+def is_partitioned(connection: Connection, table: str) -> bool:
+    return connection.execute(
+        text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table)"), {"table": table}
+    ).scalar() is not None
+
+
+def primary_key_includes(connection: Connection, table: str, column: str) -> bool:
+    return connection.execute(text(
+        "SELECT 1 FROM pg_index i JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey) "
+        "WHERE i.indrelid = to_regclass(:table) AND i.indisprimary AND a.attname = :column"
+    ), {"table": table, "column": column}).scalar() is not None
+
+
+def _set_partition_clause(target: Table, connection: Connection, **kw) -> None:
+    # Decided per CREATE TABLE, since the table metadata is shared by every app in the process.
+    count = partition_count(connection)
+    target.dialect_options["postgresql"]["partition_by"] = f"HASH ({_HASHED[target.name]})" if count else None
+
+
+def _create_partitions(target: Table, connection: Connection, **kw) -> None:
+    if count := partition_count(connection):
+        create_hash_partitions(connection, target.name, count)
+
+
+def hash_partitioned(table: Table, column: str) -> None:
+    """Partition ``table`` by hash of ``column`` when ``PATIENT_HASH_PARTITIONS`` is set."""
+    _HASHED[table.name] = column
+    event.listen(table, "before_create", _set_partition_clause)
+    event.listen(table, "after_create", _create_partitions)
+
+
+hash_partitioned(Patient.__table__, "id")
+hash_partitioned(Observation.__table__, "patient_id")
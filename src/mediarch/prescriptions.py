@@ -0,0 +1,279 @@
+"""Structured prescriptions and drug allergies, checked against a precomputed interaction index.
+
+Drugs are identified by ATC codes (the WHO Anatomical Therapeutic Chemical classification): ``B01AA03`` is
+warfarin, and its prefixes name ever broader classes, ``B01AA`` the vitamin K antagonists and ``B01A`` the
+antithrombotic agents. A dataset of two CSV files describes them, by default the one in ``data/``
+(``INTERACTIONS_DATASET`` names another directory):
+
+* ``drugs.csv``, ``code,name``: the drugs that can be prescribed, and the classes the rules refer to.
+  A code that is the prefix of another code is a class.
+* ``interactions.csv``, ``kind,code_a,code_b,severity,description``: an ``interaction`` row applies to
+  every pair of drugs of ``code_a`` and ``code_b``; an ``allergy`` row says that an allergy to (a drug
+  of) ``code_a`` contraindicates the drugs of ``code_b``, for cross-reactivity. An allergy always
+  contraindicates the drug itself, or every drug of the class.
+
+``InteractionIndex`` expands these class-level rules into pairs of drugs once, when first used, and
+stores them in dicts keyed by a pair of dense drug numbers, with the set of interacting drugs of each
+drug. Checking a medication list is then one set intersection per drug and one dict lookup per drug and
+allergy, without a query: microseconds for a realistic list, so every save of the edit form checks the
+whole list.
+"""
+import csv
+import os
+from collections import defaultdict
+from collections.abc import Iterable, Mapping
+from dataclasses import dataclass
+from datetime import UTC, datetime
+from itertools import zip_longest
+
+from flask import current_app
+from sqlalchemy import delete, select
+
+from . import db
+from .models import Patient, PatientAllergy, Prescription
+
+EXTENSION_KEY = "mediarch.interactions"
+BUNDLED_DATASET = os.path.join(os.path.dirname(__file__), "data")
+
+INTERACTION = "interaction"
+ALLERGY = "allergy"
+# Most severe first.
+SEVERITIES = ("contraindicated", "major", "moderate", "minor")
+_RANK = {severity: rank for rank, severity in enumerate(SEVERITIES)}
+
+
+class PrescriptionError(ValueError):
+    """A drug or allergen is not in the dataset, or a class of drugs was prescribed."""
+
+
+@dataclass(frozen=True, slots=True)
+class Rule:
+    kind: str  # INTERACTION or ALLERGY
+    first: str  # code of a drug or class; for ALLERGY, the allergen
+    second: str
+    severity: str
+    description: str
+
+
+@dataclass(frozen=True, slots=True)
+class SafetyWarning:
+    """A rule that applies to a medication list: two of its drugs, or an allergen (``first``) and a drug."""
+
+    kind: str
+    first: str
+    second: str
+    severity: str
+    description: str
+
+    @property
+    def key(self) -> tuple[str, str, str]:
+        return self.kind, self.first, self.second
+
+
+class InteractionIndex:
+    """Drug names and the interaction and allergy rules expanded to pairs of drugs.
+
+    Every code gets a dense number ``n``; a pair ``(a, b)`` is the key ``a * size + b``, with ``a < b`` for
+    interactions, which go both ways. Where several rules cover a pair, the most severe one is kept.
+    """
+
+    def __init__(self, drugs: Mapping[str, str], rules: Iterable[Rule]) -> None:
+        self.names = dict(drugs)
+        self._numbers = {code: number for number, code in enumerate(self.names)}
+        self._by_name = {name.casefold(): code for code, name in self.names.items()}
+        self._size = size = len(self._numbers)
+        members = defaultdict(list)  # code -> numbers of the code itself and of every code under it
+        for code, number in self._numbers.items():
+            for length in range(1, len(code) + 1):
+                if code[:length] in self._numbers:
+                    members[code[:length]].append(number)
+        self.classes = frozenset(code for code in self.names if len(members[code]) > 1)
+
+        # An allergy to a code contraindicates the code and its drugs, not its siblings. These implicit rules
+        # come first, numbered like their code: on equal severity, the first rule found for a pair is kept.
+        self._rules = [Rule(ALLERGY, code, code, SEVERITIES[0], f"Allergy to {name}.")
+                       for code, name in self.names.items()]
+        self._pairs: dict[int, int] = {}  # pair of drugs -> number of the rule
+        # (allergen, drug) -> number of the rule
+        self._allergies = {number * size + drug: number
+                           for code, number in self._numbers.items() for drug in members[code]}
+        self._rules.extend(rules)
+        for number, rule in enumerate(self._rules[size:], start=size):
+            for code in (rule.first, rule.second):
+                if code not in self._numbers:
+                    raise ValueError(f"rule {rule.first},{rule.second} names unknown code {code!r}")
+            for a in members[rule.first]:
+                for b in members[rule.second]:
+                    if rule.kind == ALLERGY:
+                        self._keep(self._allergies, a * size + b, number)
+                    elif a != b:
+                        self._keep(self._pairs, min(a, b) * size + max(a, b), number)
+        # Per drug, the numbers of the drugs it interacts with: most drugs of a list interact with none of
+        # the others, and one set intersection per drug finds that without looking up every pair.
+        partners = defaultdict(set)
+        for key in self._pairs:
+            a, b = divmod(key, size)
+            partners[a].add(b)
+            partners[b].add(a)
+        self._partners = {number: frozenset(others) for number, others in partners.items()}
+
+    def _keep(self, table: dict[int, int], key: int, number: int) -> None:
+        current = table.get(key)
+        if current is None or _RANK[self._rules[number].severity] < _RANK[self._rules[current].severity]:
+            table[key] = number
+
+    def __len__(self) -> int:
+        """Number of expanded drug pairs."""
+        return len(self._pairs) + len(self._allergies)
+
+    def resolve(self, text: str) -> str | None:
+        """The code of a drug or class given by code or by name, ignoring case."""
+        text = text.strip()
+        if text.upper() in self._numbers:
+            return text.upper()
+        return self._by_name.get(text.casefold())
+
+    def _warning(self, number: int, first: str, second: str) -> SafetyWarning:
+        rule = self._rules[number]
+        return SafetyWarning(rule.kind, first, second, rule.severity, rule.description)
+
+    def check(self, drug_codes: Iterable[str], allergen_codes: Iterable[str] = ()) -> list[SafetyWarning]:
+        """The warnings for a medication list, most severe first; unknown codes are ignored."""
+        numbers, size, partners = self._numbers, self._size, self._partners
+        drugs = [(code, numbers[code]) for code in dict.fromkeys(drug_codes) if code in numbers]
+        listed = {number: code for code, number in drugs}
+        position = {number: i for i, number in enumerate(listed)}
+        warnings = []
+        for i, (first, a) in enumerate(drugs):
+            if others := partners.get(a):  # each pair once, in the order of the list
+                warnings.extend(self._warning(self._pairs[min(a, b) * size + max(a, b)], first, listed[b])
+                                for b in others.intersection(listed) if position[b] > i)
+        for allergen in dict.fromkeys(allergen_codes):
+            if (x := numbers.get(allergen)) is None:
+                continue
+            for drug, b in drugs:
+                number = self._allergies.get(x * size + b)
+                if number is not None:
+                    warnings.append(self._warning(number, allergen, drug))
+        warnings.sort(key=lambda warning: _RANK[warning.severity])
+        return warnings
+
+
+def _read_csv(path: str, columns: tuple[str, ...]) -> list[dict[str, str]]:
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        if missing := [column for column in columns if column not in (reader.fieldnames or ())]:
+            raise ValueError(f"{path}: missing columns {', '.join(missing)}")
+        return [{key: (row[key] or "").strip() for key in columns} for row in reader]
+
+
+def load_index(directory: str | None = None) -> InteractionIndex:
+    """Build the index of the dataset in ``directory`` (default: the bundled one)."""
+    directory = directory or BUNDLED_DATASET
+    drugs = {row["code"].upper(): row["name"]
+             for row in _read_csv(os.path.join(directory, "drugs.csv"), ("code", "name")) if row["code"]}
+    rules = []
+    path = os.path.join(directory, "interactions.csv")
+    columns = ("kind", "code_a", "code_b", "severity", "description")
+    for line, row in enumerate(_read_csv(path, columns), start=2):
+        if row["kind"] not in {INTERACTION, ALLERGY} or row["severity"] not in _RANK:
+            raise ValueError(f"{path}, line {line}: unknown kind {row['kind']!r} or severity {row['severity']!r}")
+        rules.append(Rule(row["kind"], row["code_a"].upper(), row["code_b"].upper(), row["severity"],
+                          row["description"]))
+    return InteractionIndex(drugs, rules)
+
+
+def current_index() -> InteractionIndex:
+    """The app's index, built on first use."""
+    index = current_app.extensions.get(EXTENSION_KEY)
+    if index is None:
+        index = current_app.extensions[EXTENSION_KEY] = load_index(current_app.config["INTERACTIONS_DATASET"])
+    return index
+
+
+@dataclass
+class MedicationList:
+    """A patient's current drugs, as code -> dosage, and drug allergies, edited together."""
+
+    prescriptions: dict[str, str | None]
+    allergens: list[str]
+
+    def warnings(self) -> list[SafetyWarning]:
+        return current_index().check(self.prescriptions, self.allergens)
+
+
+def current_prescriptions(patient_id: int) -> list[Prescription]:
+    return list(db.session.scalars(
+        select(Prescription).where(Prescription.patient_id == patient_id, Prescription.stopped_at.is_(None))
+        .order_by(Prescription.started_at, Prescription.id)
+    ))
+
+
+def current_medication(patient_id: int) -> MedicationList:
+    allergens = db.session.scalars(select(PatientAllergy.allergen_code).where(PatientAllergy.patient_id == patient_id)
+                                   .order_by(PatientAllergy.allergen_code))
+    return MedicationList({p.drug_code: p.dosage for p in current_prescriptions(patient_id)}, list(allergens))
+
+
+def parse_medication(drugs: Iterable[str], dosages: Iterable[str], allergens: Iterable[str]) -> MedicationList:
+    """The medication list of the edit form's fields, drugs and allergens given by code or name.
+
+    Blank drug fields are skipped with their dosage. Raises ``PrescriptionError`` for an unknown drug or
+    allergen, and for a class of drugs prescribed instead of a drug.
+    """
+    index = current_index()
+    prescriptions = {}
+    for text, dosage in zip_longest(drugs, dosages, fillvalue=""):
+        if not text.strip():
+            continue
+        code = index.resolve(text)
+        if code is None:
+            raise PrescriptionError(f"Unknown drug {text.strip()!r}.")
+        if code in index.classes:
+            raise PrescriptionError(f"{index.names[code]} ({code}) is a class of drugs; prescribe one of them.")
+        prescriptions[code] = dosage.strip() or None
+    codes = []
+    for text in allergens:
+        if not text.strip():
+            continue
+        code = index.resolve(text)
+        if code is None:
+            raise PrescriptionError(f"Unknown drug or class of drugs {text.strip()!r} in the allergies.")
+        codes.append(code)
+    return MedicationList(prescriptions, sorted(set(codes)))
+
+
+def save_medication(patient: Patient, medication: MedicationList, prescribed_by_id: int | None = None) -> bool:
+    """Make ``medication`` the current lists of ``patient`` and return whether they changed; the caller commits.
+
+    Prescriptions no longer listed, listed with another dosage or listed twice (after a merge) are stopped;
+    new ones are started.
+    """
+    now = datetime.now(UTC)
+    changed = False
+    kept = set()
+    for prescription in current_prescriptions(patient.id):
+        code = prescription.drug_code
+        if code not in kept and code in medication.prescriptions \
+                and medication.prescriptions[code] == prescription.dosage:
+            kept.add(code)
+        else:
+            prescription.stopped_at = now
+            changed = True
+    for code, dosage in medication.prescriptions.items():
+        if code not in kept:
+            db.session.add(Prescription(patient_id=patient.id, drug_code=code, dosage=dosage,
+                                        prescribed_by_id=prescribed_by_id, started_at=now))
+            changed = True
+
+    stored = set(db.session.scalars(select(PatientAllergy.allergen_code)
+                                    .where(PatientAllergy.patient_id == patient.id)))
+    if removed := stored - set(medication.allergens):
+        db.session.execute(delete(PatientAllergy).where(PatientAllergy.patient_id == patient.id,
+                                                        PatientAllergy.allergen_code.in_(removed)))
+    added = set(medication.allergens) - stored
+    db.session.add_all(PatientAllergy(patient_id=patient.id, allergen_code=code, recorded_at=now) for code in added)
+    if changed or removed or added:
+        patient.last_activity_at = now
+        return True
+    return False
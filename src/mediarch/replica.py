@@ -0,0 +1,84 @@
+"""Read-replica routing.
+
+When ``DATABASE_REPLICA_URL`` is set, views decorated with ``replica_reads`` run their ``GET`` queries
+against that engine instead of the primary. Everything else stays on the primary:
+
+* flushes, DML statements and ``SELECT ... FOR UPDATE``;
+* any query issued after the session has written, so a request reads its own writes;
+* every request of a browser session for ``REPLICA_STICKY_SECONDS`` after it committed a write, which
+  hides replication lag right after a form submission redirects to a read-only page.
+
+Locally the replica can be a second SQLite file or PostgreSQL database with the same schema. The
+replica engine is deliberately not a Flask-SQLAlchemy bind, so ``db.create_all()`` never touches it.
+"""
+import time
+from functools import wraps
+
+from flask import Flask, current_app, has_request_context, request
+from flask import session as flask_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import Engine, create_engine, event
+
+EXTENSION_KEY = "mediarch.replica"
+STICKY_KEY = "_primary_until"
+
+# Keys of ``Session.info``.
+USE_REPLICA = "use_replica"
+WROTE = "wrote_primary"
+
+READ_METHODS = frozenset({"GET", "HEAD"})
+
+
+def _is_write(clause) -> bool:
+    return getattr(clause, "is_dml", False) or getattr(clause, "_for_update_arg", None) is not None
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that sends reads to the replica engine when asked to."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.info.get(USE_REPLICA) and not self.info.get(WROTE):
+            if self._flushing or _is_write(clause):
+                self.info[WROTE] = True
+            elif (engine := replica_engine()) is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _mark_written(session, flush_context) -> None:
+    session.info[WROTE] = True
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _stick_to_primary(session) -> None:
+    if not session.info.get(WROTE) or not has_request_context():
+        return
+    if replica_engine() is not None:
+        flask_session[STICKY_KEY] = time.time() + current_app.config["REPLICA_STICKY_SECONDS"]
+
+
+def replica_engine() -> Engine | None:
+    """The replica engine of the current app, or ``None`` if reads go to the primary."""
+    return current_app.extensions.get(EXTENSION_KEY)
+
+
+def _sticky() -> bool:
+    return flask_session.get(STICKY_KEY, 0) > time.time()
+
+
+def replica_reads(view):
+    """Run the queries of a read-only view on the replica, when one is configured."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if replica_engine() is not None and request.method in READ_METHODS and not _sticky():
+            current_app.extensions["sqlalchemy"].session.info[USE_REPLICA] = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def init_app(app: Flask) -> None:
+    """Create the replica engine if ``DATABASE_REPLICA_URL`` is configured."""
+    url = app.config.get("DATABASE_REPLICA_URL")
+    if url:
+        app.extensions[EXTENSION_KEY] = create_engine(url, **app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {}))
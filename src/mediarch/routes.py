@@ -1,34 +1,123 @@
-from datetime import datetime
+from collections.abc import Iterable, Iterator
+from datetime import UTC, date, datetime, timedelta
 from functools import wraps
-
-from flask import Blueprint, abort, flash, redirect, render_template, request, url_for
+from itertools import zip_longest
+
+from flask import (
+    Blueprint,
+    Response,
+    abort,
+    current_app,
+    flash,
+    redirect,
+    render_template,
+    request,
+    stream_template,
+    url_for,
+)
 from flask_login import current_user, login_required, login_user, logout_user
-from werkzeug.exceptions import NotFound
+from sqlalchemy import func, select
+from sqlalchemy.orm import selectinload
+from werkzeug.exceptions import BadRequest, NotFound
+from werkzeug.formparser import FormDataParser
 
 from . import db
-from .forms import LoginForm, RegistrationForm
-from .models import AccountType, BloodType, Patient, User
+from .analytics import cohort_report
+from .appointments import (
+    BookingConflict,
+    BookingError,
+    WorkingHours,
+    book_appointment,
+    cancel_appointment,
+    doctors,
+    list_appointments,
+    local_times,
+    next_free_slot,
+)
+from .archive import archived_patients_query, load_patient, touch_patient
+from .attachments import (
+    INLINE_TYPES,
+    AttachmentTooLarge,
+    BlobWriter,
+    add_attachment,
+    can_delete_attachment,
+    load_attachment,
+    new_writer,
+    patient_attachments,
+    send_attachment,
+)
+from .auth import (
+    STAFF_EDITABLE_FIELDS,
+    can_view_patient,
+    clear_claims,
+    editable_patient_fields,
+    has_session_user,
+    issue_claims,
+    revoke_claims,
+)
+from .cache import current_cache
+from .duplicates import MergeError, check_new_patient, merge_patients, pending_candidates, review_candidate
+from .fragments import current_fragment, fragments
+from .history import history_page
+from .models import (
+    AccountType,
+    Appointment,
+    AppointmentStatus,
+    ArchivedPatient,
+    BloodType,
+    DuplicateCandidate,
+    DuplicateStatus,
+    Patient,
+    User,
+)
+from .observations import patient_charts
+from .prescriptions import PrescriptionError, current_index, current_medication, parse_medication, save_medication
+from .replica import replica_reads
+from .softdelete import soft_delete
 
 bp = Blueprint("main", __name__)
 
+# Endpoints reachable by accounts that are pending activation
+PENDING_ALLOWED_ENDPOINTS = frozenset({"main.logout", "main.index", "static"})
+
+
+# Built once: the context processor runs for every template rendered.
+_ENUM_CONTEXT = {"AccountType": AccountType, "BloodType": BloodType}
+
 
 @bp.context_processor
 def inject_account_types():
     """Inject AccountType enum into all templates."""
-    return {"AccountType": AccountType, "BloodType": BloodType}
+    return _ENUM_CONTEXT
 
 
 @bp.before_request
 def check_user_active():
-    """Check if the logged-in user is active before allowing access to most pages."""
+    """Check if the logged-in user is active before allowing access to most pages.
+
+    Public endpoints and anonymous requests return before ``current_user`` is touched, and for
+    logged-in users the active flag comes from the session claims, so this never queries the database.
+    """
+    if not request.endpoint or request.endpoint in PENDING_ALLOWED_ENDPOINTS or not has_session_user():
+        return None
     if current_user.is_authenticated and not current_user.is_globally_active:
-        # Allow access to logout, index, and static files for pending activation users
-        allowed_endpoints = ["main.logout", "main.index", "static"]
-        if request.endpoint and request.endpoint not in allowed_endpoints:
-            flash("Your account is pending activation. Access is restricted.", "warning")
-            return redirect(url_for("main.index"))
+        flash("Your account is pending activation. Access is restricted.", "warning")
+        return redirect(url_for("main.index"))
     return None
 
+
+def _buffered(chunks: Iterable[str], size: int = 16384) -> Iterator[str]:
+    """Join the many small pieces a streamed template yields into chunks of about ``size`` characters."""
+    buffer, length = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield "".join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield "".join(buffer)
+
 # --- Role-based access control decorators ---
 
 
@@ -75,13 +164,33 @@ admin_or_doctor_required = roles_required([AccountType.ADMIN, AccountType.DOCTOR
 @login_required
 @admin_required
 def admin_dashboard() -> str:
-    """Admin dashboard page."""
-    return render_template("admin_dashboard.html")
+    """Admin dashboard page with record counts, cached until a patient or user changes."""
+    stats = current_cache().get_or_set("admin-dashboard-stats", _dashboard_stats, tags=["patients", "users"])
+    return render_template("admin_dashboard.html", stats=stats)
+
+
+def _dashboard_stats() -> dict[str, int]:
+    count = select(func.count())
+    return {
+        "patients": db.session.scalar(count.select_from(Patient).where(Patient.deleted_at.is_(None))),
+        "users": db.session.scalar(count.select_from(User)),
+        "pending": db.session.scalar(count.select_from(User).where(User.is_active.is_(False))),
+    }
+
+
+@bp.route("/admin/analytics")
+@login_required
+@admin_required
+@replica_reads
+def admin_analytics() -> str:
+    """Age, blood type and condition breakdowns of the registry, cached until a patient changes."""
+    return render_template("admin_analytics.html", report=cohort_report())
 
 
 @bp.route("/admin/users")
 @login_required
 @admin_required
+@replica_reads
 def admin_list_users() -> str:
     """List all users for admins."""
     users = User.query.order_by(User.id).all()
@@ -165,6 +274,7 @@ def admin_edit_user(user_id: int) -> str:
 
         try:
             db.session.commit()
+            revoke_claims(user_to_edit.id)
             flash("User updated successfully.", "success")
             return redirect(url_for("main.admin_list_users"))
         except Exception as e:
@@ -198,6 +308,7 @@ def admin_toggle_user_active(user_id: int) -> str:
     action = "activated" if user_to_toggle.is_active else "deactivated"
     try:
         db.session.commit()
+        revoke_claims(user_to_toggle.id)
         flash(f"User {user_to_toggle.username} has been {action}.", "success")
     except Exception as e:
         db.session.rollback()
@@ -205,6 +316,72 @@ def admin_toggle_user_active(user_id: int) -> str:
         # Log error e
     return redirect(url_for("main.admin_list_users"))
 
+
+@bp.route("/admin/duplicates")
+@login_required
+@admin_required
+@replica_reads
+def admin_duplicates() -> str:
+    """Review queue of likely duplicate patient cards, most likely first."""
+    pagination = db.paginate(pending_candidates(), per_page=current_app.config["DUPLICATES_PER_PAGE"])
+    ids = {patient_id for candidate in pagination.items for patient_id in (candidate.patient_id, candidate.other_id)}
+    cards = {patient.id: patient for patient in db.session.scalars(
+        select(Patient).where(Patient.id.in_(ids)).options(selectinload(Patient.user_account)))}
+    # Archived cards are shown from their stubs; merging restores them.
+    archived = {stub.patient_id: stub for stub in db.session.scalars(
+        select(ArchivedPatient).where(ArchivedPatient.patient_id.in_(ids - cards.keys())))}
+    return render_template("admin_duplicates.html", candidates=pagination.items, cards=cards, archived=archived,
+                           pagination=pagination)
+
+
+def _pending_candidate(candidate_id: int) -> DuplicateCandidate:
+    candidate = db.session.get(DuplicateCandidate, candidate_id)
+    if candidate is None or candidate.status != DuplicateStatus.PENDING:
+        raise NotFound
+    return candidate
+
+
+@bp.route("/admin/duplicates/<int:candidate_id>/merge", methods=["POST"])
+@login_required
+@admin_required
+def admin_merge_duplicates(candidate_id: int) -> str:
+    """Merge the pair into the card named by the ``keep`` form field and delete the other card."""
+    candidate = _pending_candidate(candidate_id)
+    keep = request.form.get("keep", type=int)
+    if keep not in {candidate.patient_id, candidate.other_id}:
+        raise BadRequest("keep must be one of the two cards")
+    target = load_patient(keep, current_user)
+    source = load_patient(candidate.other_id if keep == candidate.patient_id else candidate.patient_id, current_user)
+    if target is None or source is None:
+        flash("One of the two cards no longer exists.", "warning")
+        return redirect(url_for("main.admin_duplicates"))
+
+    account = source.user_account
+    try:
+        merge_patients(source, target)
+    except MergeError as e:
+        flash(str(e), "danger")
+        return redirect(url_for("main.admin_duplicates"))
+    review_candidate(candidate, DuplicateStatus.MERGED, current_user.id)
+    db.session.commit()
+    if account is not None:
+        revoke_claims(account.id)  # the session claims still name the old card
+
+    flash(f"Patient #{source.id} was merged into patient #{target.id}.", "success")
+    return redirect(url_for("main.admin_duplicates"))
+
+
+@bp.route("/admin/duplicates/<int:candidate_id>/dismiss", methods=["POST"])
+@login_required
+@admin_required
+def admin_dismiss_duplicates(candidate_id: int) -> str:
+    """Mark the pair as two different people; later scans do not queue it again."""
+    review_candidate(_pending_candidate(candidate_id), DuplicateStatus.DISMISSED, current_user.id)
+    db.session.commit()
+    flash("The pair was dismissed.", "info")
+    return redirect(url_for("main.admin_duplicates"))
+
+
 # --- End Admin Panel Routes ---
 
 
@@ -217,10 +394,43 @@ def index() -> str:
 @bp.route("/patients")
 @login_required
 @admin_or_doctor_required
+@replica_reads
+@fragments("main", "rows")
 def patients() -> str:
-    """List all patients. Accessible only by Admins and Doctors."""
-    all_patients = Patient.query.all()
-    return render_template("patient_list.html", patients=all_patients)
+    """List patients one page at a time. Accessible only by Admins and Doctors.
+
+    ``?all=1`` streams the complete table instead (e.g. for printing): rows are fetched through a
+    server-side cursor and rendered as they arrive, so memory stays flat however many patients exist.
+    The pager links fetch just the next page's rows (``X-Fragment: rows``).
+    """
+    order = (Patient.last_name, Patient.first_name, Patient.id)
+    if request.args.get("all", type=int):
+        rows = db.session.execute(
+            select(Patient.id, Patient.last_name, Patient.first_name, Patient.birth_date)
+            .where(Patient.deleted_at.is_(None))
+            .order_by(*order)
+            .execution_options(yield_per=current_app.config["PATIENTS_STREAM_BATCH_SIZE"])
+        )
+        return Response(_buffered(stream_template("patient_list.html", patients=rows, streaming=True)),
+                        mimetype="text/html")
+
+    pagination = db.paginate(select(Patient).order_by(*order), per_page=current_app.config["PATIENTS_PER_PAGE"])
+    template = "_patient_page.html" if current_fragment() == "rows" else "patient_list.html"
+    return render_template(template, patients=pagination.items, pagination=pagination, streaming=False)
+
+
+@bp.route("/patients/archived")
+@login_required
+@admin_or_doctor_required
+@replica_reads
+def archived_patients() -> str:
+    """List the cards in cold storage by name; ``?q=`` finds those whose first or last name starts with it.
+
+    Only the stubs are read. Opening a card restores it.
+    """
+    search = request.args.get("q", "")
+    pagination = db.paginate(archived_patients_query(search), per_page=current_app.config["PATIENTS_PER_PAGE"])
+    return render_template("archived_patients.html", stubs=pagination.items, pagination=pagination, search=search)
 
 
 @bp.route("/patients/add", methods=["GET", "POST"])
@@ -268,6 +478,7 @@ def add_patient() -> str:
         )
 
         db.session.add(new_patient)
+        check_new_patient(new_patient)
         db.session.commit()
 
         flash("Patient added successfully.", "success")
@@ -278,23 +489,56 @@ def add_patient() -> str:
 
 @bp.route("/patients/<int:patient_id>")
 @login_required
+@replica_reads
+@fragments("main")
 def view_patient(patient_id: int) -> str:
     """View a specific patient.
     Admins and Doctors can view any patient.
     Patients can only view their own linked patient card.
+    Archived cards are restored on the way.
     """
-    patient = db.session.get(Patient, patient_id)
+    patient = load_patient(patient_id, current_user)
     if patient is None:
         raise NotFound
 
-    if current_user.account_type in {AccountType.ADMIN, AccountType.DOCTOR}:
-        # Admins and Doctors can view any patient
-        pass
-    elif current_user.patient_id != patient.id:
-        # Patients can only view their own card
+    if not can_view_patient(current_user, patient.id):
         abort(403)  # Forbidden
+    touch_patient(patient)
 
-    return render_template("patient_detail.html", patient=patient)
+    history = None
+    if current_user.account_type in {AccountType.ADMIN, AccountType.DOCTOR}:
+        history = history_page(patient.id, request.args.get("history_page", 1, type=int),
+                               current_app.config["HISTORY_PER_PAGE"])
+
+    charts = patient_charts(patient.id, current_app.config["OBSERVATIONS_CHART_YEARS"],
+                            current_app.config["OBSERVATIONS_CHART_POINTS"])
+    medication = current_medication(patient.id)
+    return render_template("patient_detail.html", patient=patient, history=history, charts=charts,
+                           medication=medication, medication_warnings=medication.warnings(),
+                           drug_names=current_index().names, attachments=patient_attachments(patient.id),
+                           inline_types=INLINE_TYPES)
+
+
+def _patient_form(patient: Patient, can_edit_all_fields: bool, is_patient_editing_own: bool, **context) -> str:
+    """Render the edit form; staff also get the prescriptions and drug allergies, as stored or as submitted."""
+    if can_edit_all_fields:
+        index = current_index()
+        if request.method == "POST":
+            rows = [(code.strip(), dosage.strip()) for code, dosage in zip_longest(
+                request.form.getlist("drug_code"), request.form.getlist("dosage"), fillvalue="") if code.strip()]
+            allergens = [text.strip() for text in request.form.getlist("allergen_code") if text.strip()]
+        else:
+            medication = current_medication(patient.id)
+            rows = [(code, dosage or "") for code, dosage in medication.prescriptions.items()]
+            allergens = medication.allergens
+            context.setdefault("warnings", medication.warnings())
+        context.setdefault("warnings", [])
+        context.setdefault("unconfirmed", set())
+        # Blank rows to add to the lists
+        context.update(drug_rows=[*rows, ("", ""), ("", "")], allergen_rows=[*allergens, ""], drug_names=index.names,
+                       drug_classes=index.classes)
+    return render_template("patient_form.html", patient=patient, can_edit_all_fields=can_edit_all_fields,
+                           is_patient_editing_own=is_patient_editing_own, **context)
 
 
 @bp.route("/patients/<int:patient_id>/edit", methods=["GET", "POST"])
@@ -303,21 +547,19 @@ def edit_patient(patient_id: int) -> str:
     """Edit a specific patient.
     Admins and Doctors can edit any patient.
     Patients can only edit basic information of their own linked patient card.
+    Staff saves check the prescriptions and drug allergies against the interaction index; new warnings
+    are shown on the form and must be confirmed before the card is saved.
     """
-    patient = db.session.get(Patient, patient_id)
+    patient = load_patient(patient_id, current_user)
     if patient is None:
         raise NotFound
 
     # Authorization checks
-    can_edit_all_fields = False
-    is_own_record_for_patient_user = False
-
-    if current_user.account_type in {AccountType.ADMIN, AccountType.DOCTOR}:
-        can_edit_all_fields = True
-    elif current_user.patient_id == patient.id:
-        is_own_record_for_patient_user = True
-    else:
+    editable = editable_patient_fields(current_user, patient.id)
+    if not editable:
         abort(403)  # Patient trying to edit another patient's record
+    can_edit_all_fields = editable == STAFF_EDITABLE_FIELDS
+    is_own_record_for_patient_user = not can_edit_all_fields
 
     if request.method == "POST":
         # Get common fields first
@@ -333,10 +575,7 @@ def edit_patient(patient_id: int) -> str:
                     patient.birth_date = datetime.strptime(birth_date_str, "%Y-%m-%d").date()
                 except ValueError:
                     flash("Invalid date format for birth date. Please use YYYY-MM-DD format.", "danger")
-                    # Pass patient and can_edit_all_fields to template context
-                    return render_template("patient_form.html", patient=patient,
-                                           can_edit_all_fields=can_edit_all_fields,
-                                           is_patient_editing_own=is_own_record_for_patient_user)
+                    return _patient_form(patient, can_edit_all_fields, is_own_record_for_patient_user)
             else:
                 patient.birth_date = None
 
@@ -347,9 +586,7 @@ def edit_patient(patient_id: int) -> str:
                     patient.blood_type = BloodType(blood_type_str)
                 except ValueError:
                     flash(f"Invalid blood type value: {blood_type_str}.", "danger")
-                    return render_template("patient_form.html", patient=patient,
-                                           can_edit_all_fields=can_edit_all_fields,
-                                           is_patient_editing_own=is_own_record_for_patient_user)
+                    return _patient_form(patient, can_edit_all_fields, is_own_record_for_patient_user)
             else:
                 patient.blood_type = None  # Allow unsetting blood type
 
@@ -358,6 +595,22 @@ def edit_patient(patient_id: int) -> str:
             patient.medications = request.form.get("medications") or None
             patient.notes = request.form.get("notes") or None
 
+            if request.form.get("medication_form"):  # clients without the structured lists leave them alone
+                try:
+                    medication = parse_medication(request.form.getlist("drug_code"), request.form.getlist("dosage"),
+                                                  request.form.getlist("allergen_code"))
+                except PrescriptionError as e:
+                    flash(str(e), "danger")
+                    return _patient_form(patient, can_edit_all_fields, is_own_record_for_patient_user)
+                warnings = medication.warnings()
+                known = {warning.key for warning in current_medication(patient.id).warnings()}
+                unconfirmed = {warning.key for warning in warnings} - known
+                if unconfirmed and not request.form.get("confirm_warnings"):
+                    flash("Review the new drug safety warnings below and confirm them to save the card.", "warning")
+                    return _patient_form(patient, can_edit_all_fields, is_own_record_for_patient_user,
+                                         warnings=warnings, unconfirmed=unconfirmed)
+                save_medication(patient, medication, current_user.id)
+
         elif is_own_record_for_patient_user:
             # Patient can only edit their first_name and last_name
             patient.first_name = new_first_name
@@ -372,33 +625,213 @@ def edit_patient(patient_id: int) -> str:
         return redirect(url_for("main.view_patient", patient_id=patient.id))
 
     # For GET request, pass flags to template to conditionally render fields/warnings
-    return render_template("patient_form.html", patient=patient,
-                           can_edit_all_fields=can_edit_all_fields,
-                           is_patient_editing_own=is_own_record_for_patient_user)
+    return _patient_form(patient, can_edit_all_fields, is_own_record_for_patient_user)
 
 
 @bp.route("/patients/<int:patient_id>/delete")
 @login_required
 @admin_required
 def delete_patient(patient_id: int) -> str:
-    """Delete a patient. Accessible only by Admins."""
+    """Soft-delete a patient. Accessible only by Admins.
+
+    The row is hidden immediately and purged later by ``flask patients purge``.
+    """
     patient = db.session.get(Patient, patient_id)
     if patient is None:
         raise NotFound
 
-    db.session.delete(patient)
+    soft_delete(patient)
     db.session.commit()
 
     flash("Patient deleted successfully.", "success")
     return redirect(url_for("main.patients"))
 
 
+@bp.post("/patients/<int:patient_id>/attachments")
+@login_required
+def upload_attachments(patient_id: int) -> str:
+    """Attach the files of the patient page's upload form. Anyone who can view a card can attach files to it.
+
+    The multipart body is parsed here rather than through ``request.files``, with every file part written
+    straight into the attachment store as it arrives.
+    """
+    patient = load_patient(patient_id, current_user)
+    if patient is None:
+        raise NotFound
+    if not can_view_patient(current_user, patient.id):
+        abort(403)
+    back = url_for("main.view_patient", patient_id=patient.id) + "#patient-attachments"
+
+    writers: list[BlobWriter] = []
+
+    def stream_factory(**_) -> BlobWriter:
+        writers.append(new_writer())
+        return writers[-1]
+
+    parser = FormDataParser(stream_factory, max_form_memory_size=request.max_form_memory_size,
+                            max_form_parts=request.max_form_parts, silent=False)
+    try:
+        _, _, files = parser.parse(request.stream, request.mimetype, request.content_length, request.mimetype_params)
+        added = [add_attachment(patient, upload.stream, upload.filename, upload.mimetype, current_user.id)
+                 for upload in files.getlist("file") if upload.filename]
+    except AttachmentTooLarge as e:
+        flash(f"{e} Nothing was attached.", "danger")
+        return redirect(back)
+    except ValueError:
+        flash("The upload could not be read. Nothing was attached.", "danger")
+        return redirect(back)
+    finally:
+        for writer in writers:
+            writer.discard()
+    if not added:
+        flash("Choose a file to attach.", "warning")
+        return redirect(back)
+    db.session.commit()
+    flash(f"Attached {', '.join(attachment.filename for attachment in added)}.", "success")
+    return redirect(back)
+
+
+@bp.get("/attachments/<int:attachment_id>")
+@login_required
+@replica_reads
+def download_attachment(attachment_id: int):
+    """Send an attachment to anyone who can view its card; ``?inline=1`` shows PDFs, images and text in the browser.
+
+    Answers ``Range`` requests with 206 and revalidations with 304, from the file on disk.
+    """
+    attachment = load_attachment(attachment_id, current_user)
+    if attachment is None:
+        raise NotFound
+    if not can_view_patient(current_user, attachment.patient_id):
+        abort(403)
+    return send_attachment(attachment, inline=request.args.get("inline", type=int) == 1)
+
+
+@bp.post("/attachments/<int:attachment_id>/delete")
+@login_required
+def delete_attachment_view(attachment_id: int) -> str:
+    """Delete an attachment. Patients can only delete the files they attached themselves."""
+    attachment = load_attachment(attachment_id, current_user)
+    if attachment is None:
+        raise NotFound
+    if not can_view_patient(current_user, attachment.patient_id) or not can_delete_attachment(current_user, attachment):
+        abort(403)
+    db.session.delete(attachment)
+    db.session.commit()
+    flash(f"Deleted {attachment.filename}.", "info")
+    return redirect(url_for("main.view_patient", patient_id=attachment.patient_id) + "#patient-attachments")
+
+
+@bp.get("/appointments")
+@login_required
+@replica_reads
+def appointments() -> str:
+    """The schedule.
+
+    Admins and doctors see one doctor's day, ``?doctor_id=`` (by default their own or the first doctor's)
+    on ``?day=YYYY-MM-DD`` (by default today), with a booking form set to the next free slot.
+    Patients see the upcoming appointments of their card.
+    """
+    hours = WorkingHours.from_config(current_app.config)
+    now = datetime.now(UTC)
+    all_doctors = doctors()
+    if current_user.account_type == AccountType.PATIENT:
+        booked = []
+        if current_user.patient_id:
+            booked = list_appointments(now, now + timedelta(days=365), patient_id=current_user.patient_id)
+        return render_template("appointments.html", booked=list(local_times(booked, hours.zone)),
+                               doctors={doctor.id: doctor for doctor in all_doctors})
+
+    doctor_id = request.args.get("doctor_id", type=int)
+    if doctor_id is None and current_user.account_type == AccountType.DOCTOR:
+        doctor_id = current_user.id
+    elif doctor_id is None and all_doctors:
+        doctor_id = all_doctors[0].id
+    try:
+        day = date.fromisoformat(request.args["day"])
+    except (KeyError, ValueError):
+        day = hours.local_day(now)
+    start, end = hours.day_bounds(day)
+    booked, cards, free_slot = [], {}, None
+    if doctor_id is not None:
+        booked = list_appointments(start, end, doctor_id=doctor_id)
+        cards = {patient.id: patient for patient in db.session.scalars(
+            select(Patient).where(Patient.id.in_({appointment.patient_id for appointment in booked})))}
+        free_slot = next_free_slot(doctor_id, max(now, start))
+    return render_template(
+        "appointments.html", booked=list(local_times(booked, hours.zone)), cards=cards,
+        day=day, one_day=timedelta(days=1), doctors={doctor.id: doctor for doctor in all_doctors}, doctor_id=doctor_id,
+        free_slot=free_slot.astimezone(hours.zone) if free_slot else None,
+        minutes=current_app.config["APPOINTMENTS_DEFAULT_MINUTES"], timezone=hours.zone.key,
+    )
+
+
+@bp.post("/appointments")
+@login_required
+@admin_or_doctor_required
+def book_appointment_view() -> str:
+    """Book the appointment of the schedule page's form; ``starts_at`` is in the clinic's time zone."""
+    hours = WorkingHours.from_config(current_app.config)
+    doctor_id = request.form.get("doctor_id", type=int)
+    patient_id = request.form.get("patient_id", type=int)
+    minutes = request.form.get("minutes", type=int)
+    try:
+        starts_at = datetime.fromisoformat(request.form.get("starts_at", "")).replace(tzinfo=hours.zone)
+    except ValueError:
+        starts_at = None
+    if doctor_id is None or patient_id is None or minutes is None or starts_at is None:
+        flash("Doctor, patient, start and duration are required.", "danger")
+        return redirect(url_for("main.appointments", doctor_id=doctor_id))
+
+    back = url_for("main.appointments", doctor_id=doctor_id, day=starts_at.date().isoformat())
+    if load_patient(patient_id, current_user) is None:
+        flash(f"Patient #{patient_id} does not exist.", "danger")
+        return redirect(back)
+    try:
+        book_appointment(doctor_id, patient_id, starts_at, minutes, request.form.get("reason", "").strip(),
+                         booked_by_id=current_user.id)
+    except BookingConflict as e:
+        db.session.rollback()
+        slot = next_free_slot(doctor_id, starts_at, minutes)
+        flash(str(e) + (f" The next free slot is {slot.astimezone(hours.zone):%Y-%m-%d %H:%M}." if slot else ""),
+              "warning")
+        return redirect(back)
+    except BookingError as e:
+        db.session.rollback()
+        flash(str(e), "danger")
+        return redirect(back)
+    db.session.commit()
+    flash(f"Appointment booked for patient #{patient_id} on {starts_at:%Y-%m-%d %H:%M}.", "success")
+    return redirect(back)
+
+
+@bp.post("/appointments/<int:appointment_id>/cancel")
+@login_required
+def cancel_appointment_view(appointment_id: int) -> str:
+    """Cancel a scheduled appointment. Patients can only cancel the appointments of their own card."""
+    appointment = db.session.get(Appointment, appointment_id)
+    if appointment is None or appointment.status != AppointmentStatus.SCHEDULED:
+        raise NotFound
+    if not can_view_patient(current_user, appointment.patient_id):
+        abort(403)
+    cancel_appointment(appointment)
+    db.session.commit()
+    flash("The appointment was cancelled.", "info")
+    if current_user.account_type == AccountType.PATIENT:
+        return redirect(url_for("main.appointments"))
+    day = WorkingHours.from_config(current_app.config).local_day(appointment.starts_at)
+    return redirect(url_for("main.appointments", doctor_id=appointment.doctor_id, day=day.isoformat()))
+
+
 @bp.route("/register", methods=["GET", "POST"])
 def register() -> str:
     """Handle user registration."""
     if current_user.is_authenticated:
         return redirect(url_for("main.index"))
 
+    # Imported here so that workers only load Flask-WTF and WTForms once someone needs a form
+    from .forms import RegistrationForm  # noqa: PLC0415
+
     form = RegistrationForm()
     if form.validate_on_submit():
         # Ensure account_type is a valid AccountType enum member
@@ -445,6 +878,8 @@ def register() -> str:
             db.session.add(new_patient)  # Ensure patient is added if not cascaded by user.patient_card assignment alone
 
         try:
+            if selected_account_type == AccountType.PATIENT:
+                check_new_patient(new_patient)
             db.session.commit()
             flash("Congratulations, you are now a registered user!", "success")
             return redirect(url_for("main.login"))
@@ -463,13 +898,16 @@ def login() -> str:
     if current_user.is_authenticated:
         return redirect(url_for("main.index"))
 
+    from .forms import LoginForm  # noqa: PLC0415
+
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(email=form.email.data).first()
         if user is None or not user.check_password(form.password.data):
             flash("Invalid email or password.", "danger")
             return redirect(url_for("main.login"))
-        login_user(user)
+        if login_user(user):
+            issue_claims(user)
 
         if not user.is_globally_active:
             flash("Login successful, but your account is pending activation by an administrator.", "success")
@@ -486,5 +924,6 @@ def login() -> str:
 def logout() -> str:
     """Handle user logout."""
     logout_user()
+    clear_claims()
     flash("You have been logged out.", "info")
     return redirect(url_for("main.index"))
@@ -0,0 +1,271 @@
+"""Optional server-side session storage.
+
+With the default Flask session every flashed message and the Flask-Login state travel in a signed
+cookie that grows with its content and is verified on every request. When ``SESSION_BACKEND`` is set,
+the session data lives in a ``SessionStore`` instead and the cookie only carries a random session id.
+
+Two local stores are provided (``filesystem`` and ``sqlite``). A shared store for multi-host
+deployments (Redis, memcached, ...) only needs to implement the four ``SessionStore`` methods::
+
+    app.session_interface = ServerSideSessionInterface(MyRedisStore(...))
+"""
+import os
+import re
+import secrets
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+from flask import Flask, Request, Response
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+
+SESSION_BACKENDS = ("filesystem", "sqlite")
+
+_SID_RE = re.compile(r"^[A-Za-z0-9_-]{43}$")
+_serializer = TaggedJSONSerializer()
+
+
+class SessionStore(ABC):
+    """Storage backend for server-side sessions. Implementations must be thread-safe."""
+
+    @abstractmethod
+    def load(self, sid: str) -> dict | None:
+        """Return the session data for ``sid``, or ``None`` if it is missing or expired."""
+
+    @abstractmethod
+    def save(self, sid: str, data: dict, expires_at: float) -> None:
+        """Create or replace the session ``sid``."""
+
+    @abstractmethod
+    def delete(self, sid: str) -> None:
+        """Remove the session ``sid`` if it exists."""
+
+    @abstractmethod
+    def sweep(self, now: float | None = None) -> int:
+        """Delete all expired sessions and return how many were removed."""
+
+
+class FileSystemSessionStore(SessionStore):
+    """One file per session. The file modification time is set to the expiry so sweeping only needs ``stat``."""
+
+    def __init__(self, directory: str | os.PathLike) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, sid: str) -> Path:
+        return self.directory / sid
+
+    def load(self, sid: str) -> dict | None:
+        path = self._path(sid)
+        try:
+            if path.stat().st_mtime < time.time():
+                return None
+            return _serializer.loads(path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def save(self, sid: str, data: dict, expires_at: float) -> None:
+        path = self._path(sid)
+        tmp = path.with_name(f".{sid}.{threading.get_ident()}.tmp")
+        tmp.write_text(_serializer.dumps(data), encoding="utf-8")
+        os.utime(tmp, (expires_at, expires_at))
+        tmp.replace(path)
+
+    def delete(self, sid: str) -> None:
+        self._path(sid).unlink(missing_ok=True)
+
+    def sweep(self, now: float | None = None) -> int:
+        now = time.time() if now is None else now
+        removed = 0
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.startswith(".") or entry.stat().st_mtime >= now:
+                    continue
+                Path(entry.path).unlink(missing_ok=True)
+                removed += 1
+        return removed
+
+
+class SQLiteSessionStore(SessionStore):
+    """Sessions in a local SQLite file, shared by all worker processes on the host."""
+
+    def __init__(self, path: str | os.PathLike) -> None:
+        self.path = str(path)
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions "
+                "(sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_sessions_expires_at ON sessions (expires_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def load(self, sid: str) -> dict | None:
+        row = self._connect().execute(
+            "SELECT data FROM sessions WHERE sid = ? AND expires_at >= ?", (sid, time.time())
+        ).fetchone()
+        return _serializer.loads(row[0]) if row else None
+
+    def save(self, sid: str, data: dict, expires_at: float) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (sid, data, expires_at) VALUES (?, ?, ?)",
+                (sid, _serializer.dumps(data), expires_at),
+            )
+
+    def delete(self, sid: str) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+    def sweep(self, now: float | None = None) -> int:
+        now = time.time() if now is None else now
+        with self._connect() as conn:
+            return conn.execute("DELETE FROM sessions WHERE expires_at < ?", (now,)).rowcount
+
+
+class ServerSideSession(dict, SessionMixin):
+    """Session whose data is fetched from the store on first access only.
+
+    Requests that never touch ``session`` cost no store lookup.
+    """
+
+    def __init__(self, sid: str | None, store: SessionStore) -> None:
+        super().__init__()
+        self.sid = sid
+        self.store = store
+        self.loaded = sid is None
+        self.modified = False
+        self.accessed = False
+        self.initial_user_id = None
+
+    def _ensure_loaded(self) -> None:
+        self.accessed = True
+        if self.loaded:
+            return
+        self.loaded = True
+        data = self.store.load(self.sid)
+        if data is None:
+            self.sid = None  # expired or unknown; a fresh id is issued on save
+        else:
+            super().update(data)
+            self.initial_user_id = data.get("_user_id")
+
+
+def _reading(name: str):
+    method = getattr(dict, name)
+
+    def wrapper(self, *args, **kwargs):
+        self._ensure_loaded()
+        return method(self, *args, **kwargs)
+
+    wrapper.__name__ = name
+    return wrapper
+
+
+def _writing(name: str):
+    method = getattr(dict, name)
+
+    def wrapper(self, *args, **kwargs):
+        self._ensure_loaded()
+        self.modified = True
+        return method(self, *args, **kwargs)
+
+    wrapper.__name__ = name
+    return wrapper
+
+
+for _name in ("__getitem__", "__contains__", "__iter__", "__len__", "get", "keys", "items", "values", "copy"):
+    setattr(ServerSideSession, _name, _reading(_name))
+for _name in ("__setitem__", "__delitem__", "pop", "popitem", "setdefault", "update", "clear"):
+    setattr(ServerSideSession, _name, _writing(_name))
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """Flask session interface storing data in a ``SessionStore`` behind an opaque id cookie."""
+
+    def __init__(self, store: SessionStore, sweep_interval: float = 300) -> None:
+        self.store = store
+        self.sweep_interval = sweep_interval
+        self._next_sweep = 0.0
+
+    def open_session(self, app: Flask, request: Request) -> SessionMixin:
+        # Flask-Login inspects the session after every request; static files have no use for it.
+        if app.static_url_path and request.path.startswith(f"{app.static_url_path}/"):
+            return self.make_null_session(app)
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid is not None and not _SID_RE.match(sid):
+            sid = None
+        return ServerSideSession(sid, self.store)
+
+    def save_session(self, app: Flask, session: ServerSideSession, response: Response) -> None:
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.accessed:
+            response.vary.add("Cookie")
+        if not session.modified:
+            return
+
+        if not session:
+            if session.sid is not None:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path, secure=self.get_cookie_secure(app),
+                                       httponly=self.get_cookie_httponly(app),
+                                       samesite=self.get_cookie_samesite(app))
+            return
+
+        # Rotate the id whenever the logged-in user changes to prevent session fixation.
+        if session.sid is not None and session.get("_user_id") != session.initial_user_id:
+            self.store.delete(session.sid)
+            session.sid = None
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(32)
+
+        expires = self.get_expiration_time(app, session)
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        self.store.save(session.sid, dict(session), expires.timestamp() if expires else time.time() + lifetime)
+        response.set_cookie(name, session.sid, expires=expires, httponly=self.get_cookie_httponly(app),
+                            domain=domain, path=path, secure=self.get_cookie_secure(app),
+                            samesite=self.get_cookie_samesite(app))
+        self._maybe_sweep()
+
+    def _maybe_sweep(self) -> None:
+        now = time.time()
+        if now >= self._next_sweep:
+            self._next_sweep = now + self.sweep_interval
+            self.store.sweep(now)
+
+
+def create_store(backend: str, path: str) -> SessionStore:
+    """Build one of the bundled local stores."""
+    if backend == "filesystem":
+        return FileSystemSessionStore(path)
+    if backend == "sqlite":
+        return SQLiteSessionStore(path)
+    raise ValueError(f"Unknown SESSION_BACKEND {backend!r}; expected one of {', '.join(SESSION_BACKENDS)}.")
+
+
+def init_app(app: Flask) -> None:
+    """Install the server-side session interface if ``SESSION_BACKEND`` is configured."""
+    backend = app.config.get("SESSION_BACKEND")
+    if not backend:
+        return
+    path = app.config.get("SESSION_STORE_PATH") or os.path.join(
+        app.instance_path, "sessions.sqlite3" if backend == "sqlite" else "sessions"
+    )
+    app.session_interface = ServerSideSessionInterface(
+        create_store(backend, path), sweep_interval=app.config["SESSION_SWEEP_INTERVAL"]
+    )
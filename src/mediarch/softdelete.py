@@ -0,0 +1,90 @@
+"""Soft delete for patient cards.
+
+Deleting a card only stamps ``deleted_at``, a single-row ``UPDATE``. A global loader criterion hides
+those rows from every ORM query, and ``purge_deleted_patients`` later removes them for good in bounded
+batches outside the request path, archiving each row into ``patient_history`` first.
+"""
+from datetime import UTC, datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import delete, event, insert, select, update
+from sqlalchemy.orm import ORMExecuteState, with_loader_criteria
+
+from . import db
+from .changes import USER_COLUMNS, append_changes, notify_committed, user_updates
+from .history import purge_entries
+from .jobs import job
+from .models import Appointment, Attachment, Observation, Patient, PatientAllergy, PatientHistory, Prescription, User
+
+# Execution option that lets a query see soft-deleted patients, e.g.
+# ``db.session.execute(select(Patient), execution_options={INCLUDE_DELETED: True})``
+INCLUDE_DELETED = "include_deleted"
+
+
+@event.listens_for(db.session, "do_orm_execute")
+def _hide_deleted_patients(state: ORMExecuteState) -> None:
+    if (
+        state.is_select
+        and not state.is_column_load
+        and not state.is_relationship_load
+        and not state.execution_options.get(INCLUDE_DELETED, False)
+    ):
+        state.statement = state.statement.options(
+            with_loader_criteria(Patient, Patient.deleted_at.is_(None), include_aliases=True)
+        )
+
+
+def soft_delete(patient: Patient) -> None:
+    """Mark ``patient`` as deleted; the caller commits."""
+    patient.deleted_at = datetime.now(UTC)
+
+
+def purge_deleted_patients(older_than: timedelta, batch_size: int = 500) -> int:
+    """Hard-delete patients soft-deleted more than ``older_than`` ago and return how many were removed.
+
+    Each batch runs in its own short transaction: archive the rows into the history, unlink user
+    accounts (publishing them to the change feed), then delete the cards with their observations,
+    appointments, prescriptions, drug allergies and attachments (whose files the attachments garbage
+    collection removes). Rows locked by a concurrent purge are skipped on PostgreSQL.
+    """
+    cutoff = datetime.now(UTC) - older_than
+    patients, users = Patient.__table__, User.__table__
+    dependents = [model.__table__ for model in (Observation, Appointment, Prescription, PatientAllergy, Attachment)]
+    purged = 0
+    while True:
+        with db.engine.begin() as connection:
+            rows = connection.execute(
+                select(patients)
+                .where(patients.c.deleted_at.is_not(None), patients.c.deleted_at < cutoff)
+                .order_by(patients.c.deleted_at)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            ).all()
+            if not rows:
+                return purged
+            ids = [row.id for row in rows]
+            connection.execute(insert(PatientHistory), purge_entries(rows))
+            unlinked = connection.execute(
+                update(users).where(users.c.patient_id.in_(ids)).values(patient_id=None)
+                .returning(users.c.id, *(users.c[key] for key in USER_COLUMNS))
+            ).all()
+            append_changes(connection, user_updates(unlinked))
+            for table in dependents:
+                connection.execute(delete(table).where(table.c.patient_id.in_(ids)))
+            connection.execute(delete(patients).where(patients.c.id.in_(ids)))
+        if unlinked:
+            notify_committed()
+        purged += len(rows)
+        if len(rows) < batch_size:
+            return purged
+
+
+@job("patients.purge")
+def purge_job(days: int | None = None, batch_size: int | None = None) -> dict:
+    """Background job wrapper around ``purge_deleted_patients`` using the configured defaults."""
+    config = current_app.config
+    purged = purge_deleted_patients(
+        timedelta(days=config["PATIENT_PURGE_AFTER_DAYS"] if days is None else days),
+        batch_size or config["PATIENT_PURGE_BATCH_SIZE"],
+    )
+    return {"purged": purged}
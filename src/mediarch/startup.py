@@ -0,0 +1,86 @@
+"""Cold-start profiling.
+
+``create_app`` records the wall time of its phases in a ``StartupTimer``. ``measure_cold_start`` starts a
+fresh interpreter that imports MediArch and creates the app, exactly like a new worker, and reports the
+total time, those phases and, with ``-X importtime``, which imports the time went into. The
+``flask profile-startup`` command prints the result.
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+
+EXTENSION_KEY = "mediarch.startup"
+
+_CHILD = """
+import json, sys, time
+start = time.perf_counter()
+from mediarch import create_app
+app = create_app()
+total = time.perf_counter() - start
+json.dump({"total": total, "phases": app.extensions["mediarch.startup"].phases}, sys.stdout)
+"""
+
+
+class StartupTimer:
+    """Wall time of consecutive phases, in seconds, in the order they ran."""
+
+    def __init__(self) -> None:
+        self.phases: dict[str, float] = {}
+        self._last = time.perf_counter()
+
+    def mark(self, phase: str) -> None:
+        """End ``phase``, which started when the previous one ended."""
+        now = time.perf_counter()
+        self.phases[phase] = now - self._last
+        self._last = now
+
+
+@dataclass
+class ColdStart:
+    total: float  # seconds from the first import of mediarch to a ready app
+    phases: dict[str, float]  # create_app phase -> seconds
+    imports: list[tuple[str, float]] = field(default_factory=list)  # see parse_importtime
+
+
+def _is_own(module: str) -> bool:
+    return module == "mediarch" or module.startswith("mediarch.")
+
+
+def parse_importtime(output: str) -> list[tuple[str, float]]:
+    """Modules imported directly by MediArch (or at top level) with their cumulative time, slowest first.
+
+    ``-X importtime`` lists a module after everything it imported, indented one level deeper, so the
+    parent of a line is the next line one level up.
+    """
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|", 2)
+        if cumulative.strip().isdigit():  # skip the header
+            depth = (len(name) - len(name.lstrip()) - 1) // 2
+            rows.append((depth, name.strip(), int(cumulative) / 1e6))
+
+    imports, parents = [], {}
+    for depth, module, seconds in reversed(rows):
+        parent = parents.get(depth - 1)
+        if module != "mediarch" and (depth == 0 or (parent is not None and _is_own(parent))):
+            imports.append((module, seconds))
+        parents[depth] = module
+    return sorted(imports, key=lambda item: item[1], reverse=True)
+
+
+def measure_cold_start(importtime: bool = False, env: dict[str, str] | None = None) -> ColdStart:
+    """Import MediArch and create the app in a new interpreter; ``env`` is added to this process's environment."""
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    child_env = {**os.environ, **(env or {})}
+    child_env["PYTHONPATH"] = os.pathsep.join(filter(None, [package_root, child_env.get("PYTHONPATH")]))
+    args = [sys.executable, *(["-X", "importtime"] if importtime else []), "-c", _CHILD]
+    result = subprocess.run(args, capture_output=True, text=True, env=child_env, check=False)
+    if result.returncode != 0:
+        raise RuntimeError(f"Creating the app failed:\n{result.stderr[-2000:]}")
+    report = json.loads(result.stdout)
+    return ColdStart(report["total"], report["phases"], parse_importtime(result.stderr) if importtime else [])
@@ -1,9 +1,8 @@
 // Main JavaScript file for MediArch
 
-document.addEventListener('DOMContentLoaded', function() {
-  // Auto-dismiss alerts after 5 seconds
-  const alerts = document.querySelectorAll('.alert');
-  alerts.forEach(alert => {
+// Auto-dismiss alerts after 5 seconds
+function dismissAlerts(root) {
+  root.querySelectorAll('.alert').forEach(alert => {
     setTimeout(() => {
       alert.style.opacity = '0';
       setTimeout(() => {
@@ -11,6 +10,149 @@ document.addEventListener('DOMContentLoaded', function() {
       }, 500);
     }, 5000);
   });
+}
+
+// Incremental navigation: links marked data-fragment="main" or data-fragment="rows" fetch only that
+// part of the target page (the server answers X-Fragment requests with a partial response) and swap it
+// in, instead of reloading the whole page. Links marked data-prefetch are fetched on hover, and the
+// next page of the patient list when the browser is idle. Fetched fragments are kept for a short while
+// in a small in-memory cache, which also serves the back and forward buttons.
+const FRAGMENT_CACHE_SIZE = 20;
+const FRAGMENT_CACHE_TTL = 30000;  // ms
+const PREFETCH_DELAY = 80;  // ms of hovering before a link is prefetched
+const fragmentCache = new Map();  // "kind url" -> {time, promise}
+
+function fetchFragment(url, kind) {
+  const key = kind + ' ' + url;
+  const cached = fragmentCache.get(key);
+  if (cached && Date.now() - cached.time < FRAGMENT_CACHE_TTL) {
+    return cached.promise;
+  }
+  const promise = fetch(url, { headers: { 'X-Fragment': kind }, credentials: 'same-origin' })
+    .then(response => {
+      // Anything but our partial response (a login page after a redirect, an error) needs a full load.
+      if (!response.ok || response.headers.get('X-Fragment') !== kind) {
+        throw new Error('not a fragment');
+      }
+      return response.text();
+    });
+  promise.catch(() => fragmentCache.delete(key));
+  fragmentCache.delete(key);
+  fragmentCache.set(key, { time: Date.now(), promise: promise });
+  if (fragmentCache.size > FRAGMENT_CACHE_SIZE) {
+    fragmentCache.delete(fragmentCache.keys().next().value);  // Maps keep insertion order
+  }
+  return promise;
+}
+
+function swapFragment(html, kind) {
+  const template = document.createElement('template');
+  template.innerHTML = html;
+  const fragment = template.content;
+  if (kind === 'rows') {
+    ['patient-table-body', 'patient-pager'].forEach(id => {
+      const current = document.getElementById(id);
+      const replacement = fragment.getElementById(id);
+      if (current && replacement) {
+        current.replaceWith(replacement);
+      }
+    });
+    return;
+  }
+  const title = fragment.querySelector('title');
+  if (title) {
+    document.title = title.textContent;
+    title.remove();
+  }
+  const main = document.getElementById('main');
+  main.replaceChildren(fragment);
+  dismissAlerts(main);
+  window.scrollTo(0, 0);
+}
+
+function navigate(url, kind, push) {
+  return fetchFragment(url, kind)
+    .then(html => {
+      swapFragment(html, kind);
+      if (push) {
+        history.pushState({ fragment: true }, '', url);
+      }
+      prefetchNextPage();
+    })
+    .catch(() => {
+      window.location.assign(url);
+    });
+}
+
+function prefetchNextPage() {
+  const next = document.querySelector('#patient-pager a[rel="next"]');
+  if (next) {
+    const idle = window.requestIdleCallback || (callback => setTimeout(callback, 200));
+    idle(() => fetchFragment(next.href, next.dataset.fragment).catch(() => {}));
+  }
+}
+
+function initFragmentNavigation() {
+  if (!window.fetch || !document.getElementById('main') || !('content' in document.createElement('template'))) {
+    return;
+  }
+  history.replaceState({ fragment: true }, '', window.location.href);
+
+  document.addEventListener('click', event => {
+    const link = event.target.closest('a[data-fragment]');
+    if (!link || event.defaultPrevented || event.button !== 0 ||
+        event.metaKey || event.ctrlKey || event.shiftKey || event.altKey) {
+      return;
+    }
+    event.preventDefault();
+    navigate(link.href, link.dataset.fragment, true);
+  });
+
+  let hoverTimer = null;
+  document.addEventListener('mouseover', event => {
+    const link = event.target.closest('a[data-prefetch]');
+    if (!link) {
+      return;
+    }
+    clearTimeout(hoverTimer);
+    hoverTimer = setTimeout(() => {
+      fetchFragment(link.href, link.dataset.fragment).catch(() => {});
+    }, PREFETCH_DELAY);
+  });
+  document.addEventListener('mouseout', event => {
+    if (event.target.closest('a[data-prefetch]')) {
+      clearTimeout(hoverTimer);
+    }
+  });
+
+  window.addEventListener('popstate', event => {
+    if (event.state && event.state.fragment) {
+      navigate(window.location.href, 'main', false);
+    }
+  });
+
+  prefetchNextPage();
+}
+
+document.addEventListener('DOMContentLoaded', function() {
+  // Mobile menu toggle
+  const mobileMenuButton = document.getElementById('mobile-menu-button');
+  const mobileMenu = document.getElementById('mobile-menu');
+  const menuIconOpen = document.getElementById('menu-icon-open');
+  const menuIconClose = document.getElementById('menu-icon-close');
+
+  if (mobileMenuButton) {
+    mobileMenuButton.addEventListener('click', function() {
+      mobileMenu.classList.toggle('hidden');
+      menuIconOpen.classList.toggle('hidden');
+      menuIconOpen.classList.toggle('block');
+      menuIconClose.classList.toggle('hidden');
+      menuIconClose.classList.toggle('block');
+    });
+  }
+
+  dismissAlerts(document);
+  initFragmentNavigation();
 
   // Form validation
   const forms = document.querySelectorAll('form');
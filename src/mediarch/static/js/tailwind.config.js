@@ -0,0 +1,27 @@
+// Theme for the Tailwind CDN build. Loaded synchronously right after the CDN script so the first
+// paint already uses these colours.
+tailwind.config = {
+  darkMode: 'class',
+  theme: {
+    extend: {
+      colors: {
+        dark: {
+          100: '#d1d5db',
+          200: '#9ca3af',
+          300: '#6b7280',
+          400: '#4b5563',
+          500: '#374151',
+          600: '#1f2937',
+          700: '#111827',
+          800: '#0d1424',
+          900: '#030712',
+        },
+        brand: {
+          DEFAULT: '#60a5fa',
+          dark: '#3b82f6',
+          light: '#93c5fd'
+        }
+      }
+    }
+  }
+};
@@ -0,0 +1,52 @@
+import pytest
+
+from mediarch import create_app, db
+from mediarch.models import AccountType, Patient, User
+
+
+@pytest.fixture
+def app_config():
+    """Extra configuration for the ``app`` fixture; override it in a test module or class."""
+    return {}
+
+
+@pytest.fixture
+def app(app_config):
+    # Pass test configuration when creating the app
+    app = create_app(test_config={
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+        "WTF_CSRF_ENABLED": False,  # Disable CSRF for testing forms
+        "SECRET_KEY": "test_secret_key",  # Required for session management
+        "LOGIN_DISABLED": False,  # Ensure login is not disabled by default for these tests
+        **app_config,
+    })
+
+    with app.app_context():
+        db.create_all()
+
+        # Patient record (unlinked to a user initially, for admin/doctor interaction)
+        # Explicitly set id for predictability in tests
+        patient1 = Patient(id=1, first_name="John", last_name="Doe", birth_date=None)
+        db.session.add(patient1)
+
+        # Admin User
+        admin_user = User(username="admin", email="admin@example.com",
+                          account_type=AccountType.ADMIN, is_active=True)
+        admin_user.set_password("password123")
+        db.session.add(admin_user)
+
+        # Doctor User
+        doctor_user = User(username="doctoruser", email="doctor@example.com",
+                           account_type=AccountType.DOCTOR, is_active=True)
+        doctor_user.set_password("password123")
+        db.session.add(doctor_user)
+
+        db.session.commit()
+
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
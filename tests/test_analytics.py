@@ -0,0 +1,84 @@
+from datetime import UTC, date, datetime, timedelta
+
+from sqlalchemy import select, update
+
+from mediarch import db
+from mediarch.analytics import age_band_labels, compute_cohort_report, split_conditions
+from mediarch.archive import archive_inactive_patients
+from mediarch.models import BloodType, Patient
+
+from .test_auth import count_queries
+from .test_routes import BaseTest
+
+TODAY = date(2026, 10, 19)
+
+
+def add_cohort(app):
+    with app.app_context():
+        db.session.add_all([
+            Patient(first_name="A", last_name="Child", birth_date=date(2020, 1, 1), blood_type=BloodType.O_POSITIVE,
+                    medical_conditions="Asthma"),
+            # Turns 18 on the report day.
+            Patient(first_name="B", last_name="Adult", birth_date=date(2008, 10, 19), blood_type=BloodType.O_POSITIVE,
+                    medical_conditions="asthma, Eczema"),
+            Patient(first_name="C", last_name="Senior", birth_date=date(1940, 2, 29), blood_type=BloodType.A_NEGATIVE,
+                    medical_conditions="Hypertension; Asthma."),
+            Patient(first_name="D", last_name="Gone", birth_date=date(1990, 1, 1), medical_conditions="Asthma",
+                    deleted_at=datetime.now(UTC)),
+        ])
+        db.session.commit()
+
+
+def test_conditions_are_split_and_deduplicated():
+    """Tests that free-text condition lists are split on commas, semicolons and lines."""
+    assert split_conditions("Asthma, eczema;\nasthma. ; ") == ["Asthma", "eczema"]
+
+
+def test_report_breaks_down_live_patients(app):
+    """Tests the age and blood type histograms, their cross-tab and the condition counts."""
+    add_cohort(app)
+    with app.app_context():
+        report = compute_cohort_report(TODAY)
+    assert report["total"] == 4  # the fixture's John Doe has no birth date or blood type
+    assert dict(report["age_bands"]) == {"0-17": 1, "18-29": 1, "30-44": 0, "45-64": 0, "65-79": 0, "80+": 1,
+                                         "Unknown": 1}
+    assert dict(report["blood_types"])["O+"] == 2
+    assert dict(report["blood_types"])["Not recorded"] == 1
+    assert report["crosstab"][age_band_labels().index("80+")][report["blood_type_labels"].index("A-")] == 1
+    asthma = report["conditions"][0]
+    assert asthma[:2] == ("Asthma", 3)
+    assert asthma[2][:2] == [1, 1]
+
+
+def test_archived_cards_count_by_age(app):
+    """Tests that archived cards stay in the total and the age bands, but not in the active breakdowns."""
+    add_cohort(app)
+    with app.app_context():
+        senior = db.session.scalar(select(Patient.id).filter_by(last_name="Senior"))
+        db.session.execute(update(Patient).where(Patient.id == senior)
+                           .values(last_activity_at=datetime.now(UTC) - timedelta(days=2000)))
+        db.session.commit()
+        assert archive_inactive_patients(timedelta(days=365)) == 1
+        report = compute_cohort_report(TODAY)
+    assert (report["total"], report["active"], report["archived"]) == (4, 3, 1)
+    assert dict(report["age_bands"])["80+"] == 1
+    assert "A-" not in {label for label, count in report["blood_types"] if count}
+    assert report["conditions"][0][:2] == ("Asthma", 2)
+
+
+class TestAnalyticsPage(BaseTest):
+    def test_page_is_cached_until_a_patient_changes(self, client, app):
+        """Tests that repeated views reuse the report and a new patient refreshes it."""
+        self.login_user(client, email="admin@example.com")
+        assert b"1 patients" in client.get("/admin/analytics").data
+        with count_queries(app) as statements:
+            client.get("/admin/analytics")
+        assert not [s for s in statements if "GROUP BY" in s]
+
+        add_cohort(app)
+        assert b"4 patients" in client.get("/admin/analytics").data
+
+    def test_page_is_for_admins_only(self, client):
+        """Tests that doctors cannot open the analytics page."""
+        self.login_user(client, email="doctor@example.com")
+        assert client.get("/admin/analytics").status_code == 403
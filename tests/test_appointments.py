@@ -0,0 +1,185 @@
+import random
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+from mediarch import db
+from mediarch.appointments import (
+    BookingConflict,
+    BookingError,
+    IntervalTree,
+    book_appointment,
+    book_appointments,
+    cancel_appointment,
+    next_free_slot,
+)
+from mediarch.archive import archive_inactive_patients
+from mediarch.duplicates import merge_patients
+from mediarch.models import Appointment, AppointmentStatus, Patient
+from mediarch.softdelete import purge_deleted_patients
+
+from .test_routes import BaseTest
+
+DOCTOR = 2  # the fixture's doctoruser
+MONDAY = datetime(2030, 3, 4, tzinfo=UTC)
+
+
+def at(hour: int, minute: int = 0, days: int = 0) -> datetime:
+    return MONDAY + timedelta(days=days, hours=hour, minutes=minute)
+
+
+def book(app, *times, minutes=30, patient_id=1) -> list[int]:
+    with app.app_context():
+        booked = [book_appointment(DOCTOR, patient_id, starts_at, minutes) for starts_at in times]
+        db.session.commit()
+        return [appointment.id for appointment in booked]
+
+
+def test_interval_tree_finds_every_overlap():
+    """Tests the interval tree against a brute-force search, touching intervals excluded."""
+    rng = random.Random(1)
+    intervals = [(start, start + rng.randrange(1, 30), i) for i, start in enumerate(rng.randrange(1000)
+                                                                                     for _ in range(500))]
+    tree = IntervalTree(intervals)
+    for _ in range(200):
+        start = rng.randrange(1000)
+        end = start + rng.randrange(1, 50)
+        expected = sorted((s, i) for s, e, i in intervals if s < end and e > start)
+        assert sorted((intervals[i][0], i) for i in tree.overlapping(start, end)) == expected
+    assert IntervalTree([(0, 10, "a")]).overlapping(10, 20) == []
+
+
+class TestBooking(BaseTest):
+    def test_overlaps_are_refused(self, app):
+        """Tests that an overlapping booking fails, a touching one succeeds and cancelling frees the time."""
+        first, = book(app, at(9))
+        with app.app_context():
+            with pytest.raises(BookingConflict) as conflict:
+                book_appointment(DOCTOR, 1, at(9, 15), 30)
+            assert [appointment.id for appointment in conflict.value.conflicts] == [first]
+            db.session.rollback()
+
+            book_appointment(DOCTOR, 1, at(9, 30), 30)
+            cancel_appointment(db.session.get(Appointment, first))
+            book_appointment(DOCTOR, 1, at(8, 45), 30)
+            db.session.commit()
+            assert db.session.get(Appointment, first).status == AppointmentStatus.CANCELLED
+
+    def test_bookings_are_checked_together(self, app):
+        """Tests that a batch is refused as a whole when two of its own appointments overlap."""
+        with app.app_context():
+            batch = [Appointment(doctor_id=DOCTOR, patient_id=1, starts_at=at(hour), ends_at=at(hour, 45))
+                     for hour in (10, 11, 11)]
+            with pytest.raises(BookingConflict):
+                book_appointments(batch)
+            db.session.rollback()
+            assert db.session.scalars(select(Appointment)).all() == []
+
+    def test_invalid_bookings(self, app):
+        """Tests that only doctors can be booked, for existing cards and reasonable durations."""
+        with app.app_context():
+            for doctor_id, patient_id, minutes, message in [(1, 1, 30, "is not a doctor"),
+                                                            (DOCTOR, 999, 30, "does not exist"),
+                                                            (DOCTOR, 1, 0, "must end after it starts"),
+                                                            (DOCTOR, 1, 24 * 60, "lasts at most")]:
+                with pytest.raises(BookingError, match=message):
+                    book_appointment(doctor_id, patient_id, at(9), minutes)
+                db.session.rollback()
+
+    def test_next_free_slot_skips_appointments_and_closed_hours(self, app):
+        """Tests that the search jumps past appointments, stays on the slot grid and moves to the next day."""
+        book(app, at(8), at(8, 30), at(9, 10), at(17, 30))
+        with app.app_context():
+            assert next_free_slot(DOCTOR, at(7)) == at(9, 45)  # 9:40 is off the 15-minute grid
+            assert next_free_slot(DOCTOR, at(9, 50), minutes=60) == at(10)
+            assert next_free_slot(DOCTOR, at(17, 1)) == at(8, days=1)
+            assert next_free_slot(DOCTOR, at(17, 1), days=0.5) is None
+
+    def test_working_hours_follow_the_clinic_time_zone(self, app):
+        """Tests that the working hours are those of APPOINTMENTS_TIMEZONE."""
+        app.config["APPOINTMENTS_TIMEZONE"] = "America/New_York"
+        with app.app_context():
+            assert next_free_slot(DOCTOR, at(0)) == at(13)  # 8:00 EST
+
+    def test_cards_follow_merge_purge_and_archive(self, app):
+        """Tests that merging moves appointments, purging deletes them and they keep a card out of cold storage."""
+        with app.app_context():
+            other = Patient(first_name="Jon", last_name="Doe")
+            db.session.add(other)
+            db.session.commit()
+            other_id = other.id
+        book(app, at(9), patient_id=other_id)
+        with app.app_context():
+            merge_patients(db.session.get(Patient, other_id), db.session.get(Patient, 1))
+            db.session.commit()
+            assert db.session.scalars(select(Appointment.patient_id)).all() == [1]
+
+            patient = db.session.get(Patient, 1)
+            patient.last_activity_at = datetime.now(UTC) - timedelta(days=5000)
+            db.session.commit()
+            assert archive_inactive_patients(timedelta(days=365)) == 0
+
+            patient.deleted_at = datetime.now(UTC) - timedelta(days=365)
+            db.session.commit()
+            purge_deleted_patients(timedelta(days=30))
+            assert db.session.scalars(select(Appointment)).all() == []
+
+
+class TestAppointmentsApi(BaseTest):
+    def test_booking_and_conflicts(self, client, app):
+        """Tests booking through the API and the 409 answer with the next free slot."""
+        self.login_user(client, email="doctor@example.com")
+        body = {"doctor_id": DOCTOR, "patient_id": 1, "starts_at": at(9).isoformat(), "reason": "Checkup"}
+        response = client.post("/api/v1/appointments", json=body)
+        assert response.status_code == 201
+        assert response.get_json()["reason"] == "Checkup"
+
+        response = client.post("/api/v1/appointments", json={**body, "starts_at": at(9, 20).isoformat()})
+        assert response.status_code == 409
+        assert response.get_json()["next_free"]["starts_at"].startswith("2030-03-04T09:30:00")
+        assert client.post("/api/v1/appointments", json={**body, "patient_id": 999}).status_code == 404
+        assert client.post("/api/v1/appointments", json={**body, "minutes": "30"}).status_code == 400
+
+        slot = client.get("/api/v1/doctors/2/free-slot", query_string={"after": at(8).isoformat(), "minutes": 90})
+        assert slot.get_json()["starts_at"].startswith("2030-03-04T09:30:00")
+
+    def test_patients_see_and_cancel_their_own(self, client, app):
+        """Tests that patient accounts list and cancel only their own appointments and cannot book."""
+        self.register_user(client)
+        with app.app_context():
+            own_id = db.session.scalar(select(Patient.id).where(Patient.first_name == "Test"))
+        other, own = book(app, at(9), at(10), patient_id=1)[0], book(app, at(11), patient_id=own_id)[0]
+        self.login_user(client)
+        listed = client.get("/api/v1/appointments", query_string={"start": MONDAY.isoformat()}).get_json()
+        assert [appointment["id"] for appointment in listed["appointments"]] == [own]
+        assert client.post(f"/api/v1/appointments/{other}/cancel").status_code == 403
+        assert client.post(f"/api/v1/appointments/{own}/cancel").get_json()["status"] == "cancelled"
+        assert client.post("/api/v1/appointments", json={}).status_code == 403
+
+
+class TestSchedulePage(BaseTest):
+    def test_doctor_books_from_the_schedule(self, client, app):
+        """Tests the day view, booking from its form and the conflict message naming the next free slot."""
+        self.login_user(client, email="doctor@example.com")
+        form = {"doctor_id": DOCTOR, "patient_id": 1, "starts_at": "2030-03-04T09:00", "minutes": 30}
+        response = client.post("/appointments", data=form, follow_redirects=True)
+        assert b"Appointment booked for patient #1 on 2030-03-04 09:00." in response.data
+        assert b"#1 Doe, John" in response.data
+        assert b"09:00&ndash;09:30" in response.data
+
+        response = client.post("/appointments", data={**form, "starts_at": "2030-03-04T09:15"}, follow_redirects=True)
+        assert b"The next free slot is 2030-03-04 09:30." in response.data
+
+    def test_patient_sees_upcoming_appointments(self, client, app):
+        """Tests that a patient's page lists their appointments with the doctor's name."""
+        self.register_user(client)
+        with app.app_context():
+            own_id = db.session.scalar(select(Patient.id).where(Patient.first_name == "Test"))
+        soon = datetime.now(UTC).replace(hour=9, minute=0, second=0, microsecond=0) + timedelta(days=30)
+        book(app, soon, patient_id=own_id)
+        self.login_user(client)
+        page = client.get("/appointments").data
+        assert b"doctoruser" in page
+        assert f"{soon:%Y-%m-%d} 09:00".encode() in page
+        assert client.post("/appointments", data={}).status_code == 403
@@ -0,0 +1,180 @@
+from datetime import UTC, date, datetime, timedelta
+
+from sqlalchemy import delete, func, select, update
+
+from mediarch import db
+from mediarch.archive import archive_inactive_patients, decode_rows, encode_batch
+from mediarch.duplicates import blocking_keys, find_duplicates
+from mediarch.models import (
+    AccountType,
+    ArchivedPatient,
+    BloodType,
+    Change,
+    DuplicateCandidate,
+    Patient,
+    PatientArchiveBatch,
+    PatientMatchKey,
+    User,
+)
+
+from .test_routes import BaseTest
+
+
+def inactive_patients(app, count, days_ago=2000, **fields) -> list[int]:
+    with app.app_context():
+        patients = [Patient(first_name=f"Old{i}", last_name="Card", **fields) for i in range(count)]
+        db.session.add_all(patients)
+        db.session.commit()
+        ids = [patient.id for patient in patients]
+        db.session.execute(update(Patient.__table__).where(Patient.id.in_(ids))
+                           .values(last_activity_at=datetime.now(UTC) - timedelta(days=days_ago)))
+        db.session.commit()
+        return ids
+
+
+def count(model):
+    return db.session.scalar(select(func.count()).select_from(model))
+
+
+def test_batches_round_trip_every_column(app):
+    """Tests that a compressed column batch restores rows with their original types."""
+    with app.app_context():
+        patient = Patient(first_name="Ann", last_name="Lee", birth_date=date(1950, 5, 6),
+                          blood_type=BloodType.AB_NEGATIVE, notes="x" * 100)
+        db.session.add(patient)
+        db.session.commit()
+        row = db.session.execute(select(Patient.__table__).where(Patient.id == patient.id)).one()
+    restored = decode_rows(encode_batch([row, row]), [1])[0]
+    assert restored["birth_date"] == date(1950, 5, 6)
+    assert restored["blood_type"] == BloodType.AB_NEGATIVE
+    assert restored["notes"] == "x" * 100
+    assert isinstance(restored["last_activity_at"], datetime)
+
+
+class TestArchive(BaseTest):
+    def test_archives_only_inactive_unlinked_cards(self, app):
+        """Tests that the run moves old, unlinked, live cards into compressed batches."""
+        old = inactive_patients(app, 5)
+        recent = inactive_patients(app, 1, days_ago=10)
+        deleted = inactive_patients(app, 1, deleted_at=datetime.now(UTC))
+        linked = inactive_patients(app, 1)
+        with app.app_context():
+            db.session.add(User(username="linked", email="linked@example.com", account_type=AccountType.PATIENT,
+                                patient_id=linked[0], password_hash="x"))
+            db.session.commit()
+            changes_before = count(Change)
+
+            assert archive_inactive_patients(timedelta(days=365), batch_size=2) == 5
+            assert count(PatientArchiveBatch) == 3
+            assert set(db.session.scalars(select(ArchivedPatient.patient_id))) == set(old)
+            live = set(db.session.scalars(select(Patient.id)))
+            assert not live & set(old)
+            assert {*recent, *linked} <= live
+            assert db.session.get(ArchivedPatient, deleted[0]) is None  # left to the purge
+            assert count(Change) == changes_before  # moving a card is not a change downstream
+
+    def test_viewing_restores_card(self, client, app):
+        """Tests that opening an archived card restores it transparently with its content and id."""
+        ids = inactive_patients(app, 3, notes="Allergic to penicillin")
+        with app.app_context():
+            archive_inactive_patients(timedelta(days=365))
+        self.login_user(client, email="doctor@example.com")
+
+        response = client.get(f"/patients/{ids[1]}")
+        assert response.status_code == 200
+        assert b"Allergic to penicillin" in response.data
+        with app.app_context():
+            assert db.session.get(Patient, ids[1]).notes == "Allergic to penicillin"
+            assert db.session.get(ArchivedPatient, ids[1]) is None
+            assert count(PatientArchiveBatch) == 1  # two cards are still in it
+        assert client.get("/patients/999").status_code == 404
+
+    def test_only_viewers_restore_cards(self, client, app):
+        """Tests that an archived card stays archived when asked for by someone who may not view it."""
+        ids = inactive_patients(app, 2)
+        with app.app_context():
+            archive_inactive_patients(timedelta(days=365))
+        self.register_user(client)
+        self.login_user(client)
+        assert client.get(f"/patients/{ids[0]}").status_code == 404
+        assert client.get(f"/api/v1/patients/{ids[0]}").status_code == 404
+        results = client.get(f"/api/v1/patients/batch?ids={ids[0]},{ids[1]}").get_json()["results"]
+        assert [result["status"] for result in results] == [404, 404]
+        assert client.get("/patients/archived").status_code == 403
+        with app.app_context():
+            assert count(ArchivedPatient) == 2
+
+    def test_staff_find_archived_cards(self, client, app):
+        """Tests the staff list of archived cards and its name search."""
+        inactive_patients(app, 2, birth_date=date(1950, 5, 6))
+        with app.app_context():
+            archive_inactive_patients(timedelta(days=365))
+        self.login_user(client, email="doctor@example.com")
+        page = client.get("/patients/archived")
+        assert page.data.count(b"archived-patient-row") == 2
+        assert b"1950-05-06" in page.data
+        page = client.get("/patients/archived?q=%20old1")
+        assert page.data.count(b"archived-patient-row") == 1
+        assert b"Old1" in page.data
+        assert client.get("/patients/archived?q=card").data.count(b"archived-patient-row") == 2
+        assert b"archived-patient-row" not in client.get("/patients/archived?q=%25").data
+
+    def test_restored_cards_get_fresh_match_keys(self, client, app):
+        """Tests that restoring a card recomputes its duplicate-matching keys."""
+        ids = inactive_patients(app, 1, birth_date=date(1950, 5, 6))
+        with app.app_context():
+            archive_inactive_patients(timedelta(days=365))
+            db.session.execute(delete(PatientMatchKey))
+            db.session.commit()
+        self.login_user(client, email="doctor@example.com")
+        client.get(f"/patients/{ids[0]}")
+        with app.app_context():
+            keys = set(db.session.scalars(select(PatientMatchKey.key).where(PatientMatchKey.patient_id == ids[0])))
+        assert keys == blocking_keys("Old0", "Card", date(1950, 5, 6))
+
+    def test_archived_cards_are_matched(self, client, app):
+        """Tests that a new card is matched against an archived one, and that merging the pair restores it."""
+        [old] = inactive_patients(app, 1, birth_date=date(1950, 5, 6))
+        with app.app_context():
+            archive_inactive_patients(timedelta(days=365))
+            new = Patient(first_name="Old0", last_name="Card", birth_date=date(1950, 5, 6))
+            db.session.add(new)
+            db.session.commit()
+            new_id = new.id
+            assert find_duplicates(max_block=200, min_score=0.85) == 1
+            candidate_id = db.session.scalar(select(DuplicateCandidate.id))
+        self.login_user(client, email="admin@example.com")
+        assert b"&middot; archived" in client.get("/admin/duplicates").data
+        response = client.post(f"/admin/duplicates/{candidate_id}/merge", data={"keep": old}, follow_redirects=True)
+        assert f"Patient #{new_id} was merged into patient #{old}.".encode() in response.data
+        with app.app_context():
+            assert db.session.get(Patient, old) is not None
+            assert count(ArchivedPatient) == 0
+
+    def test_batch_is_dropped_with_its_last_card(self, client, app):
+        """Tests that restoring every card of a batch through the API removes the batch."""
+        ids = inactive_patients(app, 2)
+        with app.app_context():
+            archive_inactive_patients(timedelta(days=365))
+        self.login_user(client, email="admin@example.com")
+        assert client.get(f"/api/v1/patients/{ids[0]}").get_json()["first_name"] == "Old0"
+        results = client.get(f"/api/v1/patients/batch?ids={ids[1]}").get_json()["results"]
+        assert results[0]["status"] == 200
+        with app.app_context():
+            assert count(PatientArchiveBatch) == 0
+            assert count(ArchivedPatient) == 0
+
+    def test_views_record_activity(self, client, app):
+        """Tests that a view refreshes a stale activity time, so viewed cards are not archived."""
+        ids = inactive_patients(app, 1)
+        self.login_user(client, email="doctor@example.com")
+        client.get(f"/patients/{ids[0]}")
+        with app.app_context():
+            assert archive_inactive_patients(timedelta(days=365)) == 0
+
+    def test_archive_command(self, app):
+        """Tests the flask patients archive command."""
+        inactive_patients(app, 2)
+        result = app.test_cli_runner().invoke(args=["patients", "archive", "--days", "365"])
+        assert result.exit_code == 0
+        assert "Archived 2 patient card(s); 2 in cold storage (1 batch(es)" in result.output
@@ -0,0 +1,155 @@
+import asyncio
+import json
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+
+from mediarch import db
+from mediarch.archive import archive_inactive_patients
+from mediarch.models import ArchivedPatient, Patient, User
+
+from .test_routes import BaseTest
+
+pytest.importorskip("asgiref")
+pytest.importorskip("aiosqlite")
+
+from mediarch.asgi import AsyncApp, async_database_url
+
+
+@pytest.fixture
+def app_config(tmp_path):
+    # The async engine opens its own connections, so the database must be a file.
+    return {"SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'mediarch.db'}"}
+
+
+async def asgi_get(app, path: str, cookie: str | None = None) -> tuple[int, dict | bytes]:
+    path, _, query = path.partition("?")
+    headers = [(b"host", b"localhost")]
+    if cookie:
+        headers.append((b"cookie", cookie.encode()))
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+             "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+             "query_string": query.encode(), "headers": headers, "server": ("localhost", 80),
+             "client": ("127.0.0.1", 1234)}
+    messages = []
+
+    async def receive():  # noqa: RUF029
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):  # noqa: RUF029
+        messages.append(message)
+
+    await app(scope, receive, send)
+    status = messages[0]["status"]
+    body = b"".join(m.get("body", b"") for m in messages[1:])
+    content_type = dict(messages[0]["headers"]).get(b"content-type", b"")
+    return status, json.loads(body) if content_type.startswith(b"application/json") else body
+
+
+def session_cookie(client) -> str:
+    cookie = client.get_cookie(client.application.config["SESSION_COOKIE_NAME"])
+    return f"{cookie.key}={cookie.value}"
+
+
+class TestPatientApi(BaseTest):
+    def test_list_requires_staff(self, client, app):
+        """Tests that the WSGI patient list is limited to admins and doctors."""
+        assert client.get("/api/v1/patients").status_code == 401
+        self.register_user(client, username="patientapi", email="patientapi@example.com")
+        with app.app_context():
+            user = User.query.filter_by(username="patientapi").first()
+            user.is_active = True
+            db.session.commit()
+        self.login_user(client, email="patientapi@example.com")
+        assert client.get("/api/v1/patients").status_code == 403
+
+    def test_list_and_detail(self, client, app):
+        """Tests the WSGI patient endpoints for an admin."""
+        with app.app_context():
+            db.session.add_all(Patient(first_name=f"P{i}", last_name="Zeta") for i in range(60))
+            db.session.commit()
+        self.login_user(client, email="admin@example.com")
+        first = client.get("/api/v1/patients").get_json()
+        assert first["patients"][0]["last_name"] == "Doe"
+        assert len(first["patients"]) == 50
+        assert first["has_next"]
+        assert not client.get("/api/v1/patients?page=2").get_json()["has_next"]
+        assert client.get("/api/v1/patients/1").get_json()["first_name"] == "John"
+        assert client.get("/api/v1/patients/999").status_code == 404
+
+
+class TestAsyncApp(BaseTest):
+    def test_async_url(self):
+        assert async_database_url("sqlite:///x.db").drivername == "sqlite+aiosqlite"
+        assert async_database_url("postgresql://u@h/db").drivername == "postgresql+psycopg"
+
+    def test_native_routes_match_wsgi(self, client, app):
+        """Tests that the async endpoints return the same documents as the Flask ones."""
+        self.login_user(client, email="admin@example.com")
+        cookie = session_cookie(client)
+        asgi_app = AsyncApp(app)
+
+        async def scenario():
+            try:
+                return [await asgi_get(asgi_app, path, cookie)
+                        for path in ("/api/v1/patients", "/api/v1/patients/1", "/api/v1/patients/999")]
+            finally:
+                await asgi_app._engine.dispose()
+
+        listing, detail, missing = asyncio.run(scenario())
+        assert listing == (200, client.get("/api/v1/patients").get_json())
+        assert detail == (200, client.get("/api/v1/patients/1").get_json())
+        assert missing[0] == 404
+
+    def test_archived_card_is_restored(self, client, app):
+        """Tests that the async detail endpoint restores an archived card, like the Flask one."""
+        with app.app_context():
+            db.session.execute(update(Patient.__table__).where(Patient.id == 1)
+                               .values(last_activity_at=datetime.now(UTC) - timedelta(days=2000)))
+            db.session.commit()
+            assert archive_inactive_patients(timedelta(days=365)) == 1
+        self.login_user(client, email="admin@example.com")
+        asgi_app = AsyncApp(app)
+
+        async def scenario():
+            try:
+                return await asgi_get(asgi_app, "/api/v1/patients/1", session_cookie(client))
+            finally:
+                await asgi_app._engine.dispose()
+
+        status, document = asyncio.run(scenario())
+        assert status == 200
+        assert document == client.get("/api/v1/patients/1").get_json()
+        with app.app_context():
+            assert db.session.get(ArchivedPatient, 1) is None
+
+    def test_native_routes_check_access(self, client, app):
+        """Tests that anonymous requests and other patients' cards are refused."""
+        self.register_user(client, username="patientapi", email="patientapi@example.com")
+        with app.app_context():
+            user = User.query.filter_by(username="patientapi").first()
+            user.is_active = True
+            db.session.commit()
+        self.login_user(client, email="patientapi@example.com")
+        asgi_app = AsyncApp(app)
+
+        async def scenario():
+            try:
+                return (await asgi_get(asgi_app, "/api/v1/patients"),
+                        await asgi_get(asgi_app, "/api/v1/patients", session_cookie(client)),
+                        await asgi_get(asgi_app, "/api/v1/patients/1", session_cookie(client)))
+            finally:
+                if asgi_app._engine is not None:
+                    await asgi_app._engine.dispose()
+
+        anonymous, listing, detail = asyncio.run(scenario())
+        assert anonymous[0] == 401
+        assert listing[0] == 403
+        assert detail[0] == 403
+
+    def test_other_routes_fall_back_to_flask(self, app):
+        """Tests that HTML pages are still served by the Flask app."""
+        status, body = asyncio.run(asgi_get(AsyncApp(app), "/"))
+        assert status == 200
+        assert b"<html" in body.lower()
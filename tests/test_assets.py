@@ -0,0 +1,41 @@
+import re
+
+from mediarch.assets import asset_version
+
+from .test_routes import BaseTest
+
+
+class TestStaticAssets(BaseTest):
+    def test_pages_have_no_inline_style_or_script(self, client):
+        """Tests that CSS and JS come from static files, not from blocks repeated in every page."""
+        self.login_user(client, email="admin@example.com")
+        for path in ("/login", "/", "/patients", "/admin"):
+            body = client.get(path).get_data(as_text=True)
+            assert "<style" not in body
+            assert re.search(r"<script(?![^>]*\bsrc=)[^>]*>", body) is None
+
+    def test_versioned_assets_are_immutable(self, client):
+        """Tests that versioned static URLs are cached for good while plain ones are revalidated."""
+        body = client.get("/login").get_data(as_text=True)
+        urls = re.findall(r'(?:href|src)="(/static/[^"]+\?v=\w+)"', body)
+        assert {url.split("?")[0] for url in urls} >= {"/static/css/main.css", "/static/js/main.js"}
+        for url in urls:
+            response = client.get(url)
+            assert response.status_code == 200
+            assert response.cache_control.immutable
+            assert response.cache_control.max_age == 31536000
+            assert not response.cache_control.no_cache
+        assert not client.get("/static/css/main.css").cache_control.immutable
+
+    def test_main_script_is_deferred(self, client):
+        body = client.get("/login").get_data(as_text=True)
+        assert re.search(r'<script src="/static/js/main\.js\?v=\w+" defer>', body)
+
+
+def test_asset_version_follows_content(tmp_path):
+    path = tmp_path / "app.css"
+    path.write_text("body { color: red; }")
+    first = asset_version(str(path))
+    assert first == asset_version(str(path))
+    path.write_text("body { color: blue; }")
+    assert asset_version(str(path)) != first
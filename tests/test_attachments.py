@@ -0,0 +1,140 @@
+import hashlib
+import io
+import os
+import pathlib
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from sqlalchemy import select, update
+
+from mediarch import db
+from mediarch.attachments import blob_path, collect_garbage, storage_root
+from mediarch.duplicates import merge_patients
+from mediarch.models import Attachment, Patient
+from mediarch.softdelete import purge_deleted_patients
+
+from .test_routes import BaseTest
+
+REPORT = b"%PDF-1.4 lab report " + bytes(range(256)) * 64
+
+
+@pytest.fixture
+def app_config(tmp_path):
+    return {"ATTACHMENTS_PATH": str(tmp_path / "attachments"), "ATTACHMENTS_MAX_SIZE": 64 * 1024}
+
+
+def upload(client, patient_id=1, *files):
+    data = {"file": [(io.BytesIO(content), name) for name, content in files]}
+    return client.post(f"/patients/{patient_id}/attachments", data=data, content_type="multipart/form-data",
+                       follow_redirects=True)
+
+
+def stored_files(app) -> list[str]:
+    with app.app_context():
+        root = storage_root()
+    return [name for _, _, names in os.walk(root) for name in names]
+
+
+class TestAttachments(BaseTest):
+    def test_upload_dedup_and_download(self, client, app):
+        """Tests that identical files are stored once and that downloads answer ranges and revalidations."""
+        self.login_user(client, email="doctor@example.com")
+        response = upload(client, 1, ("report.pdf", REPORT), ("copy.pdf", REPORT))
+        assert b"Attached report.pdf, copy.pdf." in response.data
+        assert b"report.pdf" in client.get("/patients/1").data
+        digest = hashlib.sha256(REPORT).hexdigest()
+        assert stored_files(app) == [digest]
+        with app.app_context():
+            attachment = db.session.scalars(select(Attachment).order_by(Attachment.id)).first()
+            assert (attachment.digest, attachment.size, attachment.content_type) == (
+                digest, len(REPORT), "application/pdf")
+            assert os.path.isfile(blob_path(storage_root(), digest))
+
+        response = client.get(f"/attachments/{attachment.id}")
+        assert response.status_code == 200
+        assert response.data == REPORT
+        assert response.headers["Content-Disposition"].startswith("attachment")
+        assert response.headers["ETag"] == f'"{digest}"'
+        assert response.headers["X-Content-Type-Options"] == "nosniff"
+        assert "private" in response.headers["Cache-Control"]
+        assert "no-transform" in response.headers["Cache-Control"]
+        response = client.get(f"/attachments/{attachment.id}", headers={"Accept-Encoding": "gzip"})
+        assert "Content-Encoding" not in response.headers
+        assert client.get(f"/attachments/{attachment.id}?inline=1").headers["Content-Disposition"].startswith("inline")
+
+        response = client.get(f"/attachments/{attachment.id}", headers={"Range": "bytes=100-199"})
+        assert response.status_code == 206
+        assert response.data == REPORT[100:200]
+        assert response.headers["Content-Range"] == f"bytes 100-199/{len(REPORT)}"
+        response = client.get(f"/attachments/{attachment.id}", headers={"If-None-Match": f'"{digest}"'})
+        assert response.status_code == 304
+
+    def test_too_large_and_access(self, client, app):
+        """Tests that a too large upload stores nothing and that patients only reach their own card's files."""
+        self.login_user(client, email="doctor@example.com")
+        response = upload(client, 1, ("scan.tiff", b"x" * (65 * 1024)))
+        assert b"The file is larger than the 64 kB limit. Nothing was attached." in response.data
+        assert stored_files(app) == []
+        upload(client, 1, ("report.pdf", REPORT))
+        client.get("/logout")
+
+        self.register_user(client)
+        self.login_user(client)
+        assert client.get("/attachments/1").status_code == 403
+        assert client.post("/attachments/1/delete").status_code == 403
+        assert client.post("/patients/1/attachments", data={}).status_code == 403
+        with app.app_context():
+            own_card = db.session.scalars(select(Patient.id).where(Patient.first_name == "Test")).one()
+        upload(client, own_card, ("mine.txt", b"my notes"))
+        response = client.get(f"/api/v1/patients/{own_card}/attachments")
+        [mine] = response.get_json()["attachments"]
+        assert mine["content_type"] == "text/plain"
+        assert client.get(mine["url"]).data == b"my notes"
+        assert client.delete(f"/api/v1/attachments/{mine['id']}").status_code == 204
+        assert client.get(mine["url"]).status_code == 404
+
+    def test_api_upload(self, client, app):
+        """Tests the raw body upload of the API and its errors."""
+        self.login_user(client, email="doctor@example.com")
+        response = client.post("/api/v1/patients/1/attachments?filename=C:\\scans\\x-ray.png", data=REPORT[:1000],
+                               content_type="image/png")
+        assert response.status_code == 201
+        document = response.get_json()
+        assert (document["filename"], document["size"], document["content_type"]) == ("x-ray.png", 1000, "image/png")
+        assert document["sha256"] == hashlib.sha256(REPORT[:1000]).hexdigest()
+        assert client.get(document["url"]).data == REPORT[:1000]
+
+        assert client.post("/api/v1/patients/1/attachments", data=b"x").status_code == 400
+        response = client.post("/api/v1/patients/1/attachments?filename=big.bin", data=b"x" * (65 * 1024))
+        assert response.status_code == 413
+        assert response.get_json()["message"] == "The file is larger than the 64 kB limit."
+        assert client.post("/api/v1/patients/99/attachments?filename=a.txt", data=b"x").status_code == 404
+        assert len(stored_files(app)) == 1
+
+    def test_purge_and_garbage_collection(self, client, app):
+        """Tests that files outlive deleted rows only until the collection, and merges keep them."""
+        self.login_user(client, email="doctor@example.com")
+        upload(client, 1, ("report.pdf", REPORT), ("other.txt", b"other"))
+        with app.app_context():
+            root = storage_root()
+            os.makedirs(os.path.join(root, "tmp"), exist_ok=True)
+            pathlib.Path(os.path.join(root, "tmp", "abandoned.part")).write_bytes(b"half an upload")
+            assert collect_garbage(timedelta(0)) == {"removed": 0, "freed_bytes": 0, "abandoned_uploads": 1}
+
+            other = Patient(first_name="Jon", last_name="Doe")
+            db.session.add(other)
+            db.session.commit()
+            db.session.execute(update(Attachment).values(patient_id=other.id))
+            merge_patients(other, db.session.get(Patient, 1))
+            db.session.commit()
+            assert set(db.session.scalars(select(Attachment.patient_id))) == {1}
+
+            db.session.get(Patient, 1).deleted_at = datetime.now(UTC) - timedelta(days=365)
+            db.session.commit()
+            purge_deleted_patients(timedelta(days=30))
+            assert db.session.scalars(select(Attachment)).all() == []
+            assert collect_garbage(timedelta(hours=1))["removed"] == 0  # too recent
+        result = app.test_cli_runner().invoke(args=["attachments", "collect", "--grace", "0"])
+        assert result.exit_code == 0
+        assert "Removed 2 file(s) (16.0 kB) and 0 abandoned upload(s)." in result.output
+        assert stored_files(app) == []
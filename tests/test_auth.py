@@ -0,0 +1,70 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from mediarch import db
+from mediarch.models import AccountType, User
+
+from .test_routes import BaseTest
+
+
+@contextmanager
+def count_queries(app):
+    """Collect the SQL statements executed while the block runs."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+class TestSessionClaims(BaseTest):
+    def test_anonymous_index_does_not_query(self, client, app):
+        """Tests that the landing page for anonymous visitors never touches the database."""
+        with count_queries(app) as statements:
+            response = client.get("/")
+        assert response.status_code == 200
+        assert statements == []
+
+    def test_logged_in_pages_use_claims(self, client, app):
+        """Tests that a logged-in admin is resolved from the session claims, not the users table."""
+        self.login_user(client, email="admin@example.com")
+        with count_queries(app) as statements:
+            assert client.get("/").status_code == 200
+            assert client.get("/admin").status_code == 200
+        # The dashboard's own (cached) user counts are not user loading
+        assert not [s for s in statements if "FROM users" in s and "count(" not in s]
+        client.get("/logout")
+
+    def test_zero_ttl_reloads_user_every_request(self, client, app):
+        """Tests that AUTH_CLAIMS_TTL=0 restores the per-request user lookup."""
+        self.login_user(client, email="admin@example.com")
+        app.config["AUTH_CLAIMS_TTL"] = 0
+        with count_queries(app) as statements:
+            client.get("/")
+            client.get("/admin")
+        assert len([s for s in statements if "FROM users" in s and "count(" not in s]) == 2
+        client.get("/logout")
+
+    def test_deactivation_revokes_claims(self, app):
+        """Tests that a deactivated doctor is restricted on their very next request."""
+        admin_client = app.test_client()
+        doctor_client = app.test_client()
+        self.login_user(doctor_client, email="doctor@example.com")
+        assert doctor_client.get("/patients").status_code == 200
+
+        with app.app_context():
+            doctor_id = User.query.filter_by(account_type=AccountType.DOCTOR).first().id
+        self.login_user(admin_client, email="admin@example.com")
+        admin_client.post(f"/admin/users/{doctor_id}/toggle_active")
+
+        response = doctor_client.get("/patients")
+        assert response.status_code == 302
+        assert response.location.startswith("/login")
@@ -0,0 +1,92 @@
+from mediarch import db
+from mediarch.models import BloodType, Patient, User
+
+from .test_auth import count_queries
+from .test_routes import BaseTest
+
+
+def add_patients(app, count):
+    with app.app_context():
+        patients = [Patient(first_name=f"P{i}", last_name="Batch") for i in range(count)]
+        db.session.add_all(patients)
+        db.session.commit()
+        return [patient.id for patient in patients]
+
+
+def statuses(response):
+    return [(result["id"], result["status"]) for result in response.get_json()["results"]]
+
+
+class TestBatchRead(BaseTest):
+    def test_reads_patients_in_one_query(self, client, app):
+        """Tests that the batch read answers in request order, reporting missing ids, with one patient query."""
+        ids = add_patients(app, 3)
+        self.login_user(client, email="doctor@example.com")
+        with count_queries(app) as statements:
+            response = client.get(f"/api/v1/patients/batch?ids={ids[2]},{ids[0]},999,{ids[0]}")
+        assert statuses(response) == [(ids[2], 200), (ids[0], 200), (999, 404)]
+        assert response.get_json()["results"][0]["patient"]["first_name"] == "P2"
+        assert len([s for s in statements if "FROM patients" in s]) == 1
+
+    def test_patient_sees_only_own_card(self, client, app):
+        """Tests that a patient account gets its own card and a per-item 403 for the others."""
+        self.register_user(client, username="patientuser", email="patient@example.com")
+        self.login_user(client, email="patient@example.com")
+        with app.app_context():
+            own_id = User.query.filter_by(username="patientuser").one().patient_id
+        assert statuses(client.get(f"/api/v1/patients/batch?ids=1,{own_id}")) == [(1, 403), (own_id, 200)]
+
+    def test_rejects_malformed_and_oversized_batches(self, client, app):
+        """Tests that bad id lists and batches above API_BATCH_MAX_SIZE are rejected as a whole."""
+        app.config["API_BATCH_MAX_SIZE"] = 2
+        self.login_user(client, email="admin@example.com")
+        assert client.get("/api/v1/patients/batch?ids=1,x").status_code == 400
+        assert client.get("/api/v1/patients/batch?ids=1,2,3").status_code == 400
+        assert client.patch("/api/v1/patients/batch", json={"updates": [{"id": 1}] * 3}).status_code == 400
+        assert client.patch("/api/v1/patients/batch", json=[{"id": 1}]).status_code == 400
+
+
+class TestBatchUpdate(BaseTest):
+    def test_applies_valid_items_in_one_commit(self, client, app):
+        """Tests that valid updates are committed together and invalid items are reported per item."""
+        ids = add_patients(app, 3)
+        self.login_user(client, email="doctor@example.com")
+        with count_queries(app) as statements:
+            response = client.patch("/api/v1/patients/batch", json={"updates": [
+                {"id": ids[0], "notes": "Seen", "blood_type": "O+"},
+                {"id": ids[1], "birth_date": "1990-13-01"},
+                {"id": ids[2], "first_name": "Renamed", "birth_date": "1990-01-02"},
+                {"id": 999, "notes": "Nobody"},
+                {"id": ids[0], "shoe_size": 42},
+            ]})
+        assert statuses(response) == [(ids[0], 200), (ids[1], 400), (ids[2], 200), (999, 404), (ids[0], 400)]
+        assert response.get_json()["updated"] == 2
+        assert "birth_date" in response.get_json()["results"][1]["message"]
+        assert len([s for s in statements if s.startswith("INSERT INTO patient_history")]) == 1
+        with app.app_context():
+            first, second, third = (db.session.get(Patient, patient_id) for patient_id in ids)
+            assert (first.notes, first.blood_type) == ("Seen", BloodType.O_POSITIVE)
+            assert second.birth_date is None
+            assert (third.first_name, third.birth_date.isoformat()) == ("Renamed", "1990-01-02")
+
+    def test_patient_may_only_rename_own_card(self, client, app):
+        """Tests the field-level rules of edit_patient: patients change only the names on their own card."""
+        self.register_user(client, username="patientuser", email="patient@example.com")
+        self.login_user(client, email="patient@example.com")
+        with app.app_context():
+            own_id = User.query.filter_by(username="patientuser").one().patient_id
+        response = client.patch("/api/v1/patients/batch", json={"updates": [
+            {"id": own_id, "last_name": "Newname"},
+            {"id": own_id, "notes": "Self-diagnosed"},
+            {"id": 1, "first_name": "Hacked"},
+        ]})
+        assert statuses(response) == [(own_id, 200), (own_id, 403), (1, 403)]
+        with app.app_context():
+            assert db.session.get(Patient, own_id).last_name == "Newname"
+            assert db.session.get(Patient, own_id).notes is None
+            assert db.session.get(Patient, 1).first_name == "John"
+
+    def test_requires_login(self, client):
+        """Tests that the batch endpoints answer 401 to anonymous requests."""
+        assert client.get("/api/v1/patients/batch?ids=1").status_code == 401
+        assert client.patch("/api/v1/patients/batch", json={"updates": []}).status_code == 401
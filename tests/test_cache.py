@@ -0,0 +1,144 @@
+import threading
+import time
+
+from mediarch.cache import Cache, MemoryBackend, SQLiteBackend
+
+from .test_auth import count_queries
+from .test_routes import BaseTest
+
+
+def test_lru_eviction_and_stats():
+    cache = Cache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "b" is now the least recently used
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"], stats["entries"]) == (2, 1, 1, 2)
+
+
+def test_ttl_expiry():
+    cache = Cache()
+    cache.set("a", 1, ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get("a", "gone") == "gone"
+
+
+def test_tag_invalidation():
+    cache = Cache()
+    cache.set("row:1", "one", tags=["patient:1", "patients"])
+    cache.set("row:2", "two", tags=["patient:2", "patients"])
+    cache.set("stats", {"n": 2}, tags=["patients"])
+    cache.invalidate_tags("patient:1")
+    assert cache.get("row:1") is None
+    assert cache.get("row:2") == "two"
+    cache.invalidate_tags("patients")
+    assert cache.get("row:2") is None
+    assert cache.get("stats") is None
+
+
+def test_shared_level():
+    """Tests that two workers share entries and invalidations through the shared backend."""
+    shared = MemoryBackend()
+    first, second = Cache(shared=shared, local_ttl=0), Cache(shared=shared, local_ttl=0)
+    first.set("stats", 42, tags=["patients"])
+    assert second.get("stats") == 42
+    assert second.stats()["shared_hits"] == 1
+    second.invalidate_tags("patients")
+    assert first.get("stats") is None
+
+
+def test_single_flight():
+    """Tests that concurrent misses on one key compute the value once."""
+    cache = Cache()
+    calls = []
+    barrier = threading.Barrier(8)
+
+    def factory():
+        calls.append(1)
+        time.sleep(0.05)
+        return "value"
+
+    def worker(results):
+        barrier.wait()
+        results.append(cache.get_or_set("key", factory))
+
+    results = []
+    threads = [threading.Thread(target=worker, args=(results,)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["value"] * 8
+    assert len(calls) == 1
+    assert cache.stats()["coalesced"] == 7
+
+
+def test_invalidation_during_computation_is_not_lost():
+    cache = Cache()
+
+    def factory():
+        cache.invalidate_tags("patients")  # e.g. a commit in another thread while the value is computed
+        return "stale"
+
+    assert cache.get_or_set("stats", factory, tags=["patients"]) == "stale"
+    assert cache.get("stats") is None
+
+
+def test_sqlite_backend(tmp_path):
+    path = tmp_path / "cache.sqlite3"
+    first, second = Cache(shared=SQLiteBackend(path)), Cache(shared=SQLiteBackend(path))
+    first.set("user", {"name": "admin"})
+    assert second.get("user") == {"name": "admin"}
+    first.clear()
+    assert Cache(shared=SQLiteBackend(path)).get("user") is None
+
+
+def test_disabled():
+    cache = Cache(enabled=False)
+    cache.set("a", 1)
+    assert cache.get("a") is None
+    assert cache.get_or_set("a", lambda: 2) == 2
+
+
+class TestAppCache(BaseTest):
+    def test_dashboard_stats_are_cached_until_a_patient_changes(self, client, app):
+        self.login_user(client, email="admin@example.com")
+        client.get("/admin")
+        with count_queries(app) as statements:
+            body = client.get("/admin").get_data(as_text=True)
+        assert not [s for s in statements if "count(" in s.lower()]
+        assert '<p class="text-3xl font-bold text-brand-light">1</p>' in body
+        client.post("/patients/add", data={"first_name": "Jane", "last_name": "Roe"})
+        body = client.get("/admin").get_data(as_text=True)
+        assert '<p class="text-3xl font-bold text-brand-light">2</p>' in body
+
+    def test_edited_patient_row_is_rerendered(self, client):
+        self.login_user(client, email="admin@example.com")
+        assert b"Doe" in client.get("/patients").data
+        client.post("/patients/1/edit", data={"first_name": "John", "last_name": "Dough"})
+        body = client.get("/patients").data
+        assert b"Dough" in body
+        assert b">Doe<" not in body
+
+    def test_expired_claims_are_not_refreshed_from_cache(self, client, app):
+        """Tests that expired session claims are always revalidated against the users table."""
+        self.login_user(client, email="admin@example.com")
+        queries = []
+        for _ in range(2):
+            with client.session_transaction() as session:
+                session["_claims"] = {**session["_claims"], "iat": 0}
+            with count_queries(app) as statements:
+                assert client.get("/").status_code == 200
+            queries.append(len([s for s in statements if "FROM users" in s]))
+        assert queries == [1, 1]
+
+    def test_stats_endpoint(self, client):
+        self.login_user(client, email="doctor@example.com")
+        assert client.get("/api/v1/cache").status_code == 403
+        client.get("/logout")
+        self.login_user(client, email="admin@example.com")
+        stats = client.get("/api/v1/cache").get_json()
+        assert {"hits", "shared_hits", "misses", "evictions", "coalesced", "hit_ratio"} <= set(stats)
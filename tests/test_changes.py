@@ -0,0 +1,139 @@
+import threading
+import time
+from datetime import UTC, datetime, timedelta
+
+from mediarch import db
+from mediarch.models import AccountType, Change, Patient, User
+from mediarch.softdelete import purge_deleted_patients
+
+from .test_auth import count_queries
+from .test_routes import BaseTest
+
+
+def feed(client, **params):
+    response = client.get("/api/v1/changes", query_string=params)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def summary(document):
+    return [(c["entity"], c["id"], c["operation"]) for c in document["changes"]]
+
+
+class TestChangeFeed(BaseTest):
+    def test_patient_lifecycle_is_published_in_order(self, client):
+        """Tests that creating, editing and deleting a card append ordered entries with the new state."""
+        self.login_user(client, email="admin@example.com")
+        start = feed(client, since="latest")["cursor"]
+        client.post("/patients/add", data={"first_name": "Ann", "last_name": "Lee"})
+        client.post("/patients/2/edit", data={"first_name": "Anne", "last_name": "Lee"})
+        client.get("/patients/2/delete")
+
+        document = feed(client, since=start)
+        assert summary(document) == [("patient", 2, "insert"), ("patient", 2, "update"), ("patient", 2, "delete")]
+        assert document["changes"][1]["data"]["first_name"] == "Anne"
+        assert document["changes"][2]["data"] is None
+        seqs = [c["seq"] for c in document["changes"]]
+        assert seqs == sorted(seqs)
+        assert document["cursor"] == seqs[-1]
+        assert feed(client, since=document["cursor"])["changes"] == []
+
+    def test_only_user_links_are_published(self, client, app):
+        """Tests that account type, activation and patient links are published but passwords are not."""
+        self.login_user(client, email="admin@example.com")
+        start = feed(client, since="latest")["cursor"]
+        with app.app_context():
+            doctor = User.query.filter_by(username="doctoruser").one()
+            doctor.set_password("another-password")
+            db.session.commit()
+            doctor.patient_id = 1
+            db.session.commit()
+            doctor_id = doctor.id
+
+        document = feed(client, since=start)
+        assert summary(document) == [("user", doctor_id, "update")]
+        assert document["changes"][0]["data"] == {
+            "id": doctor_id, "username": "doctoruser", "account_type": "doctor", "is_active": True, "patient_id": 1,
+        }
+
+    def test_batches_follow_the_cursor(self, client, app):
+        """Tests that limit splits the feed into batches chained by the returned cursor."""
+        with app.app_context():
+            db.session.add_all(Patient(first_name=f"P{i}", last_name="Batch") for i in range(5))
+            with count_queries(app) as statements:
+                db.session.commit()
+        assert len([s for s in statements if s.startswith("INSERT INTO change_log")]) == 1
+
+        self.login_user(client, email="admin@example.com")
+        seen, cursor, has_more = [], 0, True
+        while has_more:
+            document = feed(client, since=cursor, limit=2)
+            assert len(document["changes"]) <= 2
+            seen += [c["seq"] for c in document["changes"]]
+            cursor, has_more = document["cursor"], document["has_more"]
+        with app.app_context():
+            assert seen == db.session.scalars(db.select(Change.seq).order_by(Change.seq)).all()
+
+    def test_rolled_back_changes_are_not_published(self, client, app):
+        """Tests that the feed commits and rolls back together with the change."""
+        with app.app_context():
+            before = Change.query.count()
+            db.session.add(Patient(first_name="Never", last_name="Saved"))
+            db.session.flush()
+            db.session.rollback()
+            assert Change.query.count() == before
+
+    def test_purge_publishes_unlinked_users(self, client, app):
+        """Tests that unlinking accounts during the purge is published like any other link change."""
+        with app.app_context():
+            patient = Patient(first_name="Gone", last_name="Patient",
+                              deleted_at=datetime.now(UTC) - timedelta(days=40))
+            db.session.add(patient)
+            db.session.flush()
+            user = User(username="linked", email="linked@example.com", account_type=AccountType.PATIENT,
+                        patient_id=patient.id, password_hash="x")
+            db.session.add(user)
+            db.session.commit()
+            user_id = user.id
+            start = db.session.scalar(db.select(db.func.max(Change.seq)))
+            assert purge_deleted_patients(timedelta(days=30)) == 1
+
+        self.login_user(client, email="admin@example.com")
+        document = feed(client, since=start)
+        assert summary(document) == [("user", user_id, "update")]
+        assert document["changes"][0]["data"]["patient_id"] is None
+
+    def test_long_poll_wakes_on_commit(self, client, app):
+        """Tests that ?wait= returns as soon as a change is committed instead of after the timeout."""
+        app.config["CHANGES_POLL_INTERVAL"] = 10
+        self.login_user(client, email="admin@example.com")
+        start = feed(client, since="latest")["cursor"]
+
+        def add_patient():
+            time.sleep(0.2)
+            with app.app_context():
+                db.session.add(Patient(first_name="Late", last_name="Arrival"))
+                db.session.commit()
+
+        writer = threading.Thread(target=add_patient)
+        writer.start()
+        began = time.monotonic()
+        document = feed(client, since=start, wait=5)
+        writer.join()
+        assert time.monotonic() - began < 4
+        assert [c["data"]["first_name"] for c in document["changes"]] == ["Late"]
+
+    def test_empty_long_poll_times_out(self, client):
+        """Tests that a long poll without changes returns an empty batch and the unchanged cursor."""
+        self.login_user(client, email="admin@example.com")
+        start = feed(client, since="latest")["cursor"]
+        assert feed(client, since=start, wait=0.1) == {"changes": [], "cursor": start, "has_more": False}
+
+    def test_feed_is_admin_only_and_validates_cursor(self, client):
+        """Tests the access rules and that a malformed cursor is rejected instead of restarting the feed."""
+        assert client.get("/api/v1/changes").status_code == 401
+        self.login_user(client, email="doctor@example.com")
+        assert client.get("/api/v1/changes").status_code == 403
+        client.get("/logout")
+        self.login_user(client, email="admin@example.com")
+        assert client.get("/api/v1/changes?since=abc").status_code == 400
@@ -0,0 +1,123 @@
+import gzip
+import io
+
+import pytest
+from werkzeug.test import Client
+from werkzeug.wsgi import FileWrapper
+
+from mediarch import create_app, db
+from mediarch.compress import COMPRESSORS, CompressionMiddleware, negotiate
+from mediarch.models import Patient
+
+from .test_routes import BaseTest
+
+
+def test_negotiate():
+    available = ["br", "zstd", "gzip"]
+    assert negotiate("gzip, deflate, br, zstd", available) == "br"
+    assert negotiate("gzip;q=1.0, br;q=0.5", available) == "gzip"
+    assert negotiate("br;q=0, gzip", available) == "gzip"
+    assert negotiate("*", available) == "br"
+    assert negotiate("identity", available) is None
+    assert negotiate("", available) is None
+
+
+def test_files_pass_through():
+    """Tests that a file handed to ``wsgi.file_wrapper`` is left to the server, not read and compressed."""
+    content = b"plain text " * 1000
+
+    def app(environ, start_response):
+        start_response("200 OK", [("Content-Type", "text/plain"), ("Content-Length", str(len(content)))])
+        return FileWrapper(io.BytesIO(content))
+
+    response = Client(CompressionMiddleware(app, min_size=0)).get("/", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+    assert response.get_data() == content
+
+
+def test_large_bodies_are_streamed():
+    """Tests that a body above ``max_buffered`` is compressed chunk by chunk rather than read whole."""
+    chunks = [b"row %d\n" % i * 100 for i in range(50)]
+    read = []
+
+    def app(environ, start_response):
+        start_response("200 OK", [("Content-Type", "text/plain"), ("Content-Length", str(sum(map(len, chunks))))])
+        for chunk in chunks:
+            read.append(chunk)
+            yield chunk
+
+    middleware = CompressionMiddleware(app, min_size=0, max_buffered=1000)
+    response = Client(middleware).get("/", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in response.headers
+    assert len(read) < len(chunks)  # the response started before the body was read
+    assert gzip.decompress(response.get_data()) == b"".join(chunks)
+
+
+def test_write_callable_passes_through():
+    """Tests that a response written through ``write()`` is sent as written instead of failing."""
+    content = b"written " * 200
+
+    def app(environ, start_response):
+        start_response("200 OK", [("Content-Type", "text/plain")])(content)
+        return []
+
+    response = Client(CompressionMiddleware(app, min_size=0)).get("/", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+    assert response.get_data() == content
+
+
+class TestCompression(BaseTest):
+    def test_html_is_gzipped(self, client):
+        """Tests that a page is compressed for a client that accepts gzip and decompresses to the original."""
+        plain = client.get("/login")
+        response = client.get("/login", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert "Accept-Encoding" in response.headers["Vary"]
+        assert int(response.headers["Content-Length"]) == len(response.data) < len(plain.data)
+        assert gzip.decompress(response.data) == plain.data
+
+    def test_identity_when_not_accepted(self, client):
+        response = client.get("/login")
+        assert "Content-Encoding" not in response.headers
+        assert "Accept-Encoding" in response.headers["Vary"]
+
+    def test_small_and_head_responses_pass_through(self, app, client):
+        """Tests the size threshold and that HEAD and Range requests are never compressed."""
+        app.wsgi_app.min_size = 10**6
+        assert "Content-Encoding" not in client.get("/login", headers={"Accept-Encoding": "gzip"}).headers
+        app.wsgi_app.min_size = 0
+        assert "Content-Encoding" not in client.head("/login", headers={"Accept-Encoding": "gzip"}).headers
+        response = client.get("/login", headers={"Accept-Encoding": "gzip", "Range": "bytes=0-10"})
+        assert "Content-Encoding" not in response.headers
+
+    def test_streamed_list_is_compressed(self, client, app):
+        """Tests that the streamed full patient list is compressed on the fly."""
+        with app.app_context():
+            db.session.add_all(Patient(first_name=f"First{i}", last_name=f"Last{i}") for i in range(300))
+            db.session.commit()
+        self.login_user(client, email="admin@example.com")
+        response = client.get("/patients?all=1", headers={"Accept-Encoding": "gzip"})
+        assert response.is_streamed
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert "Content-Length" not in response.headers
+        assert gzip.decompress(response.get_data()).count(b'class="patient-row') == 301
+
+    @pytest.mark.parametrize("encoding", ["br", "zstd"])
+    def test_optional_encodings(self, client, encoding):
+        """Tests brotli and zstd when their packages are installed."""
+        if encoding not in COMPRESSORS:
+            pytest.skip(f"{encoding} support is not installed")
+        module = pytest.importorskip({"br": "brotli", "zstd": "zstandard"}[encoding])
+        plain = client.get("/login")
+        response = client.get("/login", headers={"Accept-Encoding": f"gzip;q=0.5, {encoding}"})
+        assert response.headers["Content-Encoding"] == encoding
+        if encoding == "br":
+            assert module.decompress(response.data) == plain.data
+        else:
+            assert module.ZstdDecompressor().decompressobj().decompress(response.data) == plain.data
+
+    def test_disabled(self):
+        disabled = create_app({"SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:", "COMPRESS_ENABLED": False})
+        response = disabled.test_client().get("/login", headers={"Accept-Encoding": "gzip"})
+        assert "Content-Encoding" not in response.headers
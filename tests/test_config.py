@@ -0,0 +1,86 @@
+import pytest
+
+from mediarch import create_app
+from mediarch.config import ConfigError, Settings, load_settings
+
+
+def test_dev_defaults():
+    settings = load_settings(environ={})
+    assert settings.profile == "dev"
+    assert settings == Settings()
+    config = settings.to_config()
+    assert config["PATIENTS_PER_PAGE"] == 50
+    assert config["SQLALCHEMY_ENGINE_OPTIONS"] == {}
+    assert config["SESSION_COOKIE_HTTPONLY"] is True
+
+
+def test_environment_variables_are_parsed():
+    settings = load_settings(environ={
+        "DATABASE_URL": "sqlite:///mediarch.db",
+        "AUTH_CLAIMS_TTL": "5",
+        "COMPRESS_ENABLED": "false",
+        "COMPRESS_ENCODINGS": "gzip, br",
+        "COMPRESS_LEVELS": '{"gzip": 9}',
+        "DATABASE_REPLICA_URL": "",
+        "DB_POOL_SIZE": "3",
+    })
+    assert settings.sqlalchemy_database_uri == "sqlite:///mediarch.db"
+    assert settings.auth_claims_ttl == 5
+    assert settings.compress_enabled is False
+    assert settings.compress_encodings == ("gzip", "br")
+    assert settings.compress_levels == {"gzip": 9}
+    assert settings.database_replica_url is None
+    assert settings.engine_options() == {"pool_size": 3}
+
+
+def test_overrides_win_over_environment():
+    settings = load_settings("test", environ={"PATIENTS_PER_PAGE": "20"}, overrides={"PATIENTS_PER_PAGE": 10})
+    assert settings.patients_per_page == 10
+    assert settings.testing is True
+    assert settings.sqlalchemy_database_uri == "sqlite:///:memory:"
+
+
+def test_prod_profile():
+    with pytest.raises(ConfigError, match="SECRET_KEY"):
+        load_settings("prod", environ={})
+    settings = load_settings(environ={"MEDIARCH_ENV": "prod", "SECRET_KEY": "x" * 32})
+    assert settings.session_cookie_secure
+    assert settings.engine_options()["pool_pre_ping"] is True
+    assert settings.cache_shared_backend == "sqlite"
+    single = load_settings("prod", environ={"SECRET_KEY": "x" * 32, "CACHE_SHARED_BACKEND": ""})
+    assert single.cache_shared_backend is None
+
+
+def test_every_problem_is_reported():
+    """Tests that validation collects all problems instead of stopping at the first one."""
+    with pytest.raises(ConfigError) as excinfo:
+        load_settings(environ={"AUTH_CLAIMS_TTL": "soon", "DATABASE_URL": "not a url"},
+                      overrides={"PATIENTS_PER_PAGE": 0, "SESSION_BACKEND": "redis", "COMPRESS_ENABLED": "yes",
+                                 "JOBS_RETRY_BASE_SECONDS": 7200, "APPOINTMENTS_DAY_END": 25,
+                                 "APPOINTMENTS_TIMEZONE": "Mars/Olympus", "INTERACTIONS_DATASET": "/nonexistent"})
+    assert len(excinfo.value.problems) == 9
+    message = str(excinfo.value)
+    for key in ("AUTH_CLAIMS_TTL", "SQLALCHEMY_DATABASE_URI", "PATIENTS_PER_PAGE", "SESSION_BACKEND",
+                "COMPRESS_ENABLED", "JOBS_RETRY_BASE_SECONDS", "APPOINTMENTS_DAY_END", "APPOINTMENTS_TIMEZONE",
+                "INTERACTIONS_DATASET"):
+        assert key in message
+
+
+def test_unknown_profile():
+    with pytest.raises(ConfigError, match="MEDIARCH_ENV"):
+        load_settings("staging", environ={})
+
+
+def test_create_app_fails_fast():
+    with pytest.raises(ConfigError, match="API_PER_PAGE"):
+        create_app({"SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:", "API_PER_PAGE": -1})
+
+
+def test_create_app_uses_validated_overrides():
+    """Tests that settings passed to create_app reach app.config converted, and other keys as they are."""
+    app = create_app({"SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:", "COMPRESS_ENCODINGS": ["gzip"],
+                      "CHANGES_MAX_WAIT": 5, "PROFILE": "prod", "WTF_CSRF_ENABLED": False}, profile="test")
+    assert app.config["COMPRESS_ENCODINGS"] == ("gzip",)
+    assert isinstance(app.config["CHANGES_MAX_WAIT"], float)
+    assert app.config["PROFILE"] == "test"
+    assert app.config["WTF_CSRF_ENABLED"] is False
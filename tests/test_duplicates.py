@@ -0,0 +1,158 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import select
+
+from mediarch import db
+from mediarch.duplicates import (
+    Card,
+    MergeError,
+    blocking_keys,
+    find_duplicates,
+    merge_patients,
+    score_pair,
+    soundex,
+)
+from mediarch.jobs import run_pending
+from mediarch.models import AccountType, DuplicateCandidate, DuplicateStatus, Patient, PatientMatchKey, User
+from mediarch.softdelete import INCLUDE_DELETED
+
+from .test_routes import BaseTest
+
+
+def add_patients(app, *cards) -> list[int]:
+    """Add ``(first_name, last_name, birth_date)`` cards and return their ids."""
+    with app.app_context():
+        patients = [Patient(first_name=first, last_name=last, birth_date=born) for first, last, born in cards]
+        db.session.add_all(patients)
+        db.session.commit()
+        return [patient.id for patient in patients]
+
+
+def pairs(status=DuplicateStatus.PENDING) -> set[tuple[int, int]]:
+    return set(db.session.execute(select(DuplicateCandidate.patient_id, DuplicateCandidate.other_id)
+                                  .where(DuplicateCandidate.status == status)).tuples())
+
+
+def test_blocking_keys_catch_typos_and_swapped_names():
+    """Tests that misspelt and swapped names still share a key, and unrelated names do not."""
+    assert soundex("robert") == soundex("rupert") == "r163"
+    assert soundex("ashcraft") == "a261"
+    smith = blocking_keys("John", "Smith", date(1980, 1, 2))
+    assert smith & blocking_keys("Jon", "Smyth", None)
+    assert smith & blocking_keys("Smith", "John", None)
+    assert smith & blocking_keys("Mary", "Brown", date(1980, 1, 2)) == set()
+    assert blocking_keys("José", "Núñez", None) == blocking_keys("jose", "NUNEZ", None)
+
+
+def test_birth_dates_weigh_on_the_score():
+    """Tests that equal birth dates raise the score, different ones lower it and missing ones are neutral-ish."""
+    john = Card(1, "john", "smith", date(1980, 1, 2))
+    same, _ = score_pair(john, Card(2, "jon", "smith", date(1980, 1, 2)))
+    missing, reasons = score_pair(john, Card(3, "smith", "john", None))
+    different, _ = score_pair(john, Card(4, "john", "smith", date(1955, 7, 30)))
+    assert same > 0.95
+    assert missing == pytest.approx(0.85)
+    assert reasons == {"name": 1.0, "birth_date": "missing", "swapped_names": True}
+    assert different < missing
+
+
+class TestDuplicates(BaseTest):
+    def test_scan_queues_each_pair_once(self, app):
+        """Tests that a scan queues likely pairs, ignores unrelated cards and never re-queues a pair."""
+        jane, jayne, _, _ = add_patients(app, ("Jane", "Roe", date(1990, 3, 4)), ("Jayne", "Roe", date(1990, 3, 4)),
+                                         ("Mary", "Major", None), ("Rupert", "Roe", date(1950, 1, 1)))
+        with app.app_context():
+            assert find_duplicates(max_block=200, min_score=0.85) == 1
+            assert pairs() == {(jane, jayne)}
+            candidate = db.session.scalars(select(DuplicateCandidate)).one()
+            candidate.status = DuplicateStatus.DISMISSED
+            db.session.commit()
+            assert find_duplicates(max_block=200, min_score=0.85) == 0
+            assert pairs() == set()
+
+    def test_large_blocks_are_skipped(self, app):
+        """Tests that keys shared by more than DUPLICATES_MAX_BLOCK cards are not compared."""
+        add_patients(app, ("John", "Doe", None), ("John", "Doe", None))  # with the fixture's John Doe
+        with app.app_context():
+            assert find_duplicates(max_block=2, min_score=0.85) == 0
+            assert find_duplicates(max_block=3, min_score=0.85) == 3
+
+    def test_keys_follow_edits_and_deletes(self, app):
+        """Tests that blocking keys are rebuilt when a name changes and dropped when the card is deleted."""
+        with app.app_context():
+            patient = db.session.get(Patient, 1)
+            patient.last_name = "Smith"
+            db.session.commit()
+            keys = set(db.session.scalars(select(PatientMatchKey.key).where(PatientMatchKey.patient_id == 1)))
+            assert keys == blocking_keys("John", "Smith", None)
+            patient.deleted_at = patient.last_activity_at
+            db.session.commit()
+            assert db.session.scalars(select(PatientMatchKey).where(PatientMatchKey.patient_id == 1)).all() == []
+
+    def test_new_cards_are_checked_in_the_background(self, client, app):
+        """Tests that registering queues a check that pairs the new card with the existing one."""
+        self.register_user(client, first_name="john", last_name="DOE")
+        with app.app_context():
+            new_id = db.session.scalar(select(User.patient_id).where(User.username == "testuser"))
+        assert run_pending(app) == 1
+        with app.app_context():
+            assert pairs() == {(1, new_id)}
+
+    def test_queue_is_for_admins_only(self, client):
+        """Tests that doctors cannot open the review queue."""
+        self.login_user(client, email="doctor@example.com")
+        assert client.get("/admin/duplicates").status_code == 403
+
+    def test_merge_relinks_account_and_keeps_data(self, client, app):
+        """Tests that merging fills the kept card, relinks the other card's account and deletes that card."""
+        self.register_user(client, first_name="John", last_name="Doe")
+        run_pending(app)
+        with app.app_context():
+            user = db.session.scalars(select(User).where(User.username == "testuser")).one()
+            registered_id = user.patient_id
+            registered = db.session.get(Patient, registered_id)
+            registered.birth_date, registered.allergies = date(1970, 5, 6), "Penicillin"
+            db.session.get(Patient, 1).allergies = "Latex"
+            db.session.commit()
+            candidate_id = db.session.scalar(select(DuplicateCandidate.id))
+
+        self.login_user(client, email="admin@example.com")
+        page = client.get("/admin/duplicates")
+        assert f"Keep #{registered_id}".encode() in page.data
+        response = client.post(f"/admin/duplicates/{candidate_id}/merge", data={"keep": 1}, follow_redirects=True)
+        assert f"Patient #{registered_id} was merged into patient #1.".encode() in response.data
+        assert b"No likely duplicates are waiting for review." in response.data
+
+        with app.app_context():
+            kept = db.session.get(Patient, 1)
+            assert kept.birth_date == date(1970, 5, 6)
+            assert kept.allergies == "Latex\nPenicillin"
+            assert db.session.scalar(select(User.patient_id).where(User.username == "testuser")) == 1
+            merged = db.session.execute(select(Patient).where(Patient.id == registered_id),
+                                        execution_options={INCLUDE_DELETED: True}).scalar_one()
+            assert merged.deleted_at is not None
+            assert pairs(DuplicateStatus.MERGED) == {(1, registered_id)}
+        assert client.post(f"/admin/duplicates/{candidate_id}/dismiss").status_code == 404
+
+    def test_cards_of_two_accounts_are_not_merged(self, app):
+        """Tests that merging refuses when both cards belong to user accounts."""
+        first, second = add_patients(app, ("Ann", "Lee", None), ("Ann", "Lee", None))
+        with app.app_context():
+            for patient_id in (first, second):
+                db.session.add(User(username=f"u{patient_id}", email=f"u{patient_id}@example.com",
+                                    account_type=AccountType.PATIENT, patient_id=patient_id, password_hash="x"))
+            db.session.commit()
+            with pytest.raises(MergeError):
+                merge_patients(db.session.get(Patient, first), db.session.get(Patient, second))
+
+    def test_duplicates_command(self, app):
+        """Tests the flask patients duplicates command, including the key rebuild."""
+        add_patients(app, ("Doe", "John", None))
+        with app.app_context():
+            db.session.execute(PatientMatchKey.__table__.delete())
+            db.session.commit()
+        result = app.test_cli_runner().invoke(args=["patients", "duplicates", "--rebuild-keys"])
+        assert result.exit_code == 0
+        assert "Rebuilt the keys of 2 patient card(s)." in result.output
+        assert "Queued 1 new pair(s) of likely duplicates." in result.output
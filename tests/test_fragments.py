@@ -0,0 +1,55 @@
+from mediarch import db
+from mediarch.models import Patient
+
+from .test_routes import BaseTest
+
+
+class TestFragments(BaseTest):
+    def test_rows_fragment(self, client, app):
+        """Tests that X-Fragment: rows returns only the table rows and pager of the requested page."""
+        with app.app_context():
+            db.session.add_all(Patient(first_name=f"First{i:03d}", last_name=f"Zz{i:03d}") for i in range(60))
+            db.session.commit()
+        self.login_user(client, email="admin@example.com")
+        response = client.get("/patients?page=2", headers={"X-Fragment": "rows"})
+        assert response.status_code == 200
+        assert response.headers["X-Fragment"] == "rows"
+        assert "X-Fragment" in response.vary
+        body = response.get_data(as_text=True)
+        assert "<html" not in body
+        assert "<header" not in body
+        assert 'id="patient-table-body"' in body
+        assert 'id="patient-pager"' in body
+        assert body.count('class="patient-row') == 11
+        assert "Page 2 of 2" in body
+
+    def test_main_fragment(self, client):
+        """Tests that X-Fragment: main returns the patient card without the base layout."""
+        self.login_user(client, email="admin@example.com")
+        response = client.get("/patients/1", headers={"X-Fragment": "main"})
+        assert response.headers["X-Fragment"] == "main"
+        body = response.get_data(as_text=True)
+        assert body.startswith("<title>Patient Details - MediArch</title>")
+        assert "John Doe" in body
+        assert "<html" not in body
+        assert "<nav" not in body
+        assert len(body) < len(client.get("/patients/1").data)
+
+    def test_full_page_without_header(self, client):
+        """Tests that plain requests and unknown fragment kinds get the full page, without the echo header."""
+        self.login_user(client, email="admin@example.com")
+        for headers in ({}, {"X-Fragment": "rows"}):
+            response = client.get("/patients/1", headers=headers)
+            assert "X-Fragment" not in response.headers
+            assert "X-Fragment" in response.vary
+            assert b"<html" in response.data
+
+    def test_fragment_keeps_access_rules(self, client):
+        """Tests that a fragment request from a logged-out or unauthorised user gets no fragment."""
+        response = client.get("/patients/1", headers={"X-Fragment": "main"})
+        assert response.status_code == 302
+        assert "X-Fragment" not in response.headers
+        self.register_user(client, username="otherpatient", email="other@example.com")
+        self.login_user(client, email="other@example.com")
+        assert client.get("/patients/1", headers={"X-Fragment": "main"}).status_code == 403
+        assert client.get("/patients", headers={"X-Fragment": "rows"}).status_code == 403
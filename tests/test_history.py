@@ -0,0 +1,77 @@
+from datetime import date
+
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateTable
+
+from mediarch import db
+from mediarch.models import HistoryAction, Patient, PatientHistory, User
+
+from .test_auth import count_queries
+from .test_routes import BaseTest
+
+
+def history_for(app, patient_id):
+    with app.app_context():
+        return (PatientHistory.query.filter_by(patient_id=patient_id)
+                .order_by(PatientHistory.id).all())
+
+
+class TestPatientHistory(BaseTest):
+    def test_edit_records_field_level_diff(self, client, app):
+        """Tests that an edit stores only the changed fields together with the author."""
+        self.login_user(client, email="doctor@example.com")
+        client.post("/patients/1/edit", data={
+            "first_name": "John", "last_name": "Doe", "birth_date": "1980-02-03", "notes": "Seen today",
+        })
+        entries = history_for(app, 1)
+        assert entries[-1].action == HistoryAction.UPDATE
+        assert entries[-1].changes == {"birth_date": [None, "1980-02-03"], "notes": [None, "Seen today"]}
+        with app.app_context():
+            assert db.session.get(User, entries[-1].changed_by_id).username == "doctoruser"
+
+    def test_delete_is_recorded(self, client, app):
+        """Tests that deleting a card is recorded as a delete action."""
+        self.login_user(client, email="admin@example.com")
+        client.get("/patients/1/delete")
+        entries = history_for(app, 1)
+        assert entries[-1].action == HistoryAction.DELETE
+        assert list(entries[-1].changes) == ["deleted_at"]
+
+    def test_batch_of_changes_is_one_insert(self, app):
+        """Tests that changes to several patients in one flush produce a single history INSERT."""
+        with app.app_context():
+            created_before = PatientHistory.query.filter_by(action=HistoryAction.CREATE).count()
+            db.session.add_all(Patient(first_name=f"P{i}", last_name="Batch", birth_date=date(2000, 1, i + 1))
+                               for i in range(5))
+            with count_queries(app) as statements:
+                db.session.commit()
+        assert len([s for s in statements if s.startswith("INSERT INTO patient_history")]) == 1
+        with app.app_context():
+            assert PatientHistory.query.filter_by(action=HistoryAction.CREATE).count() == created_before + 5
+
+    def test_history_view_paginates_for_staff_only(self, client, app):
+        """Tests the paginated history section on the detail page and that patients do not see it."""
+        app.config["HISTORY_PER_PAGE"] = 2
+        self.login_user(client, email="admin@example.com")
+        for name in ("A", "B", "C"):
+            client.post("/patients/1/edit", data={"first_name": name, "last_name": "Doe"})
+        page_one = client.get("/patients/1")
+        assert b"Change History" in page_one.data
+        assert b"history_page=2" in page_one.data
+        page_two = client.get("/patients/1?history_page=2")
+        assert b"history_page=1" in page_two.data
+        assert b"history_page=3" not in page_two.data
+        client.get("/logout")
+
+        self.register_user(client, username="histpatient", email="hist@example.com")
+        self.login_user(client, email="hist@example.com")
+        with app.app_context():
+            patient_id = User.query.filter_by(username="histpatient").first().patient_id
+        assert b"Change History" not in client.get(f"/patients/{patient_id}").data
+
+
+def test_postgresql_table_is_partitioned_by_month():
+    """Tests that the PostgreSQL DDL partitions the history by changed_at."""
+    ddl = str(CreateTable(PatientHistory.__table__).compile(dialect=postgresql.dialect()))
+    assert "PARTITION BY RANGE (changed_at)" in ddl
+    assert "PRIMARY KEY" not in ddl  # added as (id, changed_at) after creation
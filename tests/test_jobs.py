@@ -0,0 +1,154 @@
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+from mediarch import db
+from mediarch.jobs import claim_next, enqueue, heartbeat, job, requeue_stale, run_pending, schedule_periodic
+from mediarch.models import Job, JobStatus, Patient
+
+from .test_routes import BaseTest
+
+calls = []
+
+
+@job("tests.echo")
+def echo_job(value):
+    calls.append(value)
+    return {"echo": value}
+
+
+@job("tests.flaky", max_attempts=2)
+def flaky_job():
+    raise RuntimeError("boom")
+
+
+@job("tests.unstorable", max_attempts=1)
+def unstorable_job():
+    return {"when": object()}
+
+
+@pytest.fixture(autouse=True)
+def reset_calls():
+    calls.clear()
+
+
+def queue(app, name, payload=None):
+    with app.app_context():
+        queued = enqueue(name, payload)
+        db.session.commit()
+        return queued.id
+
+
+class TestJobRunner:
+    def test_job_runs_and_stores_result(self, app):
+        """Tests that a queued job is executed once and its result recorded."""
+        job_id = queue(app, "tests.echo", {"value": 42})
+        assert run_pending(app) == 1
+        assert calls == [42]
+        with app.app_context():
+            done = db.session.get(Job, job_id)
+            assert done.status == JobStatus.SUCCEEDED
+            assert done.result == {"echo": 42}
+            assert done.attempts == 1
+
+    def test_failures_retry_with_backoff_then_fail(self, app):
+        """Tests that a failing job is rescheduled in the future and fails after max_attempts."""
+        job_id = queue(app, "tests.flaky")
+        app.config["JOBS_RETRY_BASE_SECONDS"] = 60
+        assert run_pending(app) == 1
+        with app.app_context():
+            retried = db.session.get(Job, job_id)
+            assert retried.status == JobStatus.QUEUED
+            assert "RuntimeError: boom" in retried.last_error
+            assert retried.run_at.replace(tzinfo=UTC) > datetime.now(UTC) + timedelta(seconds=50)
+            retried.run_at = datetime.now(UTC)
+            db.session.commit()
+
+        assert run_pending(app) == 1
+        with app.app_context():
+            assert db.session.get(Job, job_id).status == JobStatus.FAILED
+
+    def test_job_is_claimed_once(self, app):
+        """Tests that a job cannot be claimed by two workers."""
+        queue(app, "tests.echo", {"value": 1})
+        with app.app_context():
+            assert claim_next("worker-a") is not None
+            assert claim_next("worker-b") is None
+
+    def test_stale_jobs_are_requeued_until_out_of_attempts(self, app):
+        """Tests that a job whose worker died runs again, unless that was its last attempt."""
+        echo_id, flaky_id = queue(app, "tests.echo", {"value": 1}), queue(app, "tests.flaky")
+        with app.app_context():
+            assert claim_next("host:1:0") == echo_id
+            assert claim_next("host:1:1") == flaky_id
+            db.session.get(Job, flaky_id).attempts = 2
+            for running in db.session.scalars(select(Job)):
+                running.locked_at = datetime.now(UTC) - timedelta(hours=1)
+            db.session.commit()
+
+            assert requeue_stale(60) == 1
+            assert db.session.get(Job, echo_id).status == JobStatus.QUEUED
+            failed = db.session.get(Job, flaky_id)
+            assert failed.status == JobStatus.FAILED
+            assert failed.last_error == "The worker running the job stopped responding."
+
+    def test_heartbeat_keeps_long_jobs_claimed(self, app):
+        """Tests that only the jobs a worker's threads are running are kept claimed, however long they run."""
+        running, orphaned = queue(app, "tests.echo", {"value": 1}), queue(app, "tests.echo", {"value": 2})
+        with app.app_context():
+            claim_next("host:1:0")
+            claim_next("host:1:1")
+            for claimed in db.session.scalars(select(Job)):
+                claimed.locked_at = datetime.now(UTC) - timedelta(hours=1)
+            db.session.commit()
+            assert heartbeat("host:10", [running]) == 0
+            assert heartbeat("host:1", [running]) == 1
+            assert requeue_stale(60) == 1
+            assert db.session.get(Job, running).status == JobStatus.RUNNING
+            assert db.session.get(Job, orphaned).status == JobStatus.QUEUED
+
+    def test_unstorable_result_fails_the_job(self, app):
+        """Tests that a result the database cannot store fails the attempt instead of leaving the job running."""
+        job_id = queue(app, "tests.unstorable")
+        assert run_pending(app) == 1
+        with app.app_context():
+            failed = db.session.get(Job, job_id)
+            assert failed.status == JobStatus.FAILED
+            assert "TypeError" in failed.last_error
+            assert failed.locked_by is None
+
+    def test_periodic_jobs_are_not_duplicated(self, app):
+        """Tests that a periodic job is queued once while pending or recently run."""
+        with app.app_context():
+            assert len(schedule_periodic({"tests.echo": 3600})) == 1
+            assert schedule_periodic({"tests.echo": 3600}) == []
+
+    def test_purge_job(self, app):
+        """Tests that the purge is available as a background job."""
+        with app.app_context():
+            db.session.add(Patient(first_name="Old", last_name="Card",
+                                   deleted_at=datetime.now(UTC) - timedelta(days=90)))
+            db.session.commit()
+        job_id = queue(app, "patients.purge")
+        run_pending(app)
+        with app.app_context():
+            assert db.session.get(Job, job_id).result == {"purged": 1}
+
+
+class TestJobStatusApi(BaseTest):
+    def test_admin_reads_job_status(self, client, app):
+        """Tests the JSON status of a job for admins."""
+        job_id = queue(app, "tests.echo", {"value": "x"})
+        self.login_user(client, email="admin@example.com")
+        response = client.get(f"/api/v1/jobs/{job_id}")
+        assert response.status_code == 200
+        assert response.json["status"] == "queued"
+        assert client.get("/api/v1/jobs/9999").json["error"] == "Not Found"
+
+    def test_job_status_requires_admin(self, client, app):
+        """Tests that doctors are forbidden and anonymous callers get 401 rather than a redirect."""
+        job_id = queue(app, "tests.echo", {"value": "x"})
+        assert client.get(f"/api/v1/jobs/{job_id}").status_code == 401
+        self.login_user(client, email="doctor@example.com")
+        assert client.get(f"/api/v1/jobs/{job_id}").status_code == 403
@@ -0,0 +1,161 @@
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select
+
+from mediarch import db
+from mediarch.duplicates import merge_patients
+from mediarch.models import Observation, Patient, User
+from mediarch.observations import chart, downsample, import_csv
+from mediarch.softdelete import purge_deleted_patients
+
+from .test_routes import BaseTest
+
+START = datetime(2026, 1, 1, tzinfo=UTC)
+HEADER = "patient_id,code,observed_at,value,unit\n"
+
+
+def add_readings(app, patient_id=1, code="glucose", count=100, step=timedelta(hours=1)):
+    """Readings ``0, 1, ... count - 1`` every ``step`` from ``START``."""
+    with app.app_context():
+        db.session.add_all(Observation(patient_id=patient_id, code=code, observed_at=START + i * step, value=i,
+                                       unit="mmol/L") for i in range(count))
+        db.session.commit()
+
+
+def stored(patient_id=1) -> list[tuple]:
+    return db.session.execute(select(Observation.code, Observation.observed_at, Observation.value)
+                              .where(Observation.patient_id == patient_id)
+                              .order_by(Observation.code, Observation.observed_at)).all()
+
+
+def test_import_skips_stored_and_invalid_rows(app):
+    """Tests batched CSV import: bp pairs are split, reimports add nothing, bad rows are reported by line."""
+    dump = (HEADER
+            + "1,Glucose,2026-10-19T07:30:00+02:00,5.4,mmol/L\n"
+            + "1,bp,2026-10-19T07:31:00Z,128/84,mmHg\n"
+            + "1,glucose,yesterday,5.0,\n"
+            + "1,glucose,2026-10-19T08:00:00,nan,\n"
+            + "999,glucose,2026-10-19T08:00:00,5.0,\n")
+    with app.app_context():
+        result = import_csv(dump.splitlines(keepends=True), batch_size=2)
+        assert (result.inserted, result.duplicates, result.rejected) == (3, 0, 3)
+        assert result.errors == ["line 4: invalid observed_at 'yesterday'", "line 5: invalid value 'nan'",
+                                 "line 6: unknown patient 999"]
+        assert [(code, value) for code, _, value in stored()] == [("bp_diastolic", 84), ("bp_systolic", 128),
+                                                                  ("glucose", 5.4)]
+        assert stored()[2][1].replace(tzinfo=UTC) == datetime(2026, 10, 19, 5, 30, tzinfo=UTC)
+
+        again = import_csv(dump.splitlines(keepends=True), batch_size=2)
+        assert (again.inserted, again.duplicates) == (0, 3)
+
+
+def test_import_requires_the_columns(app):
+    """Tests that a dump without the required columns is refused before anything is stored."""
+    with app.app_context(), pytest.raises(ValueError, match=r"Missing CSV column\(s\): observed_at\."):
+        import_csv(["patient_id,code,value\n"])
+
+
+def test_downsample_aggregates_buckets(app):
+    """Tests that a range is split into at most N buckets with their min, max, mean and count."""
+    add_readings(app, count=100)
+    with app.app_context():
+        buckets = downsample(1, "glucose", START, START + timedelta(hours=100), points=10)
+        assert len(buckets) == 10
+        first = buckets[0]
+        assert (first.min, first.max, first.avg, first.count) == (0, 9, 4.5, 10)
+        assert first.at == START
+        assert sum(bucket.count for bucket in buckets) == 100
+        assert downsample(1, "glucose", START, START + timedelta(hours=100), points=1000)[99].avg == 99
+
+        plotted = chart(buckets, START, START + timedelta(hours=100))
+        assert (plotted.low, plotted.high, plotted.count) == (0, 99, 100)
+        assert len(plotted.line.split()) == 10
+        assert len(plotted.band.split()) == 20
+
+
+class TestObservationsApi(BaseTest):
+    def test_raw_and_downsampled_reads(self, client, app):
+        """Tests the code summary, paging through raw readings and the bucketed series."""
+        add_readings(app, count=30)
+        app.config["OBSERVATIONS_MAX_POINTS"] = 20
+        self.login_user(client, email="doctor@example.com")
+        summary = client.get("/api/v1/patients/1/observations").get_json()
+        assert summary["codes"][0]["code"] == "glucose"
+        assert summary["codes"][0]["count"] == 30
+
+        page = client.get("/api/v1/patients/1/observations/glucose").get_json()
+        assert len(page["observations"]) == 20
+        assert page["has_more"]
+        rest = client.get("/api/v1/patients/1/observations/glucose",
+                          query_string={"start": page["next_start"]}).get_json()
+        assert [row["value"] for row in rest["observations"]] == list(range(20, 30))
+        assert not rest["has_more"]
+
+        series = client.get("/api/v1/patients/1/observations/glucose?points=3").get_json()
+        assert sum(bucket["count"] for bucket in series["buckets"]) == 30
+        assert len(series["buckets"]) <= 3
+        assert client.get("/api/v1/patients/1/observations/glucose?points=21").status_code == 400
+        assert client.get("/api/v1/patients/1/observations/%20Glucose").get_json()["code"] == "glucose"
+        assert len(client.get("/api/v1/patients/1/observations/GLUCOSE").get_json()["observations"]) == 20
+        assert client.get("/api/v1/patients/1/observations/_glucose").status_code == 400
+        assert client.get(f"/api/v1/patients/1/observations/{'x' * 65}").status_code == 400
+
+    def test_patient_sees_only_own_readings(self, client, app):
+        """Tests that a patient account cannot read another card's observations."""
+        add_readings(app, count=1)
+        self.register_user(client)
+        self.login_user(client)
+        assert client.get("/api/v1/patients/1/observations/glucose").status_code == 403
+        with app.app_context():
+            own_id = db.session.scalar(select(User.patient_id).where(User.username == "testuser"))
+        assert client.get(f"/api/v1/patients/{own_id}/observations").get_json()["codes"] == []
+
+    def test_import_endpoint(self, client, app):
+        """Tests CSV upload by doctors and its refusal for patients and malformed dumps."""
+        self.login_user(client, email="doctor@example.com")
+        response = client.post("/api/v1/observations/import", data=HEADER + "1,heart_rate,2026-10-19T08:00Z,61,bpm\n",
+                               content_type="text/csv")
+        assert response.get_json() == {"inserted": 1, "duplicates": 0, "rejected": 0, "errors": []}
+        assert client.post("/api/v1/observations/import", data="a,b\n1,2\n").status_code == 400
+
+        client.get("/logout")
+        self.register_user(client)
+        self.login_user(client)
+        assert client.post("/api/v1/observations/import", data=HEADER).status_code == 403
+
+    def test_patient_page_charts_recent_readings(self, client, app):
+        """Tests that the patient page draws one downsampled chart per code."""
+        now = datetime.now(UTC).replace(microsecond=0)
+        with app.app_context():
+            db.session.add_all(Observation(patient_id=1, code="weight", observed_at=now - timedelta(days=i),
+                                           value=80 + i % 3, unit="kg") for i in range(400))
+            db.session.commit()
+        app.config["OBSERVATIONS_CHART_POINTS"] = 50
+        self.login_user(client, email="doctor@example.com")
+        page = client.get("/patients/1").data
+        assert b"Vitals and Lab Results" in page
+        assert b"Weight" in page
+        assert b"400 readings charted" in page
+        assert page.count(b"<polyline") == 1
+
+    def test_merge_and_purge_carry_readings(self, app):
+        """Tests that merging moves readings without doubling shared ones and purging deletes them."""
+        with app.app_context():
+            other = Patient(first_name="John", last_name="Doe")
+            db.session.add(other)
+            db.session.commit()
+            other_id = other.id
+        add_readings(app, count=3)
+        add_readings(app, patient_id=other_id, count=5)
+        with app.app_context():
+            merge_patients(db.session.get(Patient, other_id), db.session.get(Patient, 1))
+            db.session.commit()
+            assert len(stored(1)) == 5
+            assert stored(other_id) == []
+
+            patient = db.session.get(Patient, 1)
+            patient.deleted_at = datetime.now(UTC) - timedelta(days=365)
+            db.session.commit()
+            purge_deleted_patients(timedelta(days=30), batch_size=10)
+            assert db.session.scalar(select(func.count()).select_from(Observation)) == 0
@@ -0,0 +1,142 @@
+import os
+from datetime import date
+
+import pytest
+from sqlalchemy import create_engine, create_mock_engine, func, select, text
+from sqlalchemy.dialects import postgresql
+
+from mediarch import create_app, db
+from mediarch.history import ensure_history_partitions
+from mediarch.models import Patient, PatientHistory
+
+POSTGRESQL_URL = os.getenv("MEDIARCH_TEST_POSTGRESQL_URL")
+
+
+def postgresql_ddl(app, tables) -> list[str]:
+    """The statements ``create_all`` would run against PostgreSQL with the settings of ``app``."""
+    statements = []
+
+    def execute(sql, *args, **kwargs):
+        statements.append(" ".join(str(sql.compile(dialect=engine.dialect)).split()))
+
+    engine = create_mock_engine("postgresql+psycopg://", execute)
+    with app.app_context():
+        db.metadata.create_all(engine, tables=tables, checkfirst=False)
+    return statements
+
+
+class FakePostgreSQL:
+    """Connection stand-in recording statements.
+
+    ``partitioned`` lists tables that report being partitioned, ``keyed`` those whose primary key includes
+    the column asked about.
+    """
+
+    dialect = postgresql.dialect()
+
+    def __init__(self, partitioned=(), keyed=("patient_history",)):
+        self.statements = []
+        self.partitioned = set(partitioned)
+        self.keyed = set(keyed)
+
+    def execute(self, statement, params=None):
+        self.statements.append(" ".join(str(statement).split()))
+        tables = self.keyed if params is not None and "column" in params else self.partitioned
+        found = params is not None and params.get("table") in tables
+        return type("Result", (), {"scalar": lambda _: 1 if found else None})()
+
+
+@pytest.fixture
+def app_config():
+    return {"PATIENT_HASH_PARTITIONS": 4}
+
+
+def test_patients_are_hash_partitioned_on_postgresql(app):
+    """Tests that the patients table is created partitioned by hash of id, with every partition."""
+    statements = postgresql_ddl(app, [Patient.__table__])
+    create_table = next(s for s in statements if s.startswith("CREATE TABLE patients "))
+    assert create_table.endswith("PARTITION BY HASH (id)")
+    assert [s for s in statements if "PARTITION OF patients " in s] == [
+        f"CREATE TABLE IF NOT EXISTS patients_p{i} PARTITION OF patients FOR VALUES WITH (MODULUS 4, REMAINDER {i})"
+        for i in range(4)
+    ]
+
+
+def test_partitioning_is_off_by_default(app):
+    """Tests that without the setting the DDL is a plain table, even after a partitioned app created one."""
+    app.config["PATIENT_HASH_PARTITIONS"] = 0
+    statements = postgresql_ddl(app, [Patient.__table__])
+    assert not [s for s in statements if "PARTITION" in s]
+
+
+def test_queries_are_unchanged_on_sqlite(app, client):
+    """Tests that SQLite ignores the setting and the app works as usual."""
+    with app.app_context():
+        assert "PARTITION" not in db.session.execute(
+            text("SELECT sql FROM sqlite_master WHERE name = 'patients'")).scalar()
+        assert db.session.get(Patient, 1).first_name == "John"
+
+
+def test_history_months_are_split_by_patient():
+    """Tests that new monthly history partitions are hash-partitioned by patient_id."""
+    connection = FakePostgreSQL(partitioned={"patient_history_y2026m10", "patient_history_y2026m11"})
+    ensure_history_partitions(connection, months_ahead=1, today=date(2026, 10, 19), hash_partitions=2)
+    statements = connection.statements
+    assert any(s.startswith("CREATE TABLE IF NOT EXISTS patient_history_y2026m10 PARTITION OF patient_history")
+               and s.endswith("PARTITION BY HASH (patient_id)") for s in statements)
+    assert ("CREATE TABLE IF NOT EXISTS patient_history_y2026m11_p1 PARTITION OF patient_history_y2026m11 "
+            "FOR VALUES WITH (MODULUS 2, REMAINDER 1)") in statements
+
+
+def test_existing_plain_history_months_are_kept():
+    """Tests that months created before partitioning was enabled are not split, so startup still succeeds."""
+    connection = FakePostgreSQL(partitioned={"patient_history_y2026m11"})
+    ensure_history_partitions(connection, months_ahead=1, today=date(2026, 10, 19), hash_partitions=2)
+    assert not [s for s in connection.statements if "PARTITION OF patient_history_y2026m10" in s]
+    assert len([s for s in connection.statements if "PARTITION OF patient_history_y2026m11" in s]) == 2
+
+
+def test_history_primary_key_includes_the_hash_column(app):
+    """Tests that the history's primary key has every partitioning column only when months are split."""
+    assert "ALTER TABLE patient_history ADD PRIMARY KEY (id, changed_at, patient_id)" in postgresql_ddl(
+        app, [PatientHistory.__table__])
+    app.config["PATIENT_HASH_PARTITIONS"] = 0
+    assert "ALTER TABLE patient_history ADD PRIMARY KEY (id, changed_at)" in postgresql_ddl(
+        app, [PatientHistory.__table__])
+
+
+def test_history_created_without_partitioning_is_not_split():
+    """Tests that months are not hash-partitioned when the history's primary key lacks patient_id."""
+    connection = FakePostgreSQL(partitioned={"patient_history_y2026m10"}, keyed=())
+    ensure_history_partitions(connection, months_ahead=0, today=date(2026, 10, 19), hash_partitions=2)
+    assert not [s for s in connection.statements if "HASH" in s or "_p0" in s]
+
+
+def _reset_schema(url: str) -> None:
+    engine = create_engine(url)
+    with engine.begin() as connection:
+        connection.execute(text("DROP SCHEMA public CASCADE"))
+        connection.execute(text("CREATE SCHEMA public"))
+    engine.dispose()
+
+
+@pytest.mark.skipif(not POSTGRESQL_URL, reason="needs MEDIARCH_TEST_POSTGRESQL_URL, a scratch PostgreSQL database "
+                                               "that the test empties (postgresql+psycopg://...)")
+def test_hash_partitioned_app_starts_on_postgresql():
+    """Tests the partitioning DDL against a real PostgreSQL: the app starts and writes history."""
+    _reset_schema(POSTGRESQL_URL)
+    try:
+        app = create_app(test_config={"TESTING": True, "SQLALCHEMY_DATABASE_URI": POSTGRESQL_URL,
+                                      "SECRET_KEY": "test_secret_key", "PATIENT_HASH_PARTITIONS": 2})
+        with app.app_context():
+            db.session.add(Patient(first_name="John", last_name="Doe"))
+            db.session.commit()
+            assert db.session.scalar(select(func.count()).select_from(PatientHistory)) == 1
+            split = db.session.scalars(text(
+                "SELECT c.relname FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+                "WHERE c.relname LIKE 'patient_history_y%'")).all()
+            assert split  # the months are hash-partitioned by patient
+            db.session.remove()
+            db.engine.dispose()
+    finally:
+        _reset_schema(POSTGRESQL_URL)
@@ -0,0 +1,52 @@
+import re
+
+from mediarch import db
+from mediarch.models import Patient
+
+from .test_routes import BaseTest
+
+
+class TestPatientList(BaseTest):
+    def add_patients(self, app, count):
+        with app.app_context():
+            db.session.add_all(Patient(first_name=f"First{i:03d}", last_name=f"Zz{i:03d}") for i in range(count))
+            db.session.commit()
+
+    def test_list_is_paginated(self, client, app):
+        """Tests that the patient list shows PATIENTS_PER_PAGE patients per page."""
+        self.add_patients(app, 60)
+        self.login_user(client, email="admin@example.com")
+        first = client.get("/patients")
+        assert first.data.count(b'class="patient-row') == 50
+        assert b"61 total" in first.data
+        assert b"Page 1 of 2" in first.data
+        second = client.get("/patients?page=2")
+        assert second.data.count(b'class="patient-row') == 11
+        assert b"Zz059" in second.data
+
+    def test_full_list_is_streamed(self, client, app):
+        """Tests that ?all=1 streams every live patient in one response."""
+        self.add_patients(app, 120)
+        self.login_user(client, email="admin@example.com")
+        client.get("/patients/1/delete")
+        response = client.get("/patients?all=1")
+        assert response.status_code == 200
+        assert response.is_streamed
+        body = response.get_data()
+        assert body.count(b'class="patient-row') == 120
+        assert b"John" not in body
+        assert body.rstrip().endswith(b"</html>")
+
+    def test_full_list_requires_staff(self, client):
+        """Tests that the streamed list keeps the access rules of the paged list."""
+        assert client.get("/patients?all=1").status_code == 302
+
+    def test_rows_reference_icon_sprite(self, client):
+        """Tests that row icons are <use> references into the sprite, which defines every used icon."""
+        self.login_user(client, email="admin@example.com")
+        body = client.get("/patients").get_data(as_text=True)
+        assert "<path" not in body
+        used = set(re.findall(r'<use href="/static/icons\.svg(?:\?v=\w+)?#([\w-]+)"', body))
+        assert {"eye", "pencil", "trash"} <= used
+        sprite = client.get("/static/icons.svg").get_data(as_text=True)
+        assert used <= set(re.findall(r'<symbol id="([\w-]+)"', sprite))
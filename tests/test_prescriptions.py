@@ -0,0 +1,151 @@
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+from mediarch import db
+from mediarch.duplicates import merge_patients
+from mediarch.models import Patient, PatientAllergy, Prescription
+from mediarch.prescriptions import (
+    ALLERGY,
+    INTERACTION,
+    InteractionIndex,
+    PrescriptionError,
+    Rule,
+    current_medication,
+    load_index,
+    parse_medication,
+    save_medication,
+)
+from mediarch.softdelete import purge_deleted_patients
+
+from .test_routes import BaseTest
+
+WARFARIN, IBUPROFEN, NAPROXEN, AMOXICILLIN, CEFALEXIN = "B01AA03", "M01AE01", "M01AE02", "J01CA04", "J01DB01"
+
+
+def edit_form(drugs=(), allergens=(), **extra) -> dict:
+    """The staff edit form of the fixture's John Doe with the given prescriptions and drug allergies."""
+    return {"first_name": "John", "last_name": "Doe", "birth_date": "1980-01-01", "blood_type": "A+",
+            "medication_form": "1", "drug_code": [code for code, _ in drugs], "dosage": [dosage for _, dosage in drugs],
+            "allergen_code": list(allergens), **extra}
+
+
+def test_rules_apply_to_every_drug_of_a_class():
+    """Tests class-level rules, the implicit allergy rule, the most severe rule winning and the order."""
+    index = InteractionIndex(
+        {"A": "Class A", "A1": "Drug A1", "A2": "Drug A2", "B1": "Drug B1", "C1": "Drug C1"},
+        [Rule(INTERACTION, "A", "B1", "moderate", "A with B1."),
+         Rule(INTERACTION, "A2", "B1", "major", "A2 with B1."),
+         Rule(ALLERGY, "A1", "C1", "minor", "A1 cross-reacts with C1.")],
+    )
+    assert index.classes == {"A"}
+    assert [(w.first, w.second, w.severity) for w in index.check(["B1", "A1", "A2"])] == [
+        ("B1", "A2", "major"), ("B1", "A1", "moderate")]
+    assert index.check(["A1", "A2"]) == []
+    warnings = index.check(["A2", "C1", "X9"], ["A", "A1"])
+    assert [(w.kind, w.first, w.second, w.description) for w in warnings] == [
+        (ALLERGY, "A", "A2", "Allergy to Class A."), (ALLERGY, "A1", "C1", "A1 cross-reacts with C1.")]
+    assert index.resolve(" drug b1 ") == "B1"
+    assert index.resolve("a2") == "A2"
+
+
+def test_bundled_dataset():
+    """Tests a few well-known rules of the bundled dataset."""
+    index = load_index()
+    assert index.check([WARFARIN, IBUPROFEN])[0].severity == "major"
+    assert index.check([AMOXICILLIN], ["J01C"])[0].severity == "contraindicated"
+    assert index.check([CEFALEXIN], [AMOXICILLIN])[0].severity == "moderate"
+    assert index.check(["N02BE01", "A10BA02"]) == []
+
+
+class TestMedicationList(BaseTest):
+    def test_parse_and_save(self, app):
+        """Tests resolving names, refusing classes and unknown drugs, and stopping changed prescriptions."""
+        with app.app_context():
+            with pytest.raises(PrescriptionError, match="is a class of drugs"):
+                parse_medication(["J01C"], [""], [])
+            with pytest.raises(PrescriptionError, match="Unknown drug"):
+                parse_medication(["aspirin-ish"], [""], [])
+            medication = parse_medication(["warfarin", "", "M01AE01"], ["5 mg", "ignored", ""], ["penicillins"])
+            assert medication.prescriptions == {WARFARIN: "5 mg", IBUPROFEN: None}
+            assert medication.allergens == ["J01C"]
+
+            patient = db.session.get(Patient, 1)
+            assert save_medication(patient, medication)
+            db.session.commit()
+            assert not save_medication(patient, medication)
+            medication.prescriptions = {WARFARIN: "2.5 mg"}
+            assert save_medication(patient, medication)
+            db.session.commit()
+            rows = db.session.execute(select(Prescription.drug_code, Prescription.dosage, Prescription.stopped_at)
+                                      .order_by(Prescription.id)).all()
+            assert [(code, dosage, stopped is not None) for code, dosage, stopped in rows] == [
+                (WARFARIN, "5 mg", True), (IBUPROFEN, None, True), (WARFARIN, "2.5 mg", False)]
+            assert current_medication(1).prescriptions == {WARFARIN: "2.5 mg"}
+
+    def test_merge_and_purge(self, app):
+        """Tests that merging moves prescriptions and allergies once and purging deletes them."""
+        with app.app_context():
+            other = Patient(first_name="Jon", last_name="Doe")
+            db.session.add(other)
+            db.session.commit()
+            for patient_id, code in ((1, "J01C"), (other.id, "J01C"), (other.id, "M01A")):
+                db.session.add(PatientAllergy(patient_id=patient_id, allergen_code=code))
+            db.session.add(Prescription(patient_id=other.id, drug_code=WARFARIN))
+            db.session.commit()
+
+            merge_patients(other, db.session.get(Patient, 1))
+            db.session.commit()
+            assert current_medication(1).allergens == ["J01C", "M01A"]
+            assert current_medication(1).prescriptions == {WARFARIN: None}
+
+            db.session.get(Patient, 1).deleted_at = datetime.now(UTC) - timedelta(days=365)
+            db.session.commit()
+            purge_deleted_patients(timedelta(days=30))
+            assert db.session.scalars(select(Prescription)).all() == []
+            assert db.session.scalars(select(PatientAllergy)).all() == []
+
+
+class TestEditPatientChecks(BaseTest):
+    def test_new_warnings_must_be_confirmed(self, client, app):
+        """Tests that a save adding an interaction shows it inline and saves only once confirmed."""
+        self.login_user(client, email="doctor@example.com")
+        response = client.post("/patients/1/edit", data=edit_form([(WARFARIN, "5 mg daily")]), follow_redirects=True)
+        assert b"Patient updated successfully." in response.data
+        assert b"Warfarin" in response.data
+
+        form = edit_form([(WARFARIN, "5 mg daily"), ("Ibuprofen", "400 mg")])
+        response = client.post("/patients/1/edit", data=form)
+        assert response.status_code == 200
+        assert b"Review the new drug safety warnings" in response.data
+        assert b"NSAIDs increase the risk of bleeding with anticoagulants." in response.data
+        assert b'name="confirm_warnings"' in response.data
+        with app.app_context():
+            assert current_medication(1).prescriptions == {WARFARIN: "5 mg daily"}
+
+        response = client.post("/patients/1/edit", data={**form, "confirm_warnings": "1"}, follow_redirects=True)
+        assert b"Patient updated successfully." in response.data
+        assert b'id="drug-warnings"' in response.data  # on the patient page too
+        with app.app_context():
+            assert current_medication(1).prescriptions == {WARFARIN: "5 mg daily", IBUPROFEN: "400 mg"}
+
+        # Warnings already confirmed do not block later saves.
+        form["allergen_code"] = ["J01C"]
+        response = client.post("/patients/1/edit", data=form, follow_redirects=True)
+        assert b"Patient updated successfully." in response.data
+
+    def test_unknown_drug_and_forms_without_the_lists(self, client, app):
+        """Tests the error for an unknown drug, and that forms without the lists do not clear them."""
+        self.login_user(client, email="doctor@example.com")
+        client.post("/patients/1/edit", data=edit_form([(WARFARIN, "")], ["J01C"]))
+        response = client.post("/patients/1/edit", data=edit_form([("Snake oil", "")]))
+        assert b"Unknown drug &#39;Snake oil&#39;." in response.data
+        assert b'value="Snake oil"' in response.data
+
+        form = edit_form()
+        del form["medication_form"]
+        client.post("/patients/1/edit", data=form)
+        with app.app_context():
+            assert current_medication(1).prescriptions == {WARFARIN: None}
+            assert current_medication(1).allergens == ["J01C"]
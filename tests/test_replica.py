@@ -0,0 +1,59 @@
+import pytest
+
+from mediarch import create_app, db
+from mediarch.models import Patient
+from mediarch.replica import replica_engine
+
+from .test_routes import BaseTest
+
+
+@pytest.fixture
+def app_config(tmp_path):
+    return {
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'primary.db'}",
+        "DATABASE_REPLICA_URL": f"sqlite:///{tmp_path / 'replica.db'}",
+    }
+
+
+@pytest.fixture
+def replica(app):
+    """Give the replica the schema and a patient that only exists there, to tell the databases apart."""
+    with app.app_context():
+        engine = replica_engine()
+        db.metadata.create_all(engine)
+        with engine.begin() as connection:
+            connection.execute(Patient.__table__.insert(), [
+                {"id": 1, "first_name": "John", "last_name": "Doe"},
+                {"id": 2, "first_name": "Only", "last_name": "OnReplica"},
+            ])
+    return engine
+
+
+class TestReplicaRouting(BaseTest):
+    def test_read_only_views_use_replica(self, client, replica):
+        """Tests that the patient list and detail pages are served from the replica."""
+        self.login_user(client, email="admin@example.com")
+        assert b"OnReplica" in client.get("/patients").data
+        assert client.get("/patients/2").status_code == 200
+
+    def test_writes_go_to_primary_and_stick(self, client, app, replica):
+        """Tests that an edit is written to the primary and the following reads see it."""
+        self.login_user(client, email="admin@example.com")
+        response = client.post("/patients/1/edit", data={"first_name": "Johnny", "last_name": "Doe"},
+                               follow_redirects=True)
+        assert response.status_code == 200
+        assert b"Johnny" in client.get("/patients").data
+        assert b"OnReplica" not in client.get("/patients").data
+
+        with app.app_context():
+            assert db.session.get(Patient, 1).first_name == "Johnny"
+            with replica.connect() as connection:
+                assert connection.execute(
+                    Patient.__table__.select().where(Patient.id == 1)).one().first_name == "John"
+
+    def test_without_replica_everything_uses_primary(self, tmp_path):
+        """Tests that no replica engine is created when DATABASE_REPLICA_URL is unset."""
+        app = create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'only.db'}",
+                          "DATABASE_REPLICA_URL": None})
+        with app.app_context():
+            assert replica_engine() is None
@@ -1,50 +1,7 @@
-import pytest
-
-from mediarch import create_app, db
+from mediarch import db
 from mediarch.models import AccountType, BloodType, Patient, User
 
 
-@pytest.fixture
-def app():
-    # Pass test configuration when creating the app
-    app = create_app(test_config={
-        "TESTING": True,
-        "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
-        "WTF_CSRF_ENABLED": False,  # Disable CSRF for testing forms
-        "SECRET_KEY": "test_secret_key",  # Required for session management
-        "LOGIN_DISABLED": False  # Ensure login is not disabled by default for these tests
-    })
-
-    with app.app_context():
-        db.create_all()
-
-        # Patient record (unlinked to a user initially, for admin/doctor interaction)
-        # Explicitly set id for predictability in tests
-        patient1 = Patient(id=1, first_name="John", last_name="Doe", birth_date=None)
-        db.session.add(patient1)
-
-        # Admin User
-        admin_user = User(username="admin", email="admin@example.com",
-                          account_type=AccountType.ADMIN, is_active=True)
-        admin_user.set_password("password123")
-        db.session.add(admin_user)
-
-        # Doctor User
-        doctor_user = User(username="doctoruser", email="doctor@example.com",
-                           account_type=AccountType.DOCTOR, is_active=True)
-        doctor_user.set_password("password123")
-        db.session.add(doctor_user)
-
-        db.session.commit()
-
-    return app
-
-
-@pytest.fixture
-def client(app):
-    return app.test_client()
-
-
 # Base class for tests
 class BaseTest:
     """Base class for test scenarios."""
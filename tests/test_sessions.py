@@ -0,0 +1,77 @@
+import time
+
+import pytest
+
+from mediarch import create_app
+from mediarch.sessions import FileSystemSessionStore, ServerSideSessionInterface, SQLiteSessionStore
+
+from .test_routes import BaseTest
+
+
+class CountingStore(SQLiteSessionStore):
+    """SQLite store that counts how often session data is read."""
+
+    loads = 0
+
+    def load(self, sid):
+        self.loads += 1
+        return super().load(sid)
+
+
+@pytest.fixture(params=["filesystem", "sqlite"])
+def app_config(request, tmp_path):
+    return {"SESSION_BACKEND": request.param, "SESSION_STORE_PATH": str(tmp_path / "sessions")}
+
+
+class TestServerSideSessions(BaseTest):
+    def test_cookie_carries_only_session_id(self, client, app):
+        """Tests that login state and flashes are kept server-side behind a short opaque cookie."""
+        self.login_user(client, email="admin@example.com")
+        cookie = client.get_cookie(app.config["SESSION_COOKIE_NAME"])
+        assert len(cookie.value) == 43
+        assert client.get("/admin").status_code == 200
+
+        response = client.get("/logout", follow_redirects=True)
+        assert b"You have been logged out." in response.data
+        assert client.get("/admin").status_code == 302
+
+    def test_session_id_rotates_on_login(self, client, app):
+        """Tests that the anonymous session id is replaced once the user logs in."""
+        client.post("/login", data={"email": "admin@example.com", "password": "wrong"})
+        anonymous_sid = client.get_cookie(app.config["SESSION_COOKIE_NAME"]).value
+        self.login_user(client, email="admin@example.com")
+        assert client.get_cookie(app.config["SESSION_COOKIE_NAME"]).value != anonymous_sid
+
+    def test_invalid_session_id_is_ignored(self, client, app):
+        """Tests that a forged cookie never reaches the store."""
+        client.set_cookie(app.config["SESSION_COOKIE_NAME"], "../../etc/passwd")
+        assert client.get("/").status_code == 200
+
+
+@pytest.mark.parametrize("store_class", [FileSystemSessionStore, SQLiteSessionStore])
+def test_store_expiry_and_sweep(tmp_path, store_class):
+    """Tests that expired sessions are invisible and removed by a sweep."""
+    store = store_class(tmp_path / "store")
+    sid_live, sid_dead = "a" * 43, "b" * 43
+    store.save(sid_live, {"_flashes": [("info", "hi")]}, time.time() + 60)
+    store.save(sid_dead, {"x": 1}, time.time() - 1)
+
+    assert store.load(sid_live) == {"_flashes": [("info", "hi")]}
+    assert store.load(sid_dead) is None
+    assert store.sweep() == 1
+    assert store.load(sid_live) is not None
+
+
+def test_static_requests_do_not_load_session(tmp_path):
+    """Tests that static file requests never fetch the session data."""
+    app = create_app(test_config={"TESTING": True, "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+                                  "SECRET_KEY": "test_secret_key"})
+    store = CountingStore(tmp_path / "sessions.sqlite3")
+    app.session_interface = ServerSideSessionInterface(store)
+    client = app.test_client()
+    client.set_cookie(app.config["SESSION_COOKIE_NAME"], "c" * 43)
+
+    client.get("/static/css/main.css")
+    assert store.loads == 0
+    client.get("/")
+    assert store.loads == 1
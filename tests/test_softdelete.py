@@ -0,0 +1,61 @@
+from datetime import UTC, datetime, timedelta
+
+from sqlalchemy import inspect, select
+
+from mediarch import db
+from mediarch.models import AccountType, HistoryAction, Patient, PatientHistory, User
+from mediarch.softdelete import INCLUDE_DELETED, purge_deleted_patients
+
+from .test_routes import BaseTest
+
+
+def deleted_patient(app, days_ago: int, **fields) -> int:
+    with app.app_context():
+        patient = Patient(first_name="Gone", last_name="Patient",
+                          deleted_at=datetime.now(UTC) - timedelta(days=days_ago), **fields)
+        db.session.add(patient)
+        db.session.commit()
+        return patient.id
+
+
+class TestSoftDelete(BaseTest):
+    def test_delete_hides_but_keeps_row(self, client, app):
+        """Tests that deleting a card hides it from every query but keeps the row."""
+        self.login_user(client, email="admin@example.com")
+        client.get("/patients/1/delete")
+
+        assert b"Doe" not in client.get("/patients").data
+        assert client.get("/patients/1").status_code == 404
+        assert client.get("/patients/1/edit").status_code == 404
+        with app.app_context():
+            assert db.session.get(Patient, 1) is None
+            row = db.session.execute(select(Patient).where(Patient.id == 1),
+                                     execution_options={INCLUDE_DELETED: True}).scalar_one()
+            assert row.deleted_at is not None
+
+    def test_purge_removes_expired_rows_in_batches(self, app):
+        """Tests that the purge only removes old deletions, unlinks users and archives the rows."""
+        old_ids = [deleted_patient(app, days_ago=40, notes=f"note {i}") for i in range(5)]
+        recent_id = deleted_patient(app, days_ago=1)
+        with app.app_context():
+            user = User(username="purged", email="purged@example.com", account_type=AccountType.PATIENT,
+                        patient_id=old_ids[0], password_hash="x")
+            db.session.add(user)
+            db.session.commit()
+
+            assert purge_deleted_patients(timedelta(days=30), batch_size=2) == 5
+
+            remaining = db.session.execute(select(Patient.id), execution_options={INCLUDE_DELETED: True})
+            assert recent_id in remaining.scalars().all()
+            assert db.session.get(User, user.id).patient_id is None
+            archived = PatientHistory.query.filter_by(action=HistoryAction.PURGE).all()
+            assert sorted(entry.patient_id for entry in archived) == old_ids
+            assert archived[0].changes["notes"][1] is None
+
+
+def test_live_rows_have_partial_index(app):
+    """Tests that the live-row index is created as a partial index."""
+    with app.app_context():
+        indexes = {index["name"]: index for index in inspect(db.engine).get_indexes("patients")}
+    assert "ix_patients_live_name" in indexes
+    assert "deleted_at IS NULL" in str(indexes["ix_patients_live_name"]["dialect_options"]["sqlite_where"])
@@ -0,0 +1,62 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import mediarch
+from mediarch.startup import measure_cold_start, parse_importtime
+
+# A new worker must be ready to serve within this many seconds (fastest of a few cold starts).
+COLD_START_BUDGET = float(os.getenv("MEDIARCH_COLD_START_BUDGET", "2.0"))
+CHILD_ENV = {"MEDIARCH_ENV": "test", "DATABASE_URL": "sqlite:///:memory:"}
+
+LAZY_MODULES = ("flask_wtf", "wtforms", "email_validator", "mediarch.forms")
+
+
+def test_cold_start_within_budget():
+    best = min((measure_cold_start(env=CHILD_ENV) for _ in range(3)), key=lambda run: run.total)
+    assert list(best.phases) == ["settings", "database and sessions", "models", "routes",
+                                 "commands and middleware", "create tables"]
+    assert best.total < COLD_START_BUDGET, f"cold start took {best.total:.2f}s: {best.phases}"
+
+
+def test_forms_are_imported_lazily():
+    """Tests that creating the app does not import the form libraries, and that the login page does."""
+    code = (
+        "import sys\n"
+        "from mediarch import create_app\n"
+        "app = create_app()\n"
+        f"print(sorted(m for m in {LAZY_MODULES!r} if m in sys.modules))\n"
+        "app.test_client().get('/login')\n"
+        "print('mediarch.forms' in sys.modules)\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            env={**os.environ, **CHILD_ENV,
+                                 "PYTHONPATH": os.path.dirname(os.path.dirname(mediarch.__file__))})
+    assert result.stdout.splitlines() == ["[]", "True"]
+
+
+def test_parse_importtime():
+    output = """\
+import time: self [us] | cumulative | imported package
+import time:       100 |        100 | site
+import time:       300 |        300 |     werkzeug
+import time:      1000 |       1300 |   flask
+import time:       200 |        200 |     wtforms
+import time:       500 |        700 |   mediarch.forms
+import time:       400 |       2400 | mediarch
+"""
+    imports = parse_importtime(output)
+    assert [module for module, _ in imports] == ["flask", "mediarch.forms", "wtforms", "site"]
+    assert imports[0][1] == pytest.approx(0.0013)
+
+
+def test_profile_startup_command(app, monkeypatch):
+    for key, value in CHILD_ENV.items():
+        monkeypatch.setenv(key, value)
+    result = app.test_cli_runner().invoke(args=["profile-startup", "--repeat", "1", "--top", "3"])
+    assert result.exit_code == 0, result.output
+    assert "Cold start:" in result.output
+    assert "create tables" in result.output
+    assert "flask_sqlalchemy" in result.output